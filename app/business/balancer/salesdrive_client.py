@@ -5,7 +5,7 @@ from typing import Any
 import os
 import json
 import logging
-import httpx
+from app.core.http_clients import get_httpx_client
 
 # Ensure local `.env` is loaded when running ad-hoc `python -c ...` commands.
 # In the main app, env vars may already be present; load_dotenv is safe to call.
@@ -123,14 +123,14 @@ async def fetch_orders_for_segment(
 
     headers = {"X-Api-Key": sales_drive_key}
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.get(
-            f"{sales_drive_url}/api/order/list/",
-            params=params,
-            headers=headers,
-        )
-        resp.raise_for_status()
-        data = resp.json()
+    resp = await get_httpx_client().get(
+        f"{sales_drive_url}/api/order/list/",
+        params=params,
+        headers=headers,
+        timeout=30,
+    )
+    resp.raise_for_status()
+    data = resp.json()
 
     orders: list[dict[str, Any]] = []
     debug = os.getenv("BALANCER_DEBUG", "").strip().lower() in {"1", "true", "yes", "on"}
@@ -0,0 +1,122 @@
+# app/business/competitor_price_index.py
+"""
+Версионированный индекс цен конкурентов в памяти процесса.
+
+competitor_price_loader заменяет содержимое competitor_prices целиком одной
+транзакцией и в ней же добавляет строку в competitor_price_snapshots;
+id этой строки - версия набора цен.
+
+Все пути ценообразования (dropship_pipeline, business_store_offers_builder)
+читают цены отсюда: перед использованием проверяется версия (один лёгкий
+SELECT max(id)), и таблица перечитывается целиком только когда версия
+сменилась. Дальше поиск - по словарю city -> code -> price без запросов к БД.
+Пока снимков нет (таблицу ещё не загружал новый loader), индекс живёт
+COMPETITOR_PRICE_INDEX_UNVERSIONED_TTL_SEC секунд.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+from time import perf_counter
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import CompetitorPrice, CompetitorPriceSnapshot
+
+
+logger = logging.getLogger(__name__)
+
+
+def _unversioned_ttl_sec() -> int:
+    raw = (os.getenv("COMPETITOR_PRICE_INDEX_UNVERSIONED_TTL_SEC") or "").strip()
+    try:
+        return int(raw) if raw else 300
+    except ValueError:
+        return 300
+
+
+@dataclass
+class CompetitorPriceIndex:
+    version: Optional[int]
+    built_at: float = field(default_factory=time.monotonic)
+    by_city: Dict[str, Dict[str, Decimal]] = field(default_factory=dict)
+    row_count: int = 0
+
+    def get(self, code: str, city: str) -> Optional[Decimal]:
+        return self.by_city.get(city, {}).get(code)
+
+    def for_cities(self, codes: Iterable[str], cities: Iterable[str]) -> Dict[tuple[str, str], Decimal]:
+        """{(code, city): price} для заданных товаров и городов."""
+        wanted = set(codes)
+        out: Dict[tuple[str, str], Decimal] = {}
+        for city in cities:
+            city_prices = self.by_city.get(city)
+            if not city_prices:
+                continue
+            for code in wanted.intersection(city_prices):
+                out[(code, city)] = city_prices[code]
+        return out
+
+    def by_code(self, codes: Iterable[str]) -> Dict[str, Dict[str, Decimal]]:
+        """{code: {city: price}} по всем городам."""
+        wanted = set(codes)
+        out: Dict[str, Dict[str, Decimal]] = {}
+        for city, city_prices in self.by_city.items():
+            for code in wanted.intersection(city_prices):
+                out.setdefault(code, {})[city] = city_prices[code]
+        return out
+
+
+_cached_index: Optional[CompetitorPriceIndex] = None
+
+
+async def fetch_competitor_price_version(session: AsyncSession) -> Optional[int]:
+    return (await session.execute(select(func.max(CompetitorPriceSnapshot.id)))).scalar()
+
+
+async def _load_index(session: AsyncSession, version: Optional[int]) -> CompetitorPriceIndex:
+    started = perf_counter()
+    result = await session.execute(
+        select(CompetitorPrice.city, CompetitorPrice.code, CompetitorPrice.competitor_price)
+    )
+    index = CompetitorPriceIndex(version=version)
+    for city, code, price in result.all():
+        if price is None or not code or not city:
+            continue
+        index.by_city.setdefault(city, {})[str(code)] = Decimal(str(price))
+        index.row_count += 1
+    logger.info(
+        "Competitor price index loaded: version=%s rows=%s cities=%s elapsed=%.3fs",
+        version,
+        index.row_count,
+        len(index.by_city),
+        perf_counter() - started,
+    )
+    return index
+
+
+async def get_competitor_price_index(session: AsyncSession) -> CompetitorPriceIndex:
+    """
+    Актуальный индекс: перечитывается только при смене версии снимка.
+    Пока ни одной версии нет, индекс перечитывается по TTL.
+    """
+    global _cached_index
+    version = await fetch_competitor_price_version(session)
+    cached = _cached_index
+    if cached is not None and cached.version == version:
+        if version is not None or time.monotonic() - cached.built_at < _unversioned_ttl_sec():
+            return cached
+    index = await _load_index(session, version)
+    _cached_index = index
+    return index
+
+
+def invalidate_competitor_price_index() -> None:
+    """Сбрасывает индекс процесса (loader вызывает после замены набора цен)."""
+    global _cached_index
+    _cached_index = None
@@ -1,6 +1,5 @@
 # app/business/competitor_price_loader.py
 import os
-import io
 import json
 import logging
 import asyncio
@@ -9,17 +8,15 @@ from typing import Optional, Tuple, List
 
 import pandas as pd
 from dotenv import load_dotenv
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
 
-from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, text, delete
+from sqlalchemy import text
 
 # === ВАШИ ИМПОРТЫ И ИНФРА ===
+from app.business.competitor_price_index import invalidate_competitor_price_index
+from app.core.google_drive_client import file_fingerprint, get_drive_client, is_file_unchanged, mark_file_imported
 from app.database import get_async_db  # должен отдавать AsyncSession
-from app.models import CompetitorPrice  # таблица с полями: code (str), city (str), competitor_price (Numeric)
+from app.models import CompetitorPriceSnapshot  # версия набора competitor_prices
 
 logger = logging.getLogger("competitor_loader")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -27,47 +24,15 @@ load_dotenv()
 
 # -------- Google Drive --------
 def _connect_to_google_drive():
-    """Создаёт клиент Drive API через сервисный аккаунт (GOOGLE_DRIVE_CREDENTIALS_PATH)."""
+    """Общий асинхронный клиент Drive API через сервисный аккаунт (GOOGLE_DRIVE_CREDENTIALS_PATH)."""
     creds_path = os.getenv("GOOGLE_DRIVE_CREDENTIALS_PATH")
     if not creds_path or not os.path.exists(creds_path):
         raise FileNotFoundError(f"Неверный путь к учетным данным Google Drive: {creds_path}")
 
-    credentials = service_account.Credentials.from_service_account_file(
-        creds_path, scopes=["https://www.googleapis.com/auth/drive"]
-    )
-    service = build("drive", "v3", credentials=credentials)
+    service = get_drive_client(creds_path)
     logger.info("Подключено к Google Drive")
     return service
 
-def _list_files_in_folder(service, folder_id: str) -> List[dict]:
-    """Возвращает список файлов в папке Google Drive."""
-    files = []
-    page_token = None
-    query = f"'{folder_id}' in parents and trashed = false"
-    while True:
-        resp = service.files().list(
-            q=query,
-            fields="nextPageToken, files(id, name, mimeType)",
-            pageToken=page_token,
-            pageSize=1000,
-        ).execute()
-        files.extend(resp.get("files", []))
-        page_token = resp.get("nextPageToken")
-        if not page_token:
-            break
-    return files
-
-def _download_file_as_bytes(service, file_id: str) -> bytes:
-    """Скачивает файл по file_id в память (bytes)."""
-    request = service.files().get_media(fileId=file_id)
-    buf = io.BytesIO()
-    downloader = MediaIoBaseDownload(buf, request)
-    done = False
-    while not done:
-        status, done = downloader.next_chunk()
-    buf.seek(0)
-    return buf.read()
-
 # -------- Парсинг входящего JSON --------
 # Ожидаемый формат: список объектов
 # [
@@ -144,48 +109,78 @@ from collections import OrderedDict
 
 BATCH_SIZE = 1000
 
-async def upsert_competitor_prices(session, rows):
-    """
-    rows: [(code:str, city:str, price:Decimal), ...]
-    1) де-дуп по (code, city) — последняя цена выигрывает
-    2) батчи по 1000
-    """
-    if not rows:
-        return 0
 
-    # --- 1) де-дуп ---
-    uniq: "OrderedDict[tuple[str,str], Decimal]" = OrderedDict()
+def _dedupe_rows(rows) -> "OrderedDict[tuple[str, str], Decimal]":
+    """де-дуп по (code, city) — последняя цена выигрывает"""
+    uniq: "OrderedDict[tuple[str, str], Decimal]" = OrderedDict()
     for code, city, price in rows:
         # нормализация (заодно убираем мусорные пробелы)
         c = str(code).strip()
         ct = str(city).strip()
         p = Decimal(price).quantize(Decimal("0.01"))
         uniq[(c, ct)] = p  # последняя встреченная цена остаётся
+    return uniq
+
 
+async def replace_competitor_prices(
+    session: AsyncSession,
+    rows,
+    *,
+    source_name: Optional[str] = None,
+    source_fingerprint: Optional[str] = None,
+) -> Tuple[int, int]:
+    """
+    Полная замена competitor_prices новым набором одной транзакцией:
+    строки батчами пишутся во временную staging-таблицу, затем
+    DELETE + INSERT ... SELECT из staging и запись новой версии в
+    competitor_price_snapshots. До commit читатели видят старый набор
+    целиком (раньше город был пустым между delete и upsert).
+
+    rows: [(code:str, city:str, price:Decimal), ...]
+    Возвращает (число строк, версия снимка). При ошибке - rollback и raise.
+    """
+    uniq = _dedupe_rows(rows)
     payload_all = [
         {"code": c, "city": ct, "competitor_price": p}
         for (c, ct), p in uniq.items()
     ]
 
-    total = 0
-    # --- 2) батчи ---
-    for i in range(0, len(payload_all), BATCH_SIZE):
-        chunk = payload_all[i:i+BATCH_SIZE]
-        stmt = pg_insert(CompetitorPrice).values(chunk)
-        stmt = stmt.on_conflict_do_update(
-            index_elements=["code", "city"],
-            set_={"competitor_price": stmt.excluded.competitor_price}
+    try:
+        await session.execute(text(
+            "CREATE TEMP TABLE competitor_prices_staging ("
+            " code varchar NOT NULL, city varchar NOT NULL, competitor_price numeric(12, 2) NOT NULL"
+            ") ON COMMIT DROP"
+        ))
+        insert_staging = text(
+            "INSERT INTO competitor_prices_staging (code, city, competitor_price) "
+            "VALUES (:code, :city, :competitor_price)"
+        )
+        for i in range(0, len(payload_all), BATCH_SIZE):
+            await session.execute(insert_staging, payload_all[i:i + BATCH_SIZE])
+
+        await session.execute(text("DELETE FROM competitor_prices"))
+        await session.execute(text(
+            "INSERT INTO competitor_prices (code, city, competitor_price) "
+            "SELECT code, city, competitor_price FROM competitor_prices_staging"
+        ))
+
+        snapshot = CompetitorPriceSnapshot(
+            source_name=source_name,
+            source_fingerprint=source_fingerprint,
+            row_count=len(payload_all),
+            city_count=len({city for _, city in uniq}),
         )
-        try:
-            await session.execute(stmt)
-            await session.commit()
-            total += len(chunk)
-        except Exception as e:
-            # логируем, чтобы быстро увидеть, если вдруг снова дубль или другой кейс
-            logger.exception("DB upsert failed on batch [%s:%s]", i, i+len(chunk))
-            # чтобы не терять остальные батчи — продолжаем (по желанию можно сделать raise)
-            await session.rollback()
-    return total
+        session.add(snapshot)
+        await session.flush()
+        version = snapshot.id
+        await session.commit()
+    except Exception:
+        logger.exception("Competitor prices swap failed, previous snapshot kept")
+        await session.rollback()
+        raise
+    # другие процессы увидят новую версию снимка; в этом сбрасываем сразу
+    invalidate_competitor_price_index()
+    return len(payload_all), version
 
 # -------- Точка входа --------
 async def run():
@@ -197,7 +192,7 @@ async def run():
     delivery_filename = os.getenv("COMPETITOR_DELIVERY_JSON_NAME", "competitors_delivery_total.json")
 
     service = _connect_to_google_drive()
-    files = _list_files_in_folder(service, folder_id)
+    files = await service.list_files(folder_id)
 
     # Ищем JSON по имени, если не нашли — берём первый попавшийся .json
     json_files = [f for f in files if os.path.splitext(f["name"])[1].lower() == ".json"]
@@ -213,47 +208,36 @@ async def run():
             target["name"],
         )
 
+    if is_file_unchanged("competitor_prices", target):
+        logger.info("%s не менялся с последней загрузки — загрузка пропущена", target["name"])
+        return
+
     logger.info("Читаю JSON файл: %s", target["name"])
 
-    b = _download_file_as_bytes(service, target["id"])
+    b = await service.download_bytes(target["id"])
     rows = _parse_delivery_json(b, target["name"])
 
     if not rows:
         logger.warning("%s: нет валидных строк — загрузка в БД пропущена", target["name"])
         return
 
-    total_rows = 0
-
-    # Список городов, присутствующих в JSON
     processed_cities = {city for _, city, _ in rows}
 
     async with get_async_db() as session:
-        # Города, которые уже есть в БД
-        result = await session.execute(select(CompetitorPrice.city).distinct())
-        existing_cities = {row[0] for row in result if row[0] is not None}
-
-        # 1) Для каждого города из JSON — полностью очищаем город и загружаем его данные
-        for city in sorted(processed_cities):
-            city_rows = [(code, ct, price) for (code, ct, price) in rows if ct == city]
-
-            await session.execute(delete(CompetitorPrice).where(CompetitorPrice.city == city))
-            await session.commit()
-
-            cnt = await upsert_competitor_prices(session, city_rows)
-            total_rows += cnt
-            logger.info("%s: загружено %s записей", city, cnt)
-
-        # 2) Удаляем данные по городам, которые были в БД, но отсутствуют в новом JSON
-        cities_to_clear = existing_cities - processed_cities
-        if cities_to_clear:
-            await session.execute(delete(CompetitorPrice).where(CompetitorPrice.city.in_(list(cities_to_clear))))
-            await session.commit()
-            logger.info(
-                "Удалены данные по городам без строк в JSON: %s",
-                ", ".join(sorted(cities_to_clear)),
-            )
-
-    logger.info("Готово. Всего загружено записей: %s", total_rows)
+        total_rows, version = await replace_competitor_prices(
+            session,
+            rows,
+            source_name=target["name"],
+            source_fingerprint=file_fingerprint(target),
+        )
+
+    mark_file_imported("competitor_prices", target)
+    logger.info(
+        "Готово. Всего загружено записей: %s, городов: %s, версия снимка: %s",
+        total_rows,
+        len(processed_cities),
+        version,
+    )
 
 if __name__ == "__main__":
     asyncio.run(run())
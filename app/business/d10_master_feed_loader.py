@@ -11,8 +11,6 @@ from dataclasses import dataclass
 from decimal import Decimal, InvalidOperation
 from typing import Any, Dict, List, Optional
 
-from sqlalchemy import select
-
 from app.business.feed_zoohub import (
     D10_CODE_DEFAULT,
     _collect_item_nodes,
@@ -21,9 +19,9 @@ from app.business.feed_zoohub import (
     _get_feed_url_by_code,
     _load_catalog_items_from_excel_url,
 )
+from app.business.raw_supplier_feed_writer import upsert_raw_supplier_feed
 from app.business.supplier_identity import resolve_supplier_id_by_code
 from app.database import get_async_db
-from app.models import RawSupplierFeedProduct
 
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -37,6 +35,7 @@ class LoaderStats:
     barcode_matches_found: int = 0
     inserted: int = 0
     updated: int = 0
+    unchanged: int = 0
     warnings_count: int = 0
 
     def to_dict(self) -> Dict[str, Any]:
@@ -46,6 +45,7 @@ class LoaderStats:
             "barcode_matches_found": self.barcode_matches_found,
             "inserted": self.inserted,
             "updated": self.updated,
+            "unchanged": self.unchanged,
             "warnings_count": self.warnings_count,
         }
 
@@ -269,6 +269,7 @@ async def load_d10_raw_supplier_feed(limit: int = 0) -> Dict[str, Any]:
         items = items[:limit]
     stats.items_read = len(items)
 
+    feed_rows: List[Dict[str, Any]] = []
     async with get_async_db() as session:
         for item in items:
             parsed = _normalize_item(
@@ -280,45 +281,26 @@ async def load_d10_raw_supplier_feed(limit: int = 0) -> Dict[str, Any]:
             if parsed is None:
                 continue
 
-            stmt = select(RawSupplierFeedProduct).where(
-                RawSupplierFeedProduct.supplier_id == supplier_id,
-                RawSupplierFeedProduct.supplier_code == parsed["supplier_code"],
+            feed_rows.append(
+                {
+                    "supplier_code": parsed["supplier_code"],
+                    "feed_product_id": parsed["feed_product_id"],
+                    "name_raw": parsed["name_raw"],
+                    "manufacturer_raw": parsed["manufacturer_raw"],
+                    "barcode": parsed["barcode"],
+                    "description_raw": parsed["description_raw"],
+                    "weight_g": parsed["weight_g"],
+                    "category_raw": parsed["category_raw"],
+                    "source_payload": parsed["source_payload"],
+                    "source_hash": parsed["source_hash"],
+                }
             )
-            existing = (await session.execute(stmt)).scalar_one_or_none()
-
-            if existing is None:
-                session.add(
-                    RawSupplierFeedProduct(
-                        supplier_id=supplier_id,
-                        feed_product_id=parsed["feed_product_id"],
-                        supplier_code=parsed["supplier_code"],
-                        name_raw=parsed["name_raw"],
-                        manufacturer_raw=parsed["manufacturer_raw"],
-                        barcode=parsed["barcode"],
-                        description_raw=parsed["description_raw"],
-                        weight_g=parsed["weight_g"],
-                        length_mm=None,
-                        width_mm=None,
-                        height_mm=None,
-                        volume_ml=None,
-                        category_raw=parsed["category_raw"],
-                        source_payload=parsed["source_payload"],
-                        source_hash=parsed["source_hash"],
-                    )
-                )
-                stats.inserted += 1
-                continue
 
-            existing.feed_product_id = parsed["feed_product_id"]
-            existing.name_raw = parsed["name_raw"]
-            existing.manufacturer_raw = parsed["manufacturer_raw"]
-            existing.barcode = parsed["barcode"]
-            existing.description_raw = parsed["description_raw"]
-            existing.weight_g = parsed["weight_g"]
-            existing.category_raw = parsed["category_raw"]
-            existing.source_payload = parsed["source_payload"]
-            existing.source_hash = parsed["source_hash"]
-            stats.updated += 1
+        write_summary = await upsert_raw_supplier_feed(session, supplier_id, feed_rows)
+
+    stats.inserted = write_summary.inserted
+    stats.updated = write_summary.updated
+    stats.unchanged = write_summary.unchanged
 
     logger.info(
         "Завершён D10 master feed loader: items=%d, barcode_matches=%d, inserted=%d, updated=%d",
@@ -11,8 +11,6 @@ from decimal import Decimal, InvalidOperation
 from typing import Any, Dict, List, Optional
 import xml.etree.ElementTree as ET
 
-from sqlalchemy import select
-
 from app.business.feed_zoocomplex import (
     ZOOCOMPLEX_CODE_DEFAULT,
     _collect_offer_nodes,
@@ -22,9 +20,9 @@ from app.business.feed_zoocomplex import (
     _get_text,
     _load_feed_root,
 )
+from app.business.raw_supplier_feed_writer import upsert_raw_supplier_feed
 from app.business.supplier_identity import resolve_supplier_id_by_code
 from app.database import get_async_db
-from app.models import RawSupplierFeedProduct
 
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -40,6 +38,7 @@ class LoaderStats:
     items_read: int = 0
     inserted: int = 0
     updated: int = 0
+    unchanged: int = 0
     warnings_count: int = 0
 
     def to_dict(self) -> Dict[str, Any]:
@@ -48,6 +47,7 @@ class LoaderStats:
             "items_read": self.items_read,
             "inserted": self.inserted,
             "updated": self.updated,
+            "unchanged": self.unchanged,
             "warnings_count": self.warnings_count,
         }
 
@@ -270,51 +270,33 @@ async def load_d13_raw_supplier_feed(limit: int = 0) -> Dict[str, Any]:
         offers = offers[:limit]
     stats.items_read = len(offers)
 
+    feed_rows: List[Dict[str, Any]] = []
     async with get_async_db() as session:
         for offer in offers:
             parsed = _parse_offer(offer, supplier_id, stats)
             if parsed is None:
                 continue
 
-            stmt = select(RawSupplierFeedProduct).where(
-                RawSupplierFeedProduct.supplier_id == supplier_id,
-                RawSupplierFeedProduct.supplier_code == parsed["supplier_code"],
+            feed_rows.append(
+                {
+                    "supplier_code": parsed["supplier_code"],
+                    "feed_product_id": parsed["feed_product_id"],
+                    "name_raw": parsed["name_raw"],
+                    "manufacturer_raw": parsed["manufacturer_raw"],
+                    "barcode": parsed["barcode"],
+                    "description_raw": parsed["description_raw"],
+                    "weight_g": parsed["weight_g"],
+                    "category_raw": parsed["category_raw"],
+                    "source_payload": parsed["source_payload"],
+                    "source_hash": parsed["source_hash"],
+                }
             )
-            existing = (await session.execute(stmt)).scalar_one_or_none()
-
-            if existing is None:
-                session.add(
-                    RawSupplierFeedProduct(
-                        supplier_id=supplier_id,
-                        feed_product_id=parsed["feed_product_id"],
-                        supplier_code=parsed["supplier_code"],
-                        name_raw=parsed["name_raw"],
-                        manufacturer_raw=parsed["manufacturer_raw"],
-                        barcode=parsed["barcode"],
-                        description_raw=parsed["description_raw"],
-                        weight_g=parsed["weight_g"],
-                        length_mm=None,
-                        width_mm=None,
-                        height_mm=None,
-                        volume_ml=None,
-                        category_raw=parsed["category_raw"],
-                        source_payload=parsed["source_payload"],
-                        source_hash=parsed["source_hash"],
-                    )
-                )
-                stats.inserted += 1
-                continue
 
-            existing.feed_product_id = parsed["feed_product_id"]
-            existing.name_raw = parsed["name_raw"]
-            existing.manufacturer_raw = parsed["manufacturer_raw"]
-            existing.barcode = parsed["barcode"]
-            existing.description_raw = parsed["description_raw"]
-            existing.weight_g = parsed["weight_g"]
-            existing.category_raw = parsed["category_raw"]
-            existing.source_payload = parsed["source_payload"]
-            existing.source_hash = parsed["source_hash"]
-            stats.updated += 1
+        write_summary = await upsert_raw_supplier_feed(session, supplier_id, feed_rows)
+
+    stats.inserted = write_summary.inserted
+    stats.updated = write_summary.updated
+    stats.unchanged = write_summary.unchanged
 
     logger.info(
         "Завершён D13 master feed loader: items=%d inserted=%d updated=%d",
@@ -7,15 +7,14 @@ import json
 import logging
 import re
 import xml.etree.ElementTree as ET
+from contextlib import aclosing
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
-
-import httpx
-from sqlalchemy import select
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+from app.business.feed_stream_reader import FeedParseError, iter_feed_elements, local_name
+from app.business.raw_supplier_feed_writer import upsert_raw_supplier_feed
 from app.business.supplier_identity import resolve_supplier_id_by_code
 from app.database import get_async_db
-from app.models import RawSupplierFeedProduct
 
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -34,6 +33,7 @@ class LoaderStats:
     extra_feed_available: bool = False
     inserted: int = 0
     updated: int = 0
+    unchanged: int = 0
     warnings_count: int = 0
 
     def to_dict(self) -> Dict[str, Any]:
@@ -44,6 +44,7 @@ class LoaderStats:
             "extra_feed_available": self.extra_feed_available,
             "inserted": self.inserted,
             "updated": self.updated,
+            "unchanged": self.unchanged,
             "warnings_count": self.warnings_count,
         }
 
@@ -75,37 +76,58 @@ def _get_child_text(node: ET.Element, tag: str) -> Optional[str]:
     return _normalize_string(child.text)
 
 
-async def _fetch_xml_root(url: str, *, required: bool, timeout: int = 60) -> Optional[ET.Element]:
+async def _stream_feed_records(
+    url: str,
+    *,
+    primary_tag: str,
+    fallback_tag: str,
+    build: Callable[[ET.Element], Any],
+    required: bool,
+    timeout: int = 60,
+    limit: int = 0,
+) -> Optional[Tuple[int, List[Any]]]:
+    """
+    Потоково читает фид и строит записи build(node) по узлам `primary_tag`,
+    а если таких узлов в фиде нет - по узлам `fallback_tag`
+    (та же семантика, что `root.findall(primary) or root.findall(fallback)`).
+
+    Возвращает (число прочитанных узлов, записи без None) или None для
+    необязательного фида при ошибке загрузки/парсинга.
+    """
     headers = {"User-Agent": "Mozilla/5.0"}
+    primary_seen = 0
+    fallback_seen = 0
+    primary_records: List[Any] = []
+    fallback_records: List[Any] = []
     try:
-        async with httpx.AsyncClient(headers=headers, timeout=timeout) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-    except Exception as exc:
+        nodes = iter_feed_elements(url, (primary_tag, fallback_tag), timeout=timeout, headers=headers)
+        async with aclosing(nodes):
+            async for node in nodes:
+                if local_name(node.tag) == primary_tag:
+                    if limit > 0 and primary_seen >= limit:
+                        break
+                    primary_seen += 1
+                    target = primary_records
+                elif primary_seen or (limit > 0 and fallback_seen >= limit):
+                    continue
+                else:
+                    fallback_seen += 1
+                    target = fallback_records
+                record = build(node)
+                if record is not None:
+                    target.append(record)
+    except FeedParseError as exc:
         if required:
-            raise RuntimeError(f"Ошибка загрузки обязательного фида {url}: {exc}") from exc
+            raise RuntimeError(f"Ошибка парсинга обязательного фида {url}: {exc}") from exc
         return None
-
-    try:
-        return ET.fromstring(response.text)
-    except ET.ParseError as exc:
+    except Exception as exc:
         if required:
-            raise RuntimeError(f"Ошибка парсинга обязательного фида {url}: {exc}") from exc
+            raise RuntimeError(f"Ошибка загрузки обязательного фида {url}: {exc}") from exc
         return None
 
-
-def _collect_main_items(root: ET.Element) -> List[ET.Element]:
-    items = root.findall(".//item")
-    if items:
-        return items
-    return root.findall(".//offer")
-
-
-def _collect_extra_offers(root: ET.Element) -> List[ET.Element]:
-    offers = root.findall(".//offer")
-    if offers:
-        return offers
-    return root.findall(".//item")
+    if primary_seen:
+        return primary_seen, primary_records
+    return fallback_seen, fallback_records
 
 
 def _extract_images(node: ET.Element, tag_name: str) -> List[str]:
@@ -130,22 +152,19 @@ def _merge_images(*groups: List[str]) -> List[str]:
     return merged
 
 
-def _build_extra_map(root: ET.Element) -> Dict[str, Dict[str, Any]]:
-    result: Dict[str, Dict[str, Any]] = {}
-    for offer in _collect_extra_offers(root):
-        vendor_code = _get_child_text(offer, "vendorCode")
-        if not vendor_code:
-            continue
-        result[vendor_code] = {
-            "vendorCode": vendor_code,
-            "name": _get_child_text(offer, "name"),
-            "name_ua": _get_child_text(offer, "name_ua"),
-            "original_name": _get_child_text(offer, "original_name"),
-            "description": _get_child_text(offer, "description"),
-            "description_ua": _get_child_text(offer, "description_ua"),
-            "pictures": _extract_images(offer, "picture"),
-        }
-    return result
+def _build_extra_entry(offer: ET.Element) -> Optional[Tuple[str, Dict[str, Any]]]:
+    vendor_code = _get_child_text(offer, "vendorCode")
+    if not vendor_code:
+        return None
+    return vendor_code, {
+        "vendorCode": vendor_code,
+        "name": _get_child_text(offer, "name"),
+        "name_ua": _get_child_text(offer, "name_ua"),
+        "original_name": _get_child_text(offer, "original_name"),
+        "description": _get_child_text(offer, "description"),
+        "description_ua": _get_child_text(offer, "description_ua"),
+        "pictures": _extract_images(offer, "picture"),
+    }
 
 
 def _build_source_hash(payload: Dict[str, Any]) -> str:
@@ -241,66 +260,52 @@ async def load_d1_raw_supplier_feed(limit: int = 0) -> Dict[str, Any]:
     stats = LoaderStats(supplier_id=supplier_id)
     logger.info("Запуск D1 master feed loader, supplier_id=%s", supplier_id)
 
-    main_root = await _fetch_xml_root(D1_MAIN_FEED_URL, required=True)
-
-    extra_root = await _fetch_xml_root(D1_EXTRA_FEED_URL, required=False)
+    extra_result = await _stream_feed_records(
+        D1_EXTRA_FEED_URL,
+        primary_tag="offer",
+        fallback_tag="item",
+        build=_build_extra_entry,
+        required=False,
+    )
     extra_map: Dict[str, Dict[str, Any]] = {}
-    if extra_root is None:
+    if extra_result is None:
         _warn(stats, "Дополнительный Biotus фид недоступен, продолжаем только с основным")
     else:
         stats.extra_feed_available = True
-        extra_map = _build_extra_map(extra_root)
+        extra_map = dict(extra_result[1])
         stats.extra_feed_items_read = len(extra_map)
 
-    items = _collect_main_items(main_root)
-    if limit and limit > 0:
-        items = items[:limit]
-    stats.main_feed_items_read = len(items)
+    stats.main_feed_items_read, records = await _stream_feed_records(
+        D1_MAIN_FEED_URL,
+        primary_tag="item",
+        fallback_tag="offer",
+        build=lambda item: _build_merged_record(item, extra_map, stats),
+        required=True,
+        limit=limit,
+    )
 
+    feed_rows: List[Dict[str, Any]] = []
     async with get_async_db() as session:
-        for item in items:
-            record = _build_merged_record(item, extra_map, stats)
-            if record is None:
-                continue
-
-            stmt = select(RawSupplierFeedProduct).where(
-                RawSupplierFeedProduct.supplier_id == supplier_id,
-                RawSupplierFeedProduct.supplier_code == record["supplier_code"],
+        for record in records:
+            feed_rows.append(
+                {
+                    "supplier_code": record["supplier_code"],
+                    "feed_product_id": record["feed_product_id"],
+                    "name_raw": record["name_raw"],
+                    "manufacturer_raw": record["manufacturer_raw"],
+                    "barcode": record["barcode"],
+                    "description_raw": record["description_raw"],
+                    "category_raw": None,
+                    "source_payload": record["source_payload"],
+                    "source_hash": record["source_hash"],
+                }
             )
-            existing = (await session.execute(stmt)).scalar_one_or_none()
-
-            if existing is None:
-                session.add(
-                    RawSupplierFeedProduct(
-                        supplier_id=supplier_id,
-                        feed_product_id=record["feed_product_id"],
-                        supplier_code=record["supplier_code"],
-                        name_raw=record["name_raw"],
-                        manufacturer_raw=record["manufacturer_raw"],
-                        barcode=record["barcode"],
-                        description_raw=record["description_raw"],
-                        weight_g=None,
-                        length_mm=None,
-                        width_mm=None,
-                        height_mm=None,
-                        volume_ml=None,
-                        category_raw=None,
-                        source_payload=record["source_payload"],
-                        source_hash=record["source_hash"],
-                    )
-                )
-                stats.inserted += 1
-                continue
 
-            existing.feed_product_id = record["feed_product_id"]
-            existing.name_raw = record["name_raw"]
-            existing.manufacturer_raw = record["manufacturer_raw"]
-            existing.barcode = record["barcode"]
-            existing.description_raw = record["description_raw"]
-            existing.category_raw = None
-            existing.source_payload = record["source_payload"]
-            existing.source_hash = record["source_hash"]
-            stats.updated += 1
+        write_summary = await upsert_raw_supplier_feed(session, supplier_id, feed_rows)
+
+    stats.inserted = write_summary.inserted
+    stats.updated = write_summary.updated
+    stats.unchanged = write_summary.unchanged
 
     logger.info(
         "Завершён D1 master feed loader: main=%d, extra=%d, inserted=%d, updated=%d",
@@ -8,12 +8,10 @@ import re
 from dataclasses import dataclass
 from typing import Any, Dict, List, Optional
 
-from sqlalchemy import select
-
 from app.business.feed_dobavki import _try_load_products_json_from_gdrive
+from app.business.raw_supplier_feed_writer import upsert_raw_supplier_feed
 from app.business.supplier_identity import resolve_supplier_id_by_code
 from app.database import get_async_db
-from app.models import RawSupplierFeedProduct
 
 
 @dataclass
@@ -22,6 +20,7 @@ class LoaderStats:
     items_read: int = 0
     inserted: int = 0
     updated: int = 0
+    unchanged: int = 0
     warnings_count: int = 0
 
     def to_dict(self) -> Dict[str, Any]:
@@ -30,6 +29,7 @@ class LoaderStats:
             "items_read": self.items_read,
             "inserted": self.inserted,
             "updated": self.updated,
+            "unchanged": self.unchanged,
             "warnings_count": self.warnings_count,
         }
 
@@ -116,6 +116,7 @@ async def load_d4_raw_supplier_feed(limit: int = 0) -> Dict[str, Any]:
         rows = rows[:limit]
     stats.items_read = len(rows)
 
+    feed_rows: List[Dict[str, Any]] = []
     async with get_async_db() as session:
         for row in rows:
             if not isinstance(row, dict):
@@ -126,44 +127,25 @@ async def load_d4_raw_supplier_feed(limit: int = 0) -> Dict[str, Any]:
             if parsed is None:
                 continue
 
-            stmt = select(RawSupplierFeedProduct).where(
-                RawSupplierFeedProduct.supplier_id == supplier_id,
-                RawSupplierFeedProduct.supplier_code == parsed["supplier_code"],
+            feed_rows.append(
+                {
+                    "supplier_code": parsed["supplier_code"],
+                    "feed_product_id": parsed["feed_product_id"],
+                    "name_raw": parsed["name_raw"],
+                    "manufacturer_raw": parsed["manufacturer_raw"],
+                    "barcode": parsed["barcode"],
+                    "description_raw": None,
+                    "category_raw": None,
+                    "source_payload": parsed["source_payload"],
+                    "source_hash": parsed["source_hash"],
+                }
             )
-            existing = (await session.execute(stmt)).scalar_one_or_none()
-
-            if existing is None:
-                session.add(
-                    RawSupplierFeedProduct(
-                        supplier_id=supplier_id,
-                        feed_product_id=parsed["feed_product_id"],
-                        supplier_code=parsed["supplier_code"],
-                        name_raw=parsed["name_raw"],
-                        manufacturer_raw=parsed["manufacturer_raw"],
-                        barcode=parsed["barcode"],
-                        description_raw=None,
-                        weight_g=None,
-                        length_mm=None,
-                        width_mm=None,
-                        height_mm=None,
-                        volume_ml=None,
-                        category_raw=None,
-                        source_payload=parsed["source_payload"],
-                        source_hash=parsed["source_hash"],
-                    )
-                )
-                stats.inserted += 1
-                continue
 
-            existing.feed_product_id = parsed["feed_product_id"]
-            existing.name_raw = parsed["name_raw"]
-            existing.manufacturer_raw = parsed["manufacturer_raw"]
-            existing.barcode = parsed["barcode"]
-            existing.description_raw = None
-            existing.category_raw = None
-            existing.source_payload = parsed["source_payload"]
-            existing.source_hash = parsed["source_hash"]
-            stats.updated += 1
+        write_summary = await upsert_raw_supplier_feed(session, supplier_id, feed_rows)
+
+    stats.inserted = write_summary.inserted
+    stats.updated = write_summary.updated
+    stats.unchanged = write_summary.unchanged
 
     return stats.to_dict()
 
@@ -8,14 +8,14 @@ import logging
 import re
 import xml.etree.ElementTree as ET
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 
-import httpx
-from sqlalchemy import select, text
+from sqlalchemy import text
 
+from app.business.feed_stream_reader import FeedParseError, iter_feed_elements
+from app.business.raw_supplier_feed_writer import upsert_raw_supplier_feed
 from app.business.supplier_identity import resolve_supplier_id_by_code
 from app.database import get_async_db
-from app.models import RawSupplierFeedProduct
 
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -41,6 +41,7 @@ class LoaderStats:
     items_read: int = 0
     inserted: int = 0
     updated: int = 0
+    unchanged: int = 0
     warnings_count: int = 0
 
     def to_dict(self) -> Dict[str, Any]:
@@ -49,6 +50,7 @@ class LoaderStats:
             "items_read": self.items_read,
             "inserted": self.inserted,
             "updated": self.updated,
+            "unchanged": self.unchanged,
             "warnings_count": self.warnings_count,
         }
 
@@ -82,29 +84,30 @@ async def _get_feed_url_by_code(code: str = D5_CODE) -> Optional[str]:
         return result.scalar_one_or_none()
 
 
-async def _load_feed_root(code: str = D5_CODE, timeout: int = 30) -> ET.Element:
+async def _iter_feed_offers(
+    code: str = D5_CODE,
+    *,
+    limit: int = 0,
+    timeout: int = 30,
+) -> AsyncIterator[ET.Element]:
     feed_url = await _get_feed_url_by_code(code)
     if not feed_url:
         raise RuntimeError(f"Не найден feed_url в dropship_enterprises для code='{code}'")
 
     headers = {"User-Agent": "Mozilla/5.0"}
-    async with httpx.AsyncClient(headers=headers, timeout=timeout) as client:
-        response = await client.get(feed_url)
-        response.raise_for_status()
-
     try:
-        return ET.fromstring(response.text)
-    except ET.ParseError as exc:
+        async for offer in iter_feed_elements(
+            feed_url,
+            ("offer",),
+            timeout=timeout,
+            headers=headers,
+            limit=limit,
+        ):
+            yield offer
+    except FeedParseError as exc:
         raise RuntimeError(f"Ошибка парсинга XML фида D5: {exc}") from exc
 
 
-def _collect_offers(root: ET.Element, limit: int = 0) -> List[ET.Element]:
-    offers = root.findall(".//offer")
-    if limit and limit > 0:
-        return offers[:limit]
-    return offers
-
-
 def _get_text(node: ET.Element, tag: str) -> Optional[str]:
     child = node.find(tag)
     if child is None:
@@ -208,54 +211,35 @@ async def load_d5_raw_supplier_feed(limit: int = 0) -> Dict[str, Any]:
     stats = LoaderStats(supplier_id=supplier_id)
     logger.info("Запуск D5 master feed loader, supplier_id=%s", supplier_id)
 
-    root = await _load_feed_root(code=D5_CODE)
-    offers = _collect_offers(root, limit=limit)
-    stats.items_read = len(offers)
+    parsed_records: List[Dict[str, Any]] = []
+    async for offer in _iter_feed_offers(code=D5_CODE, limit=limit):
+        stats.items_read += 1
+        parsed = _parse_offer(offer, supplier_id, stats)
+        if parsed is not None:
+            parsed_records.append(parsed)
 
+    feed_rows: List[Dict[str, Any]] = []
     async with get_async_db() as session:
-        for offer in offers:
-            parsed = _parse_offer(offer, supplier_id, stats)
-            if parsed is None:
-                continue
-
-            stmt = select(RawSupplierFeedProduct).where(
-                RawSupplierFeedProduct.supplier_id == supplier_id,
-                RawSupplierFeedProduct.supplier_code == parsed["supplier_code"],
+        for parsed in parsed_records:
+            feed_rows.append(
+                {
+                    "supplier_code": parsed["supplier_code"],
+                    "feed_product_id": parsed["feed_product_id"],
+                    "name_raw": parsed["name_raw"],
+                    "manufacturer_raw": parsed["manufacturer_raw"],
+                    "barcode": parsed["barcode"],
+                    "description_raw": parsed["description_raw"],
+                    "category_raw": parsed["category_raw"],
+                    "source_payload": parsed["source_payload"],
+                    "source_hash": parsed["source_hash"],
+                }
             )
-            existing = (await session.execute(stmt)).scalar_one_or_none()
-
-            if existing is None:
-                session.add(
-                    RawSupplierFeedProduct(
-                        supplier_id=supplier_id,
-                        feed_product_id=parsed["feed_product_id"],
-                        supplier_code=parsed["supplier_code"],
-                        name_raw=parsed["name_raw"],
-                        manufacturer_raw=parsed["manufacturer_raw"],
-                        barcode=parsed["barcode"],
-                        description_raw=parsed["description_raw"],
-                        weight_g=None,
-                        length_mm=None,
-                        width_mm=None,
-                        height_mm=None,
-                        volume_ml=None,
-                        category_raw=parsed["category_raw"],
-                        source_payload=parsed["source_payload"],
-                        source_hash=parsed["source_hash"],
-                    )
-                )
-                stats.inserted += 1
-                continue
-
-            existing.feed_product_id = parsed["feed_product_id"]
-            existing.name_raw = parsed["name_raw"]
-            existing.manufacturer_raw = parsed["manufacturer_raw"]
-            existing.barcode = parsed["barcode"]
-            existing.description_raw = parsed["description_raw"]
-            existing.category_raw = parsed["category_raw"]
-            existing.source_payload = parsed["source_payload"]
-            existing.source_hash = parsed["source_hash"]
-            stats.updated += 1
+
+        write_summary = await upsert_raw_supplier_feed(session, supplier_id, feed_rows)
+
+    stats.inserted = write_summary.inserted
+    stats.updated = write_summary.updated
+    stats.unchanged = write_summary.unchanged
 
     logger.info(
         "D5 master feed loader завершён: items_read=%d, inserted=%d, updated=%d",
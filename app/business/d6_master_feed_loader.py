@@ -9,14 +9,14 @@ import re
 import xml.etree.ElementTree as ET
 from dataclasses import dataclass
 from decimal import Decimal, InvalidOperation
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 
-import httpx
-from sqlalchemy import select, text
+from sqlalchemy import text
 
+from app.business.feed_stream_reader import FeedParseError, iter_feed_elements
+from app.business.raw_supplier_feed_writer import upsert_raw_supplier_feed
 from app.business.supplier_identity import resolve_supplier_id_by_code
 from app.database import get_async_db
-from app.models import RawSupplierFeedProduct
 
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -30,6 +30,7 @@ class LoaderStats:
     items_read: int = 0
     inserted: int = 0
     updated: int = 0
+    unchanged: int = 0
     warnings_count: int = 0
 
     def to_dict(self) -> Dict[str, Any]:
@@ -37,6 +38,7 @@ class LoaderStats:
             "items_read": self.items_read,
             "inserted": self.inserted,
             "updated": self.updated,
+            "unchanged": self.unchanged,
             "warnings_count": self.warnings_count,
         }
 
@@ -70,19 +72,27 @@ async def _get_feed_url_by_code(code: str) -> Optional[str]:
         return result.scalar_one_or_none()
 
 
-async def _load_feed_root(code: str = D6_CODE, timeout: int = 30) -> ET.Element:
+async def _iter_feed_items(
+    code: str = D6_CODE,
+    *,
+    limit: int = 0,
+    timeout: int = 30,
+) -> AsyncIterator[ET.Element]:
     feed_url = await _get_feed_url_by_code(code)
     if not feed_url:
         raise RuntimeError(f"Не найден feed_url в dropship_enterprises для code='{code}'")
 
     headers = {"User-Agent": "Mozilla/5.0"}
-    async with httpx.AsyncClient(headers=headers, timeout=timeout) as client:
-        response = await client.get(feed_url)
-        response.raise_for_status()
-
     try:
-        return ET.fromstring(response.text)
-    except ET.ParseError as exc:
+        async for item in iter_feed_elements(
+            feed_url,
+            ("item",),
+            timeout=timeout,
+            headers=headers,
+            limit=limit,
+        ):
+            yield item
+    except FeedParseError as exc:
         raise RuntimeError(f"Ошибка парсинга XML фида D6: {exc}") from exc
 
 
@@ -169,13 +179,6 @@ def _build_source_hash(data: Dict[str, Any]) -> str:
     return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
 
 
-def _collect_items(root: ET.Element, limit: int = 0) -> List[ET.Element]:
-    items = root.findall(".//item")
-    if limit and limit > 0:
-        return items[:limit]
-    return items
-
-
 def _parse_item(item: ET.Element, supplier_id: int, stats: LoaderStats) -> Optional[Dict[str, Any]]:
     feed_product_id = _get_text(item, "code")
     supplier_code = _get_text(item, "art")
@@ -231,59 +234,40 @@ async def load_d6_raw_supplier_feed(limit: int = 0) -> Dict[str, Any]:
     supplier_id = await _extract_supplier_id()
     logger.info("Запуск D6 master feed loader, supplier_id=%s", supplier_id)
 
-    root = await _load_feed_root(code=D6_CODE)
-    items = _collect_items(root, limit=limit)
-    stats.items_read = len(items)
+    parsed_records: List[Dict[str, Any]] = []
+    async for item in _iter_feed_items(code=D6_CODE, limit=limit):
+        stats.items_read += 1
+        parsed = _parse_item(item, supplier_id, stats)
+        if parsed is not None:
+            parsed_records.append(parsed)
 
+    feed_rows: List[Dict[str, Any]] = []
     async with get_async_db() as session:
-        for item in items:
-            parsed = _parse_item(item, supplier_id, stats)
-            if parsed is None:
-                continue
-
-            stmt = select(RawSupplierFeedProduct).where(
-                RawSupplierFeedProduct.supplier_id == supplier_id,
-                RawSupplierFeedProduct.supplier_code == parsed["supplier_code"],
+        for parsed in parsed_records:
+            feed_rows.append(
+                {
+                    "supplier_code": parsed["supplier_code"],
+                    "feed_product_id": parsed["feed_product_id"],
+                    "name_raw": parsed["name_raw"],
+                    "manufacturer_raw": parsed["manufacturer_raw"],
+                    "barcode": parsed["barcode"],
+                    "description_raw": None,
+                    "weight_g": parsed["weight_g"],
+                    "length_mm": parsed["length_mm"],
+                    "width_mm": parsed["width_mm"],
+                    "height_mm": parsed["height_mm"],
+                    "volume_ml": None,
+                    "category_raw": parsed["category_raw"],
+                    "source_payload": parsed["source_payload"],
+                    "source_hash": parsed["source_hash"],
+                }
             )
-            existing = (await session.execute(stmt)).scalar_one_or_none()
-
-            if existing is None:
-                session.add(
-                    RawSupplierFeedProduct(
-                        supplier_id=parsed["supplier_id"],
-                        feed_product_id=parsed["feed_product_id"],
-                        supplier_code=parsed["supplier_code"],
-                        name_raw=parsed["name_raw"],
-                        manufacturer_raw=parsed["manufacturer_raw"],
-                        barcode=parsed["barcode"],
-                        description_raw=None,
-                        weight_g=parsed["weight_g"],
-                        length_mm=parsed["length_mm"],
-                        width_mm=parsed["width_mm"],
-                        height_mm=parsed["height_mm"],
-                        volume_ml=None,
-                        category_raw=parsed["category_raw"],
-                        source_payload=parsed["source_payload"],
-                        source_hash=parsed["source_hash"],
-                    )
-                )
-                stats.inserted += 1
-                continue
-
-            existing.feed_product_id = parsed["feed_product_id"]
-            existing.name_raw = parsed["name_raw"]
-            existing.manufacturer_raw = parsed["manufacturer_raw"]
-            existing.barcode = parsed["barcode"]
-            existing.description_raw = None
-            existing.weight_g = parsed["weight_g"]
-            existing.length_mm = parsed["length_mm"]
-            existing.width_mm = parsed["width_mm"]
-            existing.height_mm = parsed["height_mm"]
-            existing.volume_ml = None
-            existing.category_raw = parsed["category_raw"]
-            existing.source_payload = parsed["source_payload"]
-            existing.source_hash = parsed["source_hash"]
-            stats.updated += 1
+
+        write_summary = await upsert_raw_supplier_feed(session, supplier_id, feed_rows)
+
+    stats.inserted = write_summary.inserted
+    stats.updated = write_summary.updated
+    stats.unchanged = write_summary.unchanged
 
     logger.info(
         "D6 master feed loader завершён: items_read=%d, inserted=%d, updated=%d",
@@ -7,14 +7,12 @@ import json
 import logging
 import re
 from dataclasses import dataclass
-from typing import Any, Dict, Optional
-
-from sqlalchemy import select
+from typing import Any, Dict, List, Optional
 
 from app.business.feed_ortomedika import parse_feed_catalog_to_json
+from app.business.raw_supplier_feed_writer import upsert_raw_supplier_feed
 from app.business.supplier_identity import resolve_supplier_id_by_code
 from app.database import get_async_db
-from app.models import RawSupplierFeedProduct
 
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -29,6 +27,7 @@ class LoaderStats:
     raw_rows_read: int = 0
     inserted: int = 0
     updated: int = 0
+    unchanged: int = 0
     skipped_no_code: int = 0
     skipped_invalid: int = 0
 
@@ -38,6 +37,7 @@ class LoaderStats:
             "raw_rows_read": self.raw_rows_read,
             "inserted": self.inserted,
             "updated": self.updated,
+            "unchanged": self.unchanged,
             "skipped_no_code": self.skipped_no_code,
             "skipped_invalid": self.skipped_invalid,
         }
@@ -108,6 +108,7 @@ async def sync_d9_master_feed(limit: int = 0) -> Dict[str, Any]:
     if limit and limit > 0:
         rows = rows[:limit]
 
+    feed_rows: List[Dict[str, Any]] = []
     async with get_async_db() as session:
         for row in rows:
             if not isinstance(row, dict):
@@ -124,40 +125,27 @@ async def sync_d9_master_feed(limit: int = 0) -> Dict[str, Any]:
 
             stats.raw_rows_read += 1
 
-            stmt = select(RawSupplierFeedProduct).where(
-                RawSupplierFeedProduct.supplier_id == supplier_id,
-                RawSupplierFeedProduct.supplier_code == parsed["supplier_code"],
+            feed_rows.append(
+                {
+                    "supplier_code": parsed["supplier_code"],
+                    "feed_product_id": parsed["feed_product_id"],
+                    "name_raw": parsed["name_raw"],
+                    "barcode": parsed["barcode"],
+                    "source_payload": parsed["source_payload"],
+                    "source_hash": parsed["source_hash"],
+                }
             )
-            existing = (await session.execute(stmt)).scalar_one_or_none()
-
-            if existing is None:
-                session.add(
-                    RawSupplierFeedProduct(
-                        supplier_id=supplier_id,
-                        feed_product_id=parsed["feed_product_id"],
-                        supplier_code=parsed["supplier_code"],
-                        name_raw=parsed["name_raw"],
-                        manufacturer_raw=None,
-                        barcode=parsed["barcode"],
-                        description_raw=None,
-                        weight_g=None,
-                        length_mm=None,
-                        width_mm=None,
-                        height_mm=None,
-                        volume_ml=None,
-                        category_raw=None,
-                        source_payload=parsed["source_payload"],
-                        source_hash=parsed["source_hash"],
-                    )
-                )
-                stats.inserted += 1
-                continue
 
-            existing.name_raw = parsed["name_raw"]
-            existing.barcode = parsed["barcode"]
-            existing.source_payload = parsed["source_payload"]
-            existing.source_hash = parsed["source_hash"]
-            stats.updated += 1
+        write_summary = await upsert_raw_supplier_feed(
+            session,
+            supplier_id,
+            feed_rows,
+            insert_only=("feed_product_id",),
+        )
+
+    stats.inserted = write_summary.inserted
+    stats.updated = write_summary.updated
+    stats.unchanged = write_summary.unchanged
 
     return stats.to_dict()
 
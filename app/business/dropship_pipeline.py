@@ -12,6 +12,7 @@ from pathlib import Path
 import tempfile
 import json
 from datetime import datetime, timezone
+from time import perf_counter
 from zoneinfo import ZoneInfo
 
 # Fix: Ensure AsyncSession is imported at the top, before usage
@@ -128,14 +129,13 @@ from sqlalchemy.dialects.postgresql import insert
 
 # === ВАША ИНФРАСТРУКТУРА / МОДЕЛИ ===
 from app.database import get_async_db
+from app.business.competitor_price_index import get_competitor_price_index
+from app.business.supplier_mapping_index import get_legacy_mapping_index, get_master_mapping_index
 from app.models import (
-    CatalogSupplierMapping,
-    CompetitorPrice,
     DropshipEnterprise,
-    MasterCatalog,
     Offer,
     OfferBlockRule,
-)  # CompetitorPrice: code, city, competitor_price
+)
 from app.business.supplier_identity import resolve_supplier_id_by_code
 from app.business.feed_biotus import parse_feed_stock_to_json
 from app.business.feed_dsn import parse_dsn_stock_to_json
@@ -186,6 +186,17 @@ logger.setLevel(getattr(logging, _LOG_LEVEL, logging.INFO))
 VERBOSE_ITEM_LOGS = os.getenv("DROPSHIP_VERBOSE_ITEM_LOGS", "0") == "1"
 
 
+def _parallel_refresh_enabled() -> bool:
+    return os.getenv("DROPSHIP_PARALLEL_REFRESH_ENABLED", "0").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _parallel_fetch_concurrency() -> int:
+    try:
+        return max(1, int(os.getenv("DROPSHIP_FETCH_CONCURRENCY", "4")))
+    except ValueError:
+        return 4
+
+
 async def _collect_offers_refresh_summary(session: AsyncSession) -> tuple[int, list[str]]:
     offers_rows_after = int(
         (
@@ -293,59 +304,28 @@ async def _refresh_business_offers_in_session(
         for ent in suppliers:
             setattr(ent, "_pipeline_enterprise_code", enterprise_code)
 
+    report["supplier_timings"] = {}
     if not suppliers:
         logger.info("No active dropship enterprises.")
+    elif _parallel_refresh_enabled():
+        await _refresh_suppliers_parallel(session, suppliers, pricing_snapshot, report)
     else:
         for ent in suppliers:
             supplier_code = str(getattr(ent, "code", "") or "")
             try:
-                if await is_supplier_blocked(session, supplier_code, supplier=ent):
-                    logger.info(
-                        "Поставщик %s заблокирован по расписанию. Удаляем старые offers.",
-                        supplier_code,
-                    )
-                    try:
-                        deleted = await clear_offers_for_supplier(session, supplier_code)
-                        if supplier_code:
-                            report["_cleared_suppliers"].add(supplier_code)
-                        logger.info(
-                            "Для заблокированного поставщика %s удалено %s offers.",
-                            supplier_code,
-                            deleted,
-                        )
-                        await session.commit()
-                        report["suppliers_blocked"] += 1
-                    except Exception as exc:
-                        logger.exception(
-                            "Не удалось удалить offers для заблокированного поставщика %s: %s",
-                            supplier_code,
-                            exc,
-                        )
-                        await session.rollback()
-                        report["suppliers_failed"] += 1
-                        report["errors"].append(
-                            {
-                                "supplier_code": supplier_code or "<unknown>",
-                                "message": f"Blocked supplier cleanup failed: {exc}",
-                            }
-                        )
+                if await _handle_blocked_supplier(session, ent, report):
                     continue
 
                 if supplier_code:
                     report["_cleared_suppliers"].add(supplier_code)
-                await process_supplier(session, ent, PARSERS, pricing_snapshot)
+                timings: dict[str, float] = {}
+                await process_supplier(session, ent, PARSERS, pricing_snapshot, timings=timings)
                 await session.commit()
+                report["supplier_timings"][supplier_code or "<unknown>"] = timings
                 report["suppliers_processed"] += 1
             except Exception as exc:
-                logger.exception("Failed supplier %s: %s", supplier_code or "<unknown>", exc)
+                _record_supplier_failure(report, supplier_code, exc)
                 await session.rollback()
-                report["suppliers_failed"] += 1
-                report["errors"].append(
-                    {
-                        "supplier_code": supplier_code or "<unknown>",
-                        "message": str(exc),
-                    }
-                )
 
     offers_rows_after, cities = await _collect_offers_refresh_summary(session)
     report["offers_rows_after"] = offers_rows_after
@@ -354,6 +334,134 @@ async def _refresh_business_offers_in_session(
     return _finalize_offers_refresh_report(report, datetime.now(timezone.utc))
 
 
+def _record_supplier_failure(report: dict[str, Any], supplier_code: str, exc: Exception) -> None:
+    logger.error("Failed supplier %s: %s", supplier_code or "<unknown>", exc, exc_info=exc)
+    report["suppliers_failed"] += 1
+    report["errors"].append(
+        {
+            "supplier_code": supplier_code or "<unknown>",
+            "message": str(exc),
+        }
+    )
+
+
+async def _handle_blocked_supplier(
+    session: AsyncSession,
+    ent: DropshipEnterprise,
+    report: dict[str, Any],
+) -> bool:
+    """
+    Если поставщик заблокирован по расписанию - чистит его offers и возвращает True.
+    """
+    supplier_code = str(getattr(ent, "code", "") or "")
+    if not await is_supplier_blocked(session, supplier_code, supplier=ent):
+        return False
+
+    logger.info(
+        "Поставщик %s заблокирован по расписанию. Удаляем старые offers.",
+        supplier_code,
+    )
+    try:
+        deleted = await clear_offers_for_supplier(session, supplier_code)
+        if supplier_code:
+            report["_cleared_suppliers"].add(supplier_code)
+        logger.info(
+            "Для заблокированного поставщика %s удалено %s offers.",
+            supplier_code,
+            deleted,
+        )
+        await session.commit()
+        report["suppliers_blocked"] += 1
+    except Exception as exc:
+        logger.exception(
+            "Не удалось удалить offers для заблокированного поставщика %s: %s",
+            supplier_code,
+            exc,
+        )
+        await session.rollback()
+        report["suppliers_failed"] += 1
+        report["errors"].append(
+            {
+                "supplier_code": supplier_code or "<unknown>",
+                "message": f"Blocked supplier cleanup failed: {exc}",
+            }
+        )
+    return True
+
+
+async def _fetch_supplier_raw_items(ent: DropshipEnterprise) -> tuple[List[dict], float]:
+    """
+    Скачивает и парсит фид поставщика вне основной сессии.
+    Отдельная сессия открывается только для парсеров, которые её принимают.
+    """
+    parser = PARSERS.get(ent.code, parse_feed_stock_to_json_template)
+    started = perf_counter()
+    if "session" in inspect.signature(parser).parameters:
+        async with get_async_db(commit_on_exit=False) as fetch_session:
+            raw_items = await _call_parser_kw(parser, fetch_session, ent)
+    else:
+        raw_items = await _call_parser_kw(parser, None, ent)
+    return raw_items, perf_counter() - started
+
+
+async def _refresh_suppliers_parallel(
+    session: AsyncSession,
+    suppliers: List[DropshipEnterprise],
+    pricing_snapshot: BusinessPricingSettingsSnapshot,
+    report: dict[str, Any],
+) -> None:
+    """
+    Параллельный режим refresh: фиды скачиваются/парсятся конкурентно
+    (не больше DROPSHIP_FETCH_CONCURRENCY одновременно), а запись offers
+    идёт последовательно в основной сессии по мере готовности фидов,
+    с commit на каждого поставщика, как в последовательном режиме.
+    """
+    active: List[DropshipEnterprise] = []
+    for ent in suppliers:
+        supplier_code = str(getattr(ent, "code", "") or "")
+        try:
+            if not await _handle_blocked_supplier(session, ent, report):
+                active.append(ent)
+        except Exception as exc:
+            _record_supplier_failure(report, supplier_code, exc)
+            await session.rollback()
+
+    semaphore = asyncio.Semaphore(_parallel_fetch_concurrency())
+
+    async def fetch(ent: DropshipEnterprise):
+        async with semaphore:
+            try:
+                raw_items, fetch_sec = await _fetch_supplier_raw_items(ent)
+                return ent, raw_items, fetch_sec, None
+            except Exception as exc:
+                return ent, None, 0.0, exc
+
+    for next_done in asyncio.as_completed([fetch(ent) for ent in active]):
+        ent, raw_items, fetch_sec, fetch_error = await next_done
+        supplier_code = str(getattr(ent, "code", "") or "")
+        if fetch_error is not None:
+            _record_supplier_failure(report, supplier_code, fetch_error)
+            continue
+        try:
+            if supplier_code:
+                report["_cleared_suppliers"].add(supplier_code)
+            timings: dict[str, float] = {"fetch_sec": round(fetch_sec, 3)}
+            await process_supplier(
+                session,
+                ent,
+                PARSERS,
+                pricing_snapshot,
+                raw_items=raw_items,
+                timings=timings,
+            )
+            await session.commit()
+            report["supplier_timings"][supplier_code or "<unknown>"] = timings
+            report["suppliers_processed"] += 1
+        except Exception as exc:
+            _record_supplier_failure(report, supplier_code, exc)
+            await session.rollback()
+
+
 async def refresh_business_offers(
     enterprise_code: Optional[str] = None,
     *,
@@ -794,8 +902,6 @@ async def fetch_active_enterprises(session: AsyncSession) -> List[DropshipEnterp
 # --------------------------------------------------------------------------------------
 # 2) Маппинг supplier item -> product_code
 # --------------------------------------------------------------------------------------
-CATALOG_MAPPING_ID_COL = "ID"  # у вас именно так (UPPER)
-
 def _use_master_mapping_for_stock() -> bool:
     return os.getenv("USE_MASTER_MAPPING_FOR_STOCK", "0").strip().lower() in {"1", "true", "yes", "on"}
 
@@ -853,30 +959,13 @@ async def _map_supplier_codes_legacy(
     Возвращаем [{"product_code": <ID>, "qty": ..., "price_retail": ..., "price_opt": ...}, ...]
     """
     mapped: List[dict] = []
-    column_name = f'Code_{supplier_code}'
 
-    # 1. собираем все уникальные коды поставщика
-    codes_set = {it.get("code_sup") for it in items if it.get("code_sup")}
-    if not codes_set:
+    # 1. есть ли вообще коды поставщика
+    if not any(it.get("code_sup") for it in items):
         return []
 
-    # 2. одним запросом вытягиваем все соответствия
-    sql = text(f'''
-        SELECT "{CATALOG_MAPPING_ID_COL}" AS id,
-               "{column_name}" AS code_sup
-        FROM catalog_mapping
-        WHERE "{column_name}" = ANY(:codes)
-    ''')
-    res = await session.execute(sql, {"codes": list(codes_set)})
-    rows = res.fetchall()
-
-    # 3. строим dict code_sup -> ID
-    code_to_id: Dict[str, str] = {}
-    for r in rows:
-        m = r._mapping
-        cs = str(m["code_sup"])
-        pid = str(m["id"])
-        code_to_id[cs] = pid
+    # 2-3. индекс code_sup -> ID (кешируется до изменения catalog_mapping)
+    code_to_id = (await get_legacy_mapping_index(session, supplier_code)).lookup
 
     # 4. собираем результирующий список, сохраняя логику и порядок
     for it in items:
@@ -923,44 +1012,13 @@ async def _map_supplier_codes_master(
         )
         return await _map_supplier_codes_legacy(session, supplier_code, items)
 
-    normalized_codes: List[str] = []
-    seen_codes: set[str] = set()
-    for item in items:
-        code_sup = str(item.get("code_sup") or "").strip()
-        if not code_sup or code_sup in seen_codes:
-            continue
-        seen_codes.add(code_sup)
-        normalized_codes.append(code_sup)
-
-    if not normalized_codes:
+    if not any(str(item.get("code_sup") or "").strip() for item in items):
         logger.info("Supplier %s: master mapping backend skipped, no code_sup values", supplier_code)
         return []
 
-    stmt = (
-        select(
-            CatalogSupplierMapping.supplier_code,
-            CatalogSupplierMapping.sku,
-            MasterCatalog.is_archived,
-        )
-        .join(MasterCatalog, MasterCatalog.sku == CatalogSupplierMapping.sku)
-        .where(
-            CatalogSupplierMapping.supplier_id == supplier_id,
-            CatalogSupplierMapping.supplier_code.in_(normalized_codes),
-            CatalogSupplierMapping.is_active.is_(True),
-        )
-    )
-    rows = (await session.execute(stmt)).all()
-
-    active_lookup: Dict[str, str] = {}
-    archived_codes: set[str] = set()
-    for supplier_item_code, sku, is_archived in rows:
-        code_sup = str(supplier_item_code or "").strip()
-        if not code_sup:
-            continue
-        if bool(is_archived):
-            archived_codes.add(code_sup)
-            continue
-        active_lookup[code_sup] = str(sku)
+    index = await get_master_mapping_index(session, supplier_code, supplier_id)
+    active_lookup = index.lookup
+    archived_codes = index.archived
 
     mapped: List[dict] = []
     missing_count = 0
@@ -1049,20 +1107,12 @@ async def fetch_active_offer_blocks(
 # --------------------------------------------------------------------------------------
 async def fetch_competitor_price(session: AsyncSession, product_code: str, city: str) -> Optional[Decimal]:
     """
-    ВАЖНО: в вашей таблице competitor_prices поле кода — 'code', а не 'product_code'.
-    Полей времени нет — берём первую запись (LIMIT 1).
+    Цена конкурента из общего версионированного индекса (competitor_price_index):
+    без отдельного SELECT на каждую пару (code, city).
     """
-    q = (
-        select(CompetitorPrice.competitor_price)
-        .where(
-            CompetitorPrice.code == product_code,
-            CompetitorPrice.city == city
-        )
-        .limit(1)
-    )
-    res = await session.execute(q)
-    row = res.first()
-    return _to_decimal(row[0]) if row else None
+    index = await get_competitor_price_index(session)
+    price = index.get(str(product_code), city)
+    return _to_decimal(price) if price is not None else None
 
 
 
@@ -1583,21 +1633,38 @@ async def process_supplier(
     ent: DropshipEnterprise,
     parser_registry: Dict[str, ParserFn],
     pricing_snapshot: BusinessPricingSettingsSnapshot,
+    *,
+    raw_items: Optional[List[dict]] = None,
+    timings: Optional[dict[str, float]] = None,
 ) -> None:
+    """
+    Пересчитывает offers одного поставщика.
+
+    raw_items - уже скачанный и распарсенный фид (параллельный refresh);
+    если не передан, парсер вызывается здесь же.
+    timings - если передан, заполняется fetch_sec / map_sec / write_sec.
+    """
+    if timings is None:
+        timings = {}
     code = ent.code
     parser = parser_registry.get(code, parse_feed_stock_to_json_template)
     # <<< ДОБАВЛЕНО: полная очистка старых офферов поставщика
     await clear_offers_for_supplier(session, code)
 
     # 5.1 сырые данные из парсера (именованно: code=<ent.code>, timeout=20, + session/enterprise если поддерживаются)
-    raw_items = await _call_parser_kw(parser, session, ent)
+    if raw_items is None:
+        stage_started = perf_counter()
+        raw_items = await _call_parser_kw(parser, session, ent)
+        timings["fetch_sec"] = round(perf_counter() - stage_started, 3)
     if not raw_items:
         logger.info("Supplier %s: parser returned no items.", code)
         return
 
     # 5.2 маппинг кодов (Code_<supplier> -> ID из catalog_mapping."ID")
+    stage_started = perf_counter()
     mapped = await map_supplier_codes(session, code, raw_items)
     if not mapped:
+        timings["map_sec"] = round(perf_counter() - stage_started, 3)
         logger.info("Supplier %s: no mapped items.", code)
         return
 
@@ -1625,6 +1692,8 @@ async def process_supplier(
         filtered_mapped.append(item)
 
     mapped = filtered_mapped
+    timings["map_sec"] = round(perf_counter() - stage_started, 3)
+    stage_started = perf_counter()
     logger.info(
         "Supplier %s: mapped=%d blocked_global=%d blocked_supplier=%d remaining=%d",
         code,
@@ -1662,18 +1731,8 @@ async def process_supplier(
     product_codes_set = {str(it["product_code"]) for it in mapped if it.get("product_code")}
     comp_map: Dict[tuple[str, str], Decimal] = {}
     if product_codes_set:
-        comp_q = (
-            select(CompetitorPrice.code, CompetitorPrice.city, CompetitorPrice.competitor_price)
-            .where(
-                CompetitorPrice.code.in_(product_codes_set),
-                CompetitorPrice.city.in_(cities)
-            )
-        )
-        res = await session.execute(comp_q)
-        for code_val, city_val, price_val in res.fetchall():
-            if price_val is None:
-                continue
-            comp_map[(str(code_val), city_val)] = _to_decimal(price_val)
+        competitor_index = await get_competitor_price_index(session)
+        comp_map = competitor_index.for_cities(product_codes_set, cities)
 
     # Кэш политик балансировщика на город
     balancer_policy_cache: Dict[str, Optional[dict]] = {}
@@ -1914,6 +1973,8 @@ async def process_supplier(
             except Exception:
                 logger.exception("send_notification failed: supplier=%s city=%s", code, city)
 
+    timings["write_sec"] = round(perf_counter() - stage_started, 3)
+
 # --------------------------------------------------------------------------------------
 # 6) Построение "stock"-пакета из offers и отправка в БД-сервис
 # --------------------------------------------------------------------------------------
@@ -8,18 +8,17 @@ import os
 import time
 from typing import Optional, List, Dict, Literal, Any
 
-import httpx
 import xml.etree.ElementTree as ET
 from sqlalchemy import text
 
 from app.database import get_async_db
 from app.services.notification_service import send_notification
+from app.core.http_clients import get_httpx_client
+from app.business.feed_stream_reader import FeedParseError, iter_feed_elements, local_name
 
 # Google Drive
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaIoBaseDownload
+from app.core.google_drive_client import get_drive_client
 
 # Excel
 from openpyxl import load_workbook
@@ -194,13 +193,8 @@ async def _get_profit_percent_by_code(code: str) -> float:
     return val
 
 
-async def _load_feed_root(*, code: str, timeout: int, feed_url: Optional[str] = None) -> Optional[ET.Element]:
-    """
-    Получение XML фида:
-    1) берём feed_url из БД по code (или используем переданный feed_url)
-    2) скачиваем XML
-    3) возвращаем корень ElementTree
-    """
+async def _resolve_feed_url(*, code: str, feed_url: Optional[str] = None) -> Optional[str]:
+    """feed_url из параметра или из dropship_enterprises по code."""
     if not feed_url:
         feed_url = await _get_feed_url_by_code(code)
     if not feed_url:
@@ -208,35 +202,53 @@ async def _load_feed_root(*, code: str, timeout: int, feed_url: Optional[str] =
         logger.error(msg)
         send_notification(msg, "Разработчик")
         return None
+    return feed_url
+
+
+def _is_offer_like(tag: str) -> bool:
+    return tag.lower() in ("offer", "item")
+
+
+async def _stream_offer_rows(
+    feed_url: str,
+    *,
+    timeout: int,
+    build_row,
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Потоково читает фид и строит строки через build_row(offer).
 
+    Семантика выбора узлов как раньше: берём <offer>, а если их в фиде нет -
+    все элементы, похожие на товары (offer/item без учёта регистра).
+    Возвращает None при ошибке загрузки/парсинга (уведомление уже отправлено).
+    """
     headers = {"User-Agent": "Mozilla/5.0"}
+    offer_rows: List[Dict[str, Any]] = []
+    fallback_rows: List[Dict[str, Any]] = []
+    has_offers = False
     try:
-        async with httpx.AsyncClient(headers=headers, timeout=timeout) as client:
-            resp = await client.get(feed_url)
-            resp.raise_for_status()
-            xml_text = resp.text
-    except Exception as e:
-        msg = f"Ошибка загрузки фида {feed_url}: {e}"
+        async for node in iter_feed_elements(feed_url, _is_offer_like, timeout=timeout, headers=headers):
+            is_offer = local_name(node.tag) == "offer"
+            has_offers = has_offers or is_offer
+            row = build_row(node)
+            if row is None:
+                continue
+            if is_offer:
+                offer_rows.append(row)
+            if not has_offers:
+                fallback_rows.append(row)
+    except FeedParseError as e:
+        msg = f"Ошибка парсинга XML из {feed_url}: {e}"
         logger.exception(msg)
         send_notification(msg, "Разработчик")
         return None
-
-    try:
-        return ET.fromstring(xml_text)
     except Exception as e:
-        msg = f"Ошибка парсинга XML из {feed_url}: {e}"
+        msg = f"Ошибка загрузки фида {feed_url}: {e}"
         logger.exception(msg)
         send_notification(msg, "Разработчик")
         return None
 
-
-def _collect_offer_nodes(root: ET.Element) -> List[ET.Element]:
-    """Собираем узлы <offer> из фида."""
-    offers = root.findall(".//offer")
-    if not offers:
-        # Фолбек: возьмём элементы, похожие на товары
-        offers = [el for el in root.iter() if el.tag.lower() in ("offer", "item")]
-    return offers
+    return offer_rows if has_offers else fallback_rows
 
 
 # === GOOGLE DRIVE / EXCEL ДЛЯ КАТАЛОГА D5 ===
@@ -254,11 +266,7 @@ async def _connect_to_google_drive():
         send_notification(msg, "Разработчик")
         raise FileNotFoundError(msg)
 
-    credentials = service_account.Credentials.from_service_account_file(
-        creds_path,
-        scopes=["https://www.googleapis.com/auth/drive"],
-    )
-    service = build("drive", "v3", credentials=credentials)
+    service = get_drive_client(creds_path)
     logger.info("Подключено к Google Drive")
     return service
 
@@ -269,16 +277,7 @@ async def _fetch_single_file_metadata(drive_service, folder_id: str) -> Dict[str
     По условию задачи в папке всегда один файл.
     """
     try:
-        results = (
-            drive_service.files()
-            .list(
-                q=f"'{folder_id}' in parents and trashed=false",
-                fields="files(id, name)",
-                pageSize=10,
-            )
-            .execute()
-        )
-        files = results.get("files", []) or []
+        files = await drive_service.list_files(folder_id, page_size=10, limit=1)
         if not files:
             raise FileNotFoundError(f"В папке {folder_id} нет файлов")
         return files[0]
@@ -294,14 +293,7 @@ async def _download_file_bytes(drive_service, file_id: str) -> bytes:
     Загружает файл с Google Drive в bytes.
     """
     try:
-        request = drive_service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            _, done = downloader.next_chunk()
-        fh.seek(0)
-        return fh.read()
+        return await drive_service.download_bytes(file_id)
     except HttpError as e:
         msg = f"HTTP ошибка при загрузке файла {file_id}: {e}"
         logger.exception(msg)
@@ -438,10 +430,9 @@ async def _download_xlsx_bytes(url: str, *, timeout: int = 30) -> bytes:
     """Скачивает XLSX по URL и возвращает bytes."""
     headers = {"User-Agent": "Mozilla/5.0"}
     try:
-        async with httpx.AsyncClient(headers=headers, timeout=timeout) as client:
-            resp = await client.get(url)
-            resp.raise_for_status()
-            return resp.content
+        resp = await get_httpx_client().get(url, headers=headers, timeout=timeout)
+        resp.raise_for_status()
+        return resp.content
     except Exception as e:
         msg = f"Ошибка загрузки XLSX прайса опта {url}: {e}"
         logger.exception(msg)
@@ -583,8 +574,8 @@ async def parse_feed_stock_to_json(
     ent_feed_url = None
     if enterprise is not None and getattr(enterprise, "feed_url", None):
         ent_feed_url = str(getattr(enterprise, "feed_url"))
-    root = await _load_feed_root(code=code, timeout=timeout, feed_url=ent_feed_url)
-    if root is None:
+    feed_url = await _resolve_feed_url(code=code, feed_url=ent_feed_url)
+    if feed_url is None:
         return "[]"
 
     # Наценка для розницы из dropship_enterprises.retail_markup (в процентах)
@@ -633,13 +624,11 @@ async def parse_feed_stock_to_json(
         # Если прайс не скачался/не распарсился — просто работаем по старому алгоритму
         wholesale_map = {}
 
-    rows: List[Dict[str, Any]] = []
-
-    for offer in _collect_offer_nodes(root):
+    def _build_row(offer: ET.Element) -> Optional[Dict[str, Any]]:
         vendor_code = _extract_offer_vendor_code(offer)
         if not vendor_code:
             # Без vendorCode — пропускаем
-            continue
+            return None
 
         # Новый XML D5 может передавать пустой available, поэтому наличие считаем автономно.
         price_raw = _get_text(offer, ["price"])
@@ -648,7 +637,7 @@ async def parse_feed_stock_to_json(
 
         # Игнорируем позиции с нулевым или отрицательным остатком
         if qty <= 0:
-            continue
+            return None
 
         # Дополнительные поля нового XML читаем здесь, чтобы не ломать парсинг актуальной структуры.
         _extract_offer_vendor(offer)
@@ -686,14 +675,16 @@ async def parse_feed_stock_to_json(
         price_opt_int = int(price_opt)
         price_retail_int = int(adjusted_price)
 
-        rows.append(
-            {
-                "code_sup": str(vendor_code).strip(),
-                "qty": qty,
-                "price_retail": price_retail_int,
-                "price_opt": price_opt_int,
-            }
-        )
+        return {
+            "code_sup": str(vendor_code).strip(),
+            "qty": qty,
+            "price_retail": price_retail_int,
+            "price_opt": price_opt_int,
+        }
+
+    rows = await _stream_offer_rows(feed_url, timeout=timeout, build_row=_build_row)
+    if rows is None:
+        return "[]"
 
     logger.info("Сток %s: собрано позиций: %d", code, len(rows))
     return json.dumps(rows, ensure_ascii=False, indent=2)
@@ -17,10 +17,8 @@ from app.database import get_async_db
 from app.services.notification_service import send_notification
 
 # Google Drive
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaIoBaseDownload
+from app.core.google_drive_client import get_drive_client
 
 # Excel
 from openpyxl import load_workbook
@@ -130,11 +128,7 @@ async def _connect_to_google_drive():
         send_notification(msg, "Разработчик")
         raise FileNotFoundError(msg)
 
-    credentials = service_account.Credentials.from_service_account_file(
-        creds_path,
-        scopes=["https://www.googleapis.com/auth/drive"],
-    )
-    service = build("drive", "v3", credentials=credentials)
+    service = get_drive_client(creds_path)
     logger.info("Подключено к Google Drive")
     return service
 
@@ -145,16 +139,7 @@ async def _fetch_single_file_metadata(drive_service, folder_id: str) -> Dict[str
     По условию задачи в папке всегда один файл.
     """
     try:
-        results = (
-            drive_service.files()
-            .list(
-                q=f"'{folder_id}' in parents and trashed=false",
-                fields="files(id, name)",
-                pageSize=10,
-            )
-            .execute()
-        )
-        files = results.get("files", []) or []
+        files = await drive_service.list_files(folder_id, page_size=10, limit=1)
         if not files:
             raise FileNotFoundError(f"В папке {folder_id} нет файлов")
         return files[0]
@@ -170,14 +155,7 @@ async def _download_file_bytes(drive_service, file_id: str) -> bytes:
     Загружает файл с Google Drive в bytes.
     """
     try:
-        request = drive_service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            _, done = downloader.next_chunk()
-        fh.seek(0)
-        return fh.read()
+        return await drive_service.download_bytes(file_id)
     except HttpError as e:
         msg = f"HTTP ошибка при загрузке файла {file_id}: {e}"
         logger.exception(msg)
@@ -0,0 +1,198 @@
+"""
+Потоковое чтение XML/YML фидов поставщиков.
+
+Вместо `resp.text` + `ET.fromstring` (в памяти одновременно весь текст и всё
+дерево) фид читается чанками и разбирается инкрементально через XMLPullParser:
+наружу отдаются только завершённые элементы нужных тегов (`offer`, `item`, ...),
+а после обработки потребителем элемент очищается и отцепляется от родителя.
+
+Существующие extractors (`_build_merged_record`, `_extract_offer_*` и т.п.)
+работают с отдаваемым элементом так же, как с узлом из `root.findall(...)`,
+но обязаны обработать его сразу: после следующей итерации элемент пуст.
+
+Если установлен lxml (и не выключен FEED_XML_USE_LXML=0), используется его
+XMLPullParser; иначе - стандартный xml.etree.ElementTree.
+"""
+from __future__ import annotations
+
+import io
+import os
+import xml.etree.ElementTree as ET
+from typing import AsyncIterator, BinaryIO, Callable, Iterable, Iterator, Optional, Union
+
+from app.core.http_clients import get_httpx_client
+
+try:  # pragma: no cover - зависит от окружения
+    from lxml import etree as _lxml_etree
+except ImportError:  # pragma: no cover
+    _lxml_etree = None
+
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+TagMatcher = Union[Iterable[str], Callable[[str], bool]]
+
+
+class FeedParseError(ValueError):
+    """Ошибка разбора XML фида (независимо от backend-а)."""
+
+
+def local_name(tag) -> str:
+    """Имя тега без namespace: '{ns}offer' -> 'offer'."""
+    if not isinstance(tag, str):
+        return ""
+    return tag.rsplit("}", 1)[-1] if "}" in tag else tag
+
+
+def _use_lxml() -> bool:
+    if _lxml_etree is None:
+        return False
+    return (os.getenv("FEED_XML_USE_LXML", "1") or "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _build_matcher(tags: TagMatcher) -> Callable[[str], bool]:
+    if callable(tags):
+        return tags
+    wanted = {str(tag) for tag in tags}
+    return lambda name: name in wanted
+
+
+def _new_pull_parser():
+    if _use_lxml():
+        return _lxml_etree.XMLPullParser(
+            events=("start", "end"),
+            huge_tree=True,
+            remove_comments=True,
+            remove_pis=True,
+        )
+    return ET.XMLPullParser(events=("start", "end"))
+
+
+class StreamingElementReader:
+    """
+    Инкрементальный разборщик: feed(chunk) -> завершённые элементы нужных тегов.
+
+    Хранит стек открытых элементов, чтобы после обработки отцепить элемент от
+    родителя (elem.clear() сам по себе оставляет пустые узлы в дереве).
+    """
+
+    def __init__(self, tags: TagMatcher):
+        self._matches = _build_matcher(tags)
+        self._parser = _new_pull_parser()
+        self._stack: list = []
+
+    def _drain(self) -> list[tuple]:
+        ready: list[tuple] = []
+        try:
+            events = list(self._parser.read_events())
+        except Exception as exc:
+            raise FeedParseError(str(exc)) from exc
+        for event, elem in events:
+            if event == "start":
+                self._stack.append(elem)
+                continue
+            if self._stack:
+                self._stack.pop()
+            if self._matches(local_name(elem.tag)):
+                parent = self._stack[-1] if self._stack else None
+                ready.append((elem, parent))
+        return ready
+
+    def feed(self, chunk: bytes) -> list[tuple]:
+        try:
+            self._parser.feed(chunk)
+        except Exception as exc:
+            raise FeedParseError(str(exc)) from exc
+        return self._drain()
+
+    def close(self) -> list[tuple]:
+        try:
+            self._parser.close()
+        except Exception as exc:
+            raise FeedParseError(str(exc)) from exc
+        return self._drain()
+
+
+def release_element(elem, parent=None) -> None:
+    """Очищает обработанный элемент и отцепляет его от родителя."""
+    elem.clear()
+    if parent is not None:
+        try:
+            parent.remove(elem)
+        except ValueError:
+            pass
+
+
+def iter_xml_elements(
+    source: Union[bytes, BinaryIO],
+    tags: TagMatcher,
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    limit: int = 0,
+) -> Iterator:
+    """
+    Синхронный вариант для уже скачанных bytes или файловых объектов
+    (в т.ч. член zip-архива из ZipFile.open).
+    limit > 0 - остановиться после N элементов, не дочитывая источник.
+    """
+    stream = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+    reader = StreamingElementReader(tags)
+    yielded = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        for elem, parent in reader.feed(chunk):
+            yield elem
+            release_element(elem, parent)
+            yielded += 1
+            if limit > 0 and yielded >= limit:
+                return
+    for elem, parent in reader.close():
+        yield elem
+        release_element(elem, parent)
+        yielded += 1
+        if limit > 0 and yielded >= limit:
+            return
+
+
+async def iter_feed_elements(
+    url: str,
+    tags: TagMatcher,
+    *,
+    timeout: float = 60,
+    headers: Optional[dict] = None,
+    follow_redirects: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    limit: int = 0,
+) -> AsyncIterator:
+    """
+    Скачивает фид по URL потоково и отдаёт завершённые элементы нужных тегов.
+
+    limit > 0 - после N элементов загрузка прерывается и соединение закрывается.
+    Ошибки HTTP пробрасываются как httpx.HTTPError, ошибки XML - как FeedParseError.
+    """
+    client = get_httpx_client()
+    reader = StreamingElementReader(tags)
+    yielded = 0
+    async with client.stream(
+        "GET",
+        url,
+        headers=headers,
+        timeout=timeout,
+        follow_redirects=follow_redirects,
+    ) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes(chunk_size):
+            for elem, parent in reader.feed(chunk):
+                yield elem
+                release_element(elem, parent)
+                yielded += 1
+                if limit > 0 and yielded >= limit:
+                    return
+    for elem, parent in reader.close():
+        yield elem
+        release_element(elem, parent)
+        yielded += 1
+        if limit > 0 and yielded >= limit:
+            return
@@ -17,10 +17,8 @@ from app.database import get_async_db
 from app.services.notification_service import send_notification
 
 # Google Drive
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaIoBaseDownload
+from app.core.google_drive_client import get_drive_client
 
 # Excel xlsx
 from openpyxl import load_workbook
@@ -129,11 +127,7 @@ async def _connect_to_google_drive():
         send_notification(msg, "Разработчик")
         raise FileNotFoundError(msg)
 
-    credentials = service_account.Credentials.from_service_account_file(
-        creds_path,
-        scopes=["https://www.googleapis.com/auth/drive"],
-    )
-    service = build("drive", "v3", credentials=credentials)
+    service = get_drive_client(creds_path)
     logger.info("D11: Подключено к Google Drive")
     return service
 
@@ -143,20 +137,10 @@ async def _fetch_latest_file_metadata(drive_service, folder_id: str) -> Dict[str
     Берём самый свежий файл в папке (по modifiedTime).
     """
     try:
-        results = (
-            drive_service.files()
-            .list(
-                q=f"'{folder_id}' in parents and trashed=false",
-                fields="files(id, name, modifiedTime, mimeType)",
-                orderBy="modifiedTime desc",
-                pageSize=1,
-            )
-            .execute()
-        )
-        files = results.get("files", []) or []
-        if not files:
+        file_meta = await drive_service.latest_file(folder_id)
+        if not file_meta:
             raise FileNotFoundError(f"D11: В папке {folder_id} нет файлов")
-        return files[0]
+        return file_meta
     except HttpError as e:
         msg = f"D11: HTTP ошибка при получении файлов из папки {folder_id}: {e}"
         logger.exception(msg)
@@ -166,14 +150,7 @@ async def _fetch_latest_file_metadata(drive_service, folder_id: str) -> Dict[str
 
 async def _download_file_bytes(drive_service, file_id: str) -> bytes:
     try:
-        request = drive_service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            _, done = downloader.next_chunk()
-        fh.seek(0)
-        return fh.read()
+        return await drive_service.download_bytes(file_id)
     except HttpError as e:
         msg = f"D11: HTTP ошибка при загрузке файла {file_id}: {e}"
         logger.exception(msg)
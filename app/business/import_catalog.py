@@ -3,14 +3,10 @@ import os
 import io
 from typing import List, Dict, Any, Optional
 import json  # ← добавь наверху файла
-import httpx
 import xml.etree.ElementTree as ET
 from sqlalchemy import and_, or_, case
 import pandas as pd
 from dotenv import load_dotenv
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
 from googleapiclient.errors import HttpError
 from pathlib import Path
 from datetime import datetime
@@ -19,7 +15,10 @@ from sqlalchemy.ext.asyncio import AsyncSession  # type: ignore[import]
 
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 
+from app.core.dataframe_conversion import clean_str, column_or_default, read_excel_frame, to_records
+from app.core.google_drive_client import get_drive_client
 from app.database import get_async_db, EnterpriseSettings, MappingBranch, CatalogMapping
+from app.business.feed_stream_reader import iter_feed_elements, iter_xml_elements
 from app.services.notification_service import send_notification
 
 from sqlalchemy import update, text  # ← было только update
@@ -253,11 +252,7 @@ async def _connect_to_google_drive():
         send_notification(msg, "Разработчик")
         raise FileNotFoundError(msg)
 
-    credentials = service_account.Credentials.from_service_account_file(
-        creds_path,
-        scopes=["https://www.googleapis.com/auth/drive"],
-    )
-    service = build("drive", "v3", credentials=credentials)
+    service = get_drive_client(creds_path)
     logger.info("Подключено к Google Drive")
     return service
 
@@ -268,16 +263,7 @@ async def _fetch_single_file_metadata(drive_service, folder_id: str) -> Dict[str
     По условию задачи в папке всегда один файл.
     """
     try:
-        results = (
-            drive_service.files()
-            .list(
-                q=f"'{folder_id}' in parents and trashed=false",
-                fields="files(id, name)",
-                pageSize=10,
-            )
-            .execute()
-        )
-        files = results.get("files", []) or []
+        files = await drive_service.list_files(folder_id, page_size=10, limit=1)
         if not files:
             raise FileNotFoundError("В папке нет файлов")
         # Так как файл один — берем первый
@@ -294,14 +280,7 @@ async def _download_file_bytes(drive_service, file_id: str) -> bytes:
     Загружает файл с Google Drive в bytes.
     """
     try:
-        request = drive_service.files().get_media(fileId=file_id)
-        fh = io.BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            _, done = downloader.next_chunk()
-        fh.seek(0)
-        return fh.read()
+        return await drive_service.download_bytes(file_id)
     except HttpError as e:
         msg = f"HTTP ошибка при загрузке файла {file_id}: {e}"
         logger.exception(msg)
@@ -323,26 +302,21 @@ def parse_catalog_xlsx(file_bytes: bytes, filename: str) -> List[Dict[str, Any]]
     Выходные ключи для БД:
       ID, Name, Producer, Guid, Barcode, Code_Tabletki
     """
-    df = pd.read_excel(io.BytesIO(file_bytes), dtype=str)
-
-    rows: List[Dict[str, Any]] = []
-    for _, r in df.iterrows():
-        id_val = (r.get("Товар.Код") or "").strip()
-        if not id_val:
-            # пропускаем строку без ключа
-            continue
-
-        row = {
-            "ID": id_val,
-            "Name": (r.get("Товар.Наименование (укр.)") or "").strip(),
-            "Producer": (r.get("Товар.Производитель.Наименование") or "").strip(),
-            "Guid": (r.get("ГУИД") or "").strip(),
-            "Barcode": (r.get("Код ШК") or "").strip(),
-            "Code_Tabletki": ""
-        }
-        rows.append(row)
+    df = read_excel_frame(io.BytesIO(file_bytes), dtype=str)
 
-    return rows
+    rows = pd.DataFrame(
+        {
+            "ID": clean_str(column_or_default(df, "Товар.Код")),
+            "Name": clean_str(column_or_default(df, "Товар.Наименование (укр.)")),
+            "Producer": clean_str(column_or_default(df, "Товар.Производитель.Наименование")),
+            "Guid": clean_str(column_or_default(df, "ГУИД")),
+            "Barcode": clean_str(column_or_default(df, "Код ШК")),
+            "Code_Tabletki": "",
+        },
+        index=df.index,
+    )
+    # пропускаем строки без ключа
+    return to_records(rows[rows["ID"].ne("")])
 
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -435,12 +409,34 @@ async def _get_salesdrive_public_key(enterprise_code: str) -> str:
     return public_key
 
 
-async def _download_salesdrive_yml(public_key: str) -> bytes:
-    url = SALESDRIVE_YML_URL_TEMPLATE.format(public_key=public_key)
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url, headers={"accept": "application/xml"}, timeout=120)
-        resp.raise_for_status()
-        return resp.content
+def _salesdrive_yml_url(public_key: str) -> str:
+    return SALESDRIVE_YML_URL_TEMPLATE.format(public_key=public_key)
+
+
+def _offer_to_catalog_row(elem: ET.Element) -> Optional[Dict[str, Any]]:
+    offer_id = (elem.attrib.get("id") or "").strip()
+    if not offer_id:
+        return None
+
+    def _find_text(tag_name: str) -> str:
+        for ch in list(elem):
+            if _strip_ns(ch.tag) == tag_name:
+                return (ch.text or "").strip()
+        return ""
+
+    name_ua = _find_text("name_ua")
+    name = name_ua if name_ua else _find_text("name")
+    vendor = _find_text("vendor")
+    barcode = _find_text("barcode")
+
+    return {
+        "ID": offer_id,
+        "Name": name,
+        "Producer": vendor,
+        "Guid": "",
+        "Barcode": barcode,
+        "Code_Tabletki": "",
+    }
 
 
 def parse_catalog_yml(file_bytes: bytes, filename: str = "export.yml") -> List[Dict[str, Any]]:
@@ -453,54 +449,29 @@ def parse_catalog_yml(file_bytes: bytes, filename: str = "export.yml") -> List[D
       - Barcode   <- barcode
       - Guid / Code_Tabletki: заглушки '' (не обновляем их при upsert)
 
-    Важно: парсинг потоковый (iterparse) + elem.clear(), чтобы не росла память.
+    Важно: парсинг потоковый, обработанные offer освобождаются, чтобы не росла память.
     """
     rows: List[Dict[str, Any]] = []
-
-    # iterparse на BytesIO, освобождаем элементы по мере чтения
-    context = ET.iterparse(io.BytesIO(file_bytes), events=("end",))
-    for event, elem in context:
-        if _strip_ns(elem.tag) != "offer":
-            continue
-
-        offer_id = (elem.attrib.get("id") or "").strip()
-        if not offer_id:
-            elem.clear()
-            continue
-
-        def _find_text(tag_name: str) -> str:
-            for ch in list(elem):
-                if _strip_ns(ch.tag) == tag_name:
-                    return (ch.text or "").strip()
-            return ""
-
-        name_ua = _find_text("name_ua")
-        name = name_ua if name_ua else _find_text("name")
-        vendor = _find_text("vendor")
-        barcode = _find_text("barcode")
-
-        rows.append(
-            {
-                "ID": offer_id,
-                "Name": name,
-                "Producer": vendor,
-                "Guid": "",
-                "Barcode": barcode,
-                "Code_Tabletki": "",
-            }
-        )
-
-        # освобождаем память
-        elem.clear()
-
+    for elem in iter_xml_elements(file_bytes, ("offer",)):
+        row = _offer_to_catalog_row(elem)
+        if row is not None:
+            rows.append(row)
     return rows
 
 
 async def load_catalog_from_salesdrive_yml(enterprise_code: str) -> Dict[str, Any]:
-    """Скачивает YML по publicKey из БД и парсит в rows."""
+    """Читает YML по publicKey из БД потоково (без буфера всего ответа) и парсит в rows."""
     public_key = await _get_salesdrive_public_key(enterprise_code)
-    yml_bytes = await _download_salesdrive_yml(public_key)
-    rows = parse_catalog_yml(yml_bytes, filename="export.yml")
+    rows: List[Dict[str, Any]] = []
+    async for elem in iter_feed_elements(
+        _salesdrive_yml_url(public_key),
+        ("offer",),
+        headers={"accept": "application/xml"},
+        timeout=120,
+    ):
+        row = _offer_to_catalog_row(elem)
+        if row is not None:
+            rows.append(row)
     return {"file_name": "export.yml", "rows": rows}
 
 async def export_catalog_mapping_to_json_and_process(
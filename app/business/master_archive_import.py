@@ -1,10 +1,9 @@
 import argparse
 import asyncio
-import io
 import json
 import logging
 import os
-import xml.etree.ElementTree as ET
+from contextlib import aclosing
 from dataclasses import dataclass
 from typing import Any, Dict, List, Set
 
@@ -12,6 +11,7 @@ import httpx
 from dotenv import load_dotenv
 from sqlalchemy import select, update
 
+from app.business.feed_stream_reader import iter_feed_elements
 from app.database import get_async_db
 from app.models import MasterCatalog
 
@@ -52,35 +52,21 @@ def _get_archive_yml_url() -> str:
     return value or DEFAULT_MASTER_ARCHIVE_YML_URL
 
 
-def _xml_local_name(tag: str) -> str:
-    return tag.rsplit("}", 1)[-1] if "}" in tag else tag
-
-
-async def _download_archive_feed(url: str) -> bytes:
-    timeout = httpx.Timeout(60.0, connect=20.0)
-    async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
-        response = await client.get(url)
-        response.raise_for_status()
-        return response.content
-
-
-def _read_archive_skus(yml_bytes: bytes, stats: ArchiveStats, limit: int = 0) -> List[str]:
+async def _read_archive_skus(url: str, stats: ArchiveStats, limit: int = 0) -> List[str]:
+    """Потоково читает YML и собирает уникальные offer/@id (без загрузки фида целиком)."""
     seen: Set[str] = set()
     result: List[str] = []
 
-    for _, elem in ET.iterparse(io.BytesIO(yml_bytes), events=("end",)):
-        if _xml_local_name(elem.tag) != "offer":
-            continue
-
-        sku = (elem.attrib.get("id") or "").strip()
-        if sku and sku not in seen:
-            seen.add(sku)
-            result.append(sku)
-            if limit and len(result) >= limit:
-                elem.clear()
-                break
-
-        elem.clear()
+    timeout = httpx.Timeout(60.0, connect=20.0)
+    offers = iter_feed_elements(url, ("offer",), timeout=timeout, follow_redirects=True)
+    async with aclosing(offers):
+        async for offer in offers:
+            sku = (offer.attrib.get("id") or "").strip()
+            if sku and sku not in seen:
+                seen.add(sku)
+                result.append(sku)
+                if limit and len(result) >= limit:
+                    break
 
     stats.feed_rows = len(result)
     return result
@@ -94,8 +80,7 @@ async def import_master_archive(limit: int = 0) -> Dict[str, Any]:
     logger.info("Загружаем архив master_catalog из SalesDrive YML")
     logger.info("archive_url=%s", archive_url)
 
-    yml_bytes = await _download_archive_feed(archive_url)
-    archive_skus = _read_archive_skus(yml_bytes, stats, limit=limit)
+    archive_skus = await _read_archive_skus(archive_url, stats, limit=limit)
     logger.info("SalesDrive YML offer ids received: %d", stats.feed_rows)
 
     if not archive_skus:
@@ -1,10 +1,11 @@
 import argparse
 import asyncio
 import logging
+import os
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from time import perf_counter
-from typing import Any, Awaitable, Callable, Dict, List, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
 
 from dotenv import load_dotenv
 
@@ -50,18 +51,7 @@ from app.business.d9_barcode_mapping_sync import sync_d9_supplier_mapping_by_bar
 from app.business.d9_master_feed_loader import sync_d9_master_feed
 from app.business.master_archive_import import import_master_archive
 from app.business.master_catalog_coverage_report import build_master_catalog_coverage_report
-from app.business.master_content_fallback_d10_select import select_d10_fallback_content
-from app.business.master_content_fallback_d13_select import select_d13_fallback_content
-from app.business.master_content_fallback_d2_select import select_d2_fallback_content
-from app.business.master_content_fallback_d3_select import select_d3_fallback_content
-from app.business.master_content_fallback_d5_select import select_d5_fallback_content
-from app.business.master_content_select import select_master_content
-from app.business.master_images_fallback_d10_select import select_d10_fallback_main_images
-from app.business.master_images_fallback_d13_select import select_d13_fallback_main_images
-from app.business.master_images_fallback_d2_select import select_d2_fallback_main_images
-from app.business.master_images_fallback_d3_select import select_d3_fallback_main_images
-from app.business.master_images_fallback_d5_select import select_d5_fallback_main_images
-from app.business.master_main_image_select import select_master_main_images
+from app.business.master_enrichment_resolver import resolve_master_enrichment
 from app.business.salesdrive_category_exporter import export_categories_to_salesdrive
 from app.business.salesdrive_master_catalog_exporter import export_master_catalog_to_salesdrive
 from app.business.tabletki_master_catalog_exporter import export_master_catalog_to_tabletki
@@ -75,13 +65,29 @@ logger = logging.getLogger("master_catalog_orchestrator")
 
 AsyncStep = Callable[[], Awaitable[Any]]
 
+TABLETKI_LOADER_STEP = "tabletki_master_catalog_loader"
+MASTER_CATALOG_RESOURCE = "master_catalog"
+ENRICHMENT_RESOLVE_STEP = "master_enrichment_resolve"
+
 
 @dataclass
 class StepResult:
+    """
+    duration_sec - время выполнения шага; wait_sec - сколько шаг ждал свободного слота
+    или ресурса после готовности зависимостей; started_offset_sec - старт от начала прогона.
+    """
+
     name: str
     status: str
     duration_sec: float
     message: Optional[str] = None
+    wait_sec: float = 0.0
+    started_offset_sec: float = 0.0
+    on_critical_path: bool = False
+
+    @property
+    def finished_offset_sec(self) -> float:
+        return self.started_offset_sec + self.duration_sec
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -89,6 +95,9 @@ class StepResult:
             "status": self.status,
             "duration_sec": round(self.duration_sec, 3),
             "message": self.message,
+            "wait_sec": round(self.wait_sec, 3),
+            "started_offset_sec": round(self.started_offset_sec, 3),
+            "on_critical_path": self.on_critical_path,
         }
 
 
@@ -96,8 +105,47 @@ def _utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-def _make_step(name: str, fn: AsyncStep) -> Dict[str, Any]:
-    return {"name": name, "fn": fn}
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name)
+    if raw is None or not raw.strip():
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        return default
+
+
+def _max_parallel_steps() -> int:
+    return max(1, _env_int("MASTER_ORCHESTRATOR_MAX_PARALLEL", 1))
+
+
+def _make_step(
+    name: str,
+    fn: AsyncStep,
+    *,
+    after: Optional[Sequence[str]] = None,
+    writes: Sequence[str] = (),
+) -> Dict[str, Any]:
+    """
+    after=None - шаг ждёт все шаги, стоящие в плане перед ним (прежнее последовательное
+    поведение); иначе только перечисленные (отсутствующие в плане игнорируются).
+    writes - ресурсы, которые шаг меняет: шаги с общим ресурсом не выполняются одновременно.
+    """
+    return {
+        "name": name,
+        "fn": fn,
+        "after": tuple(after) if after is not None else None,
+        "writes": tuple(writes),
+    }
+
+
+def _chain(first_after: Sequence[str], *steps: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Шаги выполняются друг за другом; первый ждёт first_after."""
+    previous = tuple(first_after)
+    for step in steps:
+        step["after"] = previous
+        previous = (step["name"],)
+    return list(steps)
 
 
 async def _require_enterprise(enterprise: Optional[str], purpose: str = "salesdrive") -> str:
@@ -117,71 +165,117 @@ async def _require_enterprise(enterprise: Optional[str], purpose: str = "salesdr
 
 
 def _build_tabletki_steps() -> List[Dict[str, Any]]:
-    return [
-        _make_step("tabletki_master_catalog_loader", lambda: load_tabletki_master_catalog(mode="full", limit=0)),
+    return _chain(
+        (),
+        _make_step(
+            TABLETKI_LOADER_STEP,
+            lambda: load_tabletki_master_catalog(mode="full", limit=0),
+            writes=(MASTER_CATALOG_RESOURCE,),
+        ),
         _make_step("catalog_categories_sync", lambda: sync_catalog_categories_from_raw(limit=0)),
-    ]
+    )
 
 
 def _build_suppliers_steps() -> List[Dict[str, Any]]:
-    return [
+    # Цепочки поставщиков не зависят друг от друга; внутри цепочки порядок прежний.
+    after = (TABLETKI_LOADER_STEP,)
+    steps: List[Dict[str, Any]] = []
+    steps += _chain(
+        after,
         _make_step("d6_master_feed_loader", lambda: load_d6_raw_supplier_feed(limit=0)),
         _make_step("d6_barcode_mapping_sync", lambda: sync_d6_supplier_mapping_by_barcode(limit=0)),
-        _make_step("d6_master_dimensions_enrich", lambda: enrich_master_dimensions_from_d6(limit=0)),
+        _make_step(
+            "d6_master_dimensions_enrich",
+            lambda: enrich_master_dimensions_from_d6(limit=0),
+            writes=(MASTER_CATALOG_RESOURCE,),
+        ),
+    )
+    steps += _chain(
+        after,
         _make_step("d1_master_feed_loader", lambda: load_d1_raw_supplier_feed(limit=0)),
         _make_step("d1_barcode_mapping_sync", lambda: sync_d1_supplier_mapping_by_barcode(limit=0)),
         _make_step("d1_images_sync", lambda: sync_d1_images(limit=0)),
         _make_step("d1_content_sync", lambda: sync_d1_content(limit=0)),
+    )
+    steps += _chain(
+        after,
         _make_step("d2_master_feed_loader", lambda: load_d2_raw_supplier_feed(limit=0)),
         _make_step("d2_barcode_mapping_sync", lambda: sync_d2_supplier_mapping_by_barcode(limit=0)),
         _make_step("d2_images_sync", lambda: sync_d2_images(limit=0)),
         _make_step("d2_content_sync", lambda: sync_d2_content(limit=0)),
+    )
+    steps += _chain(
+        after,
         _make_step("d3_master_feed_loader", lambda: load_d3_raw_supplier_feed(limit=0)),
         _make_step("d3_barcode_mapping_sync", lambda: sync_d3_supplier_mapping_by_barcode(limit=0)),
         _make_step("d3_images_sync", lambda: sync_d3_images(limit=0)),
         _make_step("d3_content_sync", lambda: sync_d3_content(limit=0)),
+    )
+    steps += _chain(
+        after,
         _make_step("d5_master_feed_loader", lambda: load_d5_raw_supplier_feed(limit=0)),
         _make_step("d5_barcode_mapping_sync", lambda: sync_d5_supplier_mapping_by_barcode(limit=0)),
         _make_step("d5_images_sync", lambda: sync_d5_images(limit=0)),
         _make_step("d5_content_sync", lambda: sync_d5_content(limit=0)),
+    )
+    steps += _chain(
+        after,
         _make_step("d4_master_feed_loader", lambda: load_d4_raw_supplier_feed(limit=0)),
         _make_step("d4_barcode_mapping_sync", lambda: sync_d4_supplier_mapping_by_barcode(limit=0)),
+    )
+    steps += _chain(
+        after,
         _make_step("d7_master_feed_loader", lambda: load_d7_raw_supplier_feed(limit=0)),
         _make_step("d7_barcode_mapping_sync", lambda: sync_d7_supplier_mapping_by_barcode(limit=0)),
+    )
+    steps += _chain(
+        after,
         _make_step("d8_master_feed_loader", lambda: load_d8_raw_supplier_feed(limit=0)),
         _make_step("d8_barcode_mapping_sync", lambda: sync_d8_supplier_mapping_by_barcode(limit=0)),
+    )
+    steps += _chain(
+        after,
         _make_step("d9_master_feed_loader", lambda: sync_d9_master_feed(limit=0)),
         _make_step("d9_barcode_mapping_sync", lambda: sync_d9_supplier_mapping_by_barcode(limit=0)),
+    )
+    steps += _chain(
+        after,
         _make_step("d11_master_feed_loader", lambda: load_d11_raw_supplier_feed(limit=0)),
         _make_step("d11_barcode_mapping_sync", lambda: sync_d11_supplier_mapping_by_barcode(limit=0)),
+    )
+    steps += _chain(
+        after,
         _make_step("d12_master_feed_loader", lambda: load_d12_raw_supplier_feed(limit=0)),
         _make_step("d12_barcode_mapping_sync", lambda: sync_d12_supplier_mapping_by_barcode(limit=0)),
+    )
+    steps += _chain(
+        after,
         _make_step("d10_master_feed_loader", lambda: load_d10_raw_supplier_feed(limit=0)),
         _make_step("d10_barcode_mapping_sync", lambda: sync_d10_supplier_mapping_by_barcode(limit=0)),
         _make_step("d10_images_sync", lambda: sync_d10_images(limit=0)),
         _make_step("d10_content_sync", lambda: sync_d10_content(limit=0)),
+    )
+    steps += _chain(
+        after,
         _make_step("d13_master_feed_loader", lambda: load_d13_raw_supplier_feed(limit=0)),
         _make_step("d13_barcode_mapping_sync", lambda: sync_d13_supplier_mapping_by_barcode(limit=0)),
         _make_step("d13_images_sync", lambda: sync_d13_images(limit=0)),
         _make_step("d13_content_sync", lambda: sync_d13_content(limit=0)),
-    ]
+    )
+    return steps
+
+
+def _supplier_step_names(suffix: str) -> Tuple[str, ...]:
+    return tuple(step["name"] for step in _build_suppliers_steps() if step["name"].endswith(suffix))
 
 
 def _build_selection_steps() -> List[Dict[str, Any]]:
-    return [
-        _make_step("master_main_image_select", lambda: select_master_main_images(limit=0)),
-        _make_step("master_content_select", lambda: select_master_content(limit=0)),
-        _make_step("master_images_fallback_d2_select", select_d2_fallback_main_images),
-        _make_step("master_content_fallback_d2_select", select_d2_fallback_content),
-        _make_step("master_images_fallback_d3_select", select_d3_fallback_main_images),
-        _make_step("master_content_fallback_d3_select", select_d3_fallback_content),
-        _make_step("master_images_fallback_d5_select", select_d5_fallback_main_images),
-        _make_step("master_content_fallback_d5_select", select_d5_fallback_content),
-        _make_step("master_images_fallback_d10_select", select_d10_fallback_main_images),
-        _make_step("master_content_fallback_d10_select", select_d10_fallback_content),
-        _make_step("master_images_fallback_d13_select", select_d13_fallback_main_images),
-        _make_step("master_content_fallback_d13_select", select_d13_fallback_content),
-    ]
+    # Описания и главная картинка (D1 + fallback D2/D3/D5/D10/D13) выбираются одним
+    # set-based шагом, как только готовы images/content sync поставщиков.
+    return _chain(
+        _supplier_step_names("_images_sync") + _supplier_step_names("_content_sync"),
+        _make_step(ENRICHMENT_RESOLVE_STEP, resolve_master_enrichment, writes=(MASTER_CATALOG_RESOURCE,)),
+    )
 
 
 def _build_archive_steps() -> List[Dict[str, Any]]:
@@ -305,6 +399,98 @@ async def _run_step(step: Dict[str, Any]) -> StepResult:
     )
 
 
+def _resolve_dependencies(steps: List[Dict[str, Any]]) -> Dict[str, Set[str]]:
+    index = {step["name"]: position for position, step in enumerate(steps)}
+    deps: Dict[str, Set[str]] = {}
+    for position, step in enumerate(steps):
+        name = step["name"]
+        if step["after"] is None:
+            deps[name] = {item["name"] for item in steps[:position]}
+            continue
+        deps[name] = {dep for dep in step["after"] if dep in index}
+        for dep in deps[name]:
+            # зависимости только назад по плану: так граф гарантированно без циклов
+            if index[dep] >= position:
+                raise RuntimeError(f"Шаг {name} зависит от шага {dep}, который стоит позже в плане")
+    return deps
+
+
+async def _run_plan(steps: List[Dict[str, Any]], *, max_parallel: int, fail_fast: bool) -> List[StepResult]:
+    """
+    Выполняет план как граф зависимостей: готовый шаг стартует, как только есть свободный
+    слот (max_parallel) и не занят ни один из его writes-ресурсов. Из готовых шагов
+    берётся стоящий раньше в плане, поэтому при max_parallel=1 порядок прежний.
+    Ошибка шага не блокирует зависимые (как и раньше); fail_fast перестаёт запускать
+    новые шаги и дожидается уже запущенных.
+    """
+    deps = _resolve_dependencies(steps)
+    pending = list(steps)
+    finished: Dict[str, StepResult] = {}
+    ready_since: Dict[str, float] = {}
+    busy: Set[str] = set()
+    running: Dict[asyncio.Task, Tuple[Dict[str, Any], float]] = {}
+    plan_started = perf_counter()
+    stop = False
+
+    try:
+        while pending or running:
+            now = perf_counter()
+            for step in pending:
+                if step["name"] not in ready_since and deps[step["name"]] <= finished.keys():
+                    ready_since[step["name"]] = now
+
+            if not stop:
+                for step in list(pending):
+                    if len(running) >= max_parallel:
+                        break
+                    if step["name"] not in ready_since or busy.intersection(step["writes"]):
+                        continue
+                    pending.remove(step)
+                    busy.update(step["writes"])
+                    running[asyncio.create_task(_run_step(step))] = (step, perf_counter())
+
+            if not running:
+                break
+
+            done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                step, started = running.pop(task)
+                busy.difference_update(step["writes"])
+                result = task.result()
+                result.wait_sec = started - ready_since[step["name"]]
+                result.started_offset_sec = started - plan_started
+                finished[step["name"]] = result
+                if fail_fast and result.status == "error":
+                    stop = True
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running.keys(), return_exceptions=True)
+
+    return [finished[step["name"]] for step in steps if step["name"] in finished]
+
+
+def _mark_critical_path(steps: List[Dict[str, Any]], results: List[StepResult]) -> List[str]:
+    """
+    Цепочка зависимостей, закончившаяся последней: от последнего завершившегося шага
+    назад через зависимость, завершившуюся позже остальных.
+    """
+    if not results:
+        return []
+    deps = _resolve_dependencies(steps)
+    by_name = {item.name: item for item in results}
+    current: Optional[StepResult] = max(results, key=lambda item: item.finished_offset_sec)
+    path: List[str] = []
+    while current is not None:
+        current.on_critical_path = True
+        path.append(current.name)
+        candidates = [by_name[dep] for dep in deps[current.name] if dep in by_name]
+        current = max(candidates, key=lambda item: item.finished_offset_sec) if candidates else None
+    path.reverse()
+    return path
+
+
 async def run_master_catalog_orchestrator(
     *,
     mode: str,
@@ -329,17 +515,30 @@ async def run_master_catalog_orchestrator(
         skip_report=skip_report,
     )
 
-    step_results: List[StepResult] = []
-    for step in steps:
-        result = await _run_step(step)
-        step_results.append(result)
-        if fail_fast and result.status == "error":
-            break
+    max_parallel = _max_parallel_steps()
+    plan_started = perf_counter()
+    step_results = await _run_plan(steps, max_parallel=max_parallel, fail_fast=fail_fast)
+    wall_sec = perf_counter() - plan_started
+    critical_path = _mark_critical_path(steps, step_results)
+    critical_path_sec = sum(item.duration_sec for item in step_results if item.on_critical_path)
+    logger.info(
+        "Master orchestrator finished: mode=%s steps=%d max_parallel=%d wall=%.3fs critical_path=%.3fs path=%s",
+        mode,
+        len(step_results),
+        max_parallel,
+        wall_sec,
+        critical_path_sec,
+        " -> ".join(critical_path),
+    )
 
     return {
         "mode": mode,
         "started_at": started_at,
         "finished_at": _utc_now_iso(),
+        "max_parallel": max_parallel,
+        "wall_sec": round(wall_sec, 3),
+        "critical_path": critical_path,
+        "critical_path_sec": round(critical_path_sec, 3),
         "steps": [item.to_dict() for item in step_results],
     }
 
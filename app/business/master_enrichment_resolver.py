@@ -0,0 +1,319 @@
+"""
+Set-based выбор description_ua / description_ru / main_image_url для master_catalog.
+
+Раньше это делали 12 отдельных шагов (master_content_select,
+master_main_image_select и по пять fallback-шагов D2/D3/D5/D10/D13 для
+контента и картинок), каждый - полным проходом по кандидатам с ORM-объектами
+MasterCatalog на каждый sku. Здесь итоговое значение каждого поля считается
+для всех sku сразу (DISTINCT ON по кандидатам каждого поставщика), а в
+master_catalog одним UPDATE ... FROM пишутся только реально изменившиеся строки.
+
+Результат совпадает с последовательным прогоном старых шагов:
+- валидная запись D1 перезаписывает поле (значение без крайних пробелов;
+  если отличается только пробелами - поле не трогается);
+- иначе непустое текущее значение остаётся;
+- иначе берётся первый поставщик из цепочки fallback, у которого есть кандидат
+  (D13 - только для description_ua).
+
+Старые модули оставлены как ручные CLI-инструменты для одного поставщика.
+"""
+import argparse
+import asyncio
+import json
+import logging
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any, Dict
+
+from sqlalchemy import text
+
+from app.business.master_content_fallback_d10_select import D10_SUPPLIER_ID
+from app.business.master_content_fallback_d13_select import D13_SUPPLIER_ID
+from app.business.master_content_fallback_d2_select import D2_SUPPLIER_ID
+from app.business.master_content_fallback_d3_select import D3_SUPPLIER_ID
+from app.business.master_content_fallback_d5_select import D5_SUPPLIER_ID
+from app.business.master_content_select import D1_SUPPLIER_ID
+from app.database import get_async_db
+
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger("master_enrichment_resolver")
+
+# Порядок = приоритет fallback после D1.
+FALLBACK_SUPPLIER_IDS = (D2_SUPPLIER_ID, D3_SUPPLIER_ID, D5_SUPPLIER_ID, D10_SUPPLIER_ID, D13_SUPPLIER_ID)
+UA_ONLY_FALLBACK_SUPPLIER_IDS = (D13_SUPPLIER_ID,)
+
+SUPPLIER_LABELS = {
+    D1_SUPPLIER_ID: "d1",
+    D2_SUPPLIER_ID: "d2",
+    D3_SUPPLIER_ID: "d3",
+    D5_SUPPLIER_ID: "d5",
+    D10_SUPPLIER_ID: "d10",
+    D13_SUPPLIER_ID: "d13",
+}
+
+
+def _strip(expr: str) -> str:
+    # аналог str.strip() из старых шагов
+    return f"regexp_replace({expr}, '^\\s+|\\s+$', '', 'g')"
+
+
+_RESOLVE_SQL = f"""
+CREATE TEMP TABLE tmp_master_enrichment ON COMMIT DROP AS
+WITH
+d1_content AS (
+    SELECT DISTINCT ON (sku, lang) sku, lang, value
+    FROM (
+        SELECT {_strip("cc.sku")} AS sku,
+               {_strip("cc.language_code")} AS lang,
+               {_strip("cc.description")} AS value,
+               cc.is_selected,
+               cc.id
+        FROM catalog_content cc
+        WHERE cc.supplier_id = :d1_supplier_id
+          AND cc.is_active IS TRUE
+    ) src
+    WHERE sku <> '' AND lang IN ('ua', 'ru') AND value <> ''
+    ORDER BY sku, lang, (is_selected IS TRUE) DESC, id
+),
+fallback_content AS (
+    SELECT DISTINCT ON (cc.sku, cc.language_code)
+           cc.sku, cc.language_code AS lang, cc.description AS value, cc.supplier_id
+    FROM catalog_content cc
+    JOIN unnest(CAST(:fallback_supplier_ids AS bigint[])) WITH ORDINALITY AS chain(supplier_id, priority)
+      ON chain.supplier_id = cc.supplier_id
+    WHERE cc.is_active IS TRUE
+      AND cc.description IS NOT NULL AND cc.description <> ''
+      AND (
+          cc.language_code = 'ua'
+          OR (cc.language_code = 'ru' AND cc.supplier_id <> ALL(CAST(:ua_only_supplier_ids AS bigint[])))
+      )
+    ORDER BY cc.sku, cc.language_code, chain.priority, (cc.is_selected IS TRUE) DESC, cc.id
+),
+d1_image AS (
+    SELECT DISTINCT ON (sku) sku, value
+    FROM (
+        SELECT {_strip("ci.sku")} AS sku,
+               {_strip("ci.image_url")} AS value,
+               ci.sort_order,
+               ci.id
+        FROM catalog_images ci
+        WHERE ci.supplier_id = :d1_supplier_id
+          AND ci.is_active IS TRUE
+    ) src
+    WHERE sku <> '' AND value <> ''
+    ORDER BY sku, sort_order ASC, id ASC
+),
+fallback_image AS (
+    SELECT DISTINCT ON (ci.sku) ci.sku, ci.image_url AS value, ci.supplier_id
+    FROM catalog_images ci
+    JOIN unnest(CAST(:fallback_supplier_ids AS bigint[])) WITH ORDINALITY AS chain(supplier_id, priority)
+      ON chain.supplier_id = ci.supplier_id
+    WHERE ci.image_url IS NOT NULL AND ci.image_url <> ''
+    ORDER BY ci.sku, chain.priority, COALESCE(ci.sort_order, 0) ASC, ci.id ASC
+),
+candidates AS (
+    SELECT mc.id,
+           mc.description_ua AS old_ua,
+           mc.description_ru AS old_ru,
+           mc.main_image_url AS old_image,
+           d1_ua.value AS d1_ua,
+           d1_ru.value AS d1_ru,
+           d1_img.value AS d1_image,
+           fb_ua.value AS fb_ua,
+           fb_ua.supplier_id AS fb_ua_supplier_id,
+           fb_ru.value AS fb_ru,
+           fb_ru.supplier_id AS fb_ru_supplier_id,
+           fb_img.value AS fb_image,
+           fb_img.supplier_id AS fb_image_supplier_id
+    FROM master_catalog mc
+    LEFT JOIN d1_content d1_ua ON d1_ua.sku = mc.sku AND d1_ua.lang = 'ua'
+    LEFT JOIN d1_content d1_ru ON d1_ru.sku = mc.sku AND d1_ru.lang = 'ru'
+    LEFT JOIN d1_image d1_img ON d1_img.sku = mc.sku
+    LEFT JOIN fallback_content fb_ua ON fb_ua.sku = mc.sku AND fb_ua.lang = 'ua'
+    LEFT JOIN fallback_content fb_ru ON fb_ru.sku = mc.sku AND fb_ru.lang = 'ru'
+    LEFT JOIN fallback_image fb_img ON fb_img.sku = mc.sku
+    WHERE COALESCE(d1_ua.value, d1_ru.value, d1_img.value, fb_ua.value, fb_ru.value, fb_img.value) IS NOT NULL
+),
+resolved AS (
+    SELECT id, old_ua, old_ru, old_image,
+           CASE
+               WHEN d1_ua IS NOT NULL AND d1_ua IS DISTINCT FROM {_strip("old_ua")} THEN d1_ua
+               WHEN d1_ua IS NOT NULL OR (old_ua IS NOT NULL AND old_ua <> '') THEN old_ua
+               ELSE COALESCE(fb_ua, old_ua)
+           END AS description_ua,
+           CASE
+               WHEN d1_ua IS NOT NULL THEN CAST(:d1_supplier_id AS bigint)
+               WHEN old_ua IS NOT NULL AND old_ua <> '' THEN NULL
+               ELSE fb_ua_supplier_id
+           END AS description_ua_supplier_id,
+           CASE
+               WHEN d1_ru IS NOT NULL AND d1_ru IS DISTINCT FROM {_strip("old_ru")} THEN d1_ru
+               WHEN d1_ru IS NOT NULL OR (old_ru IS NOT NULL AND old_ru <> '') THEN old_ru
+               ELSE COALESCE(fb_ru, old_ru)
+           END AS description_ru,
+           CASE
+               WHEN d1_ru IS NOT NULL THEN CAST(:d1_supplier_id AS bigint)
+               WHEN old_ru IS NOT NULL AND old_ru <> '' THEN NULL
+               ELSE fb_ru_supplier_id
+           END AS description_ru_supplier_id,
+           CASE
+               WHEN d1_image IS NOT NULL AND d1_image IS DISTINCT FROM {_strip("old_image")} THEN d1_image
+               WHEN d1_image IS NOT NULL OR (old_image IS NOT NULL AND old_image <> '') THEN old_image
+               ELSE COALESCE(fb_image, old_image)
+           END AS main_image_url,
+           CASE
+               WHEN d1_image IS NOT NULL THEN CAST(:d1_supplier_id AS bigint)
+               WHEN old_image IS NOT NULL AND old_image <> '' THEN NULL
+               ELSE fb_image_supplier_id
+           END AS main_image_url_supplier_id
+    FROM candidates
+)
+SELECT * FROM resolved
+"""
+
+_STATS_SQL = """
+SELECT
+    count(*) AS candidate_skus,
+    count(*) FILTER (WHERE description_ua IS DISTINCT FROM old_ua) AS updated_ua,
+    count(*) FILTER (WHERE description_ru IS DISTINCT FROM old_ru) AS updated_ru,
+    count(*) FILTER (WHERE main_image_url IS DISTINCT FROM old_image) AS updated_images,
+    count(*) FILTER (
+        WHERE description_ua IS DISTINCT FROM old_ua
+           OR description_ru IS DISTINCT FROM old_ru
+           OR main_image_url IS DISTINCT FROM old_image
+    ) AS updated_products
+FROM tmp_master_enrichment
+"""
+
+_SOURCES_SQL = """
+SELECT 'description_ua' AS field, description_ua_supplier_id AS supplier_id, count(*)
+FROM tmp_master_enrichment
+WHERE description_ua IS DISTINCT FROM old_ua
+GROUP BY description_ua_supplier_id
+UNION ALL
+SELECT 'description_ru', description_ru_supplier_id, count(*)
+FROM tmp_master_enrichment
+WHERE description_ru IS DISTINCT FROM old_ru
+GROUP BY description_ru_supplier_id
+UNION ALL
+SELECT 'main_image_url', main_image_url_supplier_id, count(*)
+FROM tmp_master_enrichment
+WHERE main_image_url IS DISTINCT FROM old_image
+GROUP BY main_image_url_supplier_id
+"""
+
+_APPLY_SQL = """
+UPDATE master_catalog mc
+SET description_ua = r.description_ua,
+    description_ru = r.description_ru,
+    main_image_url = r.main_image_url,
+    updated_at = now()
+FROM tmp_master_enrichment r
+WHERE mc.id = r.id
+  AND (
+      r.description_ua IS DISTINCT FROM r.old_ua
+      OR r.description_ru IS DISTINCT FROM r.old_ru
+      OR r.main_image_url IS DISTINCT FROM r.old_image
+  )
+"""
+
+
+@dataclass
+class ResolveStats:
+    dry_run: bool = False
+    candidate_skus: int = 0
+    updated_ua: int = 0
+    updated_ru: int = 0
+    updated_images: int = 0
+    updated_products: int = 0
+    updated_by_source: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    resolve_sec: float = 0.0
+    apply_sec: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "dry_run": self.dry_run,
+            "candidate_skus": self.candidate_skus,
+            "updated_ua": self.updated_ua,
+            "updated_ru": self.updated_ru,
+            "updated_images": self.updated_images,
+            "updated_products": self.updated_products,
+            "updated_by_source": self.updated_by_source,
+            "resolve_sec": round(self.resolve_sec, 3),
+            "apply_sec": round(self.apply_sec, 3),
+        }
+
+
+async def resolve_master_enrichment(dry_run: bool = False) -> Dict[str, Any]:
+    stats = ResolveStats(dry_run=dry_run)
+    logger.info(
+        "Запуск выбора контента и картинок master_catalog: d1=%s fallback=%s dry_run=%s",
+        D1_SUPPLIER_ID,
+        FALLBACK_SUPPLIER_IDS,
+        dry_run,
+    )
+
+    async with get_async_db(commit_on_exit=not dry_run) as session:
+        started = perf_counter()
+        await session.execute(
+            text(_RESOLVE_SQL),
+            {
+                "d1_supplier_id": D1_SUPPLIER_ID,
+                "fallback_supplier_ids": list(FALLBACK_SUPPLIER_IDS),
+                "ua_only_supplier_ids": list(UA_ONLY_FALLBACK_SUPPLIER_IDS),
+            },
+        )
+        row = (await session.execute(text(_STATS_SQL))).one()
+        stats.candidate_skus = int(row.candidate_skus or 0)
+        stats.updated_ua = int(row.updated_ua or 0)
+        stats.updated_ru = int(row.updated_ru or 0)
+        stats.updated_images = int(row.updated_images or 0)
+        stats.updated_products = int(row.updated_products or 0)
+        for field_name, supplier_id, count in (await session.execute(text(_SOURCES_SQL))).all():
+            label = SUPPLIER_LABELS.get(supplier_id, str(supplier_id))
+            stats.updated_by_source.setdefault(field_name, {})[label] = int(count)
+        stats.resolve_sec = perf_counter() - started
+
+        if dry_run or not stats.updated_products:
+            await session.rollback()
+        else:
+            started = perf_counter()
+            await session.execute(text(_APPLY_SQL))
+            stats.apply_sec = perf_counter() - started
+
+    logger.info(
+        "Завершён выбор контента и картинок: candidate_skus=%d updated_products=%d ua=%d ru=%d images=%d "
+        "by_source=%s resolve=%.3fs apply=%.3fs",
+        stats.candidate_skus,
+        stats.updated_products,
+        stats.updated_ua,
+        stats.updated_ru,
+        stats.updated_images,
+        stats.updated_by_source,
+        stats.resolve_sec,
+        stats.apply_sec,
+    )
+    return stats.to_dict()
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Выбор описаний и главной картинки master_catalog (D1 + fallback D2/D3/D5/D10/D13)"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="только посчитать изменения, без записи в master_catalog",
+    )
+    return parser.parse_args()
+
+
+async def _amain() -> None:
+    args = _parse_args()
+    result = await resolve_master_enrichment(dry_run=args.dry_run)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(_amain())
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import RawSupplierFeedProduct
+
+
+logger = logging.getLogger(__name__)
+
+RAW_FEED_WRITE_CHUNK_SIZE = 1000
+
+
+@dataclass
+class RawFeedWriteSummary:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+
+async def _load_existing_rows(
+    session: AsyncSession,
+    supplier_id: int,
+    columns: List[str],
+) -> Dict[str, List[Dict[str, Any]]]:
+    """supplier_code -> [{id, <columns>...}, ...] одним запросом по поставщику."""
+    result = await session.execute(
+        select(
+            RawSupplierFeedProduct.id,
+            RawSupplierFeedProduct.supplier_code,
+            *(getattr(RawSupplierFeedProduct, name) for name in columns),
+        ).where(RawSupplierFeedProduct.supplier_id == supplier_id)
+    )
+    existing: Dict[str, List[Dict[str, Any]]] = {}
+    for row in result.mappings().all():
+        existing.setdefault(str(row["supplier_code"]), []).append(dict(row))
+    return existing
+
+
+def _row_changed(stored: Dict[str, Any], values: Dict[str, Any]) -> bool:
+    return any(stored.get(name) != value for name, value in values.items())
+
+
+async def upsert_raw_supplier_feed(
+    session: AsyncSession,
+    supplier_id: int,
+    rows: Iterable[Dict[str, Any]],
+    *,
+    insert_only: Iterable[str] = (),
+) -> RawFeedWriteSummary:
+    """
+    Пишет строки фида поставщика в raw_supplier_feed_products.
+
+    Каждая строка - dict колонок RawSupplierFeedProduct с обязательными
+    `supplier_code` и `source_hash`. Текущие строки поставщика читаются одним
+    запросом; строка пропускается, только если все записываемые колонки
+    (включая source_payload) совпадают с сохранёнными - source_hash лоадеров
+    покрывает не все поля payload. Новые строки вставляются, изменённые
+    обновляются по id пакетами по RAW_FEED_WRITE_CHUNK_SIZE.
+
+    Уникального ключа (supplier_id, supplier_code) в таблице нет, поэтому
+    вместо ON CONFLICT используется предзагруженная карта supplier_code -> id.
+    Повтор supplier_code внутри фида: побеждает последняя строка.
+    Колонки из `insert_only` пишутся только при вставке новой строки.
+    """
+    summary = RawFeedWriteSummary()
+    insert_only_fields = set(insert_only)
+
+    latest: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        latest[str(row["supplier_code"])] = row
+
+    compared_columns = sorted(
+        {key for row in latest.values() for key in row} - insert_only_fields - {"supplier_code"}
+    )
+    existing = await _load_existing_rows(session, supplier_id, compared_columns)
+
+    to_insert: List[Dict[str, Any]] = []
+    to_update: List[Dict[str, Any]] = []
+    for supplier_code, row in latest.items():
+        current = existing.get(supplier_code)
+        if not current:
+            to_insert.append({**row, "supplier_id": supplier_id})
+            continue
+        update_values = {key: value for key, value in row.items() if key not in insert_only_fields}
+        changed_ids = [stored["id"] for stored in current if _row_changed(stored, update_values)]
+        if not changed_ids:
+            summary.unchanged += 1
+            continue
+        for row_id in changed_ids:
+            to_update.append({**update_values, "id": row_id})
+
+    for i in range(0, len(to_insert), RAW_FEED_WRITE_CHUNK_SIZE):
+        await session.execute(
+            insert(RawSupplierFeedProduct),
+            to_insert[i : i + RAW_FEED_WRITE_CHUNK_SIZE],
+        )
+    summary.inserted = len(to_insert)
+
+    for i in range(0, len(to_update), RAW_FEED_WRITE_CHUNK_SIZE):
+        await session.execute(
+            update(RawSupplierFeedProduct),
+            to_update[i : i + RAW_FEED_WRITE_CHUNK_SIZE],
+        )
+    summary.updated = len({row["supplier_code"] for row in to_update})
+
+    logger.info(
+        "raw_supplier_feed_products supplier_id=%s: inserted=%d updated=%d unchanged=%d",
+        supplier_id,
+        summary.inserted,
+        summary.updated,
+        summary.unchanged,
+    )
+    return summary
@@ -0,0 +1,303 @@
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.business.barcode_matching import collect_barcode_matches
+from app.database import get_async_db
+from app.models import CatalogSupplierMapping, MasterCatalog, RawSupplierFeedProduct
+
+
+logger = logging.getLogger("supplier_barcode_mapping_sync")
+
+MAX_LOGGED_CONFLICTS = 20
+MAX_SAMPLES = 20
+MAPPING_UPSERT_CHUNK_SIZE = 1000
+
+
+def normalize_mapping_barcode(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    barcode = str(value).strip().replace(" ", "")
+    if not barcode:
+        return None
+    if barcode.lower() in {"nan", "none"}:
+        return None
+    return barcode
+
+
+def normalize_mapping_barcode_strict(value: Any) -> Optional[str]:
+    """Только strip: пробелы внутри и 'nan'/'none' считаются частью barcode."""
+    if value is None:
+        return None
+    barcode = str(value).strip()
+    return barcode or None
+
+
+@dataclass(frozen=True)
+class BarcodeMappingSyncConfig:
+    """
+    Параметры sync catalog_supplier_mapping по barcode для одного поставщика.
+
+    protect_existing_sku - не перезаписывать mapping, уже привязанный к другому sku;
+    store_matched_barcode - писать в mapping нормализованный barcode вместо raw;
+    warn_ambiguous_matches - логировать неоднозначные совпадения master/supplier;
+    max_logged - сколько однотипных предупреждений логировать (None - все).
+    """
+
+    code: str
+    supplier_id: int
+    normalize_barcode: Callable[[Any], Optional[str]] = normalize_mapping_barcode
+    protect_existing_sku: bool = True
+    store_matched_barcode: bool = False
+    warn_ambiguous_matches: bool = False
+    max_logged: Optional[int] = MAX_LOGGED_CONFLICTS
+
+
+@dataclass
+class SyncStats:
+    supplier_id: int
+    raw_rows_read: int = 0
+    master_rows_read: int = 0
+    unique_master_barcodes: int = 0
+    unique_supplier_barcodes: int = 0
+    matched_unique_pairs: int = 0
+    inserted: int = 0
+    updated: int = 0
+    conflicts_master: int = 0
+    conflicts_supplier: int = 0
+    conflict_existing_mapping: int = 0
+    skipped_no_barcode: int = 0
+    warnings_count: int = 0
+    sample_matched_pairs: List[Dict[str, str]] = field(default_factory=list)
+    sample_conflicts_master: List[Dict[str, Any]] = field(default_factory=list)
+    sample_conflicts_supplier: List[Dict[str, Any]] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "supplier_id": self.supplier_id,
+            "raw_rows_read": self.raw_rows_read,
+            "master_rows_read": self.master_rows_read,
+            "unique_master_barcodes": self.unique_master_barcodes,
+            "unique_supplier_barcodes": self.unique_supplier_barcodes,
+            "matched_unique_pairs": self.matched_unique_pairs,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "conflicts_master": self.conflicts_master,
+            "conflicts_supplier": self.conflicts_supplier,
+            "conflict_existing_mapping": self.conflict_existing_mapping,
+            "skipped_no_barcode": self.skipped_no_barcode,
+            "warnings_count": self.warnings_count,
+            "sample_matched_pairs": self.sample_matched_pairs,
+            "sample_conflicts_master": self.sample_conflicts_master,
+            "sample_conflicts_supplier": self.sample_conflicts_supplier,
+        }
+
+
+def _warn(stats: SyncStats, message: str, *args: Any) -> None:
+    stats.warnings_count += 1
+    logger.warning(message, *args)
+
+
+def _within_log_limit(config: BarcodeMappingSyncConfig, index: int) -> bool:
+    return config.max_logged is None or index <= config.max_logged
+
+
+def _append_sample(target: List[Dict[str, Any]], item: Dict[str, Any]) -> None:
+    if len(target) < MAX_SAMPLES:
+        target.append(item)
+
+
+async def _upsert_mappings(session, rows: List[Dict[str, Any]]) -> None:
+    table = CatalogSupplierMapping.__table__
+    for i in range(0, len(rows), MAPPING_UPSERT_CHUNK_SIZE):
+        insert_stmt = pg_insert(table).values(rows[i : i + MAPPING_UPSERT_CHUNK_SIZE])
+        excluded = insert_stmt.excluded
+        await session.execute(
+            insert_stmt.on_conflict_do_update(
+                constraint="uq_catalog_supplier_mapping_supplier_code",
+                set_={
+                    "sku": excluded.sku,
+                    "supplier_product_id": excluded.supplier_product_id,
+                    "supplier_product_name_raw": excluded.supplier_product_name_raw,
+                    "barcode": excluded.barcode,
+                    "is_confirmed": excluded.is_confirmed,
+                    "is_active": excluded.is_active,
+                    "match_source": excluded.match_source,
+                    "last_seen_at": excluded.last_seen_at,
+                },
+            )
+        )
+
+
+async def sync_supplier_mapping_by_barcode(
+    config: BarcodeMappingSyncConfig,
+    limit: int = 0,
+) -> Dict[str, Any]:
+    """
+    Сопоставляет raw_supplier_feed_products поставщика с master_catalog по barcode
+    и пишет уникальные пары в catalog_supplier_mapping.
+
+    Читаются только нужные колонки, текущие mapping поставщика загружаются одним
+    запросом, вставки и обновления пишутся пакетным upsert по
+    (supplier_id, supplier_code).
+    """
+    code = config.code
+    supplier_id = config.supplier_id
+    normalize = config.normalize_barcode
+    stats = SyncStats(supplier_id=supplier_id)
+    logger.info("Запуск sync %s barcode mapping для supplier_id=%s", code, supplier_id)
+
+    async with get_async_db() as session:
+        master_stmt = select(
+            MasterCatalog.id,
+            MasterCatalog.sku,
+            MasterCatalog.barcode,
+        ).order_by(MasterCatalog.id.asc())
+        raw_stmt = (
+            select(
+                RawSupplierFeedProduct.id,
+                RawSupplierFeedProduct.supplier_code,
+                RawSupplierFeedProduct.feed_product_id,
+                RawSupplierFeedProduct.name_raw,
+                RawSupplierFeedProduct.barcode,
+            )
+            .where(RawSupplierFeedProduct.supplier_id == supplier_id)
+            .order_by(RawSupplierFeedProduct.id.asc())
+        )
+        if limit and limit > 0:
+            raw_stmt = raw_stmt.limit(limit)
+        mapping_stmt = select(
+            CatalogSupplierMapping.supplier_code,
+            CatalogSupplierMapping.sku,
+        ).where(CatalogSupplierMapping.supplier_id == supplier_id)
+
+        master_rows = (await session.execute(master_stmt)).all()
+        raw_rows = (await session.execute(raw_stmt)).all()
+        mapped_sku_by_code: Dict[str, str] = {
+            supplier_code: sku for supplier_code, sku in (await session.execute(mapping_stmt)).all()
+        }
+
+        stats.master_rows_read = len(master_rows)
+        stats.raw_rows_read = len(raw_rows)
+
+        master_by_barcode: Dict[str, List[Any]] = defaultdict(list)
+        supplier_by_barcode: Dict[str, List[Any]] = defaultdict(list)
+
+        for master in master_rows:
+            barcode = normalize(master.barcode)
+            if not barcode:
+                stats.skipped_no_barcode += 1
+                continue
+            master_by_barcode[barcode].append(master)
+
+        for raw in raw_rows:
+            barcode = normalize(raw.barcode)
+            if not barcode:
+                stats.skipped_no_barcode += 1
+                if _within_log_limit(config, stats.skipped_no_barcode):
+                    _warn(stats, "Пропущена %s запись без barcode: supplier_code=%s", code, raw.supplier_code)
+                continue
+            supplier_by_barcode[barcode].append(raw)
+
+        stats.unique_master_barcodes = sum(1 for rows in master_by_barcode.values() if len(rows) == 1)
+        stats.unique_supplier_barcodes = sum(1 for rows in supplier_by_barcode.values() if len(rows) == 1)
+
+        conflicting_master_barcodes = {barcode for barcode, rows in master_by_barcode.items() if len(rows) > 1}
+        conflicting_supplier_barcodes = {barcode for barcode, rows in supplier_by_barcode.items() if len(rows) > 1}
+
+        stats.conflicts_master = len(conflicting_master_barcodes)
+        stats.conflicts_supplier = len(conflicting_supplier_barcodes)
+
+        for index, barcode in enumerate(sorted(conflicting_master_barcodes), start=1):
+            sku_count = len(master_by_barcode[barcode])
+            _append_sample(stats.sample_conflicts_master, {"barcode": barcode, "sku_count": sku_count})
+            if _within_log_limit(config, index):
+                _warn(stats, "barcode не уникален в master_catalog: barcode=%s, sku_count=%d", barcode, sku_count)
+
+        for index, barcode in enumerate(sorted(conflicting_supplier_barcodes), start=1):
+            item_count = len(supplier_by_barcode[barcode])
+            _append_sample(stats.sample_conflicts_supplier, {"barcode": barcode, "item_count": item_count})
+            if _within_log_limit(config, index):
+                _warn(
+                    stats,
+                    "barcode не уникален у %s в raw_supplier_feed_products: barcode=%s, item_count=%d",
+                    code,
+                    barcode,
+                    item_count,
+                )
+
+        now = datetime.now(timezone.utc)
+        pending: Dict[str, Dict[str, Any]] = {}
+        for barcode, supplier_rows in supplier_by_barcode.items():
+            master_matches = collect_barcode_matches(master_by_barcode, barcode)
+            if not master_matches:
+                continue
+
+            if len(supplier_rows) != 1 or len(master_matches) != 1:
+                if config.warn_ambiguous_matches:
+                    _warn(
+                        stats,
+                        "Конфликтное совпадение barcode=%s: master_count=%d, supplier_count=%d",
+                        barcode,
+                        len(master_matches),
+                        len(supplier_rows),
+                    )
+                continue
+
+            master_row = master_matches[0]
+            supplier_row = supplier_rows[0]
+            supplier_code = supplier_row.supplier_code
+            stats.matched_unique_pairs += 1
+            _append_sample(
+                stats.sample_matched_pairs,
+                {"barcode": barcode, "sku": master_row.sku, "supplier_code": supplier_code},
+            )
+
+            existing_sku = mapped_sku_by_code.get(supplier_code)
+            if existing_sku is None:
+                stats.inserted += 1
+            else:
+                existing_sku = existing_sku.strip()
+                if config.protect_existing_sku and existing_sku and existing_sku != master_row.sku:
+                    stats.conflict_existing_mapping += 1
+                    if _within_log_limit(config, stats.conflict_existing_mapping):
+                        _warn(
+                            stats,
+                            "Существующий mapping конфликтует и не будет перезаписан: supplier_code=%s, old_sku=%s, new_sku=%s",
+                            supplier_code,
+                            existing_sku,
+                            master_row.sku,
+                        )
+                    continue
+                stats.updated += 1
+
+            mapped_sku_by_code[supplier_code] = master_row.sku
+            pending[supplier_code] = {
+                "sku": master_row.sku,
+                "supplier_id": supplier_id,
+                "supplier_code": supplier_code,
+                "supplier_product_id": supplier_row.feed_product_id,
+                "supplier_product_name_raw": supplier_row.name_raw,
+                "barcode": barcode if config.store_matched_barcode else supplier_row.barcode,
+                "is_confirmed": True,
+                "is_active": True,
+                "match_source": "barcode",
+                "first_seen_at": now,
+                "last_seen_at": now,
+            }
+
+        await _upsert_mappings(session, list(pending.values()))
+
+    logger.info(
+        "Завершён sync %s barcode mapping: matched=%d, inserted=%d, updated=%d",
+        code,
+        stats.matched_unique_pairs,
+        stats.inserted,
+        stats.updated,
+    )
+    return stats.to_dict()
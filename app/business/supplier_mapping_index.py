@@ -0,0 +1,187 @@
+# app/business/supplier_mapping_index.py
+"""
+Кешированный индекс маппинга кодов поставщика (code_sup -> product_code).
+
+map_supplier_codes вызывается для каждого поставщика и в dropship_pipeline
+(process_supplier), и в business_store_offers_builder; раньше каждый вызов
+заново искал коды в catalog_mapping / catalog_supplier_mapping. Теперь на
+поставщика строится один индекс одним запросом только по нужным колонкам,
+и он переиспользуется, пока не изменились таблицы маппинга.
+
+Версия таблиц - счётчики вставок/обновлений/удалений из pg_stat_user_tables
+(catalog_mapping для legacy backend; catalog_supplier_mapping и
+master_catalog для master backend). Статистика пишется с небольшой задержкой,
+поэтому дополнительно индекс живёт не дольше SUPPLIER_MAPPING_INDEX_MAX_AGE_SEC.
+Если статистика недоступна, индекс строится заново на каждый вызов.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import CatalogSupplierMapping, MasterCatalog
+
+
+logger = logging.getLogger(__name__)
+
+CATALOG_MAPPING_ID_COL = "ID"
+
+LEGACY_TABLES = ("catalog_mapping",)
+MASTER_TABLES = ("catalog_supplier_mapping", "master_catalog")
+
+
+def _max_age_sec() -> int:
+    raw = (os.getenv("SUPPLIER_MAPPING_INDEX_MAX_AGE_SEC") or "").strip()
+    try:
+        return int(raw) if raw else 300
+    except ValueError:
+        return 300
+
+
+@dataclass
+class SupplierMappingIndex:
+    """code_sup -> product_code; archived - коды, чей sku в архиве master_catalog."""
+
+    backend: str
+    supplier_code: str
+    version: Optional[Tuple]
+    built_at: float
+    lookup: Dict[str, str] = field(default_factory=dict)
+    archived: frozenset = frozenset()
+
+
+_cache: Dict[Tuple[str, str, Optional[int]], SupplierMappingIndex] = {}
+
+
+async def fetch_tables_version(session: AsyncSession, tables: Tuple[str, ...]) -> Optional[Tuple]:
+    """Счётчики изменений таблиц; None, если статистика недоступна."""
+    try:
+        # иначе внутри одной транзакции статистика отдаётся из кеша снимка
+        await session.execute(text("SELECT pg_stat_clear_snapshot()"))
+        rows = (
+            await session.execute(
+                text(
+                    "SELECT relname, n_tup_ins, n_tup_upd, n_tup_del "
+                    "FROM pg_stat_user_tables WHERE relname = ANY(:tables) ORDER BY relname"
+                ),
+                {"tables": list(tables)},
+            )
+        ).all()
+    except Exception:
+        logger.warning("Supplier mapping index: table stats unavailable, cache disabled", exc_info=True)
+        return None
+    if len(rows) != len(tables):
+        return None
+    return tuple(tuple(row) for row in rows)
+
+
+def _cached(key, version: Optional[Tuple]) -> Optional[SupplierMappingIndex]:
+    index = _cache.get(key)
+    if index is None or version is None or index.version != version:
+        return None
+    if time.monotonic() - index.built_at >= _max_age_sec():
+        return None
+    return index
+
+
+async def get_legacy_mapping_index(session: AsyncSession, supplier_code: str) -> SupplierMappingIndex:
+    """catalog_mapping."Code_<supplier>" -> catalog_mapping."ID"."""
+    key = ("legacy", supplier_code, None)
+    version = await fetch_tables_version(session, LEGACY_TABLES)
+    index = _cached(key, version)
+    if index is not None:
+        return index
+
+    started = time.perf_counter()
+    column_name = f"Code_{supplier_code}"
+    rows = await session.execute(text(f'''
+        SELECT "{CATALOG_MAPPING_ID_COL}" AS id,
+               "{column_name}" AS code_sup
+        FROM catalog_mapping
+        WHERE "{column_name}" IS NOT NULL AND "{column_name}" <> ''
+    '''))
+    lookup: Dict[str, str] = {}
+    for pid, code_sup in rows.all():
+        lookup[str(code_sup)] = str(pid)
+
+    index = SupplierMappingIndex(
+        backend="legacy",
+        supplier_code=supplier_code,
+        version=version,
+        built_at=time.monotonic(),
+        lookup=lookup,
+    )
+    _cache[key] = index
+    logger.info(
+        "Supplier mapping index built: backend=legacy supplier=%s codes=%d elapsed=%.3fs",
+        supplier_code,
+        len(lookup),
+        time.perf_counter() - started,
+    )
+    return index
+
+
+async def get_master_mapping_index(
+    session: AsyncSession,
+    supplier_code: str,
+    supplier_id: int,
+) -> SupplierMappingIndex:
+    """Активные catalog_supplier_mapping поставщика -> sku (с учётом архива master_catalog)."""
+    key = ("master", supplier_code, int(supplier_id))
+    version = await fetch_tables_version(session, MASTER_TABLES)
+    index = _cached(key, version)
+    if index is not None:
+        return index
+
+    started = time.perf_counter()
+    stmt = (
+        select(
+            CatalogSupplierMapping.supplier_code,
+            CatalogSupplierMapping.sku,
+            MasterCatalog.is_archived,
+        )
+        .join(MasterCatalog, MasterCatalog.sku == CatalogSupplierMapping.sku)
+        .where(
+            CatalogSupplierMapping.supplier_id == supplier_id,
+            CatalogSupplierMapping.is_active.is_(True),
+        )
+    )
+    lookup: Dict[str, str] = {}
+    archived: set[str] = set()
+    for supplier_item_code, sku, is_archived in (await session.execute(stmt)).all():
+        code_sup = str(supplier_item_code or "").strip()
+        if not code_sup:
+            continue
+        if bool(is_archived):
+            archived.add(code_sup)
+            continue
+        lookup[code_sup] = str(sku)
+
+    index = SupplierMappingIndex(
+        backend="master",
+        supplier_code=supplier_code,
+        version=version,
+        built_at=time.monotonic(),
+        lookup=lookup,
+        archived=frozenset(archived),
+    )
+    _cache[key] = index
+    logger.info(
+        "Supplier mapping index built: backend=master supplier=%s supplier_id=%s codes=%d archived=%d elapsed=%.3fs",
+        supplier_code,
+        supplier_id,
+        len(lookup),
+        len(archived),
+        time.perf_counter() - started,
+    )
+    return index
+
+
+def invalidate_supplier_mapping_index() -> None:
+    _cache.clear()
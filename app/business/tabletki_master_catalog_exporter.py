@@ -16,6 +16,7 @@ from app.models import (
     MasterCatalog,
     Offer,
 )
+from app.services import publish_ledger
 from app.services.notification_service import send_notification
 from app.services.catalog_export_service import SUPPLIER_MAPPING, post_data_to_endpoint
 
@@ -41,6 +42,7 @@ class ExportStats:
     warnings: List[str] | None = None
     preview_path: str = ""
     sent: bool = False
+    skipped_unchanged: bool = False
 
 
 def _clean_text(value: Any) -> str:
@@ -288,6 +290,7 @@ async def export_master_catalog_to_tabletki(
     enterprise_code: str,
     limit: int = 0,
     send: bool = False,
+    force: bool = False,
 ) -> Dict[str, Any]:
     logger.info(
         "Starting master catalog export for Tabletki: enterprise=%s send=%s limit=%s",
@@ -333,15 +336,37 @@ async def export_master_catalog_to_tabletki(
     preview_document = _build_preview_document(payload, preview_rows, stats)
     stats.preview_path = _save_preview_file(str(enterprise_code), preview_document)
 
+    decision = None
     if send:
+        decision = publish_ledger.check_publish(
+            str(enterprise_code),
+            publish_ledger.KIND_MASTER_CATALOG,
+            enterprise_settings.branch_id,
+            payload,
+            force=force,
+        )
+        if not decision.should_send:
+            stats.skipped_unchanged = True
+            logger.info(
+                "Master catalog for enterprise=%s unchanged since last publish, send skipped",
+                enterprise_code,
+            )
+
+    if decision is not None and decision.should_send:
         endpoint = f"{developer_settings.endpoint_catalog}/Import/Ref/{enterprise_settings.branch_id}"
-        await post_data_to_endpoint(
+        status, _ = await post_data_to_endpoint(
             endpoint,
             payload,
             enterprise_settings.tabletki_login,
             enterprise_settings.tabletki_password,
             str(enterprise_code),
         )
+        if status < 400:
+            publish_ledger.record_publish(
+                str(enterprise_code),
+                publish_ledger.KIND_MASTER_CATALOG,
+                {enterprise_settings.branch_id: decision.payload_hash},
+            )
         stats.sent = True
         preview_document["sent"] = True
         Path(stats.preview_path).write_text(
@@ -385,6 +410,11 @@ def _build_parser() -> argparse.ArgumentParser:
         action="store_true",
         help="реально отправить payload в Tabletki; без флага выполняется dry-run",
     )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="отправить даже если payload не менялся с последней публикации (publish ledger)",
+    )
     return parser
 
 
@@ -393,6 +423,7 @@ async def _main_async(args: argparse.Namespace) -> None:
         enterprise_code=str(args.enterprise),
         limit=args.limit,
         send=args.send,
+        force=args.force,
     )
     print(json.dumps(result, ensure_ascii=False, indent=2))
 
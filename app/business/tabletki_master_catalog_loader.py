@@ -5,21 +5,21 @@ import io
 import json
 import logging
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from decimal import Decimal, InvalidOperation
+from time import perf_counter
 from typing import Any, Dict, List, Optional
 
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaIoBaseDownload
-from sqlalchemy import select
+from sqlalchemy import text
 
+from app.core.google_drive_client import get_drive_client, is_file_unchanged, mark_file_imported
 from app.database import get_async_db
-from app.models import MasterCatalog, RawTabletkiCatalog
+from app.services.inventory_bulk_loader import get_driver_connection
 
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -64,9 +64,12 @@ class LoaderStats:
     rows_read: int = 0
     raw_inserted: int = 0
     raw_updated: int = 0
+    raw_unchanged: int = 0
     master_inserted: int = 0
     master_updated: int = 0
+    master_unchanged: int = 0
     warnings_count: int = 0
+    phase_sec: Dict[str, float] = field(default_factory=dict)
 
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -74,9 +77,12 @@ class LoaderStats:
             "rows_read": self.rows_read,
             "raw_inserted": self.raw_inserted,
             "raw_updated": self.raw_updated,
+            "raw_unchanged": self.raw_unchanged,
             "master_inserted": self.master_inserted,
             "master_updated": self.master_updated,
+            "master_unchanged": self.master_unchanged,
             "warnings_count": self.warnings_count,
+            "phase_sec": {name: round(value, 3) for name, value in self.phase_sec.items()},
         }
 
 
@@ -91,44 +97,22 @@ async def _connect_drive():
     creds_path = _env_required("GOOGLE_DRIVE_CREDENTIALS_PATH")
     if not os.path.exists(creds_path):
         raise FileNotFoundError(f"GOOGLE_DRIVE_CREDENTIALS_PATH не найден: {creds_path}")
-
-    credentials = service_account.Credentials.from_service_account_file(
-        creds_path,
-        scopes=["https://www.googleapis.com/auth/drive"],
-    )
-    return build("drive", "v3", credentials=credentials)
+    return get_drive_client(creds_path)
 
 
 async def _fetch_single_file_metadata(drive_service, folder_id: str) -> Dict[str, Any]:
     try:
-        results = (
-            drive_service.files()
-            .list(
-                q=f"'{folder_id}' in parents and trashed=false",
-                fields="files(id, name, modifiedTime)",
-                pageSize=10,
-                orderBy="modifiedTime desc",
-            )
-            .execute()
-        )
-        files = results.get("files", []) or []
-        if not files:
-            raise FileNotFoundError("В папке Google Drive нет файлов")
-        return files[0]
+        metadata = await drive_service.latest_file(folder_id)
     except HttpError as exc:
         raise RuntimeError(f"Ошибка Drive API при получении списка файлов: {exc}") from exc
+    if not metadata:
+        raise FileNotFoundError("В папке Google Drive нет файлов")
+    return metadata
 
 
 async def _download_file_bytes(drive_service, file_id: str) -> bytes:
     try:
-        request = drive_service.files().get_media(fileId=file_id)
-        handle = io.BytesIO()
-        downloader = MediaIoBaseDownload(handle, request)
-        done = False
-        while not done:
-            _, done = downloader.next_chunk()
-        handle.seek(0)
-        return handle.read()
+        return await drive_service.download_bytes(file_id)
     except HttpError as exc:
         raise RuntimeError(f"Ошибка Drive API при загрузке файла {file_id}: {exc}") from exc
 
@@ -147,28 +131,11 @@ def _normalize_string(value: Any) -> Optional[str]:
     return text_value or None
 
 
-def _normalize_numeric(value: Any, field_name: str, sku: Optional[str], stats: LoaderStats) -> Optional[Decimal]:
-    normalized = _normalize_string(value)
-    if normalized is None:
-        return None
-
-    candidate = normalized.replace(" ", "").replace(",", ".")
-    if candidate.count(".") > 1:
-        _warn(stats, "Некорректное числовое значение для %s (sku=%s): %r", field_name, sku, normalized)
-        return None
-
-    try:
-        return Decimal(candidate)
-    except InvalidOperation:
-        _warn(stats, "Не удалось распарсить число для %s (sku=%s): %r", field_name, sku, normalized)
-        return None
-
-
 def _find_header_row(df: pd.DataFrame) -> int:
-    for idx, row in df.iterrows():
-        values = {_normalize_string(value) for value in row.tolist()}
+    for idx, row in enumerate(df.itertuples(index=False, name=None)):
+        values = {_normalize_string(value) for value in row}
         if all(column in values for column in HEADER_MIN_COLUMNS):
-            return int(idx)
+            return idx
     raise RuntimeError(
         "Не удалось найти строку заголовка в Excel. Ожидались минимум колонки "
         f"{', '.join(HEADER_MIN_COLUMNS)}."
@@ -202,160 +169,242 @@ def _prepare_dataframe(xlsx_bytes: bytes, stats: LoaderStats) -> pd.DataFrame:
     return data_df
 
 
+def _normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Все ячейки -> str без крайних пробелов или None (как _normalize_string), по колонкам."""
+    normalized: Dict[str, pd.Series] = {}
+    for column in df.columns:
+        values = df[column].astype("string").str.strip().fillna("")
+        normalized[str(column)] = pd.Series(
+            np.where(values.ne("").to_numpy(dtype=bool), values.to_numpy(dtype=object), None),
+            index=df.index,
+            dtype=object,
+        )
+    return pd.DataFrame(normalized, index=df.index)
+
+
+def _column_or_none(df: pd.DataFrame, column: str) -> pd.Series:
+    if column in df.columns:
+        return df[column]
+    return pd.Series([None] * len(df), index=df.index, dtype=object)
+
+
+def _numeric_column(values: pd.Series, skus: pd.Series, field_name: str, stats: LoaderStats) -> pd.Series:
+    present = values.dropna()
+    if present.empty:
+        return pd.Series([None] * len(values), index=values.index, dtype=object)
+
+    candidates = present.str.replace(" ", "", regex=False).str.replace(",", ".", regex=False)
+    malformed = candidates.str.count(r"\.") > 1
+    for idx in candidates.index[malformed]:
+        _warn(stats, "Некорректное числовое значение для %s (sku=%s): %r", field_name, skus.at[idx], present.at[idx])
+
+    parsed: Dict[Any, Decimal] = {}
+    for idx, candidate in candidates[~malformed].items():
+        try:
+            parsed[idx] = Decimal(candidate)
+        except InvalidOperation:
+            _warn(stats, "Не удалось распарсить число для %s (sku=%s): %r", field_name, skus.at[idx], present.at[idx])
+    return pd.Series([parsed.get(idx) for idx in values.index], index=values.index, dtype=object)
+
+
 def _row_source_hash(payload: Dict[str, Any]) -> str:
     serialized = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
     return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
 
 
-def _build_row_payload(row: pd.Series, stats: LoaderStats) -> Optional[Dict[str, Any]]:
-    payload = {str(column): _normalize_string(value) for column, value in row.items()}
-    sku = payload.get(COL_SKU)
-    if not sku:
-        _warn(stats, "Пропущена строка без sku (колонка %s)", COL_SKU)
-        return None
+def _read_tabletki_rows(xlsx_bytes: bytes, stats: LoaderStats, limit: int = 0) -> List[Dict[str, Any]]:
+    """
+    Строки Excel -> payload для raw_tabletki_catalog. Нормализация и разбор чисел
+    идут по колонкам; source_payload/source_hash совпадают с построчной версией.
+    """
+    df = _normalize_frame(_prepare_dataframe(xlsx_bytes, stats))
+
+    has_sku = df[COL_SKU].notna()
+    skipped = int((~has_sku).sum())
+    if skipped:
+        stats.warnings_count += skipped
+        logger.warning("Пропущено строк без sku (колонка %s): %d", COL_SKU, skipped)
+    df = df[has_sku]
+    if limit and limit > 0:
+        df = df.head(limit)
+
+    skus = df[COL_SKU]
+    payloads = df.to_dict("records")
+    items = pd.DataFrame(
+        {
+            "tabletki_guid": _column_or_none(df, COL_GUID),
+            "sku": skus,
+            "barcode": _column_or_none(df, COL_BARCODE),
+            "manufacturer": _column_or_none(df, COL_MANUFACTURER),
+            "name_ua": _column_or_none(df, COL_NAME_UA),
+            "name_ru": _column_or_none(df, COL_NAME_RU),
+            "category_l1_code": _column_or_none(df, COL_CATEGORY_L1_CODE),
+            "category_l1_name": _column_or_none(df, COL_CATEGORY_L1_NAME),
+            "category_l2_code": _column_or_none(df, COL_CATEGORY_L2_CODE),
+            "category_l2_name": _column_or_none(df, COL_CATEGORY_L2_NAME),
+            "weight_g": _numeric_column(_column_or_none(df, COL_WEIGHT), skus, "weight_g", stats),
+            "length_mm": _numeric_column(_column_or_none(df, COL_LENGTH), skus, "length_mm", stats),
+            "width_mm": _numeric_column(_column_or_none(df, COL_WIDTH), skus, "width_mm", stats),
+            "height_mm": _numeric_column(_column_or_none(df, COL_HEIGHT), skus, "height_mm", stats),
+            "volume_ml": _numeric_column(_column_or_none(df, COL_VOLUME), skus, "volume_ml", stats),
+        },
+        index=df.index,
+    )
+    items["source_payload"] = payloads
+    items["source_hash"] = [_row_source_hash(payload) for payload in payloads]
 
-    item = {
-        "tabletki_guid": payload.get(COL_GUID),
-        "sku": sku,
-        "barcode": payload.get(COL_BARCODE),
-        "manufacturer": payload.get(COL_MANUFACTURER),
-        "name_ua": payload.get(COL_NAME_UA),
-        "name_ru": payload.get(COL_NAME_RU),
-        "category_l1_code": payload.get(COL_CATEGORY_L1_CODE),
-        "category_l1_name": payload.get(COL_CATEGORY_L1_NAME),
-        "category_l2_code": payload.get(COL_CATEGORY_L2_CODE),
-        "category_l2_name": payload.get(COL_CATEGORY_L2_NAME),
-        "weight_g": _normalize_numeric(payload.get(COL_WEIGHT), "weight_g", sku, stats),
-        "length_mm": _normalize_numeric(payload.get(COL_LENGTH), "length_mm", sku, stats),
-        "width_mm": _normalize_numeric(payload.get(COL_WIDTH), "width_mm", sku, stats),
-        "height_mm": _normalize_numeric(payload.get(COL_HEIGHT), "height_mm", sku, stats),
-        "volume_ml": _normalize_numeric(payload.get(COL_VOLUME), "volume_ml", sku, stats),
-        "description_ua": None,
-        "description_ru": None,
-        "source_payload": payload,
-    }
-    item["source_hash"] = _row_source_hash(payload)
-    return item
+    rows = items.to_dict("records")
+    stats.rows_read = len(rows)
+    return rows
 
 
-def _read_tabletki_rows(xlsx_bytes: bytes, stats: LoaderStats, limit: int = 0) -> List[Dict[str, Any]]:
-    df = _prepare_dataframe(xlsx_bytes, stats)
+RAW_STAGING_TABLE = "_stage_raw_tabletki_catalog"
+RAW_DATA_COLUMNS = [
+    "tabletki_guid",
+    "sku",
+    "barcode",
+    "manufacturer",
+    "name_ua",
+    "name_ru",
+    "category_l1_code",
+    "category_l1_name",
+    "category_l2_code",
+    "category_l2_name",
+    "weight_g",
+    "length_mm",
+    "width_mm",
+    "height_mm",
+    "volume_ml",
+    "source_payload",
+    "source_hash",
+]
+MASTER_SYNC_COLUMNS = [
+    "tabletki_guid",
+    "barcode",
+    "manufacturer",
+    "name_ua",
+    "name_ru",
+    "category_l1_code",
+    "category_l2_code",
+    "weight_g",
+    "length_mm",
+    "width_mm",
+    "height_mm",
+    "volume_ml",
+]
 
-    rows: List[Dict[str, Any]] = []
-    for _, row in df.iterrows():
-        item = _build_row_payload(row, stats)
-        if item is None:
-            continue
-        rows.append(item)
-        if limit and len(rows) >= limit:
-            break
 
-    stats.rows_read = len(rows)
-    return rows
+def _dedupe_by_sku(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # при повторе sku в файле побеждает последняя строка, как при построчной загрузке
+    by_sku: Dict[str, Dict[str, Any]] = {}
+    for item in rows:
+        by_sku.pop(item["sku"], None)
+        by_sku[item["sku"]] = item
+    return list(by_sku.values())
 
 
 async def load_tabletki_raw(rows: List[Dict[str, Any]], stats: LoaderStats) -> None:
+    """
+    COPY строк файла во временную staging-таблицу и set-based merge в raw_tabletki_catalog:
+    строки с тем же source_hash не трогаются, изменённые обновляются одним UPDATE ... FROM,
+    новые sku вставляются одним INSERT ... SELECT.
+    """
+    rows = _dedupe_by_sku(rows)
+    if not rows:
+        return
+
     now = datetime.now(timezone.utc)
+    set_list = ", ".join(f"{name} = s.{name}" for name in RAW_DATA_COLUMNS if name != "sku")
+    column_list = ", ".join(RAW_DATA_COLUMNS)
 
     async with get_async_db() as session:
-        for item in rows:
-            stmt = select(RawTabletkiCatalog).where(RawTabletkiCatalog.sku == item["sku"])
-            existing = (await session.execute(stmt)).scalar_one_or_none()
-
-            if existing is None:
-                obj = RawTabletkiCatalog(
-                    tabletki_guid=item["tabletki_guid"],
-                    sku=item["sku"],
-                    barcode=item["barcode"],
-                    manufacturer=item["manufacturer"],
-                    name_ua=item["name_ua"],
-                    name_ru=item["name_ru"],
-                    category_l1_code=item["category_l1_code"],
-                    category_l1_name=item["category_l1_name"],
-                    category_l2_code=item["category_l2_code"],
-                    category_l2_name=item["category_l2_name"],
-                    weight_g=item["weight_g"],
-                    length_mm=item["length_mm"],
-                    width_mm=item["width_mm"],
-                    height_mm=item["height_mm"],
-                    volume_ml=item["volume_ml"],
-                    description_ua=None,
-                    description_ru=None,
-                    source_payload=item["source_payload"],
-                    source_hash=item["source_hash"],
-                    loaded_at=now,
+        started = perf_counter()
+        driver_connection = await get_driver_connection(session)
+        await driver_connection.execute(
+            f"CREATE TEMP TABLE {RAW_STAGING_TABLE} ("
+            " tabletki_guid varchar, sku varchar NOT NULL, barcode varchar, manufacturer varchar,"
+            " name_ua varchar, name_ru varchar, category_l1_code varchar, category_l1_name varchar,"
+            " category_l2_code varchar, category_l2_name varchar, weight_g numeric(10, 2),"
+            " length_mm numeric(10, 2), width_mm numeric(10, 2), height_mm numeric(10, 2),"
+            " volume_ml numeric(10, 2), source_payload jsonb, source_hash varchar"
+            ") ON COMMIT DROP"
+        )
+        await driver_connection.copy_records_to_table(
+            RAW_STAGING_TABLE,
+            records=[
+                tuple(
+                    json.dumps(item[name], ensure_ascii=False) if name == "source_payload" else item[name]
+                    for name in RAW_DATA_COLUMNS
                 )
-                session.add(obj)
-                stats.raw_inserted += 1
-                continue
-
-            existing.tabletki_guid = item["tabletki_guid"]
-            existing.barcode = item["barcode"]
-            existing.manufacturer = item["manufacturer"]
-            existing.name_ua = item["name_ua"]
-            existing.name_ru = item["name_ru"]
-            existing.category_l1_code = item["category_l1_code"]
-            existing.category_l1_name = item["category_l1_name"]
-            existing.category_l2_code = item["category_l2_code"]
-            existing.category_l2_name = item["category_l2_name"]
-            existing.weight_g = item["weight_g"]
-            existing.length_mm = item["length_mm"]
-            existing.width_mm = item["width_mm"]
-            existing.height_mm = item["height_mm"]
-            existing.volume_ml = item["volume_ml"]
-            existing.description_ua = None
-            existing.description_ru = None
-            existing.source_payload = item["source_payload"]
-            existing.source_hash = item["source_hash"]
-            existing.loaded_at = now
-            stats.raw_updated += 1
+                for item in rows
+            ],
+            columns=RAW_DATA_COLUMNS,
+        )
+        stats.phase_sec["raw_copy"] = perf_counter() - started
+
+        started = perf_counter()
+        updated = await session.execute(
+            text(
+                f"UPDATE raw_tabletki_catalog r SET {set_list}, "
+                "description_ua = NULL, description_ru = NULL, loaded_at = :now "
+                f"FROM {RAW_STAGING_TABLE} s "
+                "WHERE r.sku = s.sku AND r.source_hash IS DISTINCT FROM s.source_hash"
+            ),
+            {"now": now},
+        )
+        inserted = await session.execute(
+            text(
+                f"INSERT INTO raw_tabletki_catalog ({column_list}, loaded_at) "
+                f"SELECT {column_list}, :now FROM {RAW_STAGING_TABLE} s "
+                "WHERE NOT EXISTS (SELECT 1 FROM raw_tabletki_catalog r WHERE r.sku = s.sku)"
+            ),
+            {"now": now},
+        )
+        updated_count = max(updated.rowcount or 0, 0)
+        inserted_count = max(inserted.rowcount or 0, 0)
+        stats.raw_updated += updated_count
+        stats.raw_inserted += inserted_count
+        stats.raw_unchanged += len(rows) - updated_count - inserted_count
+        stats.phase_sec["raw_merge"] = perf_counter() - started
 
 
 async def sync_tabletki_raw_to_master(stats: LoaderStats, limit: int = 0) -> None:
+    """
+    raw_tabletki_catalog -> master_catalog одним INSERT ... ON CONFLICT (sku):
+    строки, у которых синхронизируемые поля не изменились, не переписываются.
+    """
+    column_list = ", ".join(MASTER_SYNC_COLUMNS)
+    set_list = ", ".join(f"{name} = EXCLUDED.{name}" for name in MASTER_SYNC_COLUMNS)
+    changed = " OR ".join(f"m.{name} IS DISTINCT FROM EXCLUDED.{name}" for name in MASTER_SYNC_COLUMNS)
+    limit_clause = "LIMIT :limit" if limit and limit > 0 else ""
+
     async with get_async_db() as session:
-        stmt = select(RawTabletkiCatalog).order_by(RawTabletkiCatalog.id.asc())
-        if limit and limit > 0:
-            stmt = stmt.limit(limit)
-
-        raw_rows = (await session.execute(stmt)).scalars().all()
-
-        for raw in raw_rows:
-            master_stmt = select(MasterCatalog).where(MasterCatalog.sku == raw.sku)
-            existing = (await session.execute(master_stmt)).scalar_one_or_none()
-
-            if existing is None:
-                obj = MasterCatalog(
-                    sku=raw.sku,
-                    tabletki_guid=raw.tabletki_guid,
-                    barcode=raw.barcode,
-                    manufacturer=raw.manufacturer,
-                    name_ua=raw.name_ua,
-                    name_ru=raw.name_ru,
-                    category_l1_code=raw.category_l1_code,
-                    category_l2_code=raw.category_l2_code,
-                    weight_g=raw.weight_g,
-                    length_mm=raw.length_mm,
-                    width_mm=raw.width_mm,
-                    height_mm=raw.height_mm,
-                    volume_ml=raw.volume_ml,
-                )
-                session.add(obj)
-                stats.master_inserted += 1
-                continue
-
-            existing.tabletki_guid = raw.tabletki_guid
-            existing.barcode = raw.barcode
-            existing.manufacturer = raw.manufacturer
-            existing.name_ua = raw.name_ua
-            existing.name_ru = raw.name_ru
-            existing.category_l1_code = raw.category_l1_code
-            existing.category_l2_code = raw.category_l2_code
-            existing.weight_g = raw.weight_g
-            existing.length_mm = raw.length_mm
-            existing.width_mm = raw.width_mm
-            existing.height_mm = raw.height_mm
-            existing.volume_ml = raw.volume_ml
-            stats.master_updated += 1
+        started = perf_counter()
+        result = await session.execute(
+            text(
+                "WITH raw AS ("
+                f"    SELECT id, sku, {column_list} FROM raw_tabletki_catalog ORDER BY id {limit_clause}"
+                "), latest AS ("
+                f"    SELECT DISTINCT ON (sku) sku, {column_list} FROM raw ORDER BY sku, id DESC"
+                "), upserted AS ("
+                f"    INSERT INTO master_catalog AS m (sku, {column_list}) "
+                f"    SELECT sku, {column_list} FROM latest "
+                f"    ON CONFLICT (sku) DO UPDATE SET {set_list}, updated_at = now() WHERE {changed} "
+                "    RETURNING (xmax = 0) AS inserted"
+                ") "
+                "SELECT "
+                "    (SELECT count(*) FROM latest) AS total, "
+                "    count(*) FILTER (WHERE inserted) AS inserted, "
+                "    count(*) FILTER (WHERE NOT inserted) AS updated "
+                "FROM upserted"
+            ),
+            {"limit": limit} if limit_clause else {},
+        )
+        total, inserted, updated = result.one()
+        stats.master_inserted += int(inserted or 0)
+        stats.master_updated += int(updated or 0)
+        stats.master_unchanged += int(total or 0) - int(inserted or 0) - int(updated or 0)
+        stats.phase_sec["master_merge"] = perf_counter() - started
 
 
 async def load_tabletki_master_catalog(mode: str, limit: int = 0) -> Dict[str, Any]:
@@ -369,14 +418,35 @@ async def load_tabletki_master_catalog(mode: str, limit: int = 0) -> Dict[str, A
         stats.file = metadata.get("name", "")
         logger.info("Drive файл: %s (%s)", stats.file, metadata.get("id"))
 
-        xlsx_bytes = await _download_file_bytes(drive, metadata["id"])
-        rows = _read_tabletki_rows(xlsx_bytes, stats, limit=limit)
-        logger.info("Подготовлено строк из Excel: %d", len(rows))
-        await load_tabletki_raw(rows, stats)
+        if not limit and is_file_unchanged("tabletki_master_catalog", metadata):
+            logger.info("Drive файл не менялся с последней загрузки, raw шаг пропущен: %s", stats.file)
+        else:
+            started = perf_counter()
+            xlsx_bytes = await _download_file_bytes(drive, metadata["id"])
+            stats.phase_sec["download"] = perf_counter() - started
+            started = perf_counter()
+            rows = _read_tabletki_rows(xlsx_bytes, stats, limit=limit)
+            stats.phase_sec["parse"] = perf_counter() - started
+            logger.info("Подготовлено строк из Excel: %d", len(rows))
+            await load_tabletki_raw(rows, stats)
+            if not limit:
+                mark_file_imported("tabletki_master_catalog", metadata)
 
     if mode in {"master", "full"}:
         await sync_tabletki_raw_to_master(stats, limit=limit)
 
+    logger.info(
+        "Tabletki master catalog loader: rows=%d raw inserted/updated/unchanged=%d/%d/%d "
+        "master inserted/updated/unchanged=%d/%d/%d phases=%s",
+        stats.rows_read,
+        stats.raw_inserted,
+        stats.raw_updated,
+        stats.raw_unchanged,
+        stats.master_inserted,
+        stats.master_updated,
+        stats.master_unchanged,
+        {name: round(value, 3) for name, value in stats.phase_sec.items()},
+    )
     return stats.to_dict()
 
 
@@ -0,0 +1,135 @@
+"""
+Общий векторный слой конвертации pandas-таблиц для Excel/CSV адаптеров.
+
+Torgsoft, JetVet, excel_feed и import_catalog читали лист pandas, а затем шли
+по нему `df.iterrows()` и приводили каждую ячейку Python-хелперами
+(_coerce_float, _coerce_int_nonneg, ...). На выгрузках в тысячи строк почти всё
+время уходило на создание Series на каждую строку. Здесь те же правила
+приведения выполняются операциями над колонками, а записи собираются одним
+`to_dict("records")`.
+
+Правила совпадают со старыми построчными хелперами:
+- clean_str: None/NaN -> "", иначе str(v).strip();
+- to_number: "," -> ".", пустое/нечисловое -> NaN (строку отбрасывает вызывающий);
+- to_float: то же, но пустое/нечисловое -> default;
+- to_int_nonneg: int(float(v)) с отбрасыванием дробной части, < 0 -> 0,
+  пустое/нечисловое -> default.
+
+Движок чтения задаётся EXCEL_READER_ENGINE / CSV_READER_ENGINE: по умолчанию
+pandas выбирает сам (openpyxl/xlrd, C-parser); `calamine` / `pyarrow` включаются
+явно или через `auto`, если соответствующий пакет установлен. Если движок не
+поддерживает переданные параметры, чтение повторяется движком по умолчанию.
+"""
+from __future__ import annotations
+
+import importlib.util
+import logging
+import os
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+_ENGINE_PACKAGES = {"calamine": "python_calamine", "pyarrow": "pyarrow"}
+
+
+def _engine_available(engine: str) -> bool:
+    package = _ENGINE_PACKAGES.get(engine)
+    return package is not None and importlib.util.find_spec(package) is not None
+
+
+def _resolve_engine(env_name: str, preferred: str) -> Optional[str]:
+    raw = (os.getenv(env_name) or "").strip().lower()
+    if not raw or raw == "default":
+        return None
+    engine = preferred if raw == "auto" else raw
+    if engine in _ENGINE_PACKAGES and not _engine_available(engine):
+        if raw != "auto":
+            logger.warning("%s=%s, but package %s is not installed; using pandas default", env_name, raw, _ENGINE_PACKAGES[engine])
+        return None
+    return engine
+
+
+def read_excel_frame(source: Any, **kwargs: Any) -> pd.DataFrame:
+    """pd.read_excel с движком из EXCEL_READER_ENGINE (calamine/auto)."""
+    engine = kwargs.pop("engine", None) or _resolve_engine("EXCEL_READER_ENGINE", "calamine")
+    if engine:
+        try:
+            return pd.read_excel(source, engine=engine, **kwargs)
+        except (ValueError, NotImplementedError, TypeError) as exc:
+            logger.warning("read_excel engine=%s failed (%s), retrying with pandas default", engine, exc)
+            if hasattr(source, "seek"):
+                source.seek(0)
+    return pd.read_excel(source, **kwargs)
+
+
+def read_csv_frame(source: Any, **kwargs: Any) -> pd.DataFrame:
+    """pd.read_csv с движком из CSV_READER_ENGINE (pyarrow/auto)."""
+    engine = kwargs.pop("engine", None) or _resolve_engine("CSV_READER_ENGINE", "pyarrow")
+    if engine:
+        try:
+            return pd.read_csv(source, engine=engine, **kwargs)
+        except (ValueError, NotImplementedError, TypeError) as exc:
+            # UnicodeDecodeError - подкласс ValueError, его решает вызывающий (смена encoding)
+            if isinstance(exc, UnicodeDecodeError):
+                raise
+            logger.warning("read_csv engine=%s failed (%s), retrying with pandas default", engine, exc)
+            if hasattr(source, "seek"):
+                source.seek(0)
+    return pd.read_csv(source, **kwargs)
+
+
+def column_or_default(df: pd.DataFrame, column: str, default: Any = None) -> pd.Series:
+    """
+    Колонка df или Series из default той же длины (аналог row.get(column, default)).
+    Если после переименования колонок имя повторяется, берётся первая.
+    """
+    if column in df.columns:
+        values = df[column]
+        return values.iloc[:, 0] if isinstance(values, pd.DataFrame) else values
+    return pd.Series([default] * len(df), index=df.index, dtype=object)
+
+
+def clean_str(values: pd.Series) -> pd.Series:
+    """None/NaN -> "", остальное -> str(v).strip()."""
+    filled = values.astype(object).where(values.notna(), "")
+    return filled.astype(str).str.strip()
+
+
+def to_number(values: pd.Series) -> pd.Series:
+    """"," -> ".", число как float; пустое, нечисловое и inf -> NaN."""
+    text = clean_str(values).str.replace(",", ".", regex=False)
+    numbers = pd.to_numeric(text.where(text.ne(""), None), errors="coerce").astype(float)
+    return numbers.where(np.isfinite(numbers))
+
+
+def to_float(values: pd.Series, default: float = 0.0) -> pd.Series:
+    return to_number(values).fillna(default)
+
+
+def to_int_nonneg(values: pd.Series, default: int = 0) -> pd.Series:
+    numbers = to_number(values)
+    valid = numbers.notna()
+    truncated = np.trunc(numbers.where(valid, 0)).clip(lower=0)
+    return truncated.where(valid, default).astype(np.int64)
+
+
+def map_column(values: pd.Series, resolve: Union[Mapping[Any, Any], Callable[[Any], Any]]) -> pd.Series:
+    """
+    Сопоставление значений колонки (например, склад -> branch).
+    resolve - словарь или функция; функция вызывается один раз на уникальное значение.
+    """
+    if not callable(resolve):
+        return values.map(resolve)
+    return values.map({value: resolve(value) for value in values.unique()})
+
+
+def to_records(df: pd.DataFrame, columns: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """Записи с нативными Python-типами (json.dump-совместимо)."""
+    if columns is not None:
+        df = df[list(columns)]
+    return df.to_dict("records")
+
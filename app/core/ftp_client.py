@@ -0,0 +1,358 @@
+"""
+Общий асинхронный доступ к FTP для ftp_* адаптеров.
+
+ftplib синхронный, поэтому все операции выполняются в отдельном пуле потоков,
+а корутины адаптеров только ждут результат: передача файла одного предприятия
+больше не останавливает остальные задачи stock/catalog планировщика.
+
+Соединения переиспользуются: на каждую пару (host, port, user, encoding)
+держится небольшой пул залогиненных FTP-сессий (FTP_POOL_MAX_PER_HOST),
+перед повторным использованием простаивающее соединение проверяется NOOP.
+
+Листинг идёт через MLSD (имя, mtime и размер за один запрос); если сервер
+MLSD не поддерживает, используется NLST + MDTM/SIZE по каждому файлу.
+Опционально (FTP_SKIP_INGESTED) хранятся mtime/size успешно загруженных
+файлов каталога, чтобы адаптеры не скачивали и не обрабатывали их повторно.
+Сток не пропускается никогда: он выгружается каждый цикл, даже из того же
+файла (SKIP_INGESTED_FILE_TYPES).
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import posixpath
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from ftplib import FTP, all_errors, error_perm
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core.paths import STATE_CACHE_DIR
+
+
+logger = logging.getLogger(__name__)
+
+FTP_DEFAULT_TIMEOUT = 30
+IDLE_CHECK_AFTER_SEC = 15
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_pools: Dict[Tuple[str, int, str, str], "AsyncFtpPool"] = {}
+_pools_lock = threading.Lock()
+_state_lock = threading.Lock()
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    return raw.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name)
+    if raw is None or not raw.strip():
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        return default
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, _env_int("FTP_MAX_WORKERS", 8)),
+                thread_name_prefix="ftp",
+            )
+        return _executor
+
+
+@dataclass(frozen=True)
+class FtpFileInfo:
+    """Файл на FTP; mtime - naive datetime из MLSD/MDTM (время сервера, обычно UTC)."""
+
+    path: str
+    name: str
+    mtime: Optional[datetime] = None
+    size: Optional[int] = None
+
+
+def _parse_ftp_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value.strip()[:14], "%Y%m%d%H%M%S")
+    except ValueError:
+        return None
+
+
+def join_ftp_path(directory: str, name: str) -> str:
+    if not directory or directory == ".":
+        return name
+    return posixpath.join(directory, name)
+
+
+class AsyncFtpPool:
+    """Пул FTP-соединений одного хоста/пользователя с async-интерфейсом."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 21,
+        user: str = "",
+        password: str = "",
+        *,
+        encoding: str = "utf-8",
+        timeout: float = FTP_DEFAULT_TIMEOUT,
+        max_size: Optional[int] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self._password = password
+        self.encoding = encoding
+        self.timeout = timeout
+        self._idle: List[Tuple[FTP, float]] = []
+        self._idle_lock = threading.Lock()
+        self._max_size = max(1, max_size or _env_int("FTP_POOL_MAX_PER_HOST", 2))
+        self._slots = threading.BoundedSemaphore(self._max_size)
+        # слот хоста занимается до run_in_executor: иначе всплеск вызовов к одному
+        # хосту занял бы все потоки общего FTP_MAX_WORKERS пула, ожидая _slots
+        self._loop_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _connect(self) -> FTP:
+        ftp = FTP()
+        ftp.encoding = self.encoding
+        ftp.connect(self.host, self.port, timeout=self.timeout)
+        ftp.login(self.user, self._password)
+        return ftp
+
+    def _checkout(self) -> FTP:
+        while True:
+            with self._idle_lock:
+                if not self._idle:
+                    break
+                ftp, released_at = self._idle.pop()
+            if time.monotonic() - released_at < IDLE_CHECK_AFTER_SEC:
+                return ftp
+            try:
+                ftp.voidcmd("NOOP")
+                return ftp
+            except all_errors:
+                _close_quietly(ftp)
+        return self._connect()
+
+    def _checkin(self, ftp: FTP) -> None:
+        with self._idle_lock:
+            self._idle.append((ftp, time.monotonic()))
+
+    def _call(self, func: Callable[..., Any], *args: Any) -> Any:
+        with self._slots:
+            ftp = self._checkout()
+            try:
+                result = func(ftp, *args)
+            except error_perm:
+                # ответ 5xx на команду - соединение исправно, ошибку отдаём вызывающему
+                self._checkin(ftp)
+                raise
+            except BaseException:
+                _close_quietly(ftp)
+                raise
+            self._checkin(ftp)
+            return result
+
+    def _loop_slot(self, loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+        with self._idle_lock:
+            semaphore = self._loop_slots.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self._max_size)
+                self._loop_slots[loop] = semaphore
+            return semaphore
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Выполняет func(ftp, *args) на соединении из пула в потоке FTP-пула."""
+        loop = asyncio.get_running_loop()
+        async with self._loop_slot(loop):
+            return await loop.run_in_executor(_get_executor(), functools.partial(self._call, func, *args))
+
+    @staticmethod
+    def _list_sync(ftp: FTP, directory: str) -> List[FtpFileInfo]:
+        try:
+            files = []
+            for name, facts in ftp.mlsd(directory or "", facts=["type", "size", "modify"]):
+                if facts.get("type", "file") != "file":
+                    continue
+                size = facts.get("size")
+                files.append(
+                    FtpFileInfo(
+                        path=join_ftp_path(directory, name),
+                        name=name,
+                        mtime=_parse_ftp_time(facts.get("modify")),
+                        size=int(size) if size and size.isdigit() else None,
+                    )
+                )
+            return files
+        except error_perm as exc:
+            if not str(exc).startswith(("500", "501", "502", "504")):
+                raise
+
+        # Сервер без MLSD: NLST + MDTM/SIZE по каждому файлу.
+        files = []
+        for entry in ftp.nlst(directory) if directory else ftp.nlst():
+            name = posixpath.basename(entry)
+            path = entry if "/" in entry else join_ftp_path(directory, entry)
+            try:
+                mtime = _parse_ftp_time(ftp.sendcmd(f"MDTM {path}")[4:])
+            except all_errors:
+                mtime = None
+            try:
+                size = ftp.size(path)
+            except all_errors:
+                size = None
+            files.append(FtpFileInfo(path=path, name=name, mtime=mtime, size=size))
+        return files
+
+    async def list_files(self, directory: str = "", *, suffix: Optional[str] = None) -> List[FtpFileInfo]:
+        """Файлы каталога с mtime/size; suffix - фильтр по расширению без учёта регистра."""
+        files = await self.run(self._list_sync, directory)
+        if suffix:
+            files = [item for item in files if item.name.lower().endswith(suffix.lower())]
+        return files
+
+    @staticmethod
+    def _retrieve_sync(ftp: FTP, path: str, write: Callable[[bytes], Any]) -> None:
+        ftp.retrbinary(f"RETR {path}", write)
+
+    async def download_bytes(self, path: str) -> bytes:
+        buffer = BytesIO()
+        await self.run(self._retrieve_sync, path, buffer.write)
+        return buffer.getvalue()
+
+    async def download_to_path(self, path: str, local_path: str) -> str:
+        """Пишет файл на диск блоками по мере получения, не держа его в памяти."""
+        def _download(ftp: FTP) -> None:
+            with open(local_path, "wb") as handle:
+                self._retrieve_sync(ftp, path, handle.write)
+
+        await self.run(_download)
+        return local_path
+
+    async def delete(self, path: str) -> None:
+        await self.run(lambda ftp: ftp.delete(path))
+
+    async def ensure_dir(self, abs_path: str) -> None:
+        """Создаёт абсолютный каталог по сегментам; существующие сегменты пропускаются."""
+        def _ensure(ftp: FTP) -> None:
+            current = "/"
+            for segment in [part for part in abs_path.strip("/").split("/") if part]:
+                current = posixpath.join(current, segment)
+                try:
+                    ftp.mkd(current)
+                except error_perm as exc:
+                    if not str(exc).startswith("550"):
+                        raise
+
+        await self.run(_ensure)
+
+
+def _close_quietly(ftp: FTP) -> None:
+    try:
+        ftp.quit()
+    except all_errors:
+        try:
+            ftp.close()
+        except Exception:
+            pass
+
+
+def get_ftp_pool(
+    host: str,
+    port: int = 21,
+    user: str = "",
+    password: str = "",
+    *,
+    encoding: str = "utf-8",
+    timeout: float = FTP_DEFAULT_TIMEOUT,
+) -> AsyncFtpPool:
+    """Пул соединений процесса для (host, port, user, encoding)."""
+    key = (str(host), int(port), str(user or ""), encoding)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool._password != (password or ""):
+            pool = AsyncFtpPool(host, port, user or "", password or "", encoding=encoding, timeout=timeout)
+            _pools[key] = pool
+        return pool
+
+
+# --- Учёт загруженных файлов ------------------------------------------------
+
+# как google_drive_service.SKIP_UNCHANGED_FILE_TYPES: сток предприятия импортируется
+# каждый цикл, чтобы обновлялись остатки, экспорт и last_stock_upload
+SKIP_INGESTED_FILE_TYPES = frozenset({"catalog"})
+
+
+def skip_ingested_enabled(file_type: str) -> bool:
+    return file_type in SKIP_INGESTED_FILE_TYPES and _env_bool("FTP_SKIP_INGESTED", False)
+
+
+def _state_path(scope: str) -> Path:
+    state_dir = Path(os.getenv("FTP_STATE_DIR") or (STATE_CACHE_DIR / "ftp"))
+    return state_dir / f"ftp_{scope}_ingested.json"
+
+
+def _signature(info: FtpFileInfo) -> Optional[Dict[str, Any]]:
+    if info.mtime is None and info.size is None:
+        return None
+    return {"mtime": info.mtime.isoformat() if info.mtime else None, "size": info.size}
+
+
+def _load_state(scope: str) -> Dict[str, Any]:
+    path = _state_path(scope)
+    if not path.exists():
+        return {}
+    try:
+        payload = json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        logger.exception("FTP ingest state read failed: scope=%s path=%s", scope, path)
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+
+def is_already_ingested(scope: str, info: FtpFileInfo, *, file_type: str) -> bool:
+    """True, если файл с теми же mtime и size уже был успешно обработан в этом scope."""
+    if not skip_ingested_enabled(file_type):
+        return False
+    signature = _signature(info)
+    return signature is not None and _load_state(scope).get(info.path) == signature
+
+
+def mark_ingested(scope: str, info: FtpFileInfo, *, file_type: str) -> None:
+    if not skip_ingested_enabled(file_type):
+        return
+    signature = _signature(info)
+    if signature is None:
+        return
+    path = _state_path(scope)
+    try:
+        with _state_lock:
+            state = _load_state(scope)
+            state[info.path] = signature
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            tmp_path.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp_path, path)
+    except Exception:
+        logger.exception("FTP ingest state write failed: scope=%s path=%s", scope, path)
@@ -0,0 +1,281 @@
+"""
+Общий асинхронный доступ к Google Drive API.
+
+googleapiclient синхронный: `files().list().execute()` и
+`MediaIoBaseDownload.next_chunk()` блокируют поток. Здесь они выполняются
+в отдельном пуле потоков, а корутины только ждут результат, поэтому event loop
+планировщиков не замирает на время загрузки.
+
+Credentials читаются один раз на путь к ключу. Drive service (`build("drive",
+"v3")`) строится лениво один раз на рабочий поток: httplib2 внутри service не
+потокобезопасен, поэтому один объект service между потоками не делится.
+
+Дополнительно модуль хранит отпечатки успешно импортированных файлов
+(md5Checksum, для Google-документов - modifiedTime), чтобы импортеры могли
+пропускать файлы, не изменившиеся с прошлого успешного импорта
+(GOOGLE_DRIVE_SKIP_UNCHANGED).
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional, Sequence
+
+from app.core.paths import STATE_CACHE_DIR
+
+
+logger = logging.getLogger(__name__)
+
+DRIVE_SCOPES = ("https://www.googleapis.com/auth/drive",)
+DEFAULT_FILE_FIELDS = "id, name, mimeType, modifiedTime, md5Checksum, size"
+DEFAULT_DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_clients: Dict[tuple, "AsyncDriveClient"] = {}
+_clients_lock = threading.Lock()
+_state_lock = threading.Lock()
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    return raw.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name)
+    if raw is None or not raw.strip():
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        return default
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, _env_int("GOOGLE_DRIVE_MAX_WORKERS", 4)),
+                thread_name_prefix="gdrive",
+            )
+        return _executor
+
+
+class AsyncDriveClient:
+    """Обёртка над Drive v3: блокирующие вызовы выполняются в пуле потоков."""
+
+    def __init__(self, credentials_path: str, scopes: Sequence[str] = DRIVE_SCOPES):
+        from google.oauth2 import service_account
+
+        self.credentials_path = credentials_path
+        self._credentials = service_account.Credentials.from_service_account_file(
+            credentials_path,
+            scopes=list(scopes),
+        )
+        self._local = threading.local()
+
+    def _service(self):
+        service = getattr(self._local, "service", None)
+        if service is None:
+            from googleapiclient.discovery import build
+
+            service = build("drive", "v3", credentials=self._credentials, cache_discovery=False)
+            self._local.service = service
+        return service
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+
+    def _list_files_sync(
+        self,
+        query: str,
+        fields: str,
+        order_by: Optional[str],
+        page_size: int,
+        limit: int,
+    ) -> List[Dict[str, Any]]:
+        files: List[Dict[str, Any]] = []
+        page_token = None
+        while True:
+            params: Dict[str, Any] = {
+                "q": query,
+                "fields": f"nextPageToken, files({fields})",
+                "pageSize": page_size,
+            }
+            if order_by:
+                params["orderBy"] = order_by
+            if page_token:
+                params["pageToken"] = page_token
+            response = self._service().files().list(**params).execute()
+            files.extend(response.get("files", []) or [])
+            if limit > 0 and len(files) >= limit:
+                return files[:limit]
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return files
+
+    async def list_files(
+        self,
+        folder_id: str,
+        *,
+        fields: str = DEFAULT_FILE_FIELDS,
+        order_by: Optional[str] = None,
+        page_size: int = 1000,
+        limit: int = 0,
+    ) -> List[Dict[str, Any]]:
+        """Файлы папки (все страницы); limit > 0 - не больше N файлов."""
+        query = f"'{folder_id}' in parents and trashed=false"
+        return await self._run(self._list_files_sync, query, fields, order_by, page_size, limit)
+
+    async def latest_file(self, folder_id: str, *, fields: str = DEFAULT_FILE_FIELDS) -> Optional[Dict[str, Any]]:
+        """Последний изменённый файл папки или None, если папка пуста."""
+        files = await self.list_files(
+            folder_id,
+            fields=fields,
+            order_by="modifiedTime desc",
+            page_size=1,
+            limit=1,
+        )
+        return files[0] if files else None
+
+    def _download_sync(self, file_id: str, handle: BinaryIO, chunk_size: int) -> None:
+        from googleapiclient.http import MediaIoBaseDownload
+
+        request = self._service().files().get_media(fileId=file_id)
+        downloader = MediaIoBaseDownload(handle, request, chunksize=chunk_size)
+        done = False
+        while not done:
+            _, done = downloader.next_chunk()
+
+    async def download_bytes(self, file_id: str, *, chunk_size: int = DEFAULT_DOWNLOAD_CHUNK_SIZE) -> bytes:
+        handle = io.BytesIO()
+        await self._run(self._download_sync, file_id, handle, chunk_size)
+        return handle.getvalue()
+
+    def _download_to_path_sync(self, file_id: str, path: str, chunk_size: int) -> None:
+        with open(path, "wb") as handle:
+            self._download_sync(file_id, handle, chunk_size)
+
+    async def download_to_path(
+        self,
+        file_id: str,
+        path: str,
+        *,
+        chunk_size: int = DEFAULT_DOWNLOAD_CHUNK_SIZE,
+    ) -> str:
+        """Потоково пишет файл на диск чанками по chunk_size, не держа его в памяти."""
+        await self._run(self._download_to_path_sync, file_id, path, chunk_size)
+        return path
+
+    async def download_to_temp(self, file_id: str, file_name: str, directory: str) -> str:
+        """
+        Скачивает файл в уникальный путь внутри directory (`gdrive_XXXX_<file_name>`).
+        Параллельные запуски разных предприятий с одинаковым именем файла
+        (например, stock.xlsx) не перезаписывают и не удаляют файлы друг друга.
+        Удалить файл после обработки - задача вызывающего.
+        """
+        fd, path = tempfile.mkstemp(prefix="gdrive_", suffix=f"_{os.path.basename(file_name) or 'file'}", dir=directory)
+        os.close(fd)
+        try:
+            return await self.download_to_path(file_id, path)
+        except BaseException:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+
+
+def get_drive_client(credentials_path: Optional[str] = None) -> AsyncDriveClient:
+    """
+    Кешированный клиент для ключа сервисного аккаунта
+    (по умолчанию GOOGLE_DRIVE_CREDENTIALS_PATH).
+    """
+    path = credentials_path or os.getenv("GOOGLE_DRIVE_CREDENTIALS_PATH")
+    if not path:
+        raise EnvironmentError("Не задан путь к учетным данным Google Drive (GOOGLE_DRIVE_CREDENTIALS_PATH).")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Не найден файл учетных данных Google Drive: {path}")
+
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = AsyncDriveClient(path)
+            _clients[key] = client
+        return client
+
+
+# --- Отпечатки импортированных файлов ---------------------------------------
+
+def skip_unchanged_enabled() -> bool:
+    return _env_bool("GOOGLE_DRIVE_SKIP_UNCHANGED", False)
+
+
+def _state_path(scope: str) -> Path:
+    state_dir = Path(os.getenv("GOOGLE_DRIVE_STATE_DIR") or (STATE_CACHE_DIR / "google_drive"))
+    return state_dir / f"gdrive_{scope}_imported.json"
+
+
+def file_fingerprint(file_meta: Dict[str, Any]) -> Optional[str]:
+    """md5Checksum для бинарных файлов, modifiedTime для Google-документов."""
+    md5 = file_meta.get("md5Checksum")
+    if md5:
+        return f"md5:{md5}"
+    modified = file_meta.get("modifiedTime")
+    if modified:
+        return f"mtime:{modified}"
+    return None
+
+
+def _load_state(scope: str) -> Dict[str, str]:
+    path = _state_path(scope)
+    if not path.exists():
+        return {}
+    try:
+        payload = json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        logger.exception("Google Drive import state read failed: scope=%s path=%s", scope, path)
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+
+def is_file_unchanged(scope: str, file_meta: Dict[str, Any]) -> bool:
+    """True, если файл уже успешно импортирован в этом scope с тем же отпечатком."""
+    if not skip_unchanged_enabled():
+        return False
+    fingerprint = file_fingerprint(file_meta)
+    if fingerprint is None:
+        return False
+    return _load_state(scope).get(str(file_meta.get("id"))) == fingerprint
+
+
+def mark_file_imported(scope: str, file_meta: Dict[str, Any]) -> None:
+    """Запоминает отпечаток файла после успешного импорта."""
+    if not skip_unchanged_enabled():
+        return
+    fingerprint = file_fingerprint(file_meta)
+    if fingerprint is None:
+        return
+    path = _state_path(scope)
+    try:
+        with _state_lock:
+            state = _load_state(scope)
+            state[str(file_meta.get("id"))] = fingerprint
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            tmp_path.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp_path, path)
+    except Exception:
+        logger.exception("Google Drive import state write failed: scope=%s path=%s", scope, path)
@@ -0,0 +1,325 @@
+"""
+Общий реестр HTTP-клиентов для исходящих интеграций.
+
+Вместо `aiohttp.ClientSession()` / `httpx.AsyncClient()` на каждый вызов
+интеграции берут долгоживущий клиент из этого модуля: соединения
+переиспользуются (keep-alive), лимиты на хост общие для процесса,
+а по каждому хосту копятся latency/bytes метрики.
+
+Клиенты привязаны к event loop, поэтому реестр хранит их отдельно
+для каждого loop (шедулеры запускаются через собственный asyncio.run).
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import weakref
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Any
+
+import aiohttp
+import httpx
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_PER_HOST = 10
+DEFAULT_KEEPALIVE_SEC = 30
+DEFAULT_TIMEOUT_SEC = 60
+# как ClientSession() по умолчанию: большие POST каталога/стока и скачивание
+# фидов идут дольше минуты; короткие лимиты задаются на уровне запроса
+DEFAULT_AIOHTTP_TOTAL_TIMEOUT_SEC = 300
+
+
+def _env_int(name: str, default: int) -> int:
+    return int((os.getenv(name) or str(default)).strip())
+
+
+def _env_bool(name: str, default: str = "0") -> bool:
+    return (os.getenv(name, default) or "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _parse_host_limits(raw: str | None) -> dict[str, int]:
+    """`host=limit,host2=limit2` -> {host: limit}."""
+    limits: dict[str, int] = {}
+    for item in (raw or "").split(","):
+        host, sep, value = item.partition("=")
+        host = host.strip().lower()
+        if not sep or not host:
+            continue
+        try:
+            limits[host] = max(1, int(value.strip()))
+        except ValueError:
+            logger.warning("HTTP clients: invalid host limit entry=%s", item)
+    return limits
+
+
+MAX_CONNECTIONS = _env_int("HTTP_CLIENT_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS)
+MAX_PER_HOST = _env_int("HTTP_CLIENT_MAX_PER_HOST", DEFAULT_MAX_PER_HOST)
+KEEPALIVE_SEC = _env_int("HTTP_CLIENT_KEEPALIVE_SEC", DEFAULT_KEEPALIVE_SEC)
+HOST_LIMITS = _parse_host_limits(os.getenv("HTTP_CLIENT_HOST_LIMITS"))
+GZIP_REQUESTS = _env_bool("HTTP_CLIENT_GZIP_REQUESTS", "0")
+GZIP_MIN_BYTES = _env_int("HTTP_CLIENT_GZIP_MIN_BYTES", 64 * 1024)
+
+
+# ---------------------------------------------------------------------------
+# Метрики по хостам
+# ---------------------------------------------------------------------------
+@dataclass
+class HostMetrics:
+    requests: int = 0
+    errors: int = 0
+    total_latency_sec: float = 0.0
+    max_latency_sec: float = 0.0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+    def observe(self, latency_sec: float, *, error: bool = False) -> None:
+        self.requests += 1
+        if error:
+            self.errors += 1
+        self.total_latency_sec += latency_sec
+        self.max_latency_sec = max(self.max_latency_sec, latency_sec)
+
+
+_METRICS: dict[str, HostMetrics] = {}
+
+
+def _host_metrics(host: str) -> HostMetrics:
+    metrics = _METRICS.get(host)
+    if metrics is None:
+        metrics = HostMetrics()
+        _METRICS[host] = metrics
+    return metrics
+
+
+def get_http_metrics_snapshot(*, reset: bool = False) -> dict[str, dict[str, Any]]:
+    snapshot = {
+        host: {
+            "requests": metrics.requests,
+            "errors": metrics.errors,
+            "avg_latency_sec": round(metrics.total_latency_sec / metrics.requests, 3) if metrics.requests else 0.0,
+            "max_latency_sec": round(metrics.max_latency_sec, 3),
+            "total_latency_sec": round(metrics.total_latency_sec, 3),
+            "bytes_sent": metrics.bytes_sent,
+            "bytes_received": metrics.bytes_received,
+        }
+        for host, metrics in _METRICS.items()
+    }
+    if reset:
+        _METRICS.clear()
+    return snapshot
+
+
+def log_http_metrics(*, reset: bool = False) -> None:
+    for host, metrics in sorted(get_http_metrics_snapshot(reset=reset).items()):
+        logger.info(
+            "HTTP metrics: host=%s requests=%s errors=%s avg_latency=%.3fs max_latency=%.3fs total_latency=%.3fs sent=%s received=%s",
+            host,
+            metrics["requests"],
+            metrics["errors"],
+            metrics["avg_latency_sec"],
+            metrics["max_latency_sec"],
+            metrics["total_latency_sec"],
+            metrics["bytes_sent"],
+            metrics["bytes_received"],
+        )
+
+
+# ---------------------------------------------------------------------------
+# Лимиты по хостам
+# ---------------------------------------------------------------------------
+_HOST_SEMAPHORES: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _host_semaphore(host: str) -> asyncio.Semaphore | None:
+    limit = HOST_LIMITS.get(host)
+    if not limit:
+        return None
+    loop = asyncio.get_running_loop()
+    per_loop = _HOST_SEMAPHORES.setdefault(loop, {})
+    semaphore = per_loop.get(host)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(limit)
+        per_loop[host] = semaphore
+    return semaphore
+
+
+# ---------------------------------------------------------------------------
+# aiohttp
+# ---------------------------------------------------------------------------
+async def _on_aiohttp_request_start(session, ctx, params) -> None:
+    ctx.host = (params.url.host or "").lower()
+    ctx.started = perf_counter()
+    ctx.semaphore = _host_semaphore(ctx.host)
+    if ctx.semaphore is not None:
+        await ctx.semaphore.acquire()
+
+
+def _release_aiohttp_slot(ctx) -> None:
+    semaphore = getattr(ctx, "semaphore", None)
+    if semaphore is not None:
+        semaphore.release()
+        ctx.semaphore = None
+
+
+async def _on_aiohttp_request_end(session, ctx, params) -> None:
+    _release_aiohttp_slot(ctx)
+    metrics = _host_metrics(ctx.host)
+    metrics.observe(perf_counter() - ctx.started, error=params.response.status >= 400)
+    if params.response.content_length:
+        metrics.bytes_received += params.response.content_length
+
+
+async def _on_aiohttp_request_exception(session, ctx, params) -> None:
+    _release_aiohttp_slot(ctx)
+    _host_metrics(ctx.host).observe(perf_counter() - ctx.started, error=True)
+
+
+async def _on_aiohttp_chunk_sent(session, ctx, params) -> None:
+    _host_metrics(ctx.host).bytes_sent += len(params.chunk)
+
+
+def _build_trace_config() -> aiohttp.TraceConfig:
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(_on_aiohttp_request_start)
+    trace_config.on_request_end.append(_on_aiohttp_request_end)
+    trace_config.on_request_exception.append(_on_aiohttp_request_exception)
+    trace_config.on_request_chunk_sent.append(_on_aiohttp_chunk_sent)
+    return trace_config
+
+
+_AIOHTTP_SESSIONS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_aiohttp_session() -> aiohttp.ClientSession:
+    """
+    Общая aiohttp-сессия текущего event loop.
+
+    Сессию не нужно закрывать после запроса (`async with session.get(...)`
+    достаточно); закрытие - через close_http_clients() при остановке процесса.
+    Общий таймаут сессии - 300 с; более короткий передаётся в запрос
+    (`session.get(url, timeout=aiohttp.ClientTimeout(total=...))`).
+    """
+    loop = asyncio.get_running_loop()
+    session = _AIOHTTP_SESSIONS.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=MAX_CONNECTIONS,
+            limit_per_host=MAX_PER_HOST,
+            keepalive_timeout=KEEPALIVE_SEC,
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=DEFAULT_AIOHTTP_TOTAL_TIMEOUT_SEC),
+            headers={"Accept-Encoding": "gzip, deflate"},
+            trace_configs=[_build_trace_config()],
+        )
+        _AIOHTTP_SESSIONS[loop] = session
+    return session
+
+
+# ---------------------------------------------------------------------------
+# httpx
+# ---------------------------------------------------------------------------
+class _MeteredTransport(httpx.AsyncHTTPTransport):
+    """Transport с лимитом на хост и сбором метрик."""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = (request.url.host or "").lower()
+        metrics = _host_metrics(host)
+        semaphore = _host_semaphore(host)
+        if semaphore is not None:
+            await semaphore.acquire()
+        started = perf_counter()
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            metrics.observe(perf_counter() - started, error=True)
+            raise
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+        metrics.observe(perf_counter() - started, error=response.status_code >= 400)
+        metrics.bytes_sent += len(request.content) if request.content else 0
+        content_length = response.headers.get("Content-Length")
+        if content_length and content_length.isdigit():
+            metrics.bytes_received += int(content_length)
+        return response
+
+
+_HTTPX_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_httpx_client() -> httpx.AsyncClient:
+    """
+    Общий httpx.AsyncClient текущего event loop.
+
+    Таймауты и заголовки передаются на уровне запроса
+    (`client.get(url, headers=..., timeout=...)`).
+    """
+    loop = asyncio.get_running_loop()
+    client = _HTTPX_CLIENTS.get(loop)
+    if client is None or client.is_closed:
+        limits = httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_SEC,
+        )
+        client = httpx.AsyncClient(
+            transport=_MeteredTransport(limits=limits),
+            timeout=DEFAULT_TIMEOUT_SEC,
+            headers={"Accept-Encoding": "gzip, deflate"},
+        )
+        _HTTPX_CLIENTS[loop] = client
+    return client
+
+
+# ---------------------------------------------------------------------------
+# gzip-тело запроса
+# ---------------------------------------------------------------------------
+def encode_json_body(payload: Any) -> tuple[bytes, dict[str, str]]:
+    """
+    Сериализует payload в JSON и (если включено HTTP_CLIENT_GZIP_REQUESTS и
+    тело больше HTTP_CLIENT_GZIP_MIN_BYTES) сжимает его gzip.
+    Возвращает (body, headers) для передачи в `data=`.
+    """
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    if GZIP_REQUESTS and len(body) >= GZIP_MIN_BYTES:
+        body = gzip.compress(body)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
+
+
+# ---------------------------------------------------------------------------
+# Жизненный цикл
+# ---------------------------------------------------------------------------
+async def close_http_clients() -> None:
+    """Закрывает клиенты текущего event loop (вызывать при остановке шедулера)."""
+    loop = asyncio.get_running_loop()
+    session = _AIOHTTP_SESSIONS.pop(loop, None)
+    if session is not None and not session.closed:
+        await session.close()
+    client = _HTTPX_CLIENTS.pop(loop, None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+@asynccontextmanager
+async def http_clients_lifespan():
+    """`async with http_clients_lifespan(): ...` - закрывает клиенты на выходе."""
+    try:
+        yield
+    finally:
+        await close_http_clients()
@@ -0,0 +1,207 @@
+"""
+Асинхронная постраничная выгрузка из внешних API (KeyCRM, Vetmanager).
+
+Раньше адаптеры ходили по страницам синхронным `requests` с `time.sleep`
+между запросами прямо внутри async run_service, и весь шедулер стоял, пока
+выгружался крупный аккаунт. Здесь:
+
+- TokenBucket - лимит запросов в секунду на API-ключ (общий для всех
+  выгрузок этого ключа в текущем event loop);
+- get_json_with_retry - GET через общую aiohttp-сессию с повтором на
+  429/5xx и сетевые ошибки, backoff через asyncio.sleep (учитывает Retry-After);
+- iter_pages - держит до max_in_flight запросов следующих страниц
+  одновременно и отдаёт страницы строго по порядку по мере готовности.
+
+Когда число страниц заранее неизвестно, следующие страницы запрашиваются
+спекулятивно; после последней страницы лишние запросы отменяются.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+
+from app.core.http_clients import get_aiohttp_session
+
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class PageFetchError(RuntimeError):
+    """Страница не получена после всех попыток (или ответ с не-retry статусом)."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity подряд."""
+
+    def __init__(self, rate_per_sec: float, capacity: float = 1.0):
+        self.rate = float(rate_per_sec)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+_BUCKETS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, TokenBucket]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def account_rate_key(integration: str, secret: str) -> str:
+    """Ключ bucket на аккаунт интеграции без хранения самого секрета (API-ключа)."""
+    return f"{integration}:{hashlib.sha256(str(secret).encode()).hexdigest()[:12]}"
+
+
+def get_rate_limiter(key: str, rate_per_sec: float, capacity: float = 1.0) -> TokenBucket:
+    """Общий bucket на ключ (например, API-ключ интеграции) в текущем event loop."""
+    per_loop = _BUCKETS.setdefault(asyncio.get_running_loop(), {})
+    bucket = per_loop.get(key)
+    if bucket is None:
+        bucket = TokenBucket(rate_per_sec, capacity)
+        per_loop[key] = bucket
+    return bucket
+
+
+@dataclass
+class RetryPolicy:
+    attempts: int = 3
+    backoff_sec: float = 0.5
+    max_backoff_sec: float = 30.0
+    statuses: frozenset = field(default=RETRY_STATUSES)
+
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(self.max_backoff_sec, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+        return min(self.max_backoff_sec, self.backoff_sec * (2 ** (attempt - 1)))
+
+
+async def get_json_with_retry(
+    url: str,
+    *,
+    headers: Optional[Dict[str, str]] = None,
+    params: Optional[Dict[str, Any]] = None,
+    timeout_sec: float = 30,
+    limiter: Optional[TokenBucket] = None,
+    retry: Optional[RetryPolicy] = None,
+    label: str = "",
+) -> Any:
+    """GET -> JSON; каждая попытка проходит через limiter, ошибки - PageFetchError."""
+    retry = retry or RetryPolicy()
+    session = get_aiohttp_session()
+    timeout = aiohttp.ClientTimeout(total=timeout_sec)
+    for attempt in range(1, retry.attempts + 1):
+        if limiter is not None:
+            await limiter.acquire()
+        try:
+            async with session.get(url, headers=headers, params=params, timeout=timeout) as resp:
+                if resp.status == 200:
+                    return await resp.json(content_type=None)
+                if resp.status not in retry.statuses or attempt >= retry.attempts:
+                    raise PageFetchError(f"{label or url}: HTTP {resp.status}", status=resp.status)
+                delay = retry.delay(attempt, resp.headers.get("Retry-After"))
+                logger.warning(
+                    "Paginated fetch retry: target=%s status=%s attempt=%s/%s delay=%.2fs",
+                    label or url,
+                    resp.status,
+                    attempt,
+                    retry.attempts,
+                    delay,
+                )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            if attempt >= retry.attempts:
+                raise PageFetchError(f"{label or url}: {exc!r}") from exc
+            delay = retry.delay(attempt)
+            logger.warning(
+                "Paginated fetch retry: target=%s error=%r attempt=%s/%s delay=%.2fs",
+                label or url,
+                exc,
+                attempt,
+                retry.attempts,
+                delay,
+            )
+        await asyncio.sleep(delay)
+    raise PageFetchError(f"{label or url}: retries exhausted")
+
+
+@dataclass
+class Page:
+    """Результат одной страницы: items и признак, что дальше страниц нет."""
+
+    number: int
+    items: List[Any]
+    is_last: bool
+    total_pages: Optional[int] = None
+
+
+async def iter_pages(
+    fetch_page: Callable[[int], Awaitable[Page]],
+    *,
+    first_page: int = 1,
+    max_in_flight: int = 4,
+) -> AsyncIterator[Page]:
+    """
+    Страницы по порядку, пока fetch_page не вернёт is_last.
+
+    Первая страница запрашивается одна; если она сообщила total_pages,
+    следующие запросы не выходят за него, иначе окно из max_in_flight
+    страниц идёт вперёд спекулятивно.
+    """
+    first = await fetch_page(first_page)
+    yield first
+    if first.is_last:
+        return
+
+    last_known = first.total_pages
+    window = max(1, max_in_flight)
+    pending: Dict[int, asyncio.Task] = {}
+    next_to_schedule = first_page + 1
+    next_to_yield = first_page + 1
+
+    def _schedule() -> None:
+        nonlocal next_to_schedule
+        while len(pending) < window and (last_known is None or next_to_schedule <= last_known):
+            pending[next_to_schedule] = asyncio.create_task(fetch_page(next_to_schedule))
+            next_to_schedule += 1
+
+    try:
+        _schedule()
+        while next_to_yield in pending:
+            page = await pending.pop(next_to_yield)
+            next_to_yield += 1
+            yield page
+            if page.is_last:
+                return
+            _schedule()
+    finally:
+        for task in pending.values():
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending.values(), return_exceptions=True)
@@ -15,9 +15,8 @@ from app.dntrade_data_service.client import DEFAULT_LIMIT, fetch_products_page
 from app.dntrade_data_service.runtime import (
     fetch_enterprise_settings,
     maybe_dump_raw_json,
-    save_to_json,
 )
-from app.services.database_service import process_database_service
+from app.services.database_service import process_database_records
 
 load_dotenv()
 
@@ -532,13 +531,7 @@ async def run_service(enterprise_code, file_type):
             merged_catalog = transformed_data
 
         file_type = "catalog"
-        json_file_path = save_to_json(merged_catalog, enterprise_code, file_type)
-
-        if not json_file_path:
-            logger.error("Dntrade catalog stop: failed to write json for %s", enterprise_code)
-            return
-
-        await process_database_service(json_file_path, file_type, enterprise_code)
+        await process_database_records(merged_catalog, file_type, enterprise_code, source="dntrade")
         _persist_success_state(
             enterprise_code=enterprise_code,
             sync_mode=effective_mode,
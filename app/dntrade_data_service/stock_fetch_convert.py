@@ -1,18 +1,24 @@
 import asyncio
+import json
 import os
 import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
 from dotenv import load_dotenv
 import traceback
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 from time import perf_counter
 
 import aiohttp
 from sqlalchemy.future import select
 
+from app.core.http_clients import get_aiohttp_session
+from app.core.paths import STATE_CACHE_DIR
 from app.database import EnterpriseSettings, MappingBranch, get_async_db
 from app.dntrade_data_service.client import DEFAULT_LIMIT, fetch_products_page
-from app.dntrade_data_service.runtime import maybe_dump_raw_json, save_to_json
-from app.services.database_service import process_database_service
+from app.dntrade_data_service.runtime import _env_flag, maybe_dump_raw_json
+from app.services.database_service import process_database_records
 
 # === Logging setup (non-intrusive: only if not already configured) ===
 if not logging.getLogger().handlers:
@@ -27,6 +33,11 @@ load_dotenv()
 LIMIT = DEFAULT_LIMIT  # Лимит количества записей за один запрос
 MAX_PAGES_PER_STORE = int(os.getenv("DNTRADE_STOCK_MAX_PAGES_PER_STORE", "2000"))
 MAX_REPEAT_PAGES = int(os.getenv("DNTRADE_STOCK_MAX_REPEAT_PAGES", "3"))
+STORE_CONCURRENCY = max(1, int(os.getenv("DNTRADE_STOCK_STORE_CONCURRENCY", "4")))
+DELTA_ENABLED = _env_flag("DNTRADE_STOCK_DELTA_ENABLED", default=False)
+DELTA_SAFETY_WINDOW_MIN = int(os.getenv("DNTRADE_STOCK_DELTA_SAFETY_WINDOW_MIN", "10"))
+FULL_SYNC_MAX_AGE_MIN = int(os.getenv("DNTRADE_STOCK_FULL_SYNC_MAX_AGE_MIN", "60"))
+STATE_DIR = Path(os.getenv("DNTRADE_STATE_DIR") or STATE_CACHE_DIR)
 logger.debug("Module loaded. LIMIT=%s", LIMIT)
 
 async def fetch_enterprise_settings(enterprise_code, db):
@@ -165,9 +176,260 @@ def transform_stock(products, store_to_branch: Dict[str, str]) -> Tuple[List[dic
     logger.info("Transform stock finished: produced %d records", len(transformed))
     return transformed, stats
 
+# === Delta sync state (по аналогии с catalog sync state в fetch_convert) ===
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _format_api_datetime(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _parse_state_datetime(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def _state_path(enterprise_code: str) -> Path:
+    return STATE_DIR / f"dntrade_{enterprise_code}_stock_sync_state.json"
+
+
+def _snapshot_path(enterprise_code: str) -> Path:
+    return STATE_DIR / f"dntrade_{enterprise_code}_stock_snapshot.json"
+
+
+def _write_json_atomically(path: Path, payload: Any) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: Path, enterprise_code: str, label: str) -> Any:
+    if not path.exists():
+        return None
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        logger.exception("Dntrade stock %s read failed: enterprise_code=%s path=%s", label, enterprise_code, path)
+        return None
+
+
+@dataclass
+class StockSyncPlan:
+    sync_mode: str
+    modified_from: Optional[str] = None
+    modified_to: Optional[str] = None
+    reason: Optional[str] = None
+    snapshot: Optional[List[dict]] = None
+
+
+def _build_sync_plan(enterprise_code: str, store_to_branch: Dict[str, str]) -> StockSyncPlan:
+    """
+    full - все товары всех складов; delta - только изменённые с прошлого успешного
+    прогона (modified_from), смерженные в последний известный снимок стока.
+    Полная выгрузка не реже FULL_SYNC_MAX_AGE_MIN: delta не видит удалённые товары.
+    """
+    if not DELTA_ENABLED:
+        return StockSyncPlan(sync_mode="full", reason="delta_disabled")
+
+    state = _read_json(_state_path(enterprise_code), enterprise_code, "state")
+    if not isinstance(state, dict):
+        return StockSyncPlan(sync_mode="full", reason="state_missing")
+    if state.get("store_to_branch") != store_to_branch:
+        return StockSyncPlan(sync_mode="full", reason="mapping_changed")
+
+    now = _utcnow()
+    last_full = _parse_state_datetime(state.get("last_full_sync_at"))
+    if last_full is None or now - last_full >= timedelta(minutes=FULL_SYNC_MAX_AGE_MIN):
+        return StockSyncPlan(sync_mode="full", reason="full_sync_max_age")
+    last_success = _parse_state_datetime(state.get("last_successful_sync_at"))
+    if last_success is None:
+        return StockSyncPlan(sync_mode="full", reason="last_sync_missing")
+
+    snapshot = _read_json(_snapshot_path(enterprise_code), enterprise_code, "snapshot")
+    if not isinstance(snapshot, list):
+        return StockSyncPlan(sync_mode="full", reason="snapshot_missing")
+
+    return StockSyncPlan(
+        sync_mode="delta",
+        modified_from=_format_api_datetime(last_success - timedelta(minutes=DELTA_SAFETY_WINDOW_MIN)),
+        modified_to=_format_api_datetime(now),
+        snapshot=snapshot,
+    )
+
+
+def _persist_sync_state(
+    enterprise_code: str,
+    *,
+    sync_mode: str,
+    started_at: datetime,
+    store_to_branch: Dict[str, str],
+    snapshot: List[dict],
+) -> None:
+    # Время начала прогона: изменения во время выгрузки попадут в следующую delta
+    state = _read_json(_state_path(enterprise_code), enterprise_code, "state")
+    state = state if isinstance(state, dict) else {}
+    state["last_successful_sync_at"] = started_at.isoformat()
+    if sync_mode == "full":
+        state["last_full_sync_at"] = started_at.isoformat()
+    state["last_sync_mode"] = sync_mode
+    state["store_to_branch"] = store_to_branch
+    try:
+        _write_json_atomically(_snapshot_path(enterprise_code), snapshot)
+        _write_json_atomically(_state_path(enterprise_code), state)
+    except Exception:
+        logger.exception("Dntrade stock state write failed: enterprise_code=%s", enterprise_code)
+
+
+# === Выгрузка по складам ===
+@dataclass
+class StoreFetchResult:
+    store_id: str
+    products: List[dict] = field(default_factory=list)
+    pages: int = 0
+    failed: bool = False
+    elapsed: float = 0.0
+
+
+async def _fetch_store_products(
+    session: aiohttp.ClientSession,
+    api_key: str,
+    enterprise_code: str,
+    store_id: str,
+    *,
+    modified_from: Optional[str] = None,
+    modified_to: Optional[str] = None,
+) -> StoreFetchResult:
+    result = StoreFetchResult(store_id=store_id)
+    started = perf_counter()
+    offset = 0
+    repeated_page_count = 0
+    last_fingerprint: Optional[Tuple[int, str, str]] = None
+    logger.info("Fetching products for store_id=%s modified_from=%s", store_id, modified_from)
+
+    while True:
+        if result.pages >= MAX_PAGES_PER_STORE:
+            logger.warning(
+                "Dntrade stock stop for store_id=%s: max pages reached (%s) enterprise_code=%s",
+                store_id,
+                MAX_PAGES_PER_STORE,
+                enterprise_code,
+            )
+            break
+
+        response = await fetch_products_page(
+            session=session,
+            api_key=api_key,
+            store_id=store_id,
+            offset=offset,
+            limit=LIMIT,
+            modified_from=modified_from,
+            modified_to=modified_to,
+        )
+
+        if response is None:
+            result.failed = True
+            logger.warning(
+                "Breaking on store_id=%s offset=%s due to API error/None response",
+                store_id,
+                offset,
+            )
+            break  # Ошибка API - останавливаем обработку этого store_id
+
+        products = response.get("products", [])
+        logger.debug("Received %d products for store_id=%s offset=%s", len(products), store_id, offset)
+        if not products:
+            logger.info("No more products for store_id=%s at offset=%s", store_id, offset)
+            break  # Если список `products` пустой, прекращаем цикл для store_id
+
+        first_id = str(products[0].get("product_id", ""))
+        last_id = str(products[-1].get("product_id", ""))
+        current_fingerprint = (len(products), first_id, last_id)
+        if current_fingerprint == last_fingerprint:
+            repeated_page_count += 1
+            if repeated_page_count >= MAX_REPEAT_PAGES:
+                logger.warning(
+                    "Dntrade stock stop for store_id=%s: repeating page detected %s times at offset=%s enterprise_code=%s",
+                    store_id,
+                    repeated_page_count,
+                    offset,
+                    enterprise_code,
+                )
+                break
+        else:
+            repeated_page_count = 0
+        last_fingerprint = current_fingerprint
+
+        result.products.extend(products)
+        offset += len(products)
+        result.pages += 1
+
+    result.elapsed = perf_counter() - started
+    return result
+
+
+async def _fetch_all_stores(
+    api_key: str,
+    enterprise_code: str,
+    store_ids: List[str],
+    *,
+    modified_from: Optional[str] = None,
+    modified_to: Optional[str] = None,
+) -> List[StoreFetchResult]:
+    """Склады выгружаются параллельно (до STORE_CONCURRENCY) через общую aiohttp-сессию."""
+    session = get_aiohttp_session()
+    semaphore = asyncio.Semaphore(STORE_CONCURRENCY)
+
+    async def _bounded(store_id: str) -> StoreFetchResult:
+        async with semaphore:
+            return await _fetch_store_products(
+                session,
+                api_key,
+                enterprise_code,
+                store_id,
+                modified_from=modified_from,
+                modified_to=modified_to,
+            )
+
+    # gather сохраняет порядок store_ids: при дублях (branch, code) побеждает
+    # последний склад, как и при прежней последовательной выгрузке
+    return list(await asyncio.gather(*(_bounded(store_id) for store_id in store_ids)))
+
+
+def _merge_records(
+    merged: Dict[Tuple[str, str], dict],
+    records: List[dict],
+    stats: Dict[str, int],
+    duplicate_samples: List[str],
+) -> None:
+    for record in records:
+        key = (str(record["branch"]), str(record["code"]))
+        existing = merged.get(key)
+        if existing is not None:
+            stats["duplicate_branch_code"] += 1
+            if (
+                existing.get("price") != record.get("price")
+                or existing.get("price_reserve") != record.get("price_reserve")
+                or existing.get("qty") != record.get("qty")
+            ):
+                stats["duplicate_conflicting_values"] += 1
+                if len(duplicate_samples) < 10:
+                    duplicate_samples.append(f"{key[0]}:{key[1]}")
+        merged[key] = record
+
+
 async def run_service(enterprise_code, file_type):
     """Основной сервис выполнения задачи."""
     started = perf_counter()
+    started_at = _utcnow()
     logger.info("Run service started: enterprise_code=%s file_type=%s", enterprise_code, file_type)
     try:
         metadata_started = perf_counter()
@@ -197,115 +459,124 @@ async def run_service(enterprise_code, file_type):
             perf_counter() - metadata_started,
         )
 
-        all_products = []
-        total_pages_fetched = 0
-        store_failures = 0
+        plan = _build_sync_plan(enterprise_code, store_to_branch)
+        sync_mode = plan.sync_mode
 
         fetch_started = perf_counter()
-        async with aiohttp.ClientSession() as session:
-            # Цикл по каждому store_id
-            for store_id in store_ids:
-                offset = 0
-                pages_fetched = 0
-                repeated_page_count = 0
-                last_fingerprint: Optional[Tuple[int, str, str]] = None
-                logger.info("Fetching products for store_id=%s", store_id)
-
-                while True:
-                    if pages_fetched >= MAX_PAGES_PER_STORE:
-                        logger.warning(
-                            "Dntrade stock stop for store_id=%s: max pages reached (%s) enterprise_code=%s",
-                            store_id,
-                            MAX_PAGES_PER_STORE,
-                            enterprise_code,
-                        )
-                        break
-
-                    response = await fetch_products_page(
-                        session=session,
-                        api_key=api_key,
-                        store_id=store_id,
-                        offset=offset,
-                        limit=LIMIT,
-                    )
-
-                    if response is None:
-                        store_failures += 1
-                        logger.warning(
-                            "Breaking on store_id=%s offset=%s due to API error/None response",
-                            store_id,
-                            offset,
-                        )
-                        break  # Ошибка API - останавливаем обработку этого store_id
-
-                    products = response.get("products", [])
-                    logger.debug("Received %d products for store_id=%s offset=%s", len(products), store_id, offset)
-                    if not products:
-                        logger.info("No more products for store_id=%s at offset=%s", store_id, offset)
-                        break  # Если список `products` пустой, прекращаем цикл для store_id
-
-                    first_id = str(products[0].get("product_id", ""))
-                    last_id = str(products[-1].get("product_id", ""))
-                    current_fingerprint = (len(products), first_id, last_id)
-                    if current_fingerprint == last_fingerprint:
-                        repeated_page_count += 1
-                        if repeated_page_count >= MAX_REPEAT_PAGES:
-                            logger.warning(
-                                "Dntrade stock stop for store_id=%s: repeating page detected %s times at offset=%s enterprise_code=%s",
-                                store_id,
-                                repeated_page_count,
-                                offset,
-                                enterprise_code,
-                            )
-                            break
-                    else:
-                        repeated_page_count = 0
-                    last_fingerprint = current_fingerprint
-
-                    all_products.extend(products)
-                    offset += len(products)
-                    pages_fetched += 1
-                    total_pages_fetched += 1
-
-                logger.info(
-                    "Dntrade stock store fetch finished: enterprise_code=%s store_id=%s pages=%d accumulated_products=%d",
-                    enterprise_code,
-                    store_id,
-                    pages_fetched,
-                    len(all_products),
-                )
-
+        store_results = await _fetch_all_stores(
+            api_key,
+            enterprise_code,
+            store_ids,
+            modified_from=plan.modified_from,
+            modified_to=plan.modified_to,
+        )
+        if sync_mode == "delta" and any(result.failed for result in store_results):
+            # Неполная delta оставила бы в снимке устаревшие остатки - перевыгружаем всё
+            logger.warning("Dntrade stock delta fallback to full: enterprise_code=%s reason=delta_fetch_error", enterprise_code)
+            sync_mode = "full"
+            plan.reason = "delta_fetch_error"
+            store_results = await _fetch_all_stores(api_key, enterprise_code, store_ids)
+
+        all_products = [product for result in store_results for product in result.products]
+        total_pages_fetched = sum(result.pages for result in store_results)
+        store_failures = sum(1 for result in store_results if result.failed)
         logger.info(
-            "Dntrade stock: fetch finished enterprise_code=%s stores=%d products=%d pages=%d store_failures=%d elapsed=%.3fs",
+            "Dntrade stock: fetch finished enterprise_code=%s sync_mode=%s reason=%s stores=%d products=%d pages=%d "
+            "store_failures=%d concurrency=%d modified_from=%s elapsed=%.3fs",
             enterprise_code,
+            sync_mode,
+            plan.reason,
             len(store_ids),
             len(all_products),
             total_pages_fetched,
             store_failures,
+            STORE_CONCURRENCY,
+            plan.modified_from if sync_mode == "delta" else None,
             perf_counter() - fetch_started,
         )
 
-        if not all_products:
+        if not all_products and sync_mode == "full":
             logger.warning("No products collected. Nothing to save.")
             return  # Нет данных для сохранения
 
         maybe_dump_raw_json(all_products, enterprise_code, "stock", label="raw_input")
 
-        transformed_data, transform_stats = transform_stock(all_products, store_to_branch)
+        # В delta базой служит последний снимок, поверх него - изменённые строки
+        merged: Dict[Tuple[str, str], dict] = {}
+        if sync_mode == "delta":
+            for record in plan.snapshot or []:
+                merged[(str(record.get("branch")), str(record.get("code")))] = record
+
+        transform_stats: Dict[str, int] = {}
+        duplicate_samples: List[str] = []
+        merge_stats = {"duplicate_branch_code": 0, "duplicate_conflicting_values": 0}
+        for result in store_results:
+            transform_started = perf_counter()
+            store_records, store_stats = transform_stock(result.products, store_to_branch)
+            transform_elapsed = perf_counter() - transform_started
+            for key, value in store_stats.items():
+                transform_stats[key] = transform_stats.get(key, 0) + value
+
+            merge_started = perf_counter()
+            if sync_mode == "delta":
+                # Изменённая строка заменяет снимок, это не дубль
+                merged.update(((str(r["branch"]), str(r["code"])), r) for r in store_records)
+            else:
+                _merge_records(merged, store_records, merge_stats, duplicate_samples)
+            logger.info(
+                "Dntrade stock store timings: enterprise_code=%s store_id=%s sync_mode=%s pages=%d products=%d "
+                "records=%d failed=%s fetch=%.3fs transform=%.3fs merge=%.3fs",
+                enterprise_code,
+                result.store_id,
+                sync_mode,
+                result.pages,
+                len(result.products),
+                len(store_records),
+                result.failed,
+                result.elapsed,
+                transform_elapsed,
+                perf_counter() - merge_started,
+            )
+
+        if merge_stats["duplicate_branch_code"]:
+            logger.warning(
+                "Dntrade stock duplicate (branch, code) across stores: total_duplicates=%d conflicting=%d samples=%s",
+                merge_stats["duplicate_branch_code"],
+                merge_stats["duplicate_conflicting_values"],
+                duplicate_samples,
+            )
+        for key, value in merge_stats.items():
+            transform_stats[key] = transform_stats.get(key, 0) + value
+
+        transformed_data = list(merged.values())
+        if not transformed_data:
+            logger.warning("No stock records after merge. Nothing to save.")
+            return
+
+        # снимок отделяем до записи: database_service приводит цены (скидка) в записях
+        snapshot = [dict(record) for record in transformed_data]
+
         file_type = "stock"
-        json_file_path = save_to_json(transformed_data, enterprise_code, file_type)
-        if not json_file_path:
-            logger.error("Stop: failed to save JSON for enterprise_code=%s", enterprise_code)
-            return  # Ошибка сохранения JSON
+        logger.info("Sending data to database_service: records=%d enterprise_code=%s type=%s", len(transformed_data), enterprise_code, file_type)
+        await process_database_records(transformed_data, file_type, enterprise_code, source="dntrade")
+
+        # Снимок для delta пишем только после полной и безошибочной выгрузки
+        if DELTA_ENABLED and store_failures == 0:
+            _persist_sync_state(
+                enterprise_code,
+                sync_mode=sync_mode,
+                started_at=started_at,
+                store_to_branch=store_to_branch,
+                snapshot=snapshot,
+            )
 
-        logger.info("Sending data to database_service: file=%s enterprise_code=%s type=%s", json_file_path, enterprise_code, file_type)
-        await process_database_service(json_file_path, file_type, enterprise_code)
         logger.info(
-            "Run service finished successfully: enterprise_code=%s records=%d "
+            "Run service finished successfully: enterprise_code=%s sync_mode=%s records=%d "
             "skipped_missing_product_id=%s missing_price_entries=%s missing_store_id=%s "
             "missing_branch=%s bad_price=%s balance_coerced_to_zero=%s duplicate_branch_code=%s "
             "duplicate_conflicting_values=%s elapsed=%.3fs",
             enterprise_code,
+            sync_mode,
             len(transformed_data),
             transform_stats["skipped_missing_product_id"],
             transform_stats["missing_price_entries"],
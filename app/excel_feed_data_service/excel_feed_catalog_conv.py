@@ -2,11 +2,11 @@ import sys
 import requests
 import json
 import asyncio
-import pandas as pd
 import tempfile
 import os
 import logging
 from dotenv import load_dotenv
+from app.core.dataframe_conversion import read_excel_frame
 from app.services.database_service import process_database_service
 
 load_dotenv()
@@ -31,7 +31,7 @@ def parse_excel(file_path):
     # Читаем 2 строки заголовков и объединяем их
     # Фильтруем нужные колонки по частичному совпадению
     
-    df = pd.read_excel(file_path, dtype=str, header=[3, 4])
+    df = read_excel_frame(file_path, dtype=str, header=[3, 4])
     df.columns = [' '.join(col).strip() if isinstance(col, tuple) else col.strip() for col in df.columns]
 
     # Очищаем названия, убирая мусорные суффиксы
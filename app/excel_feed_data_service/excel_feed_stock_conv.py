@@ -7,6 +7,7 @@ import tempfile
 import os
 import logging
 from dotenv import load_dotenv
+from app.core.dataframe_conversion import read_excel_frame
 from app.services.database_service import process_database_service
 from app.database import get_async_db, EnterpriseSettings, MappingBranch
 from sqlalchemy.future import select
@@ -39,7 +40,7 @@ def download_excel(url):
 
 def parse_excel(file_path):
     """Парсинг Excel и конвертация данных."""
-    df = pd.read_excel(file_path, dtype=str, header=4)  # Начинаем с 6-й строки (индекс 5)
+    df = read_excel_frame(file_path, dtype=str, header=4)  # Начинаем с 6-й строки (индекс 5)
 
     # Убираем лишние пробелы в заголовках
     df.columns = df.columns.str.strip()
@@ -1,10 +1,9 @@
 import os
 import json
 import asyncio
-from io import BytesIO
-from ftplib import FTP
 from datetime import datetime, timedelta
-from app.services.database_service import process_database_service
+from app.core.ftp_client import get_ftp_pool
+from app.services.database_service import process_database_records
 from app.database import get_async_db, MappingBranch
 from sqlalchemy.future import select
 from dotenv import load_dotenv
@@ -17,38 +16,16 @@ FTP_PASS = os.getenv("FTP_PASS")
 FTP_DIR = os.getenv("FTP_DIR")
 FILE_TYPE = "stock"
 
-def connect_ftp():
-    ftp = FTP(FTP_HOST)
-    ftp.login(FTP_USER, FTP_PASS)
-    ftp.cwd(FTP_DIR)
-    return ftp
+def get_ftp():
+    """Пул соединений к FTP (переиспользуется между запусками)."""
+    return get_ftp_pool(FTP_HOST, user=FTP_USER, password=FTP_PASS)
 
-def get_latest_json_file(ftp):
-    files = ftp.nlst()
-    json_files = [f for f in files if f.endswith(".json")]
-    if not json_files:
+def get_latest_json_file(files):
+    """Последний по mtime JSON-файл из листинга (MLSD отдаёт mtime сразу)."""
+    dated = [f for f in files if f.name.endswith(".json") and f.mtime is not None]
+    if not dated:
         return None
-
-    latest_file = None
-    latest_time = None
-
-    for filename in json_files:
-        try:
-            modified_time = ftp.sendcmd(f"MDTM {filename}")[4:].strip()
-            modified_datetime = datetime.strptime(modified_time, "%Y%m%d%H%M%S")
-            if latest_time is None or modified_datetime > latest_time:
-                latest_file = filename
-                latest_time = modified_datetime
-        except:
-            continue
-
-    return latest_file
-
-def download_file_to_memory(ftp, filename):
-    buffer = BytesIO()
-    ftp.retrbinary(f"RETR {filename}", buffer.write)
-    buffer.seek(0)
-    return buffer.read().decode("utf-8")
+    return max(dated, key=lambda f: f.mtime)
 
 async def fetch_branch_id(enterprise_code):
     async with get_async_db() as session:
@@ -80,75 +57,44 @@ def convert_file_from_string(json_content, enterprise_code, branch_id):
         }
         result.append(converted)
 
-    temp_dir = os.getenv("TEMP_FILE_PATH", "/tmp")
-    os.makedirs(temp_dir, exist_ok=True)
-
-    output_path = os.path.join(temp_dir, f"{enterprise_code}_{FILE_TYPE}_converted.json")
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(result, f, ensure_ascii=False, indent=4)
+    return result
 
-    return output_path
 
-
-def delete_old_files(ftp):
-    try:
-        files = ftp.nlst()
-        json_files = [f for f in files if f.endswith(".json")]
-        if not json_files:
-            return
-
-        file_dates = {}
-        for f in json_files:
+async def delete_old_files(ftp, files, latest_file):
+    now = datetime.now()
+    for f in files:
+        if f.path == latest_file.path or not f.name.endswith(".json") or f.mtime is None:
+            continue
+        if now - f.mtime > timedelta(days=7):
             try:
-                mdtm = ftp.sendcmd(f"MDTM {f}")[4:].strip()
-                modified_datetime = datetime.strptime(mdtm, "%Y%m%d%H%M%S")
-                file_dates[f] = modified_datetime
-            except:
-                continue
-
-        if not file_dates:
-            return
-
-        latest_file = max(file_dates.items(), key=lambda x: x[1])[0]
-
-        now = datetime.now()
-        for filename, file_date in file_dates.items():
-            if filename == latest_file:
-                continue
-            if now - file_date > timedelta(days=7):
-                try:
-                    ftp.delete(filename)
-                    print(f"✅ Удалён старый файл: {filename}")
-                except Exception as e:
-                    print(f"⚠️ Ошибка при удалении {filename}: {e}")
-    except Exception as e:
-        print(f"Ошибка при очистке FTP: {e}")
+                await ftp.delete(f.path)
+                print(f"✅ Удалён старый файл: {f.name}")
+            except Exception as e:
+                print(f"⚠️ Ошибка при удалении {f.name}: {e}")
 
 # -------------------------------
 # Основная функция запуска
 # -------------------------------
 async def run_service(enterprise_code, file_type):
-    ftp = connect_ftp()
-    latest_file = get_latest_json_file(ftp)
+    ftp = get_ftp()
+    files = await ftp.list_files(FTP_DIR or "")
+    latest_file = get_latest_json_file(files)
 
     if not latest_file:
         print("Нет новых JSON-файлов.")
-        ftp.quit()
         return
 
-    print(f"Обработка файла: {latest_file}")
-    json_string = download_file_to_memory(ftp, latest_file)
+    print(f"Обработка файла: {latest_file.name}")
+    json_string = (await ftp.download_bytes(latest_file.path)).decode("utf-8")
     branch_id = await fetch_branch_id(enterprise_code)
 
-    converted_path = convert_file_from_string(json_string, enterprise_code, branch_id)
-    print(f"Сконвертирован в: {converted_path}")
-
-    await process_database_service(converted_path, FILE_TYPE, enterprise_code)
-    delete_old_files(ftp)
+    records = convert_file_from_string(json_string, enterprise_code, branch_id)
+    print(f"Сконвертировано записей: {len(records)}")
 
-    ftp.quit()
+    await process_database_records(records, FILE_TYPE, enterprise_code, source=latest_file.path)
+    await delete_old_files(ftp, files, latest_file)
 
 # Для локального запуска
 if __name__ == "__main__":
     TEST_ENTERPRISE_CODE = "2"
-    asyncio.run(run_service(TEST_ENTERPRISE_CODE))
+    asyncio.run(run_service(TEST_ENTERPRISE_CODE, FILE_TYPE))
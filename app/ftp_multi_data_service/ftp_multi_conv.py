@@ -2,15 +2,13 @@ import os
 import json
 import asyncio
 import logging
-from io import BytesIO
-from datetime import datetime
-from ftplib import FTP, error_perm
 
 from dotenv import load_dotenv
 from sqlalchemy.future import select
+from app.core.ftp_client import AsyncFtpPool, FtpFileInfo, get_ftp_pool, is_already_ingested, mark_ingested
 from app.database import get_async_db, EnterpriseSettings
 from app.models import MappingBranch
-from app.services.database_service import process_database_service
+from app.services.database_service import process_database_records
 
 # =========================
 # Константы
@@ -18,7 +16,6 @@ from app.services.database_service import process_database_service
 ENTERPRISE_CODE = "2"
 FILE_TYPE = "both"
 DEFAULT_VAT = 20.0
-TEMP_DIR = "./temp"
 
 load_dotenv()
 
@@ -39,37 +36,28 @@ def _join_ftp(*parts: str) -> str:
     return "/" + "/".join(cleaned) if cleaned else "/"
 
 
-def _list_json_files_with_mtime(ftp, path):
-    ftp.encoding = 'latin1'
+def _get_ftp() -> AsyncFtpPool:
+    # latin1 - имена файлов приходят байтами как есть, без ошибок декодирования
+    return get_ftp_pool(FTP_HOST, FTP_PORT, FTP_USER, FTP_PASS, encoding="latin1")
+
+
+async def _list_json_files_with_mtime(ftp: AsyncFtpPool, path: str) -> list[FtpFileInfo]:
     try:
-        names = ftp.nlst(path)
+        files = await ftp.list_files(path, suffix=".json")
     except Exception as e:
         logging.error(f"Ошибка получения списка файлов: {e}")
         return []
 
-    json_files = []
-    for name in names:
-        if name.lower().endswith(".json"):
-            try:
-                mdtm = ftp.sendcmd(f"MDTM {name}")
-                dt_str = mdtm.replace("213 ", "")
-                mtime = datetime.strptime(dt_str, "%Y%m%d%H%M%S")
-                json_files.append((name, mtime))
-            except Exception:
-                continue
+    json_files = [f for f in files if f.mtime is not None]
+    return sorted(json_files, key=lambda f: f.mtime, reverse=True)
 
-    return sorted(json_files, key=lambda x: x[1], reverse=True)
 
-
-def _download_to_string(ftp, path, filename):
-    buf = BytesIO()
-    ftp.retrbinary(f"RETR {filename}", buf.write)
-    buf.seek(0)
+async def _download_to_string(ftp: AsyncFtpPool, file: FtpFileInfo) -> str:
+    raw = await ftp.download_bytes(file.path)
     try:
-        return buf.read().decode("utf-8")
+        return raw.decode("utf-8")
     except UnicodeDecodeError:
-        buf.seek(0)
-        return buf.read().decode("windows-1251")
+        return raw.decode("windows-1251")
 
 
 # =========================
@@ -157,30 +145,18 @@ def transform_stock(items: list[dict], branch: str) -> list[dict]:
     return out
 
 
-def save_to_json(data, enterprise_code: str, file_type: str) -> str:
-    out_dir = os.path.join(TEMP_DIR, str(enterprise_code))
-    os.makedirs(out_dir, exist_ok=True)
-    path = os.path.join(out_dir, f"{file_type}.json")
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
-    logging.info(f"✅ Сохранено: {path}")
-    return path
-
+async def send_catalog_data(data: list[dict], enterprise_code: str, source: str = "ftp_multi"):
+    await process_database_records(data, "catalog", enterprise_code, source=source)
 
-async def send_catalog_data(data: list[dict], enterprise_code: str):
-    path = save_to_json(data, enterprise_code, "catalog")
-    await process_database_service(path, "catalog", enterprise_code)
 
-
-async def send_stock_data(data: list[dict], enterprise_code: str):
-    path = save_to_json(data, enterprise_code, "stock")
-    await process_database_service(path, "stock", enterprise_code)
+async def send_stock_data(data: list[dict], enterprise_code: str, source: str = "ftp_multi"):
+    await process_database_records(data, "stock", enterprise_code, source=source)
 
 
 # =========================
 # Обработка каталога
 # =========================
-async def process_catalog(ftp: FTP, enterprise_code: str):
+async def process_catalog(ftp: AsyncFtpPool, enterprise_code: str):
     """Обработка каталога — имя файла берётся из БД:
     EnterpriseSettings.branch_id -> MappingBranch.branch -> MappingBranch.store_id (например, 'catalog-Zoomagazin_2sm.json')
     """
@@ -194,61 +170,69 @@ async def process_catalog(ftp: FTP, enterprise_code: str):
         return
 
     # Получаем список файлов на FTP
-    files = _list_json_files_with_mtime(ftp, incoming_abs)
-    # Сопоставляем basename -> полное имя (на случай, если nlst вернёт полный путь)
-    basename_map = {os.path.basename(name).lower(): name for name, _ in files}
+    files = await _list_json_files_with_mtime(ftp, incoming_abs)
+    basename_map = {f.name.lower(): f for f in files}
     expected_lower = os.path.basename(expected_filename).lower()
 
     # Ищем точное совпадение по basename (без учёта регистра)
-    target_fullname = basename_map.get(expected_lower)
+    target = basename_map.get(expected_lower)
 
     # Fallback: если вдруг файл на FTP имеет регистровые/пробельные отличия, ищем contains по basename
-    if not target_fullname:
-        for full, _mtime in files:
-            if expected_lower in os.path.basename(full).lower():
-                target_fullname = full
-                break
+    if not target:
+        target = next((f for f in files if expected_lower in f.name.lower()), None)
 
-    if not target_fullname:
+    if not target:
         logging.warning(f"Файл каталога '{expected_filename}' не найден в каталоге FTP '{incoming_abs}'")
         return
 
-    logging.info(f"📘 Обработка каталога: {target_fullname}")
-    raw = _download_to_string(ftp, incoming_abs, target_fullname)
+    scope = f"{enterprise_code}_catalog"
+    if is_already_ingested(scope, target, file_type="catalog"):
+        logging.info(f"📘 Каталог {target.path} не изменился с прошлой загрузки, пропуск.")
+        return
+
+    logging.info(f"📘 Обработка каталога: {target.path}")
+    raw = await _download_to_string(ftp, target)
     items = _normalize_input(raw)
     catalog = transform_catalog(items)
-    await send_catalog_data(catalog, enterprise_code)
+    await send_catalog_data(catalog, enterprise_code, source=target.path)
+    mark_ingested(scope, target, file_type="catalog")
 
 
 # =========================
 # Обработка стока
 # =========================
-async def process_stock(ftp: FTP, enterprise_code: str):
+async def process_stock(ftp: AsyncFtpPool, enterprise_code: str):
     """Обрабатывает все стоки по store_id из mapping_branch"""
     incoming_abs = FTP_DIR if FTP_DIR.startswith("/") else _join_ftp("/", FTP_DIR)
     store_branches = await fetch_store_branches(enterprise_code)
-    all_stock = []
 
-    files = _list_json_files_with_mtime(ftp, incoming_abs)
-    file_names = [name for name, _ in files]
+    files = await _list_json_files_with_mtime(ftp, incoming_abs)
 
+    matched: list[tuple[FtpFileInfo, str, str]] = []
     for sb in store_branches:
         store_id = sb["store_id"]
         branch = sb["branch"]
 
         # ищем файл с таким именем
-        # match = next((f for f in file_names if f == store_id), None)
-        match = next((f for f in file_names if store_id.lower() in f.lower() and f.lower().endswith(".json")), None)
+        match = next((f for f in files if store_id.lower() in f.path.lower()), None)
 
         if not match:
             logging.warning(f"❗ Файл {store_id} не найден на FTP, пропускаем.")
             continue
+        matched.append((match, store_id, branch))
+
+    if not matched:
+        logging.warning("⚠️ Не найдено ни одного валидного файла стока.")
+        return
+
+    # Файлы филиалов качаются параллельно через пул соединений
+    raws = await asyncio.gather(*(_download_to_string(ftp, f) for f, _, _ in matched))
 
+    all_stock = []
+    for (f, store_id, branch), raw in zip(matched, raws):
         logging.info(f"💾 Обработка стока: {store_id} → branch {branch}")
-        raw = _download_to_string(ftp, incoming_abs, match)
         items = _normalize_input(raw)
-        stock = transform_stock(items, branch)
-        all_stock.extend(stock)
+        all_stock.extend(transform_stock(items, branch))
 
     if not all_stock:
         logging.warning("⚠️ Не найдено ни одного валидного файла стока.")
@@ -261,10 +245,7 @@ async def process_stock(ftp: FTP, enterprise_code: str):
 # Основной сценарий
 # =========================
 async def run_service(enterprise_code: str, file_type: str):
-    ftp = FTP()
-    ftp.connect(FTP_HOST, FTP_PORT, timeout=30)
-    ftp.login(FTP_USER, FTP_PASS)
-    ftp.encoding = "utf-8"
+    ftp = _get_ftp()
 
     try:
         if file_type in ("catalog", "both"):
@@ -275,11 +256,6 @@ async def run_service(enterprise_code: str, file_type: str):
 
     except Exception as e:
         logging.exception(f"❌ Ошибка: {e}")
-    finally:
-        try:
-            ftp.quit()
-        except Exception:
-            pass
 
 
 # Локальный запуск
@@ -1,20 +1,41 @@
 import json
 import logging
+import multiprocessing
 import os
+import threading
 import zipfile
 import asyncio
-import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
 from sqlalchemy import select
 
+from app.business.feed_stream_reader import iter_xml_elements
+from app.core.paths import STATE_CACHE_DIR
 from app.database import EnterpriseSettings, InventoryData, MappingBranch, get_async_db
-from app.services.database_service import process_database_service
+from app.services.database_service import process_database_records
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name)
+    if raw is None or raw.strip() == "":
+        return default
+    try:
+        return int(raw.strip())
+    except ValueError:
+        logging.getLogger("ftp_tabletki").warning("Неверное значение %s=%r, используется default=%s", name, raw, default)
+        return default
+
 
-TEMP_DIR = Path(os.getenv("FTP_TABLETKI_TEMP_DIR", "/opt/test_project/uploads"))
 FTP_UPLOADS_DIR = Path(os.getenv("FTP_TABLETKI_UPLOADS_DIR", "/var/ftp/tabletki-uploads"))
 CLEANUP_OLD_ARCHIVES = os.getenv("FTP_TABLETKI_CLEANUP_OLD_ARCHIVES", "0") == "1"
+PARSE_WORKERS = _env_int("FTP_TABLETKI_PARSE_WORKERS", min(4, os.cpu_count() or 1))
+SKIP_PROCESSED_ARCHIVES = os.getenv("FTP_TABLETKI_SKIP_PROCESSED", "0") == "1"
+STATE_DIR = Path(os.getenv("FTP_TABLETKI_STATE_DIR") or STATE_CACHE_DIR)
+
+_parse_pool: ProcessPoolExecutor | None = None
+_parse_pool_lock = threading.Lock()
 
 
 def get_logger() -> logging.Logger:
@@ -64,38 +85,96 @@ def cleanup_old_files(branch: str, keep_file: Path) -> int:
     return removed
 
 
-def extract_zip_file(zip_path: Path, extract_to: Path) -> Path:
-    with zipfile.ZipFile(zip_path, "r") as zf:
-        zf.extractall(extract_to)
-    for file in extract_to.glob("*.xml"):
-        return file
+def _find_xml_member(zf: zipfile.ZipFile) -> str:
+    names = [name for name in zf.namelist() if name.lower().endswith(".xml")]
+    top_level = [name for name in names if "/" not in name.rstrip("/")]
+    for name in top_level or names:
+        return name
     raise FileNotFoundError("XML-файл внутри архива не найден")
 
 
-def parse_xml_file(file_path: Path) -> list[dict]:
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-    offers = []
-    for offer in root.findall("Offer"):
-        item = offer.attrib
-        offers.append(
-            {
-                "code": item.get("Code"),
-                "name": item.get("Name"),
-                "producer": item.get("Producer"),
-                "barcode": item.get("Barcode"),
-                "morion": item.get("Code1"),
-                "optima": item.get("Code2"),
-                "badm": item.get("Code7"),
-                "venta": item.get("Code9"),
-                "tabletki": item.get("tabletki"),
-                "vat": float(item.get("Tax", 0)),
-                "price": float(item.get("Price", 0)),
-                "qty": float(item.get("Quantity", 0)),
-                "price_reserve": float(item.get("PriceReserve", 0)),
-            }
-        )
-    return offers
+def _offer_from_attrib(item: dict) -> dict:
+    return {
+        "code": item.get("Code"),
+        "name": item.get("Name"),
+        "producer": item.get("Producer"),
+        "barcode": item.get("Barcode"),
+        "morion": item.get("Code1"),
+        "optima": item.get("Code2"),
+        "badm": item.get("Code7"),
+        "venta": item.get("Code9"),
+        "tabletki": item.get("tabletki"),
+        "vat": float(item.get("Tax", 0)),
+        "price": float(item.get("Price", 0)),
+        "qty": float(item.get("Quantity", 0)),
+        "price_reserve": float(item.get("PriceReserve", 0)),
+    }
+
+
+def parse_zip_archive(zip_path: str) -> list[dict]:
+    """
+    Читает <Offer> потоково прямо из XML внутри архива, без распаковки на диск
+    и без построения полного дерева. Выполняется в процессе пула разбора.
+    """
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        with zf.open(_find_xml_member(zf)) as handle:
+            return [_offer_from_attrib(dict(offer.attrib)) for offer in iter_xml_elements(handle, ("Offer",))]
+
+
+def _get_parse_pool() -> ProcessPoolExecutor | None:
+    """Общий пул процессов разбора архивов; None - разбор в потоке (FTP_TABLETKI_PARSE_WORKERS=0)."""
+    global _parse_pool
+    if PARSE_WORKERS <= 0:
+        return None
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            # spawn: дочерние процессы не наследуют event loop, соединения БД и
+            # блокировки потоков планировщика.
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _parse_pool
+
+
+async def parse_archive_async(zip_path: Path) -> list[dict]:
+    pool = _get_parse_pool()
+    if pool is None:
+        return await asyncio.to_thread(parse_zip_archive, str(zip_path))
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, parse_zip_archive, str(zip_path))
+
+
+def _state_path(enterprise_code: str, file_type: str) -> Path:
+    return STATE_DIR / f"ftp_tabletki_{enterprise_code}_{file_type}_processed.json"
+
+
+def _archive_signature(zip_file: Path) -> dict:
+    stat = zip_file.stat()
+    return {"name": zip_file.name, "mtime": stat.st_mtime, "size": stat.st_size}
+
+
+def load_processed_archives(enterprise_code: str, file_type: str) -> dict:
+    path = _state_path(enterprise_code, file_type)
+    if not path.exists():
+        return {}
+    try:
+        payload = json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        logger.exception("FTP Tabletki state read failed: path=%s", path)
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+
+def save_processed_archives(enterprise_code: str, file_type: str, state: dict) -> None:
+    path = _state_path(enterprise_code, file_type)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp_path, path)
+    except Exception:
+        logger.exception("FTP Tabletki state write failed: path=%s", path)
 
 
 async def validate_catalog_data(enterprise_code: str, offers: list[dict]) -> bool:
@@ -145,24 +224,14 @@ def transform_stock(data: list[dict], branch: str) -> list[dict]:
     ]
 
 
-def save_to_json(data: list[dict], enterprise_code: str, file_type: str, branch: str) -> Path:
-    dir_path = TEMP_DIR / enterprise_code
-    dir_path.mkdir(parents=True, exist_ok=True)
-    out_path = dir_path / f"{file_type}_{branch}.json"
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    logger.info("FTP Tabletki JSON saved: path=%s records=%s", out_path, len(data))
-    return out_path
-
-
-async def send_catalog_data(file_path: Path, enterprise_code: str):
-    await process_database_service(file_path, "catalog", enterprise_code)
-    logger.info("FTP Tabletki catalog sent: path=%s", file_path)
+async def send_catalog_data(data: list[dict], enterprise_code: str, source: str):
+    await process_database_records(data, "catalog", enterprise_code, source=source)
+    logger.info("FTP Tabletki catalog sent: source=%s records=%s", source, len(data))
 
 
-async def send_stock_data(file_path: Path, enterprise_code: str):
-    await process_database_service(file_path, "stock", enterprise_code)
-    logger.info("FTP Tabletki stock sent: path=%s", file_path)
+async def send_stock_data(data: list[dict], enterprise_code: str, source: str):
+    await process_database_records(data, "stock", enterprise_code, source=source)
+    logger.info("FTP Tabletki stock sent: source=%s records=%s", source, len(data))
 
 
 async def fetch_branches(enterprise_code: str) -> list[str]:
@@ -191,24 +260,36 @@ async def run_service(enterprise_code: str, file_type: str):
     if not branches:
         logger.warning("FTP Tabletki branches not found: enterprise_code=%s", enterprise_code)
         return
+    if file_type not in {"catalog", "stock"}:
+        logger.error("FTP Tabletki unknown file type: %s", file_type)
+        return
+
+    # пропуск неизменённых архивов - только для каталога: сток выгружается по филиалам
+    # каждый запуск, иначе пропущенный филиал не попадёт в экспорт
+    skip_processed = SKIP_PROCESSED_ARCHIVES and file_type == "catalog"
 
     logger.info(
-        "FTP Tabletki run start: enterprise_code=%s type=%s branches=%s uploads_dir=%s temp_dir=%s cleanup_old_archives=%s",
+        "FTP Tabletki run start: enterprise_code=%s type=%s branches=%s uploads_dir=%s parse_workers=%s skip_processed=%s cleanup_old_archives=%s",
         enterprise_code,
         file_type,
         len(branches),
         FTP_UPLOADS_DIR,
-        TEMP_DIR,
+        PARSE_WORKERS,
+        skip_processed,
         CLEANUP_OLD_ARCHIVES,
     )
 
     processed_branches = 0
     skipped_branches = 0
+    unchanged_branches = 0
+    failed_branches = 0
     total_offers = 0
     total_records = 0
     validation_failed = 0
     cleaned_archives = 0
+    processed_state = load_processed_archives(enterprise_code, file_type) if skip_processed else {}
 
+    candidates: list[tuple[str, Path, dict]] = []
     for branch in branches:
         zip_file = find_latest_zip_for_branch(branch)
         if not zip_file:
@@ -219,55 +300,97 @@ async def run_service(enterprise_code: str, file_type: str):
         if CLEANUP_OLD_ARCHIVES:
             cleaned_archives += cleanup_old_files(branch, zip_file)
 
-        extract_path = TEMP_DIR / f"{enterprise_code}_{branch}_{file_type}"
-        extract_path.mkdir(parents=True, exist_ok=True)
-        xml_file = extract_zip_file(zip_file, extract_path)
-        offers = parse_xml_file(xml_file)
-        total_offers += len(offers)
-
-        if file_type == "catalog":
-            is_valid = await validate_catalog_data(enterprise_code, offers)
-            if not is_valid:
-                validation_failed += 1
-                logger.warning(
-                    "FTP Tabletki catalog validation failed: enterprise_code=%s branch=%s zip=%s offers=%s",
-                    enterprise_code,
-                    branch,
-                    zip_file.name,
-                    len(offers),
-                )
-                continue
-            data = transform_catalog(offers)
-            save_path = save_to_json(data, enterprise_code, file_type, branch)
-            await send_catalog_data(save_path, enterprise_code)
-        elif file_type == "stock":
-            data = transform_stock(offers, branch)
-            save_path = save_to_json(data, enterprise_code, file_type, branch)
-            await send_stock_data(save_path, enterprise_code)
-        else:
-            logger.error("FTP Tabletki unknown file type: %s", file_type)
-            return
-
-        processed_branches += 1
-        total_records += len(data)
+        candidates.append((branch, zip_file, _archive_signature(zip_file)))
+
+    # Каталог каждого филиала перезаписывает весь каталог предприятия, поэтому пропуск
+    # допустим только целиком: если изменился хоть один архив - обрабатываются все филиалы.
+    if skip_processed and candidates and all(
+        processed_state.get(branch) == signature for branch, _, signature in candidates
+    ):
+        unchanged_branches = len(candidates)
         logger.info(
-            "FTP Tabletki branch summary: enterprise_code=%s type=%s branch=%s zip=%s offers=%s records=%s",
+            "FTP Tabletki all archives already processed, skipped: enterprise_code=%s branches=%s",
             enterprise_code,
-            file_type,
-            branch,
-            zip_file.name,
-            len(offers),
-            len(data),
+            unchanged_branches,
         )
+        candidates = []
+
+    # Разбор идёт параллельно в пуле процессов, но не более parse_window архивов впереди
+    # записи, чтобы в памяти одновременно было ограниченное число разобранных филиалов;
+    # запись в БД остаётся последовательной и в прежнем порядке филиалов.
+    parse_window = max(1, PARSE_WORKERS)
+    pending: deque[tuple[str, Path, dict, asyncio.Task]] = deque()
+    queued = iter(candidates)
+
+    def schedule_parses() -> None:
+        while len(pending) < parse_window:
+            item = next(queued, None)
+            if item is None:
+                return
+            branch, zip_file, signature = item
+            pending.append((branch, zip_file, signature, asyncio.create_task(parse_archive_async(zip_file))))
+
+    try:
+        schedule_parses()
+        while pending:
+            branch, zip_file, signature, parse_task = pending.popleft()
+            try:
+                offers = await parse_task
+            except Exception:
+                failed_branches += 1
+                logger.exception("FTP Tabletki archive parse failed: branch=%s zip=%s", branch, zip_file.name)
+                continue
+            finally:
+                schedule_parses()
+            total_offers += len(offers)
+
+            if file_type == "catalog":
+                is_valid = await validate_catalog_data(enterprise_code, offers)
+                if not is_valid:
+                    validation_failed += 1
+                    logger.warning(
+                        "FTP Tabletki catalog validation failed: enterprise_code=%s branch=%s zip=%s offers=%s",
+                        enterprise_code,
+                        branch,
+                        zip_file.name,
+                        len(offers),
+                    )
+                    continue
+                data = transform_catalog(offers)
+                await send_catalog_data(data, enterprise_code, zip_file.name)
+            else:
+                data = transform_stock(offers, branch)
+                await send_stock_data(data, enterprise_code, zip_file.name)
+
+            processed_branches += 1
+            total_records += len(data)
+            if skip_processed:
+                processed_state[branch] = signature
+                save_processed_archives(enterprise_code, file_type, processed_state)
+            logger.info(
+                "FTP Tabletki branch summary: enterprise_code=%s type=%s branch=%s zip=%s offers=%s records=%s",
+                enterprise_code,
+                file_type,
+                branch,
+                zip_file.name,
+                len(offers),
+                len(data),
+            )
+    finally:
+        for _, _, _, parse_task in pending:
+            if not parse_task.done():
+                parse_task.cancel()
 
     elapsed = (datetime.now() - run_started_at).total_seconds()
     logger.info(
-        "FTP Tabletki run summary: enterprise_code=%s type=%s branches=%s processed=%s skipped=%s validation_failed=%s offers=%s records=%s cleaned_archives=%s elapsed=%.2fs",
+        "FTP Tabletki run summary: enterprise_code=%s type=%s branches=%s processed=%s skipped=%s unchanged=%s failed=%s validation_failed=%s offers=%s records=%s cleaned_archives=%s elapsed=%.2fs",
         enterprise_code,
         file_type,
         len(branches),
         processed_branches,
         skipped_branches,
+        unchanged_branches,
+        failed_branches,
         validation_failed,
         total_offers,
         total_records,
@@ -2,15 +2,13 @@ import os
 import json
 import asyncio
 import logging
-from io import BytesIO
-from datetime import datetime
-from ftplib import FTP, error_perm
 
 from dotenv import load_dotenv
 from sqlalchemy.future import select
+from app.core.ftp_client import AsyncFtpPool, FtpFileInfo, get_ftp_pool, is_already_ingested, mark_ingested
 from app.database import get_async_db
 from app.models import MappingBranch
-from app.services.database_service import process_database_service
+from app.services.database_service import process_database_records
 
 # =========================
 # Константы
@@ -18,7 +16,6 @@ from app.services.database_service import process_database_service
 ENTERPRISE_CODE = "2"
 FILE_TYPE = "both"
 DEFAULT_VAT = 20.0
-TEMP_DIR = "./temp"
 
 load_dotenv()
 
@@ -39,68 +36,44 @@ def _join_ftp(*parts: str) -> str:
     return "/" + "/".join(cleaned) if cleaned else "/"
 
 
-def _ensure_remote_dir(ftp: FTP, abs_path: str) -> None:
+def _get_ftp() -> AsyncFtpPool:
+    # latin1 - имена файлов приходят байтами как есть, без ошибок декодирования
+    return get_ftp_pool(FTP_HOST, FTP_PORT, FTP_USER, FTP_PASS, encoding="latin1")
+
+
+async def _ensure_remote_dir(ftp: AsyncFtpPool, abs_path: str) -> None:
     if not abs_path.startswith("/"):
         raise ValueError("Ожидался абсолютный путь")
-    segs = [s for s in abs_path.strip("/").split("/") if s]
-    cur = "/"
-    for s in segs:
-        cur = _join_ftp(cur, s)
-        try:
-            ftp.mkd(cur)
-        except error_perm as e:
-            if not str(e).startswith("550"):
-                raise
+    await ftp.ensure_dir(abs_path)
 
 
-def _list_json_files_with_mtime(ftp, path):
-    ftp.encoding = 'latin1'
+async def _list_json_files_with_mtime(ftp: AsyncFtpPool, path: str) -> list[FtpFileInfo]:
     try:
-        names = ftp.nlst(path)
+        files = await ftp.list_files(path, suffix=".json")
     except Exception as e:
         logging.error(f"Ошибка получения списка файлов: {e}")
         return []
 
-    json_files = []
-    for name in names:
-        if name.lower().endswith(".json"):
-            try:
-                mdtm = ftp.sendcmd(f"MDTM {name}")
-                dt_str = mdtm.replace("213 ", "")
-                mtime = datetime.strptime(dt_str, "%Y%m%d%H%M%S")
-                json_files.append((name, mtime))
-            except Exception:
-                continue
-
-    return sorted(json_files, key=lambda x: x[1], reverse=True)
+    json_files = [f for f in files if f.mtime is not None]
+    return sorted(json_files, key=lambda f: f.mtime, reverse=True)
 
 
-def _download_to_string(ftp, path, filename):
-    buf = BytesIO()
-    ftp.retrbinary(f"RETR {filename}", buf.write)
-    buf.seek(0)
+async def _download_to_string(ftp: AsyncFtpPool, file: FtpFileInfo) -> str:
+    raw = await ftp.download_bytes(file.path)
     try:
-        return buf.read().decode("utf-8")
+        return raw.decode("utf-8")
     except UnicodeDecodeError:
-        buf.seek(0)
-        return buf.read().decode("windows-1251")
+        return raw.decode("windows-1251")
 
 
-def _cleanup_except_latest(ftp: FTP, cwd_abs: str):
-    """Удаляет все JSON-файлы кроме самого последнего"""
-    files = _list_json_files_with_mtime(ftp, cwd_abs)
-    if not files:
-        return
-
-    files.sort(key=lambda x: x[1], reverse=True)
-    latest_file = files[0][0]
-
-    for name, _ in files[1:]:
+async def _cleanup_except_latest(ftp: AsyncFtpPool, files: list[FtpFileInfo]):
+    """Удаляет все JSON-файлы кроме самого последнего (files отсортированы по mtime desc)"""
+    for f in files[1:]:
         try:
-            ftp.delete(_join_ftp(cwd_abs, name))
-            logging.info(f"🧹 Удалён старый файл: {name}")
+            await ftp.delete(f.path)
+            logging.info(f"🧹 Удалён старый файл: {f.name}")
         except Exception as e:
-            logging.warning(f"Не удалось удалить {name}: {e}")
+            logging.warning(f"Не удалось удалить {f.name}: {e}")
 
 
 # =========================
@@ -154,24 +127,12 @@ def transform_stock(items: list[dict], branch: str) -> list[dict]:
     return out
 
 
-def save_to_json(data, enterprise_code: str, file_type: str) -> str:
-    out_dir = os.path.join(TEMP_DIR, str(enterprise_code))
-    os.makedirs(out_dir, exist_ok=True)
-    path = os.path.join(out_dir, f"{file_type}.json")
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
-    logging.info(f"✅ Сохранено: {path}")
-    return path
-
-
-async def send_catalog_data(data: list[dict], enterprise_code: str):
-    path = save_to_json(data, enterprise_code, "catalog")
-    await process_database_service(path, "catalog", enterprise_code)
+async def send_catalog_data(data: list[dict], enterprise_code: str, source: str = "ftp_zoomagazin"):
+    await process_database_records(data, "catalog", enterprise_code, source=source)
 
 
-async def send_stock_data(data: list[dict], enterprise_code: str):
-    path = save_to_json(data, enterprise_code, "stock")
-    await process_database_service(path, "stock", enterprise_code)
+async def send_stock_data(data: list[dict], enterprise_code: str, source: str = "ftp_zoomagazin"):
+    await process_database_records(data, "stock", enterprise_code, source=source)
 
 
 # =========================
@@ -180,50 +141,51 @@ async def send_stock_data(data: list[dict], enterprise_code: str):
 async def run_service(enterprise_code: str, file_type: str):
     incoming_abs = FTP_DIR if FTP_DIR.startswith("/") else _join_ftp("/", FTP_DIR)
 
-    ftp = FTP()
-    ftp.connect(FTP_HOST, FTP_PORT, timeout=30)
-    ftp.login(FTP_USER, FTP_PASS)
-    ftp.encoding = "utf-8"
+    ftp = _get_ftp()
 
-    _ensure_remote_dir(ftp, incoming_abs)
-
-    latest_name = None
     try:
-        files = _list_json_files_with_mtime(ftp, incoming_abs)
+        await _ensure_remote_dir(ftp, incoming_abs)
+
+        files = await _list_json_files_with_mtime(ftp, incoming_abs)
         if not files:
             logging.info("Нет JSON-файлов во входящей папке.")
             return
 
-        files.sort(key=lambda x: x[1], reverse=True)
-        latest_name, latest_mtime = files[0]
-        logging.info(f"Обработка файла: {latest_name} (mtime={latest_mtime})")
-
-        raw = _download_to_string(ftp, incoming_abs, latest_name)
-        items = _normalize_input(raw)
+        latest = files[0]
 
         ft = (file_type or "both").lower()
         if ft not in ("catalog", "stock", "both"):
             raise ValueError("file_type должен быть 'catalog', 'stock' или 'both'")
 
-        if ft in ("catalog", "both"):
-            catalog = transform_catalog(items)
-            await send_catalog_data(catalog, enterprise_code)
+        # пропуск неизменённого файла - только для каталога, сток выгружается всегда
+        catalog_scope = f"{enterprise_code}_catalog"
+        run_catalog = ft in ("catalog", "both")
+        if run_catalog and is_already_ingested(catalog_scope, latest, file_type="catalog"):
+            logging.info(f"Каталог из {latest.name} не изменился с прошлой загрузки, пропуск.")
+            run_catalog = False
+        run_stock = ft in ("stock", "both")
+
+        if run_catalog or run_stock:
+            logging.info(f"Обработка файла: {latest.path} (mtime={latest.mtime})")
 
-        if ft in ("stock", "both"):
-            branch = await fetch_branch_by_enterprise_code(enterprise_code)
-            stock = transform_stock(items, branch)
-            await send_stock_data(stock, enterprise_code)
+            raw = await _download_to_string(ftp, latest)
+            items = _normalize_input(raw)
+
+            if run_catalog:
+                catalog = transform_catalog(items)
+                await send_catalog_data(catalog, enterprise_code, source=latest.path)
+                mark_ingested(catalog_scope, latest, file_type="catalog")
+
+            if run_stock:
+                branch = await fetch_branch_by_enterprise_code(enterprise_code)
+                stock = transform_stock(items, branch)
+                await send_stock_data(stock, enterprise_code, source=latest.path)
 
         logging.info("📦 Перемещение отключено. Удаляем все кроме последнего файла.")
-        _cleanup_except_latest(ftp, incoming_abs)
+        await _cleanup_except_latest(ftp, files)
 
     except Exception as e:
         logging.exception(f"❌ Ошибка: {e}")
-    finally:
-        try:
-            ftp.quit()
-        except Exception:
-            pass
 
 
 # Локальный запуск
@@ -1,18 +1,13 @@
-import tempfile
 import logging
-import json
-import os
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models import EnterpriseSettings
 from sqlalchemy import select
-from app.services.database_service import process_database_service  # Импорт функции Database_service
-import xmltodict
+from app.services.database_service import process_database_records
+from app.google_drive.file_reader import DriveFileData, load_drive_file, xml_element_to_value
 from dotenv import load_dotenv
 load_dotenv()
 from app.services.notification_service import send_notification 
-xml_data = "<root><element>value</element></root>"
-parsed_data = xmltodict.parse(xml_data)
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -32,23 +27,20 @@ async def get_branch_id(enterprise_code: str, db_session: AsyncSession) -> str:
     logging.info(f"Получен branch_id: {branch_id}")
     return branch_id
 
-async def convert_to_json(file_path: str, file_type: str,enterprise_code):
+async def convert_to_json(file_path: str, file_type: str,enterprise_code, file_data: DriveFileData | None = None):
     """
     Конвертирует данные из файла в JSON.
     :param file_path: Путь к файлу
     :param file_type: Тип файла (catalog или stock)
+    :param file_data: Уже прочитанный файл (load_drive_file); если None - файл читается здесь
     :return: Список словарей с данными
     """
-    try:        
-        if file_path.endswith(".xlsx") or file_path.endswith(".xls"):
-            import openpyxl
-            wb = openpyxl.load_workbook(file_path, data_only=True)
-            sheet = wb.active
-            headers = [str(cell.value).strip().lower() for cell in sheet[1]]
-            data = [
-                {headers[col_idx]: row[col_idx].value for col_idx in range(len(headers))}
-                for row in sheet.iter_rows(min_row=2)
-            ]
+    try:
+        if file_data is None:
+            file_data = load_drive_file(file_path)
+
+        if file_data.kind == "excel":
+            data = list(file_data.iter_excel_records())
             # Преобразование значений в целые числа, если это возможно
             for item in data:
                 for key, value in item.items():
@@ -59,89 +51,69 @@ async def convert_to_json(file_path: str, file_type: str,enterprise_code):
             logging.info(f"Успешно конвертирован файл {file_path} в JSON")
             return data
         
-        elif file_path.endswith(".json"):
-            with open(file_path, "r", encoding="utf-8") as json_file:
-                data = json.load(json_file)
-                logging.info(f"Успешно считан JSON файл {file_path}")
-                
-                return data
+        elif file_data.kind == "json":
+            logging.info(f"Успешно считан JSON файл {file_path}")
+            return file_data.payload
         
-        elif file_path.endswith(".xml"):
-            with open(file_path, "r", encoding="utf-8") as xml_file:
-                xml_data = xml_file.read()                                
-
-                # Парсинг XML в JSON-структуру
-                json_data = xmltodict.parse(xml_data)               
-                
-                # Приведение ключей JSON к нижнему регистру
-                def normalize_keys(d):
-                    if isinstance(d, dict):
-                        return {k.lower(): normalize_keys(v) for k, v in d.items()}
-                    elif isinstance(d, list):
-                        return [normalize_keys(i) for i in d]
-                    else:
-                        return d
-
-                json_data = normalize_keys(json_data)                
+        elif file_data.kind == "xml":
+            # XML-структура как у xmltodict, ключи в нижнем регистре
+            root = file_data.root
+            json_data = {str(root.tag).lower(): xml_element_to_value(root)}
 
-                # Проверка структуры на основе типа файла
-                if file_type == "catalog":
-                    if not isinstance(json_data, dict) or "catalog" not in json_data:
-                        logging.warning(f"Некорректная структура XML файла {file_path}. Ожидалась структура с 'Catalog'.")
-                        return None
-                    data = json_data.get("catalog", {}).get("item", [])
-                elif file_type == "stock":
-                    # Получаем данные из 'stock' -> 'item'
-                    data = json_data.get("stock", {}).get("item", [])                   
-
-                    # Приводим данные к списку, если они представлены как словарь (один элемент)
-                    if isinstance(data, dict):
-                        logging.warning("Данные из XML представлены в виде словаря, конвертация в список.")
-                        data = [data]
-
-                    # Проверка на корректный формат данных
-                    if not isinstance(data, list):
-                        logging.error(f"Неожиданный тип данных для 'stock': {type(data)}")
-                        raise ValueError("Неверный формат данных для 'stock'. Ожидался список или словарь.")
-
-                    # Нормализация данных: ключи приводим к нижнему регистру
-                    normalized_data = []
-                    for item in data:
-                        if not isinstance(item, dict):
-                            logging.error(f"Некорректный элемент данных: {item}")
-                            continue
-                        normalized_item = {k.lower(): v for k, v in item.items()}
-                        normalized_data.append(normalized_item)
-                    
-                    # Возвращаем результат
-                    return normalized_data
-                else:
-                    logging.error(f"Неизвестный тип файла: {file_type}")
-                    return None
-                # Если данные отсутствуют, логируем предупреждение
-                if not data:
-                    
+            # Проверка структуры на основе типа файла
+            if file_type == "catalog":
+                if not isinstance(json_data, dict) or "catalog" not in json_data:
+                    logging.warning(f"Некорректная структура XML файла {file_path}. Ожидалась структура с 'Catalog'.")
                     return None
+                data = json_data.get("catalog", {}).get("item", [])
+            elif file_type == "stock":
+                # Получаем данные из 'stock' -> 'item'
+                data = json_data.get("stock", {}).get("item", [])                   
 
-                # Нормализация полей внутри данных
-                if isinstance(data, dict):  # Если только один элемент, превращаем в список
+                # Приводим данные к списку, если они представлены как словарь (один элемент)
+                if isinstance(data, dict):
                     logging.warning("Данные из XML представлены в виде словаря, конвертация в список.")
                     data = [data]
 
-                for idx, item in enumerate(data):
+                # Проверка на корректный формат данных
+                if not isinstance(data, list):
+                    logging.error(f"Неожиданный тип данных для 'stock': {type(data)}")
+                    raise ValueError("Неверный формат данных для 'stock'. Ожидался список или словарь.")
+
+                # Нормализация данных: ключи приводим к нижнему регистру
+                normalized_data = []
+                for item in data:
                     if not isinstance(item, dict):
-                        logging.error(f"Элемент данных не является словарем: {item} (индекс {idx})")
-                    data[idx] = {k.lower(): v for k, v in item.items()}
+                        logging.error(f"Некорректный элемент данных: {item}")
+                        continue
+                    normalized_item = {k.lower(): v for k, v in item.items()}
+                    normalized_data.append(normalized_item)
+                
+                # Возвращаем результат
+                return normalized_data
+            else:
+                logging.error(f"Неизвестный тип файла: {file_type}")
+                return None
+            # Если данные отсутствуют, логируем предупреждение
+            if not data:
+                
+                return None
 
-                return data
-        
-        elif file_path.endswith(".csv"):
-            import csv
-            with open(file_path, "r", encoding="utf-8") as csv_file:
-                reader = csv.DictReader(csv_file)
-                data = [row for row in reader]
-                logging.info(f"Успешно конвертирован CSV файл {file_path} в JSON")
-                return data
+            # Нормализация полей внутри данных
+            if isinstance(data, dict):  # Если только один элемент, превращаем в список
+                logging.warning("Данные из XML представлены в виде словаря, конвертация в список.")
+                data = [data]
+
+            for idx, item in enumerate(data):
+                if not isinstance(item, dict):
+                    logging.error(f"Элемент данных не является словарем: {item} (индекс {idx})")
+                data[idx] = {k.lower(): v for k, v in item.items()}
+
+            return data
+    
+        elif file_data.kind == "csv":
+            logging.info(f"Успешно конвертирован CSV файл {file_path} в JSON")
+            return file_data.rows
         
         else:
             logging.error(f"Неподдерживаемый формат файла: {file_path}")
@@ -281,14 +253,14 @@ async def transform_data_types(data, file_type,enterprise_code):
         raise
 
 async def process_data_converter(
-    enterprise_code, file_path, file_type, store_serial, single_store, db_session
+    enterprise_code, file_path, file_type, store_serial, single_store, db_session, file_data=None
 ):
     try:
         branch_id = None
         if file_type == "catalog":
             branch_id = await get_branch_id(enterprise_code, db_session)
 
-        converted_data = await convert_to_json(file_path, file_type, enterprise_code)
+        converted_data = await convert_to_json(file_path, file_type, enterprise_code, file_data=file_data)
         if not converted_data:
             logging.warning(f"Пустые данные после конвертации файла {file_path}")
 
@@ -301,16 +273,8 @@ async def process_data_converter(
         if not transformed_data:
             logging.warning(f"Пустые данные после преобразования типов для файла {file_path}")
 
-        temp_dir = os.getenv("TEMP_FILE_PATH", tempfile.gettempdir())
-        os.makedirs(temp_dir, exist_ok=True)
-        json_file_path = os.path.join(temp_dir, f"{enterprise_code}_{file_type}_data.json")
-        
-        with open(json_file_path, "w", encoding="utf-8") as json_file:
-            json.dump(transformed_data, json_file, ensure_ascii=False, indent=4)
-        logging.info(f"JSON записан в файл: {json_file_path}")
-
-        # Передача enterprise_code в process_database_service
-        await process_database_service(json_file_path, file_type, enterprise_code)
+        # Передача записей в database_service без промежуточного JSON-файла
+        await process_database_records(transformed_data, file_type, enterprise_code, source=file_path)
         
     except Exception as e:
         error_message = f"Ошибка обработки файла {file_path} для предприятия {enterprise_code}: {str(e)}"
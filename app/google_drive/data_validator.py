@@ -1,9 +1,7 @@
 import logging
 import os
-import openpyxl
-import xml.etree.ElementTree as ET
-import csv
 from app.google_drive.data_converter import process_data_converter  
+from app.google_drive.file_reader import DriveFileData, load_drive_file
 from app.database import get_async_db
 from app.services.notification_service import send_notification  
 # Настройка логирования
@@ -111,9 +109,12 @@ async def validate_data(enterprise_code, file_path, file_type, single_store, sto
         if single_store and not store_serial:
             raise ValueError("store_serial обязателен для single_store режима.")
 
+        # Файл читается один раз; валидация и конвертация работают с прочитанными строками
+        file_data = load_drive_file(file_path)
+
         # Проверка обязательности Branch для multi-store режима
         if not single_store and file_type == "stock":
-            data = read_file_data(file_path, file_type)
+            data = read_file_data(file_data, file_type)
             for row in data:
 
                 branch = row.get("branch", "").strip()
@@ -124,12 +125,12 @@ async def validate_data(enterprise_code, file_path, file_type, single_store, sto
                     continue  # Пропускаем этот товар, но продолжаем обработку файла
 
         # Проверка формата файла
-        if file_path.endswith(".xlsx") or file_path.endswith(".xls"):
-            validate_excel(file_path, file_type, single_store, store_serial,enterprise_code)
-        elif file_path.endswith(".xml"):
-            validate_xml(file_path, file_type, single_store, store_serial,enterprise_code)
-        elif file_path.endswith(".csv"):
-            validate_csv(file_path, file_type, single_store, store_serial,enterprise_code)
+        if file_data.kind == "excel":
+            validate_excel(file_data, file_type, single_store, store_serial,enterprise_code)
+        elif file_data.kind == "xml":
+            validate_xml(file_data, file_type, single_store, store_serial,enterprise_code)
+        elif file_data.kind == "csv":
+            validate_csv(file_data, file_type, single_store, store_serial,enterprise_code)
         else:
             raise ValueError(f"Неизвестный формат файла: {file_path}")
 
@@ -142,7 +143,8 @@ async def validate_data(enterprise_code, file_path, file_type, single_store, sto
                 file_type=file_type,
                 store_serial=store_serial,
                 single_store=single_store,
-                db_session=db_session  # Передача сессии базы данных
+                db_session=db_session,  # Передача сессии базы данных
+                file_data=file_data,
             )
         
         return True
@@ -154,44 +156,33 @@ async def validate_data(enterprise_code, file_path, file_type, single_store, sto
         
         return False
 
-def read_file_data(file_path, file_type):
+def read_file_data(file_data: DriveFileData, file_type):
     """
-    Считывает данные из файла в общий формат (универсальный парсер).
-    :param file_path: Путь к файлу.
+    Приводит прочитанный файл к общему формату (универсальный парсер).
+    :param file_data: Файл, прочитанный load_drive_file.
     :param file_type: Тип файла (catalog или stock).
     :return: Список строк с данными.
     """
-    if file_path.endswith(".xlsx") or file_path.endswith(".xls"):
-        return read_excel_data(file_path)
-    elif file_path.endswith(".xml"):
-        return read_xml_data(file_path)
-    elif file_path.endswith(".csv"):
-        return read_csv_data(file_path)
+    if file_data.kind == "excel":
+        return read_excel_data(file_data)
+    elif file_data.kind == "xml":
+        return read_xml_data(file_data)
+    elif file_data.kind == "csv":
+        return read_csv_data(file_data)
     else:
-        raise ValueError(f"Неизвестный формат файла: {file_path}")
+        raise ValueError(f"Неизвестный формат файла: {file_data.path}")
 
-def read_excel_data(file_path):
+def read_excel_data(file_data: DriveFileData):
     """
-    Считывает данные из Excel в общий формат.
+    Строки Excel в общем формате; полностью пустые строки пропускаются.
     """
-    wb = openpyxl.load_workbook(file_path)
-    sheet = wb.active
-    headers = [str(cell.value).strip().lower() if cell.value is not None else "" for cell in sheet[1]]
-    data = []
-    for row in sheet.iter_rows(min_row=2, values_only=True):
-        row_data = {headers[col_idx]: str(cell).strip() if cell is not None else "" for col_idx, cell in enumerate(row)}
-        # Пропускаем строки, в которых нет значимых данных (все значения пустые)
-        if all(value == "" for value in row_data.values()):
-            continue  # Игнорируем эту строку, если все значения пустые
-        data.append(row_data)
-    return data
+    return file_data.excel_text_rows()
 
-def read_xml_data(file_path):
+def read_xml_data(file_data: DriveFileData):
     """
     Считывает данные из XML в общий формат с нормализацией ключей.
     """
-    tree = ET.parse(file_path)
-    root = tree.getroot()
+    root = file_data.root
 
     # Сбор данных из тегов <Item> (или другого актуального тега)
     data = []
@@ -210,31 +201,26 @@ def read_xml_data(file_path):
         if "PriceReserve" in row:
             row["PriceReserve"] = float(row["PriceReserve"]) if row["PriceReserve"] else 0.0
 
-    logging.info(f"Данные, извлеченные из XML: {data}")
+    logging.info(f"Данные, извлеченные из XML: {len(data)} строк")
     return data
 
-def read_csv_data(file_path):
+def read_csv_data(file_data: DriveFileData):
     """
-    Считывает данные из CSV в общий формат.
+    Строки CSV в общем формате: ключи в нижнем регистре, пустые значения отброшены.
     """
-    with open(file_path, mode="r", encoding="utf-8") as csvfile:
-        reader = csv.DictReader(csvfile)
-        headers = [header.strip().lower() for header in reader.fieldnames]  # Приводим заголовки к нижнему регистру
-        data = []
-        for row in reader:
-            cleaned_row = {k.strip().lower(): v.strip() for k, v in row.items() if v and v.strip()}  # Приводим ключи и значения
-            if cleaned_row:
-                data.append(cleaned_row)
+    data = []
+    for row in file_data.rows:
+        cleaned_row = {k.strip().lower(): v.strip() for k, v in row.items() if k and v and v.strip()}  # Приводим ключи и значения
+        if cleaned_row:
+            data.append(cleaned_row)
 
-        logging.info(f"CSV файл {file_path} содержит {len(data)} строк.")
+    logging.info(f"CSV файл {file_data.path} содержит {len(data)} строк.")
 
-        return data
+    return data
 
-def validate_excel(file_path: str, file_type: str, single_store: bool, store_serial: str,enterprise_code):
+def validate_excel(file_data: DriveFileData, file_type: str, single_store: bool, store_serial: str,enterprise_code):
+    file_path = file_data.path
     try:
-        wb = openpyxl.load_workbook(file_path)
-        sheet = wb.active
-
         # Определение обязательных полей
         required_fields = {
             "catalog": ["code", "name", "producer"],  # Приводим обязательные поля к нижнему регистру
@@ -244,8 +230,8 @@ def validate_excel(file_path: str, file_type: str, single_store: bool, store_ser
         if file_type == "stock" and not single_store:
             required_fields.append("branch")
 
-        # Чтение заголовков из первой строки и приведение их к нижнему регистру
-        headers = [str(cell.value).strip().lower() if cell.value is not None else "" for cell in sheet[1]]
+        # Заголовки из первой строки в нижнем регистре
+        headers = file_data.excel_headers()
         
         # Проверка отсутствующих полей
         missing_fields = [field for field in required_fields if field not in headers]
@@ -253,11 +239,8 @@ def validate_excel(file_path: str, file_type: str, single_store: bool, store_ser
             raise ValueError(f"Отсутствуют обязательные поля: {', '.join(missing_fields)}")
 
 
-        # Чтение данных с учетом заголовков
-        data = []
-        for row in sheet.iter_rows(min_row=2, values_only=True):
-            row_data = {headers[col_idx]: str(cell).strip() if cell is not None else "" for col_idx, cell in enumerate(row)}
-            data.append(row_data)
+        # Данные с учетом заголовков
+        data = file_data.excel_text_rows()
 
         # Проверка консистентности данных
         validate_consistency(data, file_type, single_store, store_serial,enterprise_code)
@@ -267,13 +250,13 @@ def validate_excel(file_path: str, file_type: str, single_store: bool, store_ser
         logging.error(error_message)
         send_notification(f"Внимание",error_message)
         raise
-def validate_xml(file_path: str, file_type: str, single_store: bool, store_serial: str,enterprise_code):
+def validate_xml(file_data: DriveFileData, file_type: str, single_store: bool, store_serial: str,enterprise_code):
     """
     Проверяет данные в файле XML.
     """
+    file_path = file_data.path
     try:
-        tree = ET.parse(file_path)
-        root = tree.getroot()
+        root = file_data.root
 
         # Определение обязательных полей
         required_fields = {
@@ -298,7 +281,7 @@ def validate_xml(file_path: str, file_type: str, single_store: bool, store_seria
                 row["pricereserve"] = float(row["pricereserve"]) if row["pricereserve"] else 0.0
 
         # Логгирование количества строк
-        logging.info(f"XML файл {file_path} содержит {len(data)} строк: {data}")
+        logging.info(f"XML файл {file_path} содержит {len(data)} строк.")
 
         # Проверка отсутствующих полей
         for row in data:
@@ -316,47 +299,46 @@ def validate_xml(file_path: str, file_type: str, single_store: bool, store_seria
         logging.error(error_message)
         send_notification(f"Внимание",error_message)
         raise
-def validate_csv(file_path: str, file_type: str, single_store: bool, store_serial: str,enterprise_code):
+def validate_csv(file_data: DriveFileData, file_type: str, single_store: bool, store_serial: str,enterprise_code):
     """
     Проверяет данные в файле CSV.
     """
+    file_path = file_data.path
     try:
-        with open(file_path, mode="r", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            headers = reader.fieldnames
+        headers = file_data.headers
 
-            # Определение обязательных полей
-            required_fields = {
-                "catalog": ["code", "name", "producer"],
-                "stock": ["code", "price", "Qty", "PriceReserve"]
-            }[file_type]
+        # Определение обязательных полей
+        required_fields = {
+            "catalog": ["code", "name", "producer"],
+            "stock": ["code", "price", "Qty", "PriceReserve"]
+        }[file_type]
 
-            if file_type == "stock" and not single_store:
-                required_fields.append("branch")
+        if file_type == "stock" and not single_store:
+            required_fields.append("branch")
 
-            # Проверка отсутствующих полей
-            missing_fields = [field for field in required_fields if field not in headers]
-            if missing_fields:
-                raise ValueError(f"Отсутствуют обязательные поля: {', '.join(missing_fields)}")
+        # Проверка отсутствующих полей
+        missing_fields = [field for field in required_fields if field not in headers]
+        if missing_fields:
+            raise ValueError(f"Отсутствуют обязательные поля: {', '.join(missing_fields)}")
 
-            logging.info(f"Файл {file_path} успешно прошел проверку заголовков.")
+        logging.info(f"Файл {file_path} успешно прошел проверку заголовков.")
 
-            # Чтение данных
-            data = []
-            for row in reader:
-                # Убираем пробелы и проверяем на пустоту
-                cleaned_row = {k.strip(): v.strip() for k, v in row.items() if v and v.strip()}
-                if cleaned_row:
-                    data.append(cleaned_row)
+        # Чтение данных
+        data = []
+        for row in file_data.rows:
+            # Убираем пробелы и проверяем на пустоту
+            cleaned_row = {k.strip(): v.strip() for k, v in row.items() if k and v and v.strip()}
+            if cleaned_row:
+                data.append(cleaned_row)
 
-            # Логгирование количества строк
-            logging.info(f"CSV файл {file_path} содержит {len(data)} строк.")
+        # Логгирование количества строк
+        logging.info(f"CSV файл {file_path} содержит {len(data)} строк.")
 
-            # Проверка консистентности данных
-            validate_consistency(data, file_type, single_store, store_serial,enterprise_code)
+        # Проверка консистентности данных
+        validate_consistency(data, file_type, single_store, store_serial,enterprise_code)
 
     except Exception as e:
         error_message = f"Ошибка валидации CSV файла {file_path}: {str(e)}для предприятия {enterprise_code}"
         logging.error(error_message)
         send_notification(f"Внимание", error_message)
-        raise  
+        raise
@@ -0,0 +1,137 @@
+"""
+Однократное чтение файла каталога/стока, скачанного с Google Drive.
+
+Раньше один и тот же файл открывался до трёх раз: read_file_data и
+validate_excel в data_validator и convert_to_json в data_converter
+(openpyxl.load_workbook в полном режиме каждый раз). Теперь файл читается один
+раз в load_drive_file, а валидация, добавление branch и преобразование типов
+работают с уже прочитанными строками.
+
+Excel открывается в read_only режиме с data_only=True: строки читаются
+потоково, без построения полной модели листа, формулы отдаются вычисленными
+значениями.
+"""
+from __future__ import annotations
+
+import csv
+import json
+import logging
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+import openpyxl
+
+
+EXCEL_SUFFIXES = (".xlsx", ".xls")
+
+
+@dataclass
+class DriveFileData:
+    """
+    Содержимое файла в исходном виде.
+
+    kind: excel | csv | xml | json.
+    headers/rows - для excel (кортежи значений) и csv (dict от DictReader);
+    root - корневой элемент XML; payload - результат json.load.
+    """
+
+    path: str
+    kind: str
+    headers: List[Any] = field(default_factory=list)
+    rows: List[Any] = field(default_factory=list)
+    root: Optional[ET.Element] = None
+    payload: Any = None
+    _text_rows: Optional[List[Dict[str, str]]] = field(default=None, repr=False)
+
+    def excel_headers(self) -> List[str]:
+        return [str(value).strip().lower() if value is not None else "" for value in self.headers]
+
+    def iter_excel_records(self) -> Iterator[Dict[str, Any]]:
+        """Строки Excel как dict header -> исходное значение ячейки."""
+        headers = self.excel_headers()
+        width = len(headers)
+        for row in self.rows:
+            values = tuple(row[:width]) + (None,) * (width - len(row))
+            yield dict(zip(headers, values))
+
+    def excel_text_rows(self) -> List[Dict[str, str]]:
+        """
+        Строки Excel со строковыми значениями (str().strip(), None -> ""),
+        полностью пустые строки пропускаются. Считается один раз на файл.
+        """
+        if self._text_rows is None:
+            text_rows = []
+            for record in self.iter_excel_records():
+                row_data = {key: str(value).strip() if value is not None else "" for key, value in record.items()}
+                if all(value == "" for value in row_data.values()):
+                    continue
+                text_rows.append(row_data)
+            self._text_rows = text_rows
+        return self._text_rows
+
+
+def _load_excel(file_path: str) -> DriveFileData:
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = wb.active
+        # В read_only режиме размеры берутся из метаданных файла, которые
+        # некоторые генераторы xlsx пишут неверно; пересчитываем по данным.
+        sheet.reset_dimensions()
+        rows = sheet.iter_rows(values_only=True)
+        headers = list(next(rows, ()) or ())
+        data = [tuple(row) for row in rows]
+    finally:
+        wb.close()
+    return DriveFileData(path=file_path, kind="excel", headers=headers, rows=data)
+
+
+def _load_csv(file_path: str) -> DriveFileData:
+    with open(file_path, mode="r", encoding="utf-8") as csv_file:
+        reader = csv.DictReader(csv_file)
+        rows = list(reader)
+        headers = list(reader.fieldnames or [])
+    return DriveFileData(path=file_path, kind="csv", headers=headers, rows=rows)
+
+
+def load_drive_file(file_path: str) -> DriveFileData:
+    """Читает файл один раз; неизвестное расширение - ValueError."""
+    if file_path.endswith(EXCEL_SUFFIXES):
+        data = _load_excel(file_path)
+    elif file_path.endswith(".csv"):
+        data = _load_csv(file_path)
+    elif file_path.endswith(".xml"):
+        data = DriveFileData(path=file_path, kind="xml", root=ET.parse(file_path).getroot())
+    elif file_path.endswith(".json"):
+        with open(file_path, "r", encoding="utf-8") as json_file:
+            data = DriveFileData(path=file_path, kind="json", payload=json.load(json_file))
+    else:
+        raise ValueError(f"Неизвестный формат файла: {file_path}")
+    logging.info("Файл %s прочитан: kind=%s rows=%s", file_path, data.kind, len(data.rows))
+    return data
+
+
+def xml_element_to_value(elem: ET.Element) -> Any:
+    """
+    Элемент XML в структуру как у xmltodict.parse с ключами в нижнем регистре:
+    лист без атрибутов -> текст (или None), иначе dict с '@attr', дочерними
+    тегами (повторы -> список) и '#text'.
+    """
+    children = list(elem)
+    text = (elem.text or "").strip()
+    if not children and not elem.attrib:
+        return text or None
+
+    value: Dict[str, Any] = {f"@{key}".lower(): attr for key, attr in elem.attrib.items()}
+    for child in children:
+        key = str(child.tag).lower()
+        child_value = xml_element_to_value(child)
+        if key not in value:
+            value[key] = child_value
+        elif isinstance(value[key], list):
+            value[key].append(child_value)
+        else:
+            value[key] = [value[key], child_value]
+    if text:
+        value["#text"] = text
+    return value
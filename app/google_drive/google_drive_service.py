@@ -4,11 +4,9 @@ import tempfile
 import time
 
 from dotenv import load_dotenv
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
 from sqlalchemy.future import select
 
+from app.core.google_drive_client import get_drive_client, is_file_unchanged, mark_file_imported
 from app.database import DeveloperSettings, EnterpriseSettings, get_async_db
 from app.google_drive.data_validator import validate_data
 from app.services.notification_service import send_notification
@@ -29,6 +27,11 @@ def get_logger() -> logging.Logger:
 
 logger = get_logger()
 
+# Пропуск неизменённых файлов (GOOGLE_DRIVE_SKIP_UNCHANGED) - только для каталога:
+# сток предприятия импортируется каждый цикл, даже из того же файла, чтобы
+# обновлялись остатки и last_stock_upload.
+SKIP_UNCHANGED_FILE_TYPES = frozenset({"catalog"})
+
 
 def get_temp_dir() -> str:
     temp_dir = os.getenv("TEMP_DIR", tempfile.gettempdir())
@@ -49,11 +52,7 @@ async def connect_to_google_drive():
             send_notification(f"Не найден файл учетных данных Google Drive: {google_drive_file_name}", "Разработчик")
             raise FileNotFoundError(f"Не найден файл учетных данных Google Drive: {google_drive_file_name}")
 
-        credentials = service_account.Credentials.from_service_account_file(
-            google_drive_file_name,
-            scopes=["https://www.googleapis.com/auth/drive"],
-        )
-        return build("drive", "v3", credentials=credentials)
+        return get_drive_client(google_drive_file_name)
     except Exception as exc:
         logger.error("Ошибка при подключении к Google Drive: %s", exc)
         send_notification(f"Ошибка при подключении к Google Drive: {exc}", "Разработчик")
@@ -63,11 +62,7 @@ async def connect_to_google_drive():
 async def fetch_files_from_folder(drive_service, folder_id: str) -> list[dict]:
     try:
         logger.info("Google Drive list files: folder_id=%s", folder_id)
-        results = drive_service.files().list(
-            q=f"'{folder_id}' in parents and trashed=false",
-            fields="files(id, name)",
-        ).execute()
-        files = results.get("files", [])
+        files = await drive_service.list_files(folder_id)
         logger.info("Google Drive files found: folder_id=%s count=%s", folder_id, len(files))
         return files
     except Exception as exc:
@@ -78,18 +73,8 @@ async def fetch_files_from_folder(drive_service, folder_id: str) -> list[dict]:
 
 async def download_file(drive_service, file_id: str, file_name: str) -> str:
     try:
-        request = drive_service.files().get_media(fileId=file_id)
-        temp_dir = get_temp_dir()
-        file_path = os.path.join(temp_dir, file_name)
-
-        with open(file_path, "wb") as file:
-            downloader = MediaIoBaseDownload(file, request)
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-                if status is not None:
-                    logger.info("Google Drive download progress: file=%s progress=%s%%", file_name, int(status.progress() * 100))
-
+        file_path = await drive_service.download_to_temp(file_id, file_name, get_temp_dir())
+        logger.info("Google Drive file downloaded: file=%s", file_name)
         return file_path
     except Exception as exc:
         logger.error("Ошибка при скачивании файла %s: %s", file_name, exc)
@@ -156,9 +141,21 @@ async def _process_google_drive_files(enterprise_code: str, file_type: str) -> N
 
     success_count = 0
     failed_count = 0
+    unchanged_count = 0
     failed_files: list[str] = []
+    state_scope = f"{enterprise_code}_{file_type}"
+    skip_unchanged = file_type in SKIP_UNCHANGED_FILE_TYPES
 
     for file in files:
+        if skip_unchanged and is_file_unchanged(state_scope, file):
+            unchanged_count += 1
+            logger.info(
+                "Google Drive file unchanged since last import, skipped: enterprise_code=%s type=%s file=%s",
+                enterprise_code,
+                file_type,
+                file["name"],
+            )
+            continue
         file_path = await download_file(drive_service, file["id"], file["name"])
         try:
             is_valid = await validate_data(
@@ -170,6 +167,8 @@ async def _process_google_drive_files(enterprise_code: str, file_type: str) -> N
             )
             if is_valid:
                 success_count += 1
+                if skip_unchanged:
+                    mark_file_imported(state_scope, file)
                 logger.info(
                     "Google Drive file processed: enterprise_code=%s type=%s file=%s status=success",
                     enterprise_code,
@@ -205,12 +204,13 @@ async def _process_google_drive_files(enterprise_code: str, file_type: str) -> N
                 logger.info("Google Drive temp file removed: %s", file_path)
 
     logger.info(
-        "Google Drive run summary: enterprise_code=%s type=%s found_files=%s success=%s failed=%s elapsed=%.2fs",
+        "Google Drive run summary: enterprise_code=%s type=%s found_files=%s success=%s failed=%s unchanged=%s elapsed=%.2fs",
         enterprise_code,
         file_type,
         len(files),
         success_count,
         failed_count,
+        unchanged_count,
         time.monotonic() - run_started_at,
     )
     if failed_files:
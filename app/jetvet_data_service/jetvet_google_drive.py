@@ -4,11 +4,9 @@ import tempfile
 import time
 
 from dotenv import load_dotenv
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
 from sqlalchemy.future import select
 
+from app.core.google_drive_client import get_drive_client
 from app.database import EnterpriseSettings, MappingBranch, get_async_db
 from app.jetvet_data_service.jetvet_catalog_conv import process_jetvet_catalog
 from app.jetvet_data_service.jetvet_stock_conv import process_jetvet_stock
@@ -47,11 +45,7 @@ async def connect_to_google_drive():
             send_notification(msg, "Разработчик")
             raise FileNotFoundError(msg)
 
-        credentials = service_account.Credentials.from_service_account_file(
-            google_drive_file_name,
-            scopes=["https://www.googleapis.com/auth/drive"],
-        )
-        return build("drive", "v3", credentials=credentials)
+        return get_drive_client(google_drive_file_name)
     except Exception as exc:
         msg = f"Ошибка при подключении к Google Drive: {exc}"
         logger.error(msg)
@@ -62,11 +56,7 @@ async def connect_to_google_drive():
 async def fetch_files_from_folder(drive_service, folder_id: str) -> list[dict]:
     try:
         logger.info("JetVet list files: folder_id=%s", folder_id)
-        results = drive_service.files().list(
-            q=f"'{folder_id}' in parents and trashed=false",
-            fields="files(id, name)",
-        ).execute()
-        files = results.get("files", [])
+        files = await drive_service.list_files(folder_id)
         logger.info("JetVet files found: folder_id=%s count=%s", folder_id, len(files))
         return files
     except Exception as exc:
@@ -78,16 +68,7 @@ async def fetch_files_from_folder(drive_service, folder_id: str) -> list[dict]:
 
 async def download_file(drive_service, file_id: str, file_name: str) -> str:
     try:
-        file_path = os.path.join(get_temp_dir(), file_name)
-        request = drive_service.files().get_media(fileId=file_id)
-        with open(file_path, "wb") as file:
-            downloader = MediaIoBaseDownload(file, request)
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-                if status is not None:
-                    logger.info("JetVet download progress: file=%s progress=%s%%", file_name, int(status.progress() * 100))
-        return file_path
+        return await drive_service.download_to_temp(file_id, file_name, get_temp_dir())
     except Exception as exc:
         msg = f"Ошибка при скачивании файла {file_name}: {exc}"
         logger.error(msg)
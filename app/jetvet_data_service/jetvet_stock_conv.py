@@ -9,6 +9,8 @@ from app.services.database_service import process_database_service
 import chardet
 import pandas as pd
 
+from app.core.dataframe_conversion import column_or_default, read_csv_frame, to_number, to_records
+
 load_dotenv()
 
 def detect_encoding(file_path):
@@ -40,41 +42,35 @@ async def process_jetvet_stock(
         encoding = detect_encoding(file_path)
         logging.info(f"Определена кодировка файла: {encoding}")
 
-        df = pd.read_csv(file_path, sep=";", encoding=encoding, dtype=str)
+        df = read_csv_frame(file_path, sep=";", encoding=encoding, dtype=str)
         df = df.fillna("")
 
         logging.info(f"Загружено строк из файла: {len(df)}")
 
-        items = []
-        skipped_rows = 0
-
-        for _, row in df.iterrows():
-            code = (row.get("code") or row.get("id", "")).strip()
-            price = row.get("outprice", "0").replace(",", ".").strip()
-            qty = row.get("stock", "0").replace(",", ".").strip()
-
-            try:
-                price_float = float(price)
-                qty_float = float(qty)
-                qty_int = int(round(qty_float))
-            except ValueError:
-                logging.warning(f"Пропущена строка из-за ошибки преобразования: {row.to_dict()}")
-                skipped_rows += 1
-                continue
-
-            if not code:
-                logging.warning(f"Пропущена строка без кода: {row.to_dict()}")
-                skipped_rows += 1
-                continue
-
-            item = {
+        raw_codes = column_or_default(df, "code", "")
+        codes = raw_codes.where(raw_codes.ne(""), column_or_default(df, "id", "")).str.strip()
+        prices = to_number(column_or_default(df, "outprice", "0"))
+        stocks = to_number(column_or_default(df, "stock", "0"))
+
+        not_converted = prices.isna() | stocks.isna()
+        without_code = ~not_converted & codes.eq("")
+        for row in df[not_converted].to_dict("records"):
+            logging.warning(f"Пропущена строка из-за ошибки преобразования: {row}")
+        for row in df[without_code].to_dict("records"):
+            logging.warning(f"Пропущена строка без кода: {row}")
+        skipped_rows = int(not_converted.sum() + without_code.sum())
+
+        valid = ~(not_converted | without_code)
+        stock = pd.DataFrame(
+            {
                 "branch": branch,
-                "code": code,
-                "price": price_float,
-                "qty": qty_int,
-                "price_reserve": price_float
+                "code": codes[valid],
+                "price": prices[valid],
+                "qty": stocks[valid].round().astype("int64"),
+                "price_reserve": prices[valid],
             }
-            items.append(item)
+        )
+        items = to_records(stock)
 
         logging.info(
             "JetVet stock parse summary: enterprise_code=%s branch=%s encoding=%s transformed=%s skipped=%s",
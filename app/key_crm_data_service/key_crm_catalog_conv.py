@@ -1,8 +1,15 @@
 import sys
-import requests
 import json
 import asyncio
 import time
+from app.core.paginated_fetch import (
+    Page,
+    PageFetchError,
+    account_rate_key,
+    get_json_with_retry,
+    get_rate_limiter,
+    iter_pages,
+)
 from app.database import get_async_db, EnterpriseSettings
 from app.services.database_service import process_database_service
 from sqlalchemy.future import select
@@ -17,7 +24,7 @@ API_URL = "https://openapi.keycrm.app/v1/products"
 REQUEST_LIMIT_PER_MINUTE = 60
 PAGE_LIMIT = 15
 REQUEST_TIMEOUT_SEC = 30
-REQUEST_DELAY_SEC = 60 / REQUEST_LIMIT_PER_MINUTE if REQUEST_LIMIT_PER_MINUTE > 0 else 0
+MAX_PAGES_IN_FLIGHT = int(os.getenv("KEYCRM_FETCH_MAX_IN_FLIGHT", "3"))
 
 
 def log_progress(page, count):
@@ -25,7 +32,7 @@ def log_progress(page, count):
     sys.stdout.flush()
 
 
-class KeyCRMFetchError(RuntimeError):
+class KeyCRMFetchError(PageFetchError):
     pass
 
 async def fetch_enterprise_settings(enterprise_code):
@@ -36,46 +43,62 @@ async def fetch_enterprise_settings(enterprise_code):
         return result.scalars().first()
 
 
-def fetch_all_products(api_key):
+async def iter_product_pages(api_key):
+    """
+    Страницы товаров KeyCRM по мере получения. Следующие страницы
+    запрашиваются заранее (до KEYCRM_FETCH_MAX_IN_FLIGHT), общий лимит
+    REQUEST_LIMIT_PER_MINUTE соблюдается token bucket'ом.
+    """
     headers = {
         "accept": "application/json",
         "Authorization": f"Bearer {api_key}"
     }
+    # лимит KeyCRM - на API-ключ: у каждого предприятия свой bucket
+    limiter = get_rate_limiter(account_rate_key("keycrm", api_key), REQUEST_LIMIT_PER_MINUTE / 60)
 
-    all_products = []
-    page = 1
-    pages_fetched = 0
-    started = time.perf_counter()
-
-    while True:
+    async def fetch_page(page):
         params = {
             "limit": PAGE_LIMIT,
             "page": page
         }
+        try:
+            json_data = await get_json_with_retry(
+                API_URL,
+                headers=headers,
+                params=params,
+                timeout_sec=REQUEST_TIMEOUT_SEC,
+                limiter=limiter,
+                label=f"KeyCRM catalog page={page}",
+            )
+        except PageFetchError as e:
+            raise KeyCRMFetchError(
+                f"KeyCRM catalog request failed: page={page} status={e.status}", status=e.status
+            ) from e
+
+        products = json_data.get("data", []) or []
+        last_page = json_data.get("last_page")
+        return Page(
+            number=page,
+            items=products,
+            # Проверка на конец страниц
+            is_last=not products or not json_data.get("next_page_url"),
+            total_pages=last_page if isinstance(last_page, int) else None,
+        )
 
-        response = requests.get(API_URL, headers=headers, params=params, timeout=REQUEST_TIMEOUT_SEC)
+    async for page in iter_pages(fetch_page, max_in_flight=MAX_PAGES_IN_FLIGHT):
+        if page.items:
+            log_progress(page.number, len(page.items))
+            yield page.items
 
-        if response.status_code != 200:
-            raise KeyCRMFetchError(
-                f"KeyCRM catalog request failed: page={page} status={response.status_code}"
-            )
 
-        json_data = response.json()
-        products = json_data.get("data", [])
-        if not products:
-            break
+async def fetch_all_products(api_key):
+    all_products = []
+    pages_fetched = 0
+    started = time.perf_counter()
 
+    async for products in iter_product_pages(api_key):
         pages_fetched += 1
         all_products.extend(products)
-        log_progress(page, len(products))
-
-        # Проверка на конец страниц
-        if not json_data.get("next_page_url"):
-            break
-
-        page += 1
-        if REQUEST_DELAY_SEC > 0:
-            time.sleep(REQUEST_DELAY_SEC)
 
     print(f"\nВсего получено: {len(all_products)} записей")
     elapsed = time.perf_counter() - started
@@ -156,7 +179,7 @@ async def run_service(enterprise_code, file_type):
         print("API ключ не найден.у")
         return
 
-    all_products, fetch_summary = fetch_all_products(api_key)
+    all_products, fetch_summary = await fetch_all_products(api_key)
     if not all_products:
         print("Данные не получены.")
         return
@@ -1,12 +1,18 @@
 import sys
-import requests
 import json
 import asyncio
 import time
+from app.core.paginated_fetch import (
+    Page,
+    PageFetchError,
+    account_rate_key,
+    get_json_with_retry,
+    get_rate_limiter,
+    iter_pages,
+)
 from app.database import get_async_db, EnterpriseSettings, MappingBranch
-from app.services.database_service import process_database_service
+from app.services.database_service import process_database_records
 from sqlalchemy.future import select
-import tempfile
 import os
 import logging
 from dotenv import load_dotenv
@@ -16,7 +22,7 @@ API_URL = "https://openapi.keycrm.app/v1/products"
 REQUEST_LIMIT_PER_MINUTE = 60
 PAGE_LIMIT = 15
 REQUEST_TIMEOUT_SEC = 30
-REQUEST_DELAY_SEC = 60 / REQUEST_LIMIT_PER_MINUTE if REQUEST_LIMIT_PER_MINUTE > 0 else 0
+MAX_PAGES_IN_FLIGHT = int(os.getenv("KEYCRM_FETCH_MAX_IN_FLIGHT", "3"))
 
 
 def log_progress(page, count):
@@ -24,7 +30,7 @@ def log_progress(page, count):
     sys.stdout.flush()
 
 
-class KeyCRMFetchError(RuntimeError):
+class KeyCRMFetchError(PageFetchError):
     pass
 
 
@@ -51,60 +57,53 @@ async def fetch_branch_id(enterprise_code):
 
 
 
-def fetch_all_products(api_key):
+async def iter_product_pages(api_key):
+    """
+    Страницы товаров KeyCRM по мере получения. Следующие страницы
+    запрашиваются заранее (до KEYCRM_FETCH_MAX_IN_FLIGHT), общий лимит
+    REQUEST_LIMIT_PER_MINUTE соблюдается token bucket'ом.
+    """
     headers = {
         "accept": "application/json",
         "Authorization": f"Bearer {api_key}"
     }
+    # лимит KeyCRM - на API-ключ: у каждого предприятия свой bucket
+    limiter = get_rate_limiter(account_rate_key("keycrm", api_key), REQUEST_LIMIT_PER_MINUTE / 60)
 
-    all_products = []
-    page = 1
-    pages_fetched = 0
-    started = time.perf_counter()
-
-    while True:
+    async def fetch_page(page):
         params = {
             "limit": PAGE_LIMIT,
             "page": page
         }
-
-        response = requests.get(API_URL, headers=headers, params=params, timeout=REQUEST_TIMEOUT_SEC)
-
-        if response.status_code != 200:
-            raise KeyCRMFetchError(
-                f"KeyCRM stock request failed: page={page} status={response.status_code}"
+        try:
+            json_data = await get_json_with_retry(
+                API_URL,
+                headers=headers,
+                params=params,
+                timeout_sec=REQUEST_TIMEOUT_SEC,
+                limiter=limiter,
+                label=f"KeyCRM stock page={page}",
             )
+        except PageFetchError as e:
+            raise KeyCRMFetchError(
+                f"KeyCRM stock request failed: page={page} status={e.status}", status=e.status
+            ) from e
+
+        products = json_data.get("data", []) or []
+        last_page = json_data.get("last_page")
+        return Page(
+            number=page,
+            items=products,
+            # Проверка на конец страниц
+            is_last=not products or not json_data.get("next_page_url"),
+            total_pages=last_page if isinstance(last_page, int) else None,
+        )
 
-        json_data = response.json()
-        products = json_data.get("data", [])
-        if not products:
-            break
-
-        pages_fetched += 1
-        all_products.extend(products)
-        log_progress(page, len(products))
-
-        if not json_data.get("next_page_url"):
-            break
-
-        page += 1
-        if REQUEST_DELAY_SEC > 0:
-            time.sleep(REQUEST_DELAY_SEC)
+    async for page in iter_pages(fetch_page, max_in_flight=MAX_PAGES_IN_FLIGHT):
+        if page.items:
+            log_progress(page.number, len(page.items))
+            yield page.items
 
-    print(f"\nВсего получено: {len(all_products)} записей")
-    elapsed = time.perf_counter() - started
-    logging.info(
-        "KeyCRM stock fetch summary: pages=%s fetched=%s page_limit=%s elapsed=%.3fs",
-        pages_fetched,
-        len(all_products),
-        PAGE_LIMIT,
-        elapsed,
-    )
-    return all_products, {
-        "pages_fetched": pages_fetched,
-        "fetched_records": len(all_products),
-        "elapsed": elapsed,
-    }
 
 def save_raw_input(data, enterprise_code):
     try:
@@ -123,7 +122,7 @@ def save_raw_input(data, enterprise_code):
         return None
 
 
-def transform_stock_data(products, branch_id):
+def _transform_stock_page(products, branch_id):
     transformed = []
     skipped_non_positive_qty = 0
     for item in products:
@@ -139,24 +138,23 @@ def transform_stock_data(products, branch_id):
             "qty": int(quantity),
             "price_reserve": float(item.get("max_price", 0)),
         })
+    return transformed, skipped_non_positive_qty
+
+
+def _log_transform_summary(incoming, transformed, skipped_non_positive_qty, branch_id):
     logging.info(
         "KeyCRM stock transform summary: incoming=%s transformed=%s skipped_non_positive_qty=%s branch=%s",
-        len(products),
-        len(transformed),
+        incoming,
+        transformed,
         skipped_non_positive_qty,
         branch_id,
     )
-    return transformed, skipped_non_positive_qty
 
 
-def save_to_tempfile(data):
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".json", mode='w', encoding='utf-8') as temp_file:
-            json.dump(data, temp_file, ensure_ascii=False, indent=4)
-            return temp_file.name
-    except IOError as e:
-        logging.error(f"Ошибка при сохранении временного файла: {e}")
-        return None
+def transform_stock_data(products, branch_id):
+    transformed, skipped_non_positive_qty = _transform_stock_page(products, branch_id)
+    _log_transform_summary(len(products), len(transformed), skipped_non_positive_qty, branch_id)
+    return transformed, skipped_non_positive_qty
 
 
 async def run_service(enterprise_code, file_type):
@@ -177,7 +175,27 @@ async def run_service(enterprise_code, file_type):
         print(str(e))
         return
 
-    all_products, fetch_summary = fetch_all_products(api_key)
+    # Страницы преобразуются по мере получения, пока следующие ещё качаются
+    all_products = []
+    transformed_data = []
+    skipped_non_positive_qty = 0
+    pages_fetched = 0
+    fetch_started = time.perf_counter()
+    async for products in iter_product_pages(api_key):
+        pages_fetched += 1
+        all_products.extend(products)
+        rows, skipped = _transform_stock_page(products, branch_id)
+        transformed_data.extend(rows)
+        skipped_non_positive_qty += skipped
+
+    print(f"\nВсего получено: {len(all_products)} записей")
+    logging.info(
+        "KeyCRM stock fetch summary: pages=%s fetched=%s page_limit=%s elapsed=%.3fs",
+        pages_fetched,
+        len(all_products),
+        PAGE_LIMIT,
+        time.perf_counter() - fetch_started,
+    )
     if not all_products:
         print("Данные не получены.")
         return
@@ -185,26 +203,21 @@ async def run_service(enterprise_code, file_type):
     # ✅ Сохраняем входящий файл до фильтрации
     save_raw_input(all_products, enterprise_code)
 
-    transformed_data, skipped_non_positive_qty = transform_stock_data(all_products, branch_id)
+    _log_transform_summary(len(all_products), len(transformed_data), skipped_non_positive_qty, branch_id)
     if not transformed_data:
         print("Нет данных для сохранения после фильтрации.")
         return
 
-    json_file_path = save_to_tempfile(transformed_data)
-    if not json_file_path:
-        print("Ошибка сохранения JSON-файла.")
-        return
-
     logging.info(
         "KeyCRM stock run summary: enterprise_code=%s pages=%s fetched=%s transformed=%s skipped_non_positive_qty=%s elapsed=%.3fs",
         enterprise_code,
-        fetch_summary["pages_fetched"],
-        fetch_summary["fetched_records"],
+        pages_fetched,
+        len(all_products),
         len(transformed_data),
         skipped_non_positive_qty,
         time.perf_counter() - started,
     )
-    await process_database_service(json_file_path, "stock", enterprise_code)
+    await process_database_records(transformed_data, "stock", enterprise_code, source="key_crm")
 
 
 if __name__ == "__main__":
@@ -996,6 +996,20 @@ class CompetitorPrice(Base, TimestampMixin):
         Index("ix_competitor_prices_city", "city"),
         Index("ix_competitor_prices_code", "code"),
     )
+
+
+class CompetitorPriceSnapshot(Base, TimestampMixin):
+    """Версия загруженного набора competitor_prices (одна строка на успешную загрузку)."""
+
+    __tablename__ = "competitor_price_snapshots"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True, doc="Версия снимка")
+    source_name = Column(String, nullable=True, doc="Имя исходного файла")
+    source_fingerprint = Column(String, nullable=True, doc="md5/modifiedTime исходного файла")
+    row_count = Column(Integer, nullable=False, server_default=text("0"))
+    city_count = Column(Integer, nullable=False, server_default=text("0"))
+
+
 class Offer(Base):
     __tablename__ = "offers"
 
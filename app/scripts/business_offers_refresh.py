@@ -34,6 +34,16 @@ def _print_human_summary(report: dict[str, Any]) -> None:
         f" cities={len(report.get('cities') or [])}"
         f" duration_sec={report.get('duration_sec')}"
     )
+    supplier_timings = dict(report.get("supplier_timings") or {})
+    if supplier_timings:
+        print("supplier timings:")
+        for supplier_code, timings in sorted(supplier_timings.items()):
+            print(
+                f"- supplier={supplier_code}"
+                f" fetch_sec={timings.get('fetch_sec')}"
+                f" map_sec={timings.get('map_sec')}"
+                f" write_sec={timings.get('write_sec')}"
+            )
     warnings = list(report.get("warnings") or [])
     errors = list(report.get("errors") or [])
     if warnings:
@@ -6,6 +6,7 @@ from pathlib import Path
 from datetime import datetime, timezone, timedelta
 from zoneinfo import ZoneInfo
 
+from app.core.http_clients import close_http_clients
 from app.business.balancer.jobs import run_balancer_pipeline_async
 
 logger = logging.getLogger("balancer_scheduler")
@@ -94,46 +95,49 @@ async def loop() -> None:
     logger.info("🚀 Balancer scheduler started. tz=%s boundaries=%s fire_window_sec=%s run_both=%s state_file=%s",
                 str(TZ), BOUNDARIES_LOCAL, fire_window_sec, run_both, str(STATE_FILE))
 
-    while True:
-        now = datetime.now(timezone.utc)
-        prev_boundary = _prev_boundary_end_utc(now)
-        next_boundary = _next_boundary_end_utc(now)
+    try:
+        while True:
+            now = datetime.now(timezone.utc)
+            prev_boundary = _prev_boundary_end_utc(now)
+            next_boundary = _next_boundary_end_utc(now)
 
-        prev_iso = prev_boundary.isoformat()
-        last_done = _load_last_boundary_utc_iso()
+            prev_iso = prev_boundary.isoformat()
+            last_done = _load_last_boundary_utc_iso()
 
-        # Запускаемся только в первые N секунд после границы
-        in_fire_window = now >= prev_boundary and (now - prev_boundary).total_seconds() <= fire_window_sec
+            # Запускаемся только в первые N секунд после границы
+            in_fire_window = now >= prev_boundary and (now - prev_boundary).total_seconds() <= fire_window_sec
 
-        logger.info("🕒 Tick. now_utc=%s prev_boundary_utc=%s next_boundary_utc=%s in_fire_window=%s last_done=%s",
-                    now.isoformat(), prev_iso, next_boundary.isoformat(), in_fire_window, last_done)
+            logger.info("🕒 Tick. now_utc=%s prev_boundary_utc=%s next_boundary_utc=%s in_fire_window=%s last_done=%s",
+                        now.isoformat(), prev_iso, next_boundary.isoformat(), in_fire_window, last_done)
 
-        if in_fire_window and last_done != prev_iso:
-            logger.info("✅ Boundary fired: %s", prev_iso)
+            if in_fire_window and last_done != prev_iso:
+                logger.info("✅ Boundary fired: %s", prev_iso)
 
-            # Говорим jobs, какой сегмент закрыли (по его segment_end)
-            os.environ["BALANCER_COLLECT_SEGMENT_END_UTC"] = prev_iso
+                # Говорим jobs, какой сегмент закрыли (по его segment_end)
+                os.environ["BALANCER_COLLECT_SEGMENT_END_UTC"] = prev_iso
 
-            try:
-                if run_both:
-                    os.environ["BALANCER_RUN_MODE"] = "TEST"
-                    await run_balancer_pipeline_async()
+                try:
+                    if run_both:
+                        os.environ["BALANCER_RUN_MODE"] = "TEST"
+                        await run_balancer_pipeline_async()
 
-                    os.environ["BALANCER_RUN_MODE"] = "LIVE"
-                    await run_balancer_pipeline_async()
-                else:
-                    await run_balancer_pipeline_async()
+                        os.environ["BALANCER_RUN_MODE"] = "LIVE"
+                        await run_balancer_pipeline_async()
+                    else:
+                        await run_balancer_pipeline_async()
 
-                _save_last_boundary_utc_iso(prev_iso)
-                logger.info("✅ Boundary processed and saved: %s", prev_iso)
+                    _save_last_boundary_utc_iso(prev_iso)
+                    logger.info("✅ Boundary processed and saved: %s", prev_iso)
 
-            except Exception:
-                logger.exception("❌ Balancer scheduler boundary iteration failed")
+                except Exception:
+                    logger.exception("❌ Balancer scheduler boundary iteration failed")
 
-        # Спим до следующей границы (с запасом)
-        sleep_sec = max(10, int((next_boundary - now).total_seconds()) - 5)
-        logger.info("⏳ Sleep %s sec (to next boundary)", sleep_sec)
-        await asyncio.sleep(sleep_sec)
+            # Спим до следующей границы (с запасом)
+            sleep_sec = max(10, int((next_boundary - now).total_seconds()) - 5)
+            logger.info("⏳ Sleep %s sec (to next boundary)", sleep_sec)
+            await asyncio.sleep(sleep_sec)
+    finally:
+        await close_http_clients()
 
 
 if __name__ == "__main__":
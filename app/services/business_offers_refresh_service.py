@@ -116,6 +116,7 @@ async def run_business_offers_refresh_once(enterprise_code: str | None = None) -
             "started_at": None,
             "finished_at": None,
             "duration_sec": 0.0,
+            "supplier_timings": {},
             "warnings": warnings,
             "errors": [{"supplier_code": "__selector__", "message": error} for error in errors],
         }
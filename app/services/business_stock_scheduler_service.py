@@ -5,6 +5,7 @@ from datetime import datetime, timedelta, timezone
 import pytz
 from sqlalchemy.future import select
 
+from app.core.http_clients import close_http_clients
 from app.database import EnterpriseSettings, get_async_db
 from app.models import BusinessSettings
 from app.services.notification_service import send_notification
@@ -225,6 +226,7 @@ async def schedule_business_stock_tasks():
             "business_stock_scheduler",
         )
     finally:
+        await close_http_clients()
         await notify_error(
             "Сервис business_stock_scheduler неожиданно остановлен.",
             "business_stock_scheduler",
@@ -12,6 +12,7 @@ from app.models import DeveloperSettings, EnterpriseSettings
 from app.services.business_store_native_stock_dataset_service import (
     build_business_store_native_stock_dataset,
 )
+from app.services import publish_ledger
 from app.services.stock_export_service import send_to_endpoint
 
 
@@ -96,6 +97,7 @@ async def publish_business_store_native_stock(
     confirm: bool = False,
     compare_legacy: bool = False,
     allow_baseline_runtime_override: bool = False,
+    force: bool = False,
 ) -> dict[str, Any]:
     if not dry_run and require_confirm and not bool(confirm):
         raise ValueError("Live send requires explicit confirm.")
@@ -164,6 +166,25 @@ async def publish_business_store_native_stock(
             result["status"] = "error"
         return result
 
+    pending_hashes: dict[str, str] = {}
+    changed_branches: list[dict[str, Any]] = []
+    for branch_payload in payload.get("Branches") or []:
+        decision = publish_ledger.check_publish(
+            _clean_text(enterprise_code),
+            publish_ledger.KIND_BUSINESS_STORE_STOCK,
+            branch_payload["Code"],
+            branch_payload,
+            force=force,
+        )
+        if decision.should_send:
+            changed_branches.append(branch_payload)
+            pending_hashes[branch_payload["Code"]] = decision.payload_hash
+    result["unchanged_branches_count"] = len(payload.get("Branches") or []) - len(changed_branches)
+    if not changed_branches:
+        result["status"] = "skipped_unchanged"
+        return result
+    payload = {"Branches": changed_branches}
+
     response_status, response_text = await send_to_endpoint(
         endpoint,
         payload,
@@ -176,5 +197,11 @@ async def publish_business_store_native_stock(
         "status_code": int(response_status),
         "body": response_text,
     }
-    result["sent_products"] = len(rows)
+    result["sent_products"] = sum(len(branch["Rests"]) for branch in changed_branches)
+    if result["status"] == "sent":
+        publish_ledger.record_publish(
+            _clean_text(enterprise_code),
+            publish_ledger.KIND_BUSINESS_STORE_STOCK,
+            pending_hashes,
+        )
     return result
@@ -431,17 +431,18 @@ async def _load_competitor_map(
 )-> tuple[dict[str, Decimal], list[str]]:
     if not product_codes:
         return {}, []
-    from app.models import CompetitorPrice
+    from app.business.competitor_price_index import get_competitor_price_index
 
-    comp_rows = await session.execute(
-        select(CompetitorPrice.code, CompetitorPrice.city, CompetitorPrice.competitor_price).where(
-            CompetitorPrice.code.in_(product_codes),
-        )
-    )
+    competitor_index = await get_competitor_price_index(session)
+    comp_rows = [
+        (code, city, price)
+        for code, prices_by_city in competitor_index.by_code(product_codes).items()
+        for city, price in prices_by_city.items()
+    ]
     prices_by_code: dict[str, Decimal] = {}
     distinct_price_counts: dict[str, set[str]] = {}
     sampled_cities: dict[str, list[str]] = {}
-    for code, city, price in comp_rows.all():
+    for code, city, price in comp_rows:
         normalized_code = _clean_text(code)
         normalized_city = _clean_text(city)
         normalized_price = _round_money(_decimal_or_none(price)) or ZERO
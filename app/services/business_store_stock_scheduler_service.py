@@ -2,6 +2,7 @@ import asyncio
 import logging
 import os
 
+from app.core.http_clients import close_http_clients
 from app.database import get_async_db
 from app.services.business_offers_refresh_service import run_business_offers_refresh_once
 from app.services.business_store_stock_publish_service import (
@@ -262,6 +263,7 @@ async def schedule_business_store_stock_tasks() -> None:
             "business_store_stock_scheduler",
         )
     finally:
+        await close_http_clients()
         if not stopped_gracefully:
             send_notification(
                 "Сервис business_store_stock_scheduler неожиданно остановлен.",
@@ -5,6 +5,8 @@ import aiohttp
 from sqlalchemy.future import select
 from app.database import get_async_db, DeveloperSettings, EnterpriseSettings
 from app.services.notification_service import send_notification  # Импортируем функцию для отправки уведомлений
+from app.core.http_clients import encode_json_body, get_aiohttp_session
+from app.services import publish_ledger
 from datetime import datetime,timezone
 import pytz
 local_tz = pytz.timezone('Europe/Kiev')
@@ -90,13 +92,13 @@ async def transform_data(raw_data: list, developer_settings: DeveloperSettings,e
 # Функция для отправки данных на эндпоинт
 async def post_data_to_endpoint(endpoint: str, data: dict, login: str, password: str,enterprise_code):
     try:
-        headers = {"Content-Type": "application/json"}
+        body, headers = encode_json_body(data)
         auth = aiohttp.BasicAuth(login, password)
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(endpoint, json=data, headers=headers, auth=auth) as response:
-                response_text = await response.text()
-                return response.status, response_text
+        session = get_aiohttp_session()
+        async with session.post(endpoint, data=body, headers=headers, auth=auth) as response:
+            response_text = await response.text()
+            return response.status, response_text
     except Exception as e:
         logging.error(f"Error posting data to endpoint: {str(e)}")
         send_notification(f"Ошибка отпраки каталога на ендпоинт {str(e)} для предприятия {enterprise_code}",enterprise_code)
@@ -109,6 +111,7 @@ async def export_catalog(
     *,
     enterprise_settings: EnterpriseSettings | None = None,
     developer_settings: DeveloperSettings | None = None,
+    force: bool = False,
 ):
     try:
         if enterprise_settings is None or developer_settings is None:
@@ -142,8 +145,26 @@ async def export_catalog(
         endpoint = f"{developer_settings.endpoint_catalog}/Import/Ref/{enterprise_settings.branch_id}"
         logging.info(f"Prepared endpoint URL: {endpoint}")
 
+        # Пропускаем отправку, если каталог не менялся с последней успешной публикации
+        decision = publish_ledger.check_publish(
+            enterprise_code,
+            publish_ledger.KIND_CATALOG,
+            enterprise_settings.branch_id,
+            transformed_data,
+            force=force,
+        )
+        if not decision.should_send:
+            logging.info(f"Catalog for enterprise_code={enterprise_code} unchanged since last publish. Skipping send.")
+            return
+
         # Отправка данных на реальный эндпоинт
-        await post_data_to_endpoint(endpoint,transformed_data, enterprise_settings.tabletki_login, enterprise_settings.tabletki_password,enterprise_code )
+        status, _ = await post_data_to_endpoint(endpoint,transformed_data, enterprise_settings.tabletki_login, enterprise_settings.tabletki_password,enterprise_code )
+        if status < 400:
+            publish_ledger.record_publish(
+                enterprise_code,
+                publish_ledger.KIND_CATALOG,
+                {enterprise_settings.branch_id: decision.payload_hash},
+            )
         
         if developer_settings.message_orders:
             send_notification(f"🟡 Каталог успешно отправлен!", enterprise_code)
@@ -33,6 +33,7 @@ from app.ftp_multi_data_service.ftp_multi_conv import run_service as run_ftp_mul
 from app.biotus_data_service.biotus_conv import run_service as run_biotus
 from app.bioteca_data_service.bioteca_conv import run_service as run_bioteca
 from app.business.import_catalog import run_service as run_business
+from app.core.http_clients import close_http_clients
 from app.database import get_async_db, EnterpriseSettings
 from app.services.notification_service import send_notification
 
@@ -204,6 +205,7 @@ async def schedule_catalog_tasks():
     except Exception as main_error:
         await notify_error(f"🔥 Критическая ошибка в планировщике: {str(main_error)}")
     finally:
+        await close_http_clients()
         await notify_error("🔴 Сервис catalog_scheduler неожиданно остановлен.", "catalog_scheduler")
         
 if __name__ == "__main__":
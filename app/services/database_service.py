@@ -1,5 +1,7 @@
 import logging
 import json
+import os
+from collections.abc import AsyncIterable, Iterable
 from dataclasses import dataclass, field
 from datetime import datetime
 from time import perf_counter
@@ -12,6 +14,16 @@ from app.services.catalog_export_service import export_catalog
 from app.services.stock_export_service import process_stock_file
 from app.services.stock_update_service import update_stock
 from app.services.notification_service import send_notification
+from app.services.inventory_bulk_loader import (
+    PERSISTENCE_MODE_COPY,
+    PERSISTENCE_MODE_DIFF,
+    PERSISTENCE_MODE_ORM,
+    StockDeltaSummary,
+    apply_stock_delta,
+    copy_catalog_records,
+    copy_stock_records,
+    get_persistence_mode,
+)
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -37,6 +49,10 @@ class ValidationSummary:
 class PersistenceSummary:
     deleted_count: int
     prepared_count: int
+    persistence_mode: str = "orm"
+    inserted_count: int = 0
+    updated_count: int = 0
+    unchanged_count: int = 0
 
 
 @dataclass
@@ -65,22 +81,60 @@ class PhaseExecutionError(RuntimeError):
 async def process_database_service(file_path: str, data_type: str, enterprise_code: str):
     """
     Обрабатывает данные из JSON и записывает их в базу данных.
+    Тонкая обёртка над process_database_records для адаптеров, которые
+    по-прежнему передают данные через JSON-файл.
     :param file_path: Путь к JSON-файлу
     :param data_type: Тип данных ('catalog' или 'stock')
     :param enterprise_code: Код предприятия
     """
+    await _run_database_service(
+        lambda: _load_payload(file_path),
+        data_type,
+        enterprise_code,
+        source=file_path,
+    )
+
+
+async def process_database_records(
+    records: Iterable[dict] | AsyncIterable[dict],
+    data_type: str,
+    enterprise_code: str,
+    *,
+    source: str = "memory",
+):
+    """
+    Записывает в базу уже сконвертированные записи без промежуточного JSON-файла.
+
+    Ключи нормализуются за один проход по records (list, генератор или async
+    iterable). Каждая запись копируется (поверхностно), переданные словари
+    вызывающего не изменяются.
+    Для отладки payload можно сохранить на диск через DATABASE_SERVICE_DEBUG_DUMP_DIR.
+    :param records: Записи catalog/stock
+    :param data_type: Тип данных ('catalog' или 'stock')
+    :param enterprise_code: Код предприятия
+    :param source: Метка источника для логов
+    """
+    async def _load() -> tuple[list, list]:
+        raw_data, cleaned_data = await _collect_records(records, keep_raw=data_type == "catalog")
+        _maybe_dump_payload(raw_data or cleaned_data, enterprise_code, data_type)
+        return raw_data, cleaned_data
+
+    await _run_database_service(_load, data_type, enterprise_code, source=source)
+
+
+async def _run_database_service(load_payload, data_type: str, enterprise_code: str, *, source: str):
     started = perf_counter()
     logging.info(
-        "Database service start: enterprise_code=%s data_type=%s file_path=%s",
+        "Database service start: enterprise_code=%s data_type=%s source=%s",
         enterprise_code,
         data_type,
-        file_path,
+        source,
     )
 
     async with get_async_db(commit_on_exit=False) as session:
         run_outcome = RunOutcomeSummary()
         try:
-            raw_data, cleaned_data = _load_payload(file_path)
+            raw_data, cleaned_data = await load_payload()
             records_count = len(cleaned_data)
             settings_context = SettingsContext()
             logging.info(
@@ -180,13 +234,58 @@ def clean_json_keys(data: list):
     return [{k.strip().lower(): v for k, v in record.items()} for record in data]
 
 
-def _load_payload(file_path: str) -> tuple[list, list]:
+async def _load_payload(file_path: str) -> tuple[list, list]:
     with open(file_path, "r", encoding="utf-8") as json_file:
         raw_data = json.load(json_file)
     cleaned_data = clean_json_keys(raw_data)
     return raw_data, cleaned_data
 
 
+def _clean_record_keys(record: dict) -> dict:
+    # всегда новый dict: дальше apply_discount_rate меняет price_reserve по месту
+    return {k.strip().lower(): v for k, v in record.items()}
+
+
+async def _collect_records(
+    records: Iterable[dict] | AsyncIterable[dict],
+    *,
+    keep_raw: bool,
+) -> tuple[list, list]:
+    """
+    Один проход по записям: очищенные ключи + (для catalog) исходные записи,
+    которые нужны export_catalog в исходном виде.
+    """
+    raw_data: list = []
+    cleaned_data: list = []
+
+    def _accept(record: dict) -> None:
+        if keep_raw:
+            raw_data.append(record)
+        cleaned_data.append(_clean_record_keys(record))
+
+    if isinstance(records, AsyncIterable):
+        async for record in records:
+            _accept(record)
+    else:
+        for record in records:
+            _accept(record)
+    return raw_data, cleaned_data
+
+
+def _maybe_dump_payload(data: list, enterprise_code: str, data_type: str) -> None:
+    dump_dir = (os.getenv("DATABASE_SERVICE_DEBUG_DUMP_DIR") or "").strip()
+    if not dump_dir:
+        return
+    try:
+        os.makedirs(dump_dir, exist_ok=True)
+        dump_path = os.path.join(dump_dir, f"{enterprise_code}_{data_type}_data.json")
+        with open(dump_path, "w", encoding="utf-8") as json_file:
+            json.dump(data, json_file, ensure_ascii=False)
+        logging.info("Database service debug dump written: path=%s", dump_path)
+    except OSError as exc:
+        logging.warning("Database service debug dump failed: enterprise_code=%s error=%s", enterprise_code, exc)
+
+
 def _catalog_identity_key(record: dict, enterprise_code: str) -> tuple[str, str]:
     return str(record.get("code") or "").strip(), enterprise_code
 
@@ -255,13 +354,15 @@ async def _run_phase(
         raise PhaseExecutionError(phase) from exc
 
     if records_count is not None:
+        elapsed = perf_counter() - started
         logging.info(
-            "Database service phase done: enterprise_code=%s data_type=%s phase=%s elapsed=%.3fs records_count=%s",
+            "Database service phase done: enterprise_code=%s data_type=%s phase=%s elapsed=%.3fs records_count=%s rows_per_sec=%.1f",
             enterprise_code,
             data_type,
             phase,
-            perf_counter() - started,
+            elapsed,
             records_count,
+            records_count / elapsed if elapsed > 0 else 0.0,
         )
     else:
         logging.info(
@@ -384,6 +485,10 @@ async def _process_catalog_flow(
         session.flush,
         records_count=records_count,
     )
+    # diff-режим есть только для стока; каталог в нём пишется через ORM
+    persistence_mode = get_persistence_mode()
+    if persistence_mode == PERSISTENCE_MODE_DIFF:
+        persistence_mode = PERSISTENCE_MODE_ORM
     _log_persistence_summary(
         enterprise_code=enterprise_code,
         data_type=data_type,
@@ -391,6 +496,7 @@ async def _process_catalog_flow(
         summary=PersistenceSummary(
             deleted_count=deleted_count or 0,
             prepared_count=prepared_count or 0,
+            persistence_mode=persistence_mode,
         ),
     )
 
@@ -419,15 +525,24 @@ async def _process_stock_flow(
         summary=pre_delete_validation_summary,
     )
 
-    deleted_count = await _run_phase(
-        enterprise_code,
-        data_type,
-        "delete_old_stock",
-        delete_old_stock_data,
-        session,
-        enterprise_code,
-    )
-    run_outcome.deleted_count = deleted_count or 0
+    persistence_mode = get_persistence_mode()
+    if persistence_mode == PERSISTENCE_MODE_DIFF:
+        deleted_count = 0
+        logging.info(
+            "Database service phase skipped: enterprise_code=%s data_type=%s phase=delete_old_stock reason=diff_mode",
+            enterprise_code,
+            data_type,
+        )
+    else:
+        deleted_count = await _run_phase(
+            enterprise_code,
+            data_type,
+            "delete_old_stock",
+            delete_old_stock_data,
+            session,
+            enterprise_code,
+        )
+        run_outcome.deleted_count = deleted_count or 0
 
     if settings_context.enterprise_settings:
         cleaned_data = await _run_phase(
@@ -523,16 +638,32 @@ async def _process_stock_flow(
             records_count=len(cleaned_data),
         ),
     )
-    prepared_count = await _run_phase(
-        enterprise_code,
-        data_type,
-        "save_stock",
-        save_stock_data,
-        cleaned_data,
-        session,
-        enterprise_code,
-        records_count=len(cleaned_data),
-    )
+    delta_summary = StockDeltaSummary()
+    if persistence_mode == PERSISTENCE_MODE_DIFF:
+        delta_summary = await _run_phase(
+            enterprise_code,
+            data_type,
+            "apply_stock_delta",
+            apply_stock_delta,
+            session,
+            enterprise_code,
+            [_prepare_stock_record_for_persistence(record, enterprise_code) for record in cleaned_data],
+            records_count=len(cleaned_data),
+        )
+        deleted_count = delta_summary.deleted_count
+        run_outcome.deleted_count = deleted_count
+        prepared_count = len(cleaned_data)
+    else:
+        prepared_count = await _run_phase(
+            enterprise_code,
+            data_type,
+            "save_stock",
+            save_stock_data,
+            cleaned_data,
+            session,
+            enterprise_code,
+            records_count=len(cleaned_data),
+        )
     run_outcome.prepared_count = prepared_count or 0
     await _run_phase(
         enterprise_code,
@@ -548,6 +679,10 @@ async def _process_stock_flow(
         summary=PersistenceSummary(
             deleted_count=deleted_count or 0,
             prepared_count=prepared_count or 0,
+            persistence_mode=persistence_mode,
+            inserted_count=delta_summary.inserted_count,
+            updated_count=delta_summary.updated_count,
+            unchanged_count=delta_summary.unchanged_count,
         ),
     )
     return cleaned_data
@@ -718,12 +853,16 @@ def _log_persistence_summary(
     summary: PersistenceSummary,
 ) -> None:
     logging.info(
-        "Database service persistence summary: enterprise_code=%s data_type=%s phase=%s deleted=%s prepared=%s",
+        "Database service persistence summary: enterprise_code=%s data_type=%s phase=%s mode=%s deleted=%s prepared=%s inserted=%s updated=%s unchanged=%s",
         enterprise_code,
         data_type,
         phase,
+        summary.persistence_mode,
         summary.deleted_count,
         summary.prepared_count,
+        summary.inserted_count,
+        summary.updated_count,
+        summary.unchanged_count,
     )
 
 
@@ -804,6 +943,11 @@ async def save_catalog_data(data: list, session: AsyncSession, enterprise_code:
     :param session: Сессия базы данных
     :param enterprise_code: Код предприятия
     """
+    if get_persistence_mode() == PERSISTENCE_MODE_COPY:
+        return await copy_catalog_records(
+            session,
+            [_prepare_catalog_record_for_persistence(record, enterprise_code) for record in data],
+        )
     for record in data:
         prepared_record = _prepare_catalog_record_for_persistence(record, enterprise_code)
         session.add(InventoryData(**prepared_record))
@@ -816,6 +960,11 @@ async def save_stock_data(data: list, session: AsyncSession, enterprise_code: st
     :param session: Сессия базы данных
     :param enterprise_code: Код предприятия
     """
+    if get_persistence_mode() == PERSISTENCE_MODE_COPY:
+        return await copy_stock_records(
+            session,
+            [_prepare_stock_record_for_persistence(record, enterprise_code) for record in data],
+        )
     for record in data:
         prepared_record = _prepare_stock_record_for_persistence(record, enterprise_code)
         session.add(InventoryStock(**prepared_record))
@@ -0,0 +1,283 @@
+import logging
+import os
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Callable, Iterable
+
+from sqlalchemy import Float, Integer, Numeric, Table, func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import InventoryData, InventoryStock
+
+
+logger = logging.getLogger(__name__)
+
+PERSISTENCE_MODE_ORM = "orm"
+PERSISTENCE_MODE_COPY = "copy"
+PERSISTENCE_MODE_DIFF = "diff"
+_SUPPORTED_PERSISTENCE_MODES = {PERSISTENCE_MODE_ORM, PERSISTENCE_MODE_COPY, PERSISTENCE_MODE_DIFF}
+
+STOCK_DELTA_CHUNK_SIZE = 1000
+_PRICE_QUANT = Decimal("0.01")
+
+# Служебные колонки заполняются server_default и не участвуют в загрузке.
+_SERVICE_COLUMNS = {"created_at", "updated_at"}
+
+
+def get_persistence_mode() -> str:
+    """
+    Режим записи catalog/stock в database_service.
+
+    `orm` - историческое поведение (session.add на каждую запись),
+    `copy` - COPY в staging-таблицу и INSERT ... SELECT в целевую таблицу,
+    `diff` - для stock применяется только delta (INSERT/UPDATE/DELETE) по (branch, code),
+    catalog в этом режиме пишется так же, как в `orm`.
+    """
+    mode = (os.getenv("DATABASE_SERVICE_PERSISTENCE_MODE") or PERSISTENCE_MODE_ORM).strip().lower()
+    if mode not in _SUPPORTED_PERSISTENCE_MODES:
+        logger.warning(
+            "Unknown DATABASE_SERVICE_PERSISTENCE_MODE=%s, fallback to %s",
+            mode,
+            PERSISTENCE_MODE_ORM,
+        )
+        return PERSISTENCE_MODE_ORM
+    return mode
+
+
+def _to_str(value: Any) -> str | None:
+    return None if value is None else str(value)
+
+
+def _to_float(value: Any) -> float | None:
+    return None if value is None else float(value)
+
+
+def _to_int(value: Any) -> int | None:
+    return None if value is None else int(value)
+
+
+def _to_decimal(value: Any) -> Decimal | None:
+    if value is None:
+        return None
+    if isinstance(value, Decimal):
+        return value
+    return Decimal(str(value))
+
+
+def _column_converter(column) -> Callable[[Any], Any]:
+    column_type = column.type
+    if isinstance(column_type, Numeric) and not isinstance(column_type, Float):
+        return _to_decimal
+    if isinstance(column_type, Float):
+        return _to_float
+    if isinstance(column_type, Integer):
+        return _to_int
+    return _to_str
+
+
+def _load_columns(table: Table) -> list[str]:
+    return [column.name for column in table.columns if column.name not in _SERVICE_COLUMNS]
+
+
+def _build_copy_rows(table: Table, columns: list[str], records: Iterable[dict]) -> list[tuple]:
+    allowed = set(columns)
+    converters = [_column_converter(table.columns[name]) for name in columns]
+    rows: list[tuple] = []
+    for index, record in enumerate(records):
+        unknown = set(record) - allowed
+        if unknown:
+            raise ValueError(
+                f"Unexpected fields for {table.name}: idx={index} fields={','.join(sorted(unknown))}"
+            )
+        rows.append(tuple(
+            converter(record.get(name))
+            for name, converter in zip(columns, converters)
+        ))
+    return rows
+
+
+async def get_driver_connection(session: AsyncSession):
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    driver_connection = raw_connection.driver_connection
+    if not hasattr(driver_connection, "copy_records_to_table"):
+        raise RuntimeError(
+            "COPY persistence requires asyncpg driver connection, "
+            f"got {type(driver_connection).__name__}"
+        )
+    return driver_connection
+
+
+async def copy_records_into_table(
+    session: AsyncSession,
+    table: Table,
+    records: list[dict],
+) -> int:
+    """
+    Загружает записи в `table` через staging-таблицу в текущей транзакции сессии.
+
+    Staging создаётся как TEMP ... ON COMMIT DROP, поэтому rollback основной
+    транзакции откатывает и вставку в целевую таблицу.
+    """
+    if not records:
+        return 0
+
+    columns = _load_columns(table)
+    rows = _build_copy_rows(table, columns, records)
+    staging_name = f"_stage_{table.name}"
+    column_list = ", ".join(f'"{name}"' for name in columns)
+
+    driver_connection = await get_driver_connection(session)
+    await driver_connection.execute(
+        f'CREATE TEMP TABLE IF NOT EXISTS "{staging_name}" '
+        f'(LIKE "{table.name}" INCLUDING DEFAULTS) ON COMMIT DROP'
+    )
+    await driver_connection.execute(f'TRUNCATE "{staging_name}"')
+    await driver_connection.copy_records_to_table(
+        staging_name,
+        records=rows,
+        columns=columns,
+    )
+    await driver_connection.execute(
+        f'INSERT INTO "{table.name}" ({column_list}) '
+        f'SELECT {column_list} FROM "{staging_name}"'
+    )
+    return len(rows)
+
+
+async def copy_catalog_records(session: AsyncSession, records: list[dict]) -> int:
+    return await copy_records_into_table(session, InventoryData.__table__, records)
+
+
+async def copy_stock_records(session: AsyncSession, records: list[dict]) -> int:
+    return await copy_records_into_table(session, InventoryStock.__table__, records)
+
+
+@dataclass
+class StockDeltaSummary:
+    inserted_count: int = 0
+    updated_count: int = 0
+    deleted_count: int = 0
+    unchanged_count: int = 0
+    # (branch, code) уже занят строкой другого предприятия - такие строки не перезаписываются
+    foreign_conflict_count: int = 0
+
+
+def _normalize_price(value: Any) -> Decimal | None:
+    value = _to_decimal(value)
+    if value is None:
+        return None
+    return value.quantize(_PRICE_QUANT, rounding=ROUND_HALF_UP)
+
+
+def _stock_fingerprint(price: Any, qty: Any, price_reserve: Any) -> tuple:
+    return (
+        _normalize_price(price),
+        _to_int(qty),
+        _normalize_price(price_reserve),
+    )
+
+
+async def _load_current_stock_fingerprints(
+    session: AsyncSession,
+    enterprise_code: str,
+) -> dict[tuple[str, str], tuple]:
+    table = InventoryStock.__table__
+    result = await session.execute(
+        select(
+            table.c.branch,
+            table.c.code,
+            table.c.price,
+            table.c.qty,
+            table.c.price_reserve,
+        ).where(table.c.enterprise_code == enterprise_code)
+    )
+    return {
+        (branch, code): _stock_fingerprint(price, qty, price_reserve)
+        for branch, code, price, qty, price_reserve in result.all()
+    }
+
+
+async def apply_stock_delta(
+    session: AsyncSession,
+    enterprise_code: str,
+    records: list[dict],
+) -> StockDeltaSummary:
+    """
+    Применяет к inventory_stock только изменения относительно текущих строк предприятия.
+
+    Строки сравниваются по (branch, code) и нормализованным (price, qty, price_reserve);
+    новые и изменённые пишутся пакетным upsert, отсутствующие в payload удаляются.
+    Upsert обновляет только строки этого же предприятия: конфликт по (branch, code)
+    со строкой другого enterprise_code пропускается и попадает в foreign_conflict_count.
+    """
+    table = InventoryStock.__table__
+    summary = StockDeltaSummary()
+    current = await _load_current_stock_fingerprints(session, enterprise_code)
+
+    upsert_rows: list[dict] = []
+    incoming_keys: set[tuple[str, str]] = set()
+    for record in records:
+        key = (str(record.get("branch")), str(record.get("code")))
+        incoming_keys.add(key)
+        fingerprint = _stock_fingerprint(record.get("price"), record.get("qty"), record.get("price_reserve"))
+        existing = current.get(key)
+        if existing == fingerprint:
+            summary.unchanged_count += 1
+            continue
+        if existing is None:
+            summary.inserted_count += 1
+        else:
+            summary.updated_count += 1
+        price, qty, price_reserve = fingerprint
+        upsert_rows.append({
+            "branch": key[0],
+            "code": key[1],
+            "price": price,
+            "qty": qty,
+            "price_reserve": price_reserve,
+            "enterprise_code": enterprise_code,
+        })
+
+    for i in range(0, len(upsert_rows), STOCK_DELTA_CHUNK_SIZE):
+        chunk = upsert_rows[i : i + STOCK_DELTA_CHUNK_SIZE]
+        insert_stmt = pg_insert(table).values(chunk)
+        excluded = insert_stmt.excluded
+        result = await session.execute(
+            insert_stmt.on_conflict_do_update(
+                index_elements=[table.c.branch, table.c.code],
+                set_={
+                    "price": excluded.price,
+                    "qty": excluded.qty,
+                    "price_reserve": excluded.price_reserve,
+                    "updated_at": func.now(),
+                },
+                where=table.c.enterprise_code == excluded.enterprise_code,
+            )
+        )
+        skipped = len(chunk) - max(result.rowcount or 0, 0)
+        if skipped > 0:
+            # текущие строки предприятия в чанке всегда обновляются, пропуск - только "новые" ключи
+            summary.foreign_conflict_count += skipped
+            summary.inserted_count -= skipped
+
+    if summary.foreign_conflict_count:
+        logger.warning(
+            "Stock delta: enterprise_code=%s skipped=%d rows whose (branch, code) belongs to another enterprise",
+            enterprise_code,
+            summary.foreign_conflict_count,
+        )
+
+    stale_keys = [key for key in current if key not in incoming_keys]
+    for i in range(0, len(stale_keys), STOCK_DELTA_CHUNK_SIZE):
+        chunk = stale_keys[i : i + STOCK_DELTA_CHUNK_SIZE]
+        result = await session.execute(
+            table.delete().where(
+                table.c.enterprise_code == enterprise_code,
+                tuple_(table.c.branch, table.c.code).in_(chunk),
+            )
+        )
+        summary.deleted_count += result.rowcount or 0
+
+    return summary
@@ -13,6 +13,7 @@ import fcntl
 from zoneinfo import ZoneInfo
 
 from app.business.master_catalog_orchestrator import run_master_catalog_orchestrator
+from app.core.http_clients import close_http_clients
 from app.core.paths import STATE_CACHE_DIR
 from app.database import get_async_db
 from app.services.business_store_catalog_publish_service import (
@@ -126,6 +127,9 @@ def _extract_job_summary(result: Dict[str, Any]) -> Dict[str, Any]:
     if steps:
         summary["steps_count"] = len(steps)
         summary["step_messages"] = [step.get("message") for step in steps if step.get("message")]
+    if result.get("critical_path_sec") is not None:
+        summary["wall_sec"] = result.get("wall_sec")
+        summary["critical_path_sec"] = result.get("critical_path_sec")
     return summary
 
 
@@ -500,6 +504,8 @@ async def schedule_master_catalog_tasks() -> None:
     except Exception as main_error:
         logger.exception("Master scheduler crashed")
         send_notification(f"🔴 Сервис master_catalog_scheduler неожиданно остановлен: {main_error}", "master_catalog_scheduler")
+    finally:
+        await close_http_clients()
 
 
 if __name__ == "__main__":
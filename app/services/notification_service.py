@@ -1,5 +1,11 @@
+import atexit
+import logging
 import os
+import queue
+import threading
+import time
 import requests
+from dataclasses import dataclass
 from typing import Optional, Tuple, Union
 
 from dotenv import load_dotenv
@@ -9,6 +15,7 @@ from sqlalchemy import create_engine, text
 # ENV / Константи
 # ---------------------------------------
 load_dotenv()
+logger = logging.getLogger(__name__)
 INFO_TOKEN = os.getenv("TELEGRAM_DEVELOP") or os.getenv("TELEGRAM_BOT_TOKEN")
 ERROR_TOKEN = os.getenv("TELEGRAM_ERROR_BOT_TOKEN")
 
@@ -55,6 +62,23 @@ CHAT_IDS = _parse_chat_ids(os.getenv("TELEGRAM_CHAT_IDS"))
 ERROR_CHAT_IDS = _parse_chat_ids(os.getenv("TELEGRAM_ERROR_CHAT_IDS") or os.getenv("TELEGRAM_CHAT_IDS"))
 
 
+def _env_bool(name: str, default: str = "0") -> bool:
+    return (os.getenv(name, default) or "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _env_float(name: str, default: float) -> float:
+    return float((os.getenv(name) or str(default)).strip())
+
+
+ASYNC_ENABLED = _env_bool("NOTIFICATION_ASYNC_ENABLED", "1")
+QUEUE_MAX_SIZE = int(_env_float("NOTIFICATION_QUEUE_MAX_SIZE", 1000))
+META_CACHE_TTL_SEC = _env_float("NOTIFICATION_META_CACHE_TTL_SEC", 600)
+COALESCE_WINDOW_SEC = _env_float("NOTIFICATION_COALESCE_WINDOW_SEC", 60)
+CHAT_MIN_INTERVAL_SEC = _env_float("NOTIFICATION_CHAT_MIN_INTERVAL_SEC", 1.0)
+SHUTDOWN_FLUSH_TIMEOUT_SEC = _env_float("NOTIFICATION_SHUTDOWN_FLUSH_TIMEOUT_SEC", 10)
+SEND_TIMEOUT_SEC = 15
+
+
 def _is_error_message(message: str) -> bool:
     normalized = str(message or "").strip().lower()
     return any(marker in normalized for marker in ERROR_MARKERS)
@@ -109,6 +133,10 @@ _SYNC_ENGINE = create_engine(_SYNC_DB_URL, pool_pre_ping=True) if _SYNC_DB_URL e
 # ---------------------------------------
 # Доступ до БД (синхронно)
 # ---------------------------------------
+_META_CACHE: dict[str, tuple[float, Optional[Tuple[Optional[str], Optional[str]]]]] = {}
+_META_CACHE_LOCK = threading.Lock()
+
+
 def _fetch_enterprise_meta_sync(enterprise_code: str) -> Optional[Tuple[Optional[str], Optional[str]]]:
     """
     СИНХРОННО дістає (enterprise_name, data_format) з таблиці enterprise_settings
@@ -131,10 +159,27 @@ def _fetch_enterprise_meta_sync(enterprise_code: str) -> Optional[Tuple[Optional
             # row[0] -> enterprise_name, row[1] -> data_format
             return row[0], row[1]
     except Exception:
-        # За потреби додайте логування
+        logger.warning("Notification: failed to load enterprise meta enterprise_code=%s", enterprise_code)
         return None
 
 
+def _get_enterprise_meta_cached(enterprise_code: str) -> Optional[Tuple[Optional[str], Optional[str]]]:
+    """
+    Те саме, що _fetch_enterprise_meta_sync, але з TTL-кешем у процесі,
+    щоб серія повідомлень по одному підприємству не ходила в БД щоразу.
+    """
+    now = time.monotonic()
+    with _META_CACHE_LOCK:
+        cached = _META_CACHE.get(enterprise_code)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    meta = _fetch_enterprise_meta_sync(enterprise_code)
+    with _META_CACHE_LOCK:
+        _META_CACHE[enterprise_code] = (now + META_CACHE_TTL_SEC, meta)
+    return meta
+
+
 # ---------------------------------------
 # Формування тексту
 # ---------------------------------------
@@ -165,38 +210,192 @@ def _build_text(
     return "\n".join(lines)
 
 
+# ---------------------------------------
+# Відправка у Telegram
+# ---------------------------------------
+def _post_to_telegram(token: str, chat_id: Union[int, str], text: str) -> Optional[float]:
+    """
+    Надсилає одне повідомлення. Повертає retry_after (сек), якщо Telegram відповів 429.
+    """
+    telegram_api = f"https://api.telegram.org/bot{token}/sendMessage"
+    payload = {"chat_id": chat_id, "text": text}
+    try:
+        response = requests.post(telegram_api, data=payload, timeout=SEND_TIMEOUT_SEC)
+    except Exception:
+        logger.warning("Notification: telegram send failed chat_id=%s", chat_id)
+        return None
+    if response.status_code == 429:
+        try:
+            return float(response.json().get("parameters", {}).get("retry_after") or 1)
+        except Exception:
+            return 1.0
+    return None
+
+
+def _send_now(message: str, code_str: Optional[str], token: str, chat_ids: list[Union[int, str]]) -> None:
+    meta = _get_enterprise_meta_cached(code_str) if code_str else None
+    text = _build_text(message, code_str, meta)
+    for chat_id in chat_ids:
+        _post_to_telegram(token, chat_id, text)
+
+
+@dataclass
+class _QueuedNotification:
+    message: str
+    code_str: Optional[str]
+    token: str
+    chat_ids: list[Union[int, str]]
+
+
+class _NotificationDispatcher:
+    """
+    Фоновий відправник повідомлень.
+
+    send_notification лише кладе повідомлення в чергу; окремий daemon-потік
+    розбирає чергу, склеює однакові повідомлення в межах COALESCE_WINDOW_SEC
+    і витримує мінімальний інтервал між відправками в один chat.
+    Потік, а не asyncio-задача, бо send_notification викликається і з
+    синхронного коду, і з різних event loop-ів шедулерів.
+    """
+
+    def __init__(self):
+        self._queue: "queue.Queue[_QueuedNotification]" = queue.Queue(maxsize=QUEUE_MAX_SIZE)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._last_seen: dict[tuple, float] = {}
+        self._suppressed: dict[tuple, int] = {}
+        self._next_prune_at = 0.0
+        self._chat_next_allowed: dict[tuple[str, Union[int, str]], float] = {}
+
+    def _ensure_started(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run,
+                name="telegram-notification-dispatcher",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def enqueue(self, item: _QueuedNotification) -> None:
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            logger.warning("Notification: queue is full, message dropped enterprise_code=%s", item.code_str)
+
+    def flush(self, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _prune_expired(self, now: float) -> None:
+        # ключі старші за вікно вже нічого не склеюють; без чистки словники ростуть
+        # з кожним унікальним текстом. Ключі з непоказаним лічильником пропущених
+        # лишаються: його має отримати наступний повтор цього повідомлення.
+        if now < self._next_prune_at:
+            return
+        self._next_prune_at = now + COALESCE_WINDOW_SEC
+        expired = [
+            key
+            for key, last_seen in self._last_seen.items()
+            if now - last_seen >= COALESCE_WINDOW_SEC and key not in self._suppressed
+        ]
+        for key in expired:
+            del self._last_seen[key]
+
+    def _coalesce(self, item: _QueuedNotification) -> Optional[str]:
+        key = (item.token, item.code_str, item.message)
+        now = time.monotonic()
+        self._prune_expired(now)
+        last_seen = self._last_seen.get(key)
+        if last_seen is not None and now - last_seen < COALESCE_WINDOW_SEC:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return None
+        self._last_seen[key] = now
+        suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            return f"{item.message}\n\n(+{suppressed} повторів пропущено)"
+        return item.message
+
+    def _wait_for_chat_slot(self, token: str, chat_id: Union[int, str]) -> None:
+        next_allowed = self._chat_next_allowed.get((token, chat_id), 0.0)
+        delay = next_allowed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _deliver(self, item: _QueuedNotification) -> None:
+        message = self._coalesce(item)
+        if message is None:
+            return
+        meta = _get_enterprise_meta_cached(item.code_str) if item.code_str else None
+        text = _build_text(message, item.code_str, meta)
+        for chat_id in item.chat_ids:
+            self._wait_for_chat_slot(item.token, chat_id)
+            retry_after = _post_to_telegram(item.token, chat_id, text)
+            if retry_after is not None:
+                time.sleep(retry_after)
+                _post_to_telegram(item.token, chat_id, text)
+            self._chat_next_allowed[(item.token, chat_id)] = time.monotonic() + CHAT_MIN_INTERVAL_SEC
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                self._deliver(item)
+            except Exception:
+                logger.exception("Notification: dispatcher failure enterprise_code=%s", item.code_str)
+            finally:
+                self._queue.task_done()
+
+
+_DISPATCHER = _NotificationDispatcher()
+
+
+def flush_notifications(timeout: float = SHUTDOWN_FLUSH_TIMEOUT_SEC) -> None:
+    """Чекає, поки фонова черга повідомлень спорожніє (не довше timeout)."""
+    _DISPATCHER.flush(timeout)
+
+
+atexit.register(flush_notifications)
+
+
 # ---------------------------------------
 # Публічна функція
 # ---------------------------------------
 def send_notification(message: str, enterprise_code: Optional[Union[str, int]] = None) -> None:
     """
-    Синхронна відправка повідомлення у Telegram.
+    Відправка повідомлення у Telegram (fire-and-forget).
 
     - Якщо enterprise_code не передано → надсилається лише message.
     - Якщо enterprise_code передано → додаються Enterprise Code, Название предприятия і Формат.
+    - Повідомлення ставиться у фонову чергу й не блокує виклик;
+      NOTIFICATION_ASYNC_ENABLED=0 повертає синхронну відправку.
     """
     token, chat_ids, _channel = _resolve_notification_target(message)
     if not token:
         # Немає токена — пропускаємо відправку
         return
 
-    meta: Optional[Tuple[Optional[str], Optional[str]]] = None
     code_str: Optional[str] = None
-
     if enterprise_code is not None and str(enterprise_code).strip():
         code_str = str(enterprise_code).strip()
-        meta = _fetch_enterprise_meta_sync(code_str)
 
-    text = _build_text(message, code_str, meta)
-    telegram_api = f"https://api.telegram.org/bot{token}/sendMessage"
+    if not ASYNC_ENABLED:
+        _send_now(message, code_str, token, chat_ids)
+        return
 
-    for chat_id in chat_ids:
-        payload = {"chat_id": chat_id, "text": text}
-        try:
-            requests.post(telegram_api, data=payload, timeout=15)
-        except Exception:
-            # За потреби додайте логування
-            pass
+    _DISPATCHER.enqueue(
+        _QueuedNotification(
+            message=message,
+            code_str=code_str,
+            token=token,
+            chat_ids=list(chat_ids),
+        )
+    )
 
 
 # Локальний тест:
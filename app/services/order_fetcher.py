@@ -1,5 +1,4 @@
 import base64
-import aiohttp
 import json
 import logging
 import os
@@ -7,6 +6,7 @@ from typing import Any, Dict, List, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.models import DeveloperSettings, EnterpriseSettings, MappingBranch
+from app.core.http_clients import get_aiohttp_session
 from app.business.business_store_order_mapper import (
     ORIGINAL_EXTERNAL_GOODS_CODE_FIELD,
     normalize_store_order_payload,
@@ -256,203 +256,74 @@ async def fetch_orders_for_enterprise(session: AsyncSession, enterprise_code: st
     auto_confirm_flag = enterprise.auto_confirm
 
     all_orders = []
-    async with aiohttp.ClientSession() as http_session:
-        for branch in branches:
-            if auto_confirm_flag:
-                # ===== Вариант с авто-подтверждением =====
-                for status in [0, 2, 4, 4.1]:
-                    url = f"{endpoint_orders}/api/Orders/{branch}/{status}"
-                    try:
-                        async with http_session.get(url, headers=headers) as response:
-                            logger.info("Orders request: %s", url)
-                            if response.status == 200:
-                                data = await response.json()
-                                if isinstance(data, list):
-                                    for order_data in data:
-                                        if isinstance(order_data, dict) and "customerEmail" not in order_data:
-                                            order_data["customerEmail"] = order_data.get("customerEmail")
-
-                                    legacy_orders, store_aware_orders, _mapping_error_orders = await _normalize_business_orders_for_runtime(
-                                        session,
-                                        enterprise=enterprise,
-                                        branch=branch,
-                                        orders=data,
-                                    )
-                                    await _safe_sync_reporting_for_orders(
-                                        session,
-                                        enterprise_code=enterprise_code,
-                                        branch=branch,
-                                        status=status,
-                                        orders=legacy_orders + store_aware_orders,
-                                    )
-
-                                    for order in legacy_orders:
-                                        if VERBOSE_ORDER_LOGS:
-                                            logger.info("Order payload: %s", json.dumps(order, ensure_ascii=False))
+    http_session = get_aiohttp_session()
+    for branch in branches:
+        if auto_confirm_flag:
+            # ===== Вариант с авто-подтверждением =====
+            for status in [0, 2, 4, 4.1]:
+                url = f"{endpoint_orders}/api/Orders/{branch}/{status}"
+                try:
+                    async with http_session.get(url, headers=headers) as response:
+                        logger.info("Orders request: %s", url)
+                        if response.status == 200:
+                            data = await response.json()
+                            if isinstance(data, list):
+                                for order_data in data:
+                                    if isinstance(order_data, dict) and "customerEmail" not in order_data:
+                                        order_data["customerEmail"] = order_data.get("customerEmail")
+
+                                legacy_orders, store_aware_orders, _mapping_error_orders = await _normalize_business_orders_for_runtime(
+                                    session,
+                                    enterprise=enterprise,
+                                    branch=branch,
+                                    orders=data,
+                                )
+                                await _safe_sync_reporting_for_orders(
+                                    session,
+                                    enterprise_code=enterprise_code,
+                                    branch=branch,
+                                    status=status,
+                                    orders=legacy_orders + store_aware_orders,
+                                )
+
+                                for order in legacy_orders:
+                                    if VERBOSE_ORDER_LOGS:
+                                        logger.info("Order payload: %s", json.dumps(order, ensure_ascii=False))
+                                    else:
+                                        logger.debug("Order payload (truncated): %.2000s", json.dumps(order, ensure_ascii=False))
+
+                                    if status in [0, 2]:
+                                        processor = ORDER_SEND_PROCESSORS.get(enterprise.data_format)
+                                        if processor:
+                                            await processor(order, enterprise_code, branch)
                                         else:
-                                            logger.debug("Order payload (truncated): %.2000s", json.dumps(order, ensure_ascii=False))
-
-                                        if status in [0, 2]:
-                                            processor = ORDER_SEND_PROCESSORS.get(enterprise.data_format)
-                                            if processor:
-                                                await processor(order, enterprise_code, branch)
-                                            else:
-                                                logger.warning("No order send processor for data_format=%s", enterprise.data_format)
-
-                                        # Для формата Business не выполняем проверку статусов у продавца
-                                        if enterprise.data_format != "Business" and status in [2, 4, 4.1]:
-                                            status_checker = ORDER_STATUS_CHECKERS.get(enterprise.data_format)
-                                            if status_checker:
-                                                await status_checker(order, enterprise_code, branch)
-                                            else:
-                                                logger.warning("No status checker for data_format=%s", enterprise.data_format)
-
-                                    for order in store_aware_orders:
-                                        if VERBOSE_ORDER_LOGS:
-                                            logger.info("Store-aware normalized order payload: %s", json.dumps(order, ensure_ascii=False))
-                                        else:
-                                            logger.debug("Store-aware normalized order payload (truncated): %.2000s", json.dumps(order, ensure_ascii=False))
-
-                                        if status in [0, 2]:
-                                            processor = ORDER_SEND_PROCESSORS.get(enterprise.data_format)
-                                            if processor:
-                                                await processor(order, enterprise_code, branch)
-                                                logger.info(
-                                                    "Store-aware auto-confirm bypassed after Business processing: enterprise_code=%s branch=%s order_id=%s",
-                                                    enterprise_code,
-                                                    branch,
-                                                    order.get("id"),
-                                                )
-                                                if status == 0:
-                                                    try:
-                                                        await _send_store_aware_status_2_if_enabled(
-                                                            session=session,
-                                                            enterprise=enterprise,
-                                                            order=order,
-                                                            branch=branch,
-                                                        )
-                                                    except Exception as exc:
-                                                        logger.warning(
-                                                            "Store-aware status 2 send failed after successful outbound processing: enterprise_code=%s branch=%s order_id=%s error=%s",
-                                                            enterprise_code,
-                                                            branch,
-                                                            order.get("id"),
-                                                            exc,
-                                                        )
-                                            else:
-                                                logger.warning("No order send processor for data_format=%s", enterprise.data_format)
-
-                                    if status in [0, 2] and legacy_orders:
-                                        processed_orders = await process_orders(session, legacy_orders)
-                                        logger.info("Auto-confirm processed %d orders", len(processed_orders))
-                                        await send_orders_to_tabletki(
-                                            session,
-                                            processed_orders,
-                                            tabletki_login=enterprise.tabletki_login,
-                                            tabletki_password=enterprise.tabletki_password,
-                                            cancel_reason=2,
-                                            enterprise_code=enterprise_code,
-                                        )
-
-                                    if status == 0 and ORDER_FETCHER_NOTIFY_ON_NEW_ORDERS:
-                                        order_codes = list({order["code"] for order in (legacy_orders + store_aware_orders) if "code" in order})
-                                        if order_codes:
-                                            from app.services.telegram_bot import notify_user
-                                            await notify_user(branch, order_codes)
-                            else:
-                                logger.warning("Orders request failed: status=%s branch=%s", response.status, branch)
-                    except Exception as e:
-                        logger.exception("Orders request exception: branch=%s status=%s", branch, status)
-            else:
-                # ===== Вариант без авто-подтверждения =====
-                for status in [0, 2, 4, 4.1]:
-                    url = f"{endpoint_orders}/api/Orders/{branch}/{status}"
-                    try:
-                        async with http_session.get(url, headers=headers) as response:
-                            logger.info("Orders request: %s", url)
-                            if response.status == 200:
-                                data = await response.json()
-                                if isinstance(data, list):
-                                    for order_data in data:
-                                        if isinstance(order_data, dict) and "customerEmail" not in order_data:
-                                            order_data["customerEmail"] = order_data.get("customerEmail")
-
-                                    legacy_orders, store_aware_orders, _mapping_error_orders = await _normalize_business_orders_for_runtime(
-                                        session,
-                                        enterprise=enterprise,
-                                        branch=branch,
-                                        orders=data,
-                                    )
-                                    await _safe_sync_reporting_for_orders(
-                                        session,
-                                        enterprise_code=enterprise_code,
-                                        branch=branch,
-                                        status=status,
-                                        orders=legacy_orders + store_aware_orders,
-                                    )
+                                            logger.warning("No order send processor for data_format=%s", enterprise.data_format)
 
-                                    for order in legacy_orders:
-                                        if VERBOSE_ORDER_LOGS:
-                                            logger.info("Order payload: %s", json.dumps(order, ensure_ascii=False))
-                                        else:
-                                            logger.debug("Order payload (truncated): %.2000s", json.dumps(order, ensure_ascii=False))
-                                        if status == 0:
-                                            # TODO: передача заказов продавцу
-                                            processor = ORDER_SEND_PROCESSORS.get(enterprise.data_format)
-                                            processor_ok = True
-                                            if processor:
-                                                result = await processor(order, enterprise_code, branch)
-                                                if enterprise.data_format == "SalesDriveSimple":
-                                                    processor_ok = bool(result)
-                                            else:
-                                                logger.warning("No order send processor for data_format=%s", enterprise.data_format)
-                                            if processor_ok:
-                                                # Отправка на Tabletki.ua со статусом 2.0
-                                                order["statusID"] = 2.0
-                                                await send_single_order_status_2(
-                                                    session=session,
-                                                    order=order,
-                                                    tabletki_login=enterprise.tabletki_login,
-                                                    tabletki_password=enterprise.tabletki_password
-                                                )
-                                            else:
-                                                logger.warning(
-                                                        "Skip Tabletki status 2.0 because outbound send failed: data_format=%s order_id=%s",
-                                                        enterprise.data_format,
-                                                        order.get("id"),
-                                                    )
-                                        elif status in [2, 4, 4.1]:
-                                            # TODO: передача статуса продавцу
-                                            # Отправка актуального статуса продавцу через соответствующий обработчик
-                                            if enterprise.data_format != "Business":
-                                                status_checker = ORDER_STATUS_CHECKERS.get(enterprise.data_format)
-                                                if status_checker:
-                                                    await status_checker(order, enterprise_code, branch)
-                                                else:
-                                                    logger.warning("No status checker for data_format=%s", enterprise.data_format)
-                                        all_orders.append(order)
-
-                                    for order in store_aware_orders:
-                                        if VERBOSE_ORDER_LOGS:
-                                            logger.info("Store-aware normalized order payload: %s", json.dumps(order, ensure_ascii=False))
+                                    # Для формата Business не выполняем проверку статусов у продавца
+                                    if enterprise.data_format != "Business" and status in [2, 4, 4.1]:
+                                        status_checker = ORDER_STATUS_CHECKERS.get(enterprise.data_format)
+                                        if status_checker:
+                                            await status_checker(order, enterprise_code, branch)
                                         else:
-                                            logger.debug("Store-aware normalized order payload (truncated): %.2000s", json.dumps(order, ensure_ascii=False))
-                                        if status == 0:
-                                            processor = ORDER_SEND_PROCESSORS.get(enterprise.data_format)
-                                            processor_ok = True
-                                            if processor:
-                                                result = await processor(order, enterprise_code, branch)
-                                                if enterprise.data_format == "SalesDriveSimple":
-                                                    processor_ok = bool(result)
-                                            else:
-                                                logger.warning("No order send processor for data_format=%s", enterprise.data_format)
-                                            if processor_ok:
-                                                logger.info(
-                                                    "Store-aware order processed with legacy auto-confirm bypass: enterprise_code=%s branch=%s order_id=%s",
-                                                    enterprise_code,
-                                                    branch,
-                                                    order.get("id"),
-                                                )
+                                            logger.warning("No status checker for data_format=%s", enterprise.data_format)
+
+                                for order in store_aware_orders:
+                                    if VERBOSE_ORDER_LOGS:
+                                        logger.info("Store-aware normalized order payload: %s", json.dumps(order, ensure_ascii=False))
+                                    else:
+                                        logger.debug("Store-aware normalized order payload (truncated): %.2000s", json.dumps(order, ensure_ascii=False))
+
+                                    if status in [0, 2]:
+                                        processor = ORDER_SEND_PROCESSORS.get(enterprise.data_format)
+                                        if processor:
+                                            await processor(order, enterprise_code, branch)
+                                            logger.info(
+                                                "Store-aware auto-confirm bypassed after Business processing: enterprise_code=%s branch=%s order_id=%s",
+                                                enterprise_code,
+                                                branch,
+                                                order.get("id"),
+                                            )
+                                            if status == 0:
                                                 try:
                                                     await _send_store_aware_status_2_if_enabled(
                                                         session=session,
@@ -468,30 +339,159 @@ async def fetch_orders_for_enterprise(session: AsyncSession, enterprise_code: st
                                                         order.get("id"),
                                                         exc,
                                                     )
+                                        else:
+                                            logger.warning("No order send processor for data_format=%s", enterprise.data_format)
+
+                                if status in [0, 2] and legacy_orders:
+                                    processed_orders = await process_orders(session, legacy_orders)
+                                    logger.info("Auto-confirm processed %d orders", len(processed_orders))
+                                    await send_orders_to_tabletki(
+                                        session,
+                                        processed_orders,
+                                        tabletki_login=enterprise.tabletki_login,
+                                        tabletki_password=enterprise.tabletki_password,
+                                        cancel_reason=2,
+                                        enterprise_code=enterprise_code,
+                                    )
+
+                                if status == 0 and ORDER_FETCHER_NOTIFY_ON_NEW_ORDERS:
+                                    order_codes = list({order["code"] for order in (legacy_orders + store_aware_orders) if "code" in order})
+                                    if order_codes:
+                                        from app.services.telegram_bot import notify_user
+                                        await notify_user(branch, order_codes)
+                        else:
+                            logger.warning("Orders request failed: status=%s branch=%s", response.status, branch)
+                except Exception as e:
+                    logger.exception("Orders request exception: branch=%s status=%s", branch, status)
+        else:
+            # ===== Вариант без авто-подтверждения =====
+            for status in [0, 2, 4, 4.1]:
+                url = f"{endpoint_orders}/api/Orders/{branch}/{status}"
+                try:
+                    async with http_session.get(url, headers=headers) as response:
+                        logger.info("Orders request: %s", url)
+                        if response.status == 200:
+                            data = await response.json()
+                            if isinstance(data, list):
+                                for order_data in data:
+                                    if isinstance(order_data, dict) and "customerEmail" not in order_data:
+                                        order_data["customerEmail"] = order_data.get("customerEmail")
+
+                                legacy_orders, store_aware_orders, _mapping_error_orders = await _normalize_business_orders_for_runtime(
+                                    session,
+                                    enterprise=enterprise,
+                                    branch=branch,
+                                    orders=data,
+                                )
+                                await _safe_sync_reporting_for_orders(
+                                    session,
+                                    enterprise_code=enterprise_code,
+                                    branch=branch,
+                                    status=status,
+                                    orders=legacy_orders + store_aware_orders,
+                                )
+
+                                for order in legacy_orders:
+                                    if VERBOSE_ORDER_LOGS:
+                                        logger.info("Order payload: %s", json.dumps(order, ensure_ascii=False))
+                                    else:
+                                        logger.debug("Order payload (truncated): %.2000s", json.dumps(order, ensure_ascii=False))
+                                    if status == 0:
+                                        # TODO: передача заказов продавцу
+                                        processor = ORDER_SEND_PROCESSORS.get(enterprise.data_format)
+                                        processor_ok = True
+                                        if processor:
+                                            result = await processor(order, enterprise_code, branch)
+                                            if enterprise.data_format == "SalesDriveSimple":
+                                                processor_ok = bool(result)
+                                        else:
+                                            logger.warning("No order send processor for data_format=%s", enterprise.data_format)
+                                        if processor_ok:
+                                            # Отправка на Tabletki.ua со статусом 2.0
+                                            order["statusID"] = 2.0
+                                            await send_single_order_status_2(
+                                                session=session,
+                                                order=order,
+                                                tabletki_login=enterprise.tabletki_login,
+                                                tabletki_password=enterprise.tabletki_password
+                                            )
+                                        else:
+                                            logger.warning(
+                                                    "Skip Tabletki status 2.0 because outbound send failed: data_format=%s order_id=%s",
+                                                    enterprise.data_format,
+                                                    order.get("id"),
+                                                )
+                                    elif status in [2, 4, 4.1]:
+                                        # TODO: передача статуса продавцу
+                                        # Отправка актуального статуса продавцу через соответствующий обработчик
+                                        if enterprise.data_format != "Business":
+                                            status_checker = ORDER_STATUS_CHECKERS.get(enterprise.data_format)
+                                            if status_checker:
+                                                await status_checker(order, enterprise_code, branch)
                                             else:
+                                                logger.warning("No status checker for data_format=%s", enterprise.data_format)
+                                    all_orders.append(order)
+
+                                for order in store_aware_orders:
+                                    if VERBOSE_ORDER_LOGS:
+                                        logger.info("Store-aware normalized order payload: %s", json.dumps(order, ensure_ascii=False))
+                                    else:
+                                        logger.debug("Store-aware normalized order payload (truncated): %.2000s", json.dumps(order, ensure_ascii=False))
+                                    if status == 0:
+                                        processor = ORDER_SEND_PROCESSORS.get(enterprise.data_format)
+                                        processor_ok = True
+                                        if processor:
+                                            result = await processor(order, enterprise_code, branch)
+                                            if enterprise.data_format == "SalesDriveSimple":
+                                                processor_ok = bool(result)
+                                        else:
+                                            logger.warning("No order send processor for data_format=%s", enterprise.data_format)
+                                        if processor_ok:
+                                            logger.info(
+                                                "Store-aware order processed with legacy auto-confirm bypass: enterprise_code=%s branch=%s order_id=%s",
+                                                enterprise_code,
+                                                branch,
+                                                order.get("id"),
+                                            )
+                                            try:
+                                                await _send_store_aware_status_2_if_enabled(
+                                                    session=session,
+                                                    enterprise=enterprise,
+                                                    order=order,
+                                                    branch=branch,
+                                                )
+                                            except Exception as exc:
                                                 logger.warning(
-                                                    "Store-aware order outbound processing failed: data_format=%s order_id=%s",
-                                                    enterprise.data_format,
+                                                    "Store-aware status 2 send failed after successful outbound processing: enterprise_code=%s branch=%s order_id=%s error=%s",
+                                                    enterprise_code,
+                                                    branch,
                                                     order.get("id"),
+                                                    exc,
                                                 )
-                                        elif status in [2, 4, 4.1]:
-                                            if enterprise.data_format != "Business":
-                                                status_checker = ORDER_STATUS_CHECKERS.get(enterprise.data_format)
-                                                if status_checker:
-                                                    await status_checker(order, enterprise_code, branch)
-                                                else:
-                                                    logger.warning("No status checker for data_format=%s", enterprise.data_format)
-                                        all_orders.append(order)
-
-                                    if status == 0 and ORDER_FETCHER_NOTIFY_ON_NEW_ORDERS:
-                                        order_codes = list({order["code"] for order in (legacy_orders + store_aware_orders) if "code" in order})
-                                        if order_codes:
-                                            from app.services.telegram_bot import notify_user
-                                            await notify_user(branch, order_codes)
-                            else:
-                                logger.warning("Orders request failed: status=%s branch=%s", response.status, branch)
-                    except Exception as e:
-                        logger.exception("Orders request exception: branch=%s status=%s", branch, status)
+                                        else:
+                                            logger.warning(
+                                                "Store-aware order outbound processing failed: data_format=%s order_id=%s",
+                                                enterprise.data_format,
+                                                order.get("id"),
+                                            )
+                                    elif status in [2, 4, 4.1]:
+                                        if enterprise.data_format != "Business":
+                                            status_checker = ORDER_STATUS_CHECKERS.get(enterprise.data_format)
+                                            if status_checker:
+                                                await status_checker(order, enterprise_code, branch)
+                                            else:
+                                                logger.warning("No status checker for data_format=%s", enterprise.data_format)
+                                    all_orders.append(order)
+
+                                if status == 0 and ORDER_FETCHER_NOTIFY_ON_NEW_ORDERS:
+                                    order_codes = list({order["code"] for order in (legacy_orders + store_aware_orders) if "code" in order})
+                                    if order_codes:
+                                        from app.services.telegram_bot import notify_user
+                                        await notify_user(branch, order_codes)
+                        else:
+                            logger.warning("Orders request failed: status=%s branch=%s", response.status, branch)
+                except Exception as e:
+                    logger.exception("Orders request exception: branch=%s status=%s", branch, status)
 
     logger.info("Total orders fetched: %d enterprise_code=%s", len(all_orders), enterprise_code)
     return all_orders
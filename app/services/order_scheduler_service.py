@@ -9,6 +9,7 @@ from sqlalchemy.future import select
 os.environ['TZ'] = 'UTC'
 KIEV_TZ = pytz.timezone("Europe/Kiev")
 
+from app.core.http_clients import close_http_clients
 from app.database import get_async_db, EnterpriseSettings
 from app.services.notification_service import send_notification
 from app.services.order_fetcher import fetch_orders_for_enterprise
@@ -87,6 +88,7 @@ async def schedule_order_fetcher_tasks():
     except Exception as main_error:
         await notify_error(f"🔥 Критическая ошибка в планировщике заказов: {str(main_error)}", "order_scheduler")
     finally:
+        await close_http_clients()
         await notify_error("❌ Сервис order_scheduler неожиданно остановлен.", "order_scheduler")
 
 if __name__ == "__main__":
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from datetime import datetime
+from bisect import bisect_left
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
 from decimal import Decimal
 
-from sqlalchemy import delete, select
+from sqlalchemy import delete, insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import (
@@ -224,6 +226,106 @@ async def _clear_existing_internal_pairs(
     await session.flush()
 
 
+INTERNAL_PAIR_REASON = "matched account pair, amount, and time window"
+
+# запас при бинарном поиске окна; точная проверка - _date_diff_minutes
+_WINDOW_SLACK = timedelta(seconds=1)
+
+
+@dataclass
+class _IncomingBucket:
+    """Входящие платежи одного ключа, отсортированные по (payment_date, позиция в списке)."""
+
+    keys: list[tuple[datetime, int]] = field(default_factory=list)
+
+    def first_in_window(
+        self,
+        incoming: list[SalesDrivePayment],
+        out_date: datetime,
+        window_minutes: int,
+    ) -> int | None:
+        delta = timedelta(minutes=window_minutes) + _WINDOW_SLACK
+        pos = bisect_left(self.keys, (out_date - delta,))
+        upper = out_date + delta
+        while pos < len(self.keys) and self.keys[pos][0] <= upper:
+            index = self.keys[pos][1]
+            if _date_diff_minutes(out_date, incoming[index].payment_date) <= window_minutes:
+                return index
+            pos += 1
+        return None
+
+    def remove(self, key: tuple[datetime, int]) -> None:
+        pos = bisect_left(self.keys, key)
+        if pos < len(self.keys) and self.keys[pos] == key:
+            del self.keys[pos]
+
+
+def _match_internal_transfers(
+    rules_by_pair: dict[tuple[int, int], InternalTransferRule],
+    outgoing: list[SalesDrivePayment],
+    incoming: list[SalesDrivePayment],
+) -> list[tuple[SalesDrivePayment, SalesDrivePayment]]:
+    """
+    Жадное сопоставление исходящих и входящих платежей.
+
+    Семантика прежнего перебора out x in: для каждого исходящего (в порядке списка)
+    берётся первый по списку ещё не занятый входящий, для которого есть правило
+    (from_account, to_account), совпадает business_entity_id, сумма (если правило
+    требует точного совпадения) и разница во времени не больше окна правила.
+
+    Входящие разложены по корзинам (to_account, business_entity_id, amount) -
+    для правил без точной суммы amount в ключе None - и внутри корзины окно
+    ищется бинарным поиском по дате. Списки платежей приходят из _load_payments
+    отсортированными по (payment_date, id), поэтому первый подходящий по дате в
+    корзине - это и первый по списку; из нескольких корзин берётся меньшая позиция.
+    """
+    rules_by_from: dict[int, list[InternalTransferRule]] = defaultdict(list)
+    exact_targets: set[int] = set()
+    loose_targets: set[int] = set()
+    for (from_account_id, to_account_id), rule in rules_by_pair.items():
+        rules_by_from[from_account_id].append(rule)
+        (exact_targets if rule.require_exact_amount else loose_targets).add(to_account_id)
+
+    buckets: dict[tuple, _IncomingBucket] = defaultdict(_IncomingBucket)
+    bucket_keys_by_index: dict[int, list[tuple]] = {}
+    for index, in_payment in enumerate(incoming):
+        keys: list[tuple] = []
+        if in_payment.business_account_id in exact_targets:
+            keys.append((in_payment.business_account_id, in_payment.business_entity_id, Decimal(in_payment.amount)))
+        if in_payment.business_account_id in loose_targets:
+            keys.append((in_payment.business_account_id, in_payment.business_entity_id, None))
+        for key in keys:
+            buckets[key].keys.append((in_payment.payment_date, index))
+        if keys:
+            bucket_keys_by_index[index] = keys
+    for bucket in buckets.values():
+        bucket.keys.sort()
+
+    matches: list[tuple[SalesDrivePayment, SalesDrivePayment]] = []
+    for out_payment in outgoing:
+        best: int | None = None
+        for rule in rules_by_from.get(out_payment.business_account_id, ()):
+            amount = Decimal(out_payment.amount) if rule.require_exact_amount else None
+            bucket = buckets.get((rule.to_account_id, out_payment.business_entity_id, amount))
+            if bucket is None:
+                continue
+            index = bucket.first_in_window(
+                incoming,
+                out_payment.payment_date,
+                int(rule.pairing_window_minutes or 5),
+            )
+            if index is not None and (best is None or index < best):
+                best = index
+        if best is None:
+            continue
+
+        in_payment = incoming[best]
+        for key in bucket_keys_by_index[best]:
+            buckets[key].remove((in_payment.payment_date, best))
+        matches.append((out_payment, in_payment))
+    return matches
+
+
 async def _detect_internal_transfers(
     session: AsyncSession,
     *,
@@ -247,46 +349,35 @@ async def _detect_internal_transfers(
         for payment in payments
         if payment.payment_type == "outcoming" and payment.business_account_id is not None
     ]
-    used_incoming_ids: set[int] = set()
-    pair_count = 0
-
-    for out_payment in outgoing:
-        for in_payment in incoming:
-            if int(in_payment.id) in used_incoming_ids:
-                continue
-            rule = rules_by_pair.get((out_payment.business_account_id, in_payment.business_account_id))
-            if rule is None:
-                continue
-            if out_payment.business_entity_id != in_payment.business_entity_id:
-                continue
-            if rule.require_exact_amount and Decimal(out_payment.amount) != Decimal(in_payment.amount):
-                continue
-            if _date_diff_minutes(out_payment.payment_date, in_payment.payment_date) > int(rule.pairing_window_minutes or 5):
-                continue
-
-            pair = InternalTransferPair(
-                pair_key=_pair_key(out_payment, in_payment),
-                outcoming_payment_id=out_payment.id,
-                incoming_payment_id=in_payment.id,
-                amount=out_payment.amount,
-                outcoming_account_id=out_payment.business_account_id,
-                incoming_account_id=in_payment.business_account_id,
-                outcoming_date=out_payment.payment_date,
-                incoming_date=in_payment.payment_date,
-                reason="matched account pair, amount, and time window",
-                match_confidence=Decimal("1.0000"),
-            )
-            session.add(pair)
-            await session.flush()
-            out_payment.is_internal_transfer = True
-            out_payment.internal_transfer_pair_id = pair.id
-            out_payment.internal_transfer_reason = pair.reason
-            in_payment.is_internal_transfer = True
-            in_payment.internal_transfer_pair_id = pair.id
-            in_payment.internal_transfer_reason = pair.reason
-            used_incoming_ids.add(int(in_payment.id))
-            pair_count += 1
-            break
+    matches = _match_internal_transfers(rules_by_pair, outgoing, incoming)
+
+    if matches:
+        # одна bulk-вставка вместо flush на каждую пару; id пар нужны для ссылок из платежей
+        inserted = await session.execute(
+            insert(InternalTransferPair).returning(InternalTransferPair.id, InternalTransferPair.pair_key),
+            [
+                {
+                    "pair_key": _pair_key(out_payment, in_payment),
+                    "outcoming_payment_id": out_payment.id,
+                    "incoming_payment_id": in_payment.id,
+                    "amount": out_payment.amount,
+                    "outcoming_account_id": out_payment.business_account_id,
+                    "incoming_account_id": in_payment.business_account_id,
+                    "outcoming_date": out_payment.payment_date,
+                    "incoming_date": in_payment.payment_date,
+                    "reason": INTERNAL_PAIR_REASON,
+                    "match_confidence": Decimal("1.0000"),
+                }
+                for out_payment, in_payment in matches
+            ],
+        )
+        pair_ids = {pair_key: pair_id for pair_id, pair_key in inserted.all()}
+        for out_payment, in_payment in matches:
+            pair_id = pair_ids[_pair_key(out_payment, in_payment)]
+            for payment in (out_payment, in_payment):
+                payment.is_internal_transfer = True
+                payment.internal_transfer_pair_id = pair_id
+                payment.internal_transfer_reason = INTERNAL_PAIR_REASON
 
     for payment in payments:
         if payment.is_internal_transfer or payment.business_account_id is None:
@@ -296,7 +387,7 @@ async def _detect_internal_transfers(
             payment.internal_transfer_reason = "direct self-transfer marker"
 
     await session.flush()
-    return pair_count
+    return len(matches)
 
 
 async def _load_supplier_mappings(session: AsyncSession) -> list[PaymentCounterpartySupplierMapping]:
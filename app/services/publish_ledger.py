@@ -0,0 +1,185 @@
+"""
+Журнал публикаций в Tabletki (publish ledger).
+
+Для каждой пары (enterprise, payload kind, branch) хранится канонический хеш
+последнего успешно отправленного payload и время отправки. Перед POST экспортер
+сравнивает хеш нового payload с журналом и пропускает отправку, если содержимое
+не изменилось и запись не старше PUBLISH_LEDGER_MAX_AGE_SEC.
+
+Журнал - JSON файл на предприятие в STATE_CACHE_DIR/publish_ledger,
+пишется атомарно (tmp + os.replace). Запись делается только после успешного
+ответа Tabletki, поэтому неудачная отправка повторится на следующем запуске.
+
+PUBLISH_LEDGER_ENABLED=0 (дефолт) - поведение как раньше, отправляется всё;
+PUBLISH_LEDGER_FORCE=1 или force=True у экспортера - отправить без проверки.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from app.core.paths import STATE_CACHE_DIR
+
+
+logger = logging.getLogger(__name__)
+
+KIND_STOCK = "stock"
+KIND_CATALOG = "catalog"
+KIND_MASTER_CATALOG = "master_catalog"
+KIND_BUSINESS_STORE_STOCK = "business_store_stock"
+
+DEFAULT_EXCLUDE_KEYS = ("DateTime",)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    return raw.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name)
+    if raw is None or not raw.strip():
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        return default
+
+
+def _ledger_dir() -> Path:
+    return Path(os.getenv("PUBLISH_LEDGER_DIR") or (STATE_CACHE_DIR / "publish_ledger"))
+
+
+def is_enabled() -> bool:
+    return _env_bool("PUBLISH_LEDGER_ENABLED", False)
+
+
+def _max_age_sec() -> int:
+    return _env_int("PUBLISH_LEDGER_MAX_AGE_SEC", 3600)
+
+
+def _strip_keys(value: Any, exclude: frozenset) -> Any:
+    if isinstance(value, dict):
+        return {key: _strip_keys(item, exclude) for key, item in value.items() if key not in exclude}
+    if isinstance(value, (list, tuple)):
+        return [_strip_keys(item, exclude) for item in value]
+    return value
+
+
+def canonical_payload_hash(payload: Any, exclude_keys: Iterable[str] = DEFAULT_EXCLUDE_KEYS) -> str:
+    """
+    sha256 канонического JSON payload: ключи отсортированы, служебные поля
+    (по умолчанию DateTime, который меняется при каждой сборке) исключены.
+    Порядок элементов в списках сохраняется.
+    """
+    exclude = frozenset(exclude_keys)
+    normalized = _strip_keys(payload, exclude) if exclude else payload
+    encoded = json.dumps(
+        normalized,
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    ).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+@dataclass(frozen=True)
+class PublishDecision:
+    should_send: bool
+    payload_hash: Optional[str]
+    reason: str
+
+
+def _ledger_path(enterprise_code: str) -> Path:
+    return _ledger_dir() / f"publish_ledger_{enterprise_code}.json"
+
+
+def _entry_key(kind: str, branch: Any) -> str:
+    return f"{kind}:{str(branch or '').strip()}"
+
+
+def _load_entries(enterprise_code: str) -> Dict[str, Dict[str, Any]]:
+    path = _ledger_path(enterprise_code)
+    if not path.exists():
+        return {}
+    try:
+        payload = json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        logger.exception("Publish ledger read failed: enterprise_code=%s path=%s", enterprise_code, path)
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+
+def _write_entries(enterprise_code: str, entries: Dict[str, Dict[str, Any]]) -> None:
+    path = _ledger_path(enterprise_code)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(json.dumps(entries, ensure_ascii=False, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def _entry_age_sec(entry: Dict[str, Any], now: datetime) -> Optional[float]:
+    try:
+        sent_at = datetime.fromisoformat(str(entry.get("sent_at")))
+    except ValueError:
+        return None
+    if sent_at.tzinfo is None:
+        sent_at = sent_at.replace(tzinfo=timezone.utc)
+    return (now - sent_at).total_seconds()
+
+
+def check_publish(
+    enterprise_code: str,
+    kind: str,
+    branch: Any,
+    payload: Any,
+    *,
+    force: bool = False,
+    exclude_keys: Iterable[str] = DEFAULT_EXCLUDE_KEYS,
+) -> PublishDecision:
+    """Решает, нужно ли отправлять payload; хеш возвращается для record_publish."""
+    if not is_enabled():
+        # ledger выключен - хеш не нужен, не сериализуем payload впустую
+        return PublishDecision(True, None, "ledger_disabled")
+    payload_hash = canonical_payload_hash(payload, exclude_keys)
+    if force or _env_bool("PUBLISH_LEDGER_FORCE", False):
+        return PublishDecision(True, payload_hash, "forced")
+
+    entry = _load_entries(str(enterprise_code)).get(_entry_key(kind, branch))
+    if not entry:
+        return PublishDecision(True, payload_hash, "no_previous_publish")
+    if entry.get("hash") != payload_hash:
+        return PublishDecision(True, payload_hash, "changed")
+
+    max_age = _max_age_sec()
+    if max_age > 0:
+        age = _entry_age_sec(entry, datetime.now(timezone.utc))
+        if age is None or age >= max_age:
+            return PublishDecision(True, payload_hash, "max_age_expired")
+    return PublishDecision(False, payload_hash, "unchanged")
+
+
+def record_publish(enterprise_code: str, kind: str, hashes_by_branch: Dict[Any, Optional[str]]) -> None:
+    """Фиксирует успешно отправленные хеши; ошибки записи только логируются."""
+    if not is_enabled() or not hashes_by_branch:
+        return
+    enterprise_code = str(enterprise_code)
+    try:
+        entries = _load_entries(enterprise_code)
+        sent_at = datetime.now(timezone.utc).isoformat()
+        for branch, payload_hash in hashes_by_branch.items():
+            if payload_hash is None:
+                continue
+            entries[_entry_key(kind, branch)] = {"hash": payload_hash, "sent_at": sent_at}
+        _write_entries(enterprise_code, entries)
+    except Exception:
+        logger.exception("Publish ledger write failed: enterprise_code=%s kind=%s", enterprise_code, kind)
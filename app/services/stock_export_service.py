@@ -7,6 +7,8 @@ from datetime import datetime, timezone
 import pytz
 from app.database import get_async_db, DeveloperSettings, EnterpriseSettings
 from app.services.notification_service import send_notification 
+from app.core.http_clients import encode_json_body, get_aiohttp_session
+from app.services import publish_ledger
 
 local_tz = pytz.timezone('Europe/Kiev')
 
@@ -36,8 +38,14 @@ async def process_stock_file(
     *,
     enterprise_settings: EnterpriseSettings | None = None,
     developer_settings: DeveloperSettings | None = None,
+    force: bool = False,
 ):
-    """Форматирует данные и отправляет их на API."""
+    """
+    Форматирует данные и отправляет их на API.
+
+    При PUBLISH_LEDGER_ENABLED=1 отправляются только филиалы, чьи остатки
+    изменились с последней успешной отправки (force=True - все филиалы).
+    """
 
     if not stock_file:
         logging.warning(f"Empty stock_file for enterprise_code={enterprise_code}. Skipping processing.")
@@ -98,8 +106,35 @@ async def process_stock_file(
         login = enterprise_settings.tabletki_login
         password = enterprise_settings.tabletki_password
 
-        await send_to_endpoint(endpoint, formatted_json, login, password, enterprise_code)
-        
+        pending_hashes = {}
+        changed_branches = []
+        for branch_code, branch_payload in branches_data.items():
+            decision = publish_ledger.check_publish(
+                enterprise_code,
+                publish_ledger.KIND_STOCK,
+                branch_code,
+                branch_payload,
+                force=force,
+            )
+            if decision.should_send:
+                changed_branches.append(branch_payload)
+                pending_hashes[branch_code] = decision.payload_hash
+
+        if not changed_branches:
+            logging.info(f"Stock for enterprise_code={enterprise_code} unchanged since last publish. Skipping send.")
+            return
+
+        if len(changed_branches) < len(branches_data):
+            logging.info(
+                f"Stock for enterprise_code={enterprise_code}: sending {len(changed_branches)} "
+                f"of {len(branches_data)} branches, others unchanged."
+            )
+            formatted_json = {"Branches": changed_branches}
+
+        status, _ = await send_to_endpoint(endpoint, formatted_json, login, password, enterprise_code)
+        if status < 400:
+            publish_ledger.record_publish(enterprise_code, publish_ledger.KIND_STOCK, pending_hashes)
+
         logging.info(f"Stock file for enterprise_code={enterprise_code} processed successfully.")
 
         if developer_settings.message_orders:
@@ -112,13 +147,13 @@ async def process_stock_file(
 async def send_to_endpoint(endpoint: str, data: list, login: str, password: str, enterprise_code):
     """Отправляет данные на указанный API-эндпоинт."""
     try:
-        headers = {"Content-Type": "application/json"}
+        body, headers = encode_json_body(data)
         auth = aiohttp.BasicAuth(login, password)
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(endpoint, json=data, headers=headers, auth=auth) as response:
-                response_text = await response.text()
-                return response.status, response_text
+        session = get_aiohttp_session()
+        async with session.post(endpoint, data=body, headers=headers, auth=auth) as response:
+            response_text = await response.text()
+            return response.status, response_text
     except Exception as e:
         logging.error(f"Error sending data to endpoint: {str(e)}")
         send_notification(f"Ошибка отправки стока на API {enterprise_code}: {str(e)}", enterprise_code)
@@ -3,6 +3,7 @@ import os
 import asyncio
 import logging
 import time
+from dataclasses import dataclass
 from time import perf_counter
 import pytz
 from datetime import datetime, timedelta, timezone
@@ -34,6 +35,7 @@ from app.bioteca_data_service.bioteca_conv import run_service as run_bioteca
 
 from app.database import get_async_db, EnterpriseSettings
 from app.services.notification_service import send_notification
+from app.core.http_clients import close_http_clients, log_http_metrics
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -61,6 +63,160 @@ PROCESSORS = {
     "Bioteca": run_bioteca,
 }
 
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_WORKERS_PER_FORMAT = 2
+DEFAULT_ENTERPRISE_TIMEOUT_SEC = 900
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name)
+    if raw is None or raw.strip() == "":
+        return default
+    try:
+        return int(raw.strip())
+    except ValueError:
+        logging.warning("Неверное значение %s=%r, используется default=%s", name, raw, default)
+        return default
+
+
+def _max_workers() -> int:
+    return max(1, _env_int("STOCK_SCHEDULER_MAX_WORKERS", DEFAULT_MAX_WORKERS))
+
+
+def _max_workers_per_format() -> int:
+    return max(1, _env_int("STOCK_SCHEDULER_MAX_WORKERS_PER_FORMAT", DEFAULT_MAX_WORKERS_PER_FORMAT))
+
+
+def _enterprise_timeout_sec() -> int:
+    return max(0, _env_int("STOCK_SCHEDULER_ENTERPRISE_TIMEOUT_SEC", DEFAULT_ENTERPRISE_TIMEOUT_SEC))
+
+
+@dataclass
+class EnterpriseRunReport:
+    enterprise_code: str
+    data_format: str
+    status: str = "queued"
+    queued_at: float = 0.0
+    started_at: float | None = None
+    finished_at: float | None = None
+
+    @property
+    def queue_wait_sec(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return self.started_at - self.queued_at
+
+    @property
+    def run_sec(self) -> float:
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+
+class StockWorkerPool:
+    """
+    Ограниченный пул выполнения process_stock_for_enterprise.
+
+    Общий лимит и лимит на data_format задаются семафорами; предприятие,
+    которое ещё выполняется с прошлого цикла, повторно не ставится в очередь.
+    """
+
+    def __init__(self, max_workers: int, max_workers_per_format: int, timeout_sec: int):
+        self._global_slots = asyncio.Semaphore(max_workers)
+        self._max_workers_per_format = max_workers_per_format
+        self._format_slots: dict[str, asyncio.Semaphore] = {}
+        self._timeout_sec = timeout_sec
+        self._running: dict[str, asyncio.Task] = {}
+        self._finished: list[EnterpriseRunReport] = []
+
+    def _format_slot(self, data_format: str) -> asyncio.Semaphore:
+        slot = self._format_slots.get(data_format)
+        if slot is None:
+            slot = asyncio.Semaphore(self._max_workers_per_format)
+            self._format_slots[data_format] = slot
+        return slot
+
+    @property
+    def running_count(self) -> int:
+        return len(self._running)
+
+    def submit(self, enterprise_code: str, data_format: str, stock_enabled: bool) -> bool:
+        if enterprise_code in self._running:
+            logging.info(
+                "Stock scheduler: skip enterprise_code=%s data_format=%s because previous run is still in progress",
+                enterprise_code,
+                data_format,
+            )
+            return False
+        report = EnterpriseRunReport(
+            enterprise_code=enterprise_code,
+            data_format=data_format,
+            queued_at=perf_counter(),
+        )
+        task = asyncio.create_task(self._run(report, stock_enabled))
+        self._running[enterprise_code] = task
+        task.add_done_callback(lambda _task, code=enterprise_code: self._running.pop(code, None))
+        return True
+
+    async def _run(self, report: EnterpriseRunReport, stock_enabled: bool) -> None:
+        try:
+            async with self._format_slot(report.data_format), self._global_slots:
+                report.started_at = perf_counter()
+                report.status = "running"
+                coro = process_stock_for_enterprise(
+                    enterprise_code=report.enterprise_code,
+                    data_format=report.data_format,
+                    stock_enabled=stock_enabled,
+                )
+                if self._timeout_sec:
+                    await asyncio.wait_for(coro, timeout=self._timeout_sec)
+                else:
+                    await coro
+                report.status = "done"
+        except asyncio.TimeoutError:
+            report.status = "timeout"
+            await notify_error(
+                f"Таймаут обработки остатков для предприятия {report.enterprise_code}: "
+                f"превышено {self._timeout_sec} сек.",
+                report.enterprise_code,
+            )
+        except Exception:
+            report.status = "failed"
+            logging.exception(
+                "Stock scheduler: worker failure enterprise_code=%s data_format=%s",
+                report.enterprise_code,
+                report.data_format,
+            )
+        finally:
+            report.finished_at = perf_counter()
+            self._finished.append(report)
+
+    def drain_finished(self) -> list[EnterpriseRunReport]:
+        finished, self._finished = self._finished, []
+        return finished
+
+    async def wait_all(self) -> None:
+        if self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+
+
+def _log_cycle_report(reports: list[EnterpriseRunReport], running_count: int) -> None:
+    for report in reports:
+        logging.info(
+            "Stock scheduler: run report enterprise_code=%s data_format=%s status=%s queue_wait=%.3fs run=%.3fs",
+            report.enterprise_code,
+            report.data_format,
+            report.status,
+            report.queue_wait_sec,
+            report.run_sec,
+        )
+    logging.info(
+        "Stock scheduler: cycle report finished=%d still_running=%d",
+        len(reports),
+        running_count,
+    )
+
+
 async def notify_error(message: str, enterprise_code: str = "unknown"):
     logging.error(message)
     # send_notification — синхронная функция
@@ -162,34 +318,55 @@ async def process_stock_for_enterprise(enterprise_code: str, data_format: str, s
 async def schedule_stock_tasks():
     """
     Главный цикл обновления остатков:
-    - Каждую минуту отбирает предприятия по частоте и запускает их обработчики.
+    - Каждую минуту отбирает предприятия по частоте и ставит их обработчики
+      в ограниченный пул (общий лимит + лимит на data_format).
+    - Предприятие, которое ещё обрабатывается, в новом цикле повторно не запускается.
     """
     interval_minutes = 1
+    pool = StockWorkerPool(
+        max_workers=_max_workers(),
+        max_workers_per_format=_max_workers_per_format(),
+        timeout_sec=_enterprise_timeout_sec(),
+    )
+    logging.info(
+        "Stock scheduler: worker pool max_workers=%d max_workers_per_format=%d enterprise_timeout_sec=%d",
+        _max_workers(),
+        _max_workers_per_format(),
+        _enterprise_timeout_sec(),
+    )
     try:
         while True:
             loop_started = perf_counter()
             logging.info("🚀 Запуск планировщика остатков...")
             enterprises = await get_enterprises_for_stock()
             logging.info("Stock scheduler: enterprises queued=%d", len(enterprises))
+            submitted = 0
             for enterprise in enterprises:
-                await process_stock_for_enterprise(
+                if pool.submit(
                     enterprise_code=str(enterprise["enterprise_code"]),
                     data_format=str(enterprise.get("data_format") or ""),
                     stock_enabled=(enterprise.get("stock_enabled") is not False),
-                )
+                ):
+                    submitted += 1
 
             logging.info(
-                "Stock scheduler: cycle finished enterprises=%d elapsed=%.3fs",
+                "Stock scheduler: cycle dispatched enterprises=%d submitted=%d running=%d elapsed=%.3fs",
                 len(enterprises),
+                submitted,
+                pool.running_count,
                 perf_counter() - loop_started,
             )
 
             logging.info("⏳ Ожидание 1 минуты перед следующим циклом стока...")
             await asyncio.sleep(interval_minutes * 60)
+            _log_cycle_report(pool.drain_finished(), pool.running_count)
+            log_http_metrics(reset=True)
     except Exception as main_error:
         logging.exception("Stock scheduler: session/connection failure on outer loop")
         await notify_error(f"🔥 Критическая ошибка в планировщике стока: {str(main_error)}", "stock_scheduler")
     finally:
+        await pool.wait_all()
+        await close_http_clients()
         await notify_error("❌ Сервис stock_scheduler неожиданно остановлен.", "stock_scheduler")
 
 if __name__ == "__main__":
@@ -5,36 +5,80 @@ import aiohttp
 from sqlalchemy.future import select
 from app.database import get_async_db, DeveloperSettings, EnterpriseSettings 
 from app.services.notification_service import send_notification 
+from app.core.http_clients import get_aiohttp_session
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-async def api_call(branch: str, endpoint_orders: str, login: str, password: str):
+BRANCH_ORDERS_CONCURRENCY = 8
+
+
+async def _fetch_branch_orders(
+    session: aiohttp.ClientSession,
+    branch: str,
+    endpoint_orders: str,
+    auth: aiohttp.BasicAuth,
+):
+    url = f"{endpoint_orders}/api/orders/{branch}/4"
+    headers = {"Content-Type": "application/json"}
+    async with session.get(url, headers=headers, auth=auth) as response:
+        if response.status == 200:
+            return await response.json()
+        logging.error(f"Error from API for branch {branch}: {response.status}")
+        return []
+
+
+async def api_call(
+    branch: str,
+    endpoint_orders: str,
+    login: str,
+    password: str,
+    session: aiohttp.ClientSession | None = None,
+):
     """
     Функция для реального вызова API.
     :param branch: Код филиала.
     :param endpoint_orders: URL для API.
     :param login: Логин для API.
     :param password: Пароль для API.
+    :param session: aiohttp-сессия; по умолчанию общая сессия из app.core.http_clients.
     :return: Ответ от API.
     """
-    url = f"{endpoint_orders}/api/orders/{branch}/4"
-    headers = {"Content-Type": "application/json"}
     auth = aiohttp.BasicAuth(login, password)
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, auth=auth) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data
-                else:
-                    logging.error(f"Error from API for branch {branch}: {response.status}")
-                    return []
+        return await _fetch_branch_orders(session or get_aiohttp_session(), branch, endpoint_orders, auth)
     except Exception as e:
         logging.error(f"Error calling API for branch {branch}: {e}")
         return []
 
+
+def _build_reserved_qty_index(api_response) -> dict[str, float]:
+    """
+    Строит goodsCode -> qty по ответу API заказов филиала за один проход.
+
+    Сохраняет прежнюю семантику сопоставления: внутри заказа берётся первая
+    строка с данным goodsCode, а при повторе кода в нескольких заказах
+    действует последний заказ (значения не суммируются).
+    """
+    reserved: dict[str, float] = {}
+    for api_record in api_response or []:
+        seen_in_order: set[str] = set()
+        for row in api_record.get("rows", []):
+            goods_code = str(row.get("goodsCode"))
+            if goods_code in seen_in_order:
+                continue
+            seen_in_order.add(goods_code)
+            reserved[goods_code] = float(row.get("qty", 0))
+    return reserved
+
+
+def _group_records_by_branch(stock_data) -> dict:
+    grouped: dict = {}
+    for record in stock_data:
+        grouped.setdefault(record["branch"], []).append(record)
+    return grouped
+
 async def update_stock(
     stock_data,
     enterprise_code,
@@ -80,45 +124,34 @@ async def update_stock(
         login = enterprise_settings.tabletki_login
         password = enterprise_settings.tabletki_password
 
-        # Собираем уникальные филиалы
-        branches = {record["branch"] for record in stock_data}
-        logging.info(f"Уникальные филиалы для обработки: {branches}")
+        # Группируем записи по филиалам за один проход
+        records_by_branch = _group_records_by_branch(stock_data)
+        branches = list(records_by_branch)
+        logging.info(f"Уникальные филиалы для обработки: {set(branches)}")
+
+        # Запрашиваем заказы всех филиалов параллельно через общую сессию
+        semaphore = asyncio.Semaphore(BRANCH_ORDERS_CONCURRENCY)
+        http_session = get_aiohttp_session()
+
+        async def fetch(branch):
+            async with semaphore:
+                logging.info(f"Запрос API для branch {branch}...")
+                return await api_call(branch, endpoint_orders, login, password, session=http_session)
 
-        # Выполняем запрос для каждого уникального branch
-        for branch in branches:
-            logging.info(f"Запрос API для branch {branch}...")
-            api_response = await api_call(branch, endpoint_orders, login, password)
+        responses = await asyncio.gather(*(fetch(branch) for branch in branches))
 
-            if api_response:
-                pass
-            else:
+        for branch, api_response in zip(branches, responses):
+            if not api_response:
                 logging.warning(f"Нет данных в ответе от API для branch {branch}")
 
-            # Обрабатываем все записи для этого branch
-            for record in stock_data:
-                if record["branch"] == branch:
-                    code = record["code"]
-                    qty = record["qty"]
-
-                    # Ищем товар в ответе API
-                    updated_qty = qty  # Начинаем с исходного количества
-                    found_in_api = False  # Флаг для проверки наличия товара в ответе API
-
-                    for api_record in api_response:
-                        for row in api_record.get("rows", []):  # Итерируемся по списку товаров внутри 'rows'
-                            goods_code = row.get("goodsCode")
-                            
-                            if str(goods_code) == str(code):  # Сравниваем товары по их кодам
-                                api_qty = float(row.get("qty", 0))
-                                updated_qty = max(qty - api_qty, 0)  # Количество не может быть отрицательным
-                                break 
-                        else:
-                            pass
-                    if not found_in_api:
-                        pass
-                    updated_record = record.copy()
-                    updated_record["qty"] = updated_qty  # Обновляем количество товара
-                    updated_data.append(updated_record)
+            reserved_by_code = _build_reserved_qty_index(api_response)
+            for record in records_by_branch[branch]:
+                updated_record = record.copy()
+                reserved_qty = reserved_by_code.get(str(record["code"]))
+                if reserved_qty is not None:
+                    # Количество не может быть отрицательным
+                    updated_record["qty"] = max(record["qty"] - reserved_qty, 0)
+                updated_data.append(updated_record)
 
         logging.info("Обновление стока завершено.")
         return updated_data
@@ -3,13 +3,22 @@
 import asyncio
 import json
 import logging
-import math
 import os
 import tempfile
 from typing import Any, Dict, List, Optional
 
 import pandas as pd
 
+from app.core.dataframe_conversion import (
+    clean_str,
+    column_or_default,
+    read_csv_frame,
+    read_excel_frame,
+    to_float,
+    to_int_nonneg,
+    to_records,
+)
+
 # 👉 Замени на актуальный путь в твоём проекте, если отличается
 try:
     from app.services.database_service import process_database_service  # type: ignore
@@ -68,36 +77,6 @@ def _norm(s: Any) -> str:
     return str(s).strip().lower() if s is not None else ""
 
 
-def _coerce_str(v: Any) -> str:
-    if v is None or (isinstance(v, float) and math.isnan(v)):
-        return ""
-    s = str(v).strip()
-    # Сохраним ведущие нули для штрихкодов
-    return s
-
-
-def _coerce_float(v: Any, default: float = 0.0) -> float:
-    try:
-        if v is None or (isinstance(v, float) and math.isnan(v)):
-            return default
-        s = str(v).replace(",", ".").strip()
-        return float(s) if s else default
-    except Exception:
-        return default
-
-
-def _coerce_int_nonneg(v: Any, default: int = 0) -> int:
-    try:
-        if v is None or (isinstance(v, float) and math.isnan(v)):
-            return default
-        if isinstance(v, str) and not v.strip():
-            return default
-        val = int(float(str(v).replace(",", ".").strip()))
-        return max(val, 0)
-    except Exception:
-        return default
-
-
 def _read_table(file_path: str) -> pd.DataFrame:
     """
     Читает Excel/CSV и АВТОМАТИЧЕСКИ определяет строку заголовков.
@@ -136,19 +115,19 @@ def _read_table(file_path: str) -> pd.DataFrame:
 
     # --- читаем "черновик" без заголовков, чтобы определить строку шапки
     if file_path.lower().endswith((".xlsx", ".xls")):
-        probe = pd.read_excel(file_path, header=None, nrows=10, dtype=object)
+        probe = read_excel_frame(file_path, header=None, nrows=10, dtype=object)
         header_row = _detect_header_row(probe)
-        df = pd.read_excel(file_path, header=header_row, dtype=object)
+        df = read_excel_frame(file_path, header=header_row, dtype=object)
     elif file_path.lower().endswith(".csv"):
         try:
-            probe = pd.read_csv(file_path, header=None, nrows=10, dtype=object)
+            probe = read_csv_frame(file_path, header=None, nrows=10, dtype=object)
         except UnicodeDecodeError:
-            probe = pd.read_csv(file_path, header=None, nrows=10, dtype=object, encoding="cp1251")
+            probe = read_csv_frame(file_path, header=None, nrows=10, dtype=object, encoding="cp1251")
         header_row = _detect_header_row(probe)
         try:
-            df = pd.read_csv(file_path, header=header_row, dtype=object)
+            df = read_csv_frame(file_path, header=header_row, dtype=object)
         except UnicodeDecodeError:
-            df = pd.read_csv(file_path, header=header_row, dtype=object, encoding="cp1251")
+            df = read_csv_frame(file_path, header=header_row, dtype=object, encoding="cp1251")
     else:
         raise ValueError(f"Неподдерживаемый формат файла: {file_path}")
 
@@ -243,24 +222,19 @@ async def process_torgsoft_catalog(
     if missing:
         raise ValueError(f"В каталоге отсутствуют обязательные колонки: {', '.join(missing)}")
 
-    converted: List[Dict[str, Any]] = []
-    for _, row in df.iterrows():
-        item_code = _coerce_str(row.get("code"))
-        item_name = _coerce_str(row.get("name"))
-
-        if not item_code or not item_name:
-            # пропустим пустые строки
-            continue
-
-        converted.append(
-            {
-                "code": item_code,
-                "name": item_name,
-                "producer": DEFAULT_PRODUCER,
-                "vat": DEFAULT_VAT,
-                "barcode": _coerce_str(row.get("barcode")),
-            }
-        )
+    catalog = pd.DataFrame(
+        {
+            "code": clean_str(column_or_default(df, "code")),
+            "name": clean_str(column_or_default(df, "name")),
+            "producer": DEFAULT_PRODUCER,
+            "vat": DEFAULT_VAT,
+            "barcode": clean_str(column_or_default(df, "barcode")),
+        },
+        index=df.index,
+    )
+    # пропустим пустые строки
+    catalog = catalog[catalog["code"].ne("") & catalog["name"].ne("")]
+    converted = to_records(catalog)
 
     logging.info("Каталог сконвертирован: %s позиций", len(converted))
     await _send_downstream(converted, data_type="catalog", enterprise_code=enterprise_code)
@@ -298,26 +272,17 @@ async def process_torgsoft_stock(
     if missing:
         raise ValueError(f"В стоке отсутствуют обязательные колонки: {', '.join(missing)}")
 
-    converted: List[Dict[str, Any]] = []
-    for _, row in df.iterrows():
-        item_code = _coerce_str(row.get("code"))
-        if not item_code:
-            continue
-
-        qty = _coerce_int_nonneg(row.get("qty"))
-        price = _coerce_float(row.get("price"))
-        price_reserve = _coerce_float(row.get("price_reserve"))
-
-        converted.append(
-            {
-                "branch": str(branch),
-                "code": item_code,
-                # "barcode": _coerce_str(row.get("barcode")),
-                "price": price,
-                "price_reserve": price_reserve,
-                "qty": qty,
-            }
-        )
+    stock = pd.DataFrame(
+        {
+            "branch": str(branch),
+            "code": clean_str(column_or_default(df, "code")),
+            "price": to_float(column_or_default(df, "price")),
+            "price_reserve": to_float(column_or_default(df, "price_reserve")),
+            "qty": to_int_nonneg(column_or_default(df, "qty")),
+        },
+        index=df.index,
+    )
+    converted = to_records(stock[stock["code"].ne("")])
 
     logging.info(
         "Сток сконвертирован: %s позиций (enterprise=%s, branch=%s)",
@@ -3,13 +3,23 @@
 import asyncio
 import json
 import logging
-import math
 import os
 import tempfile
 from typing import Any, Dict, List, Optional
 
 import pandas as pd
 
+from app.core.dataframe_conversion import (
+    clean_str,
+    column_or_default,
+    map_column,
+    read_csv_frame,
+    read_excel_frame,
+    to_float,
+    to_int_nonneg,
+    to_records,
+)
+
 from sqlalchemy.future import select
 from app.database import get_async_db
 from app.database import get_async_db, MappingBranch
@@ -86,36 +96,6 @@ def _norm(s: Any) -> str:
     return str(s).strip().lower() if s is not None else ""
 
 
-def _coerce_str(v: Any) -> str:
-    if v is None or (isinstance(v, float) and math.isnan(v)):
-        return ""
-    s = str(v).strip()
-    # Сохраним ведущие нули для штрихкодов
-    return s
-
-
-def _coerce_float(v: Any, default: float = 0.0) -> float:
-    try:
-        if v is None or (isinstance(v, float) and math.isnan(v)):
-            return default
-        s = str(v).replace(",", ".").strip()
-        return float(s) if s else default
-    except Exception:
-        return default
-
-
-def _coerce_int_nonneg(v: Any, default: int = 0) -> int:
-    try:
-        if v is None or (isinstance(v, float) and math.isnan(v)):
-            return default
-        if isinstance(v, str) and not v.strip():
-            return default
-        val = int(float(str(v).replace(",", ".").strip()))
-        return max(val, 0)
-    except Exception:
-        return default
-
-
 def _read_table(file_path: str) -> pd.DataFrame:
     """
     Читает Excel/CSV и АВТОМАТИЧЕСКИ определяет строку заголовков.
@@ -154,19 +134,19 @@ def _read_table(file_path: str) -> pd.DataFrame:
 
     # --- читаем "черновик" без заголовков, чтобы определить строку шапки
     if file_path.lower().endswith((".xlsx", ".xls")):
-        probe = pd.read_excel(file_path, header=None, nrows=10, dtype=object)
+        probe = read_excel_frame(file_path, header=None, nrows=10, dtype=object)
         header_row = _detect_header_row(probe)
-        df = pd.read_excel(file_path, header=header_row, dtype=object)
+        df = read_excel_frame(file_path, header=header_row, dtype=object)
     elif file_path.lower().endswith(".csv"):
         try:
-            probe = pd.read_csv(file_path, header=None, nrows=10, dtype=object)
+            probe = read_csv_frame(file_path, header=None, nrows=10, dtype=object)
         except UnicodeDecodeError:
-            probe = pd.read_csv(file_path, header=None, nrows=10, dtype=object, encoding="cp1251")
+            probe = read_csv_frame(file_path, header=None, nrows=10, dtype=object, encoding="cp1251")
         header_row = _detect_header_row(probe)
         try:
-            df = pd.read_csv(file_path, header=header_row, dtype=object)
+            df = read_csv_frame(file_path, header=header_row, dtype=object)
         except UnicodeDecodeError:
-            df = pd.read_csv(file_path, header=header_row, dtype=object, encoding="cp1251")
+            df = read_csv_frame(file_path, header=header_row, dtype=object, encoding="cp1251")
     else:
         raise ValueError(f"Неподдерживаемый формат файла: {file_path}")
 
@@ -253,26 +233,26 @@ async def process_torgsoft_catalog(
     if missing:
         raise ValueError(f"В каталоге отсутствуют обязательные колонки: {', '.join(missing)}")
 
-    items_by_code: Dict[str, Dict[str, Any]] = {}
-
-    for _, row in df.iterrows():
-        item_code = _coerce_str(row.get("code"))
-        item_name = _coerce_str(row.get("name"))
-
-        if not item_code or not item_name:
-            continue  # пропускаем пустые строки
-
-        # Каждый новый дубль перезаписывает предыдущий
-        items_by_code[item_code] = {
-            "code": item_code,
-            "name": item_name,
+    catalog = pd.DataFrame(
+        {
+            "code": clean_str(column_or_default(df, "code")),
+            "name": clean_str(column_or_default(df, "name")),
             "producer": DEFAULT_PRODUCER,
             "vat": DEFAULT_VAT,
-            "barcode": _coerce_str(row.get("barcode")),
-        }
-
-    # Преобразуем словарь обратно в список
-    converted: List[Dict[str, Any]] = list(items_by_code.values())
+            "barcode": clean_str(column_or_default(df, "barcode")),
+        },
+        index=df.index,
+    )
+    catalog = catalog[catalog["code"].ne("") & catalog["name"].ne("")]  # пропускаем пустые строки
+    # Каждый новый дубль перезаписывает предыдущий, позиция кода - по первому вхождению
+    first_codes = catalog["code"].drop_duplicates(keep="first")
+    catalog = (
+        catalog.drop_duplicates(subset="code", keep="last")
+        .set_index("code")
+        .loc[first_codes.to_numpy()]
+        .reset_index()
+    )
+    converted: List[Dict[str, Any]] = to_records(catalog)
 
     logging.info(
         "Каталог сконвертирован: %s позиций (уникальные коды, дубли удалены)",
@@ -329,41 +309,43 @@ async def process_torgsoft_stock(
     # Кэш соответствий склад->branch
     store_to_branch = await _build_branch_map(enterprise_code)
 
-    converted = []
-    skipped_rows = 0
-
-    for _, row in df.iterrows():
-        item_code = _coerce_str(row.get("code"))
-        store_id_raw = _coerce_str(row.get("склад"))
+    codes = clean_str(column_or_default(df, "code"))
+    store_ids = clean_str(column_or_default(df, "склад"))
 
-        # 1) Пропуск пустых/служебных строк и «вторых шапок»
-        if not item_code or not store_id_raw:
-            skipped_rows += 1
-            continue
-        if item_code.lower() == "код фото" or store_id_raw.lower() == "склад":
-            skipped_rows += 1
-            continue
-
-        qty = _coerce_int_nonneg(row.get("qty"))
-        price = _coerce_float(row.get("price"))
-        price_reserve = _coerce_float(row.get("price_reserve"))
-
-        key = _norm_store_id(store_id_raw)
-        branch = store_to_branch.get(key)
+    # 1) Пропуск пустых/служебных строк и «вторых шапок»
+    keep = (
+        codes.ne("")
+        & store_ids.ne("")
+        & codes.str.lower().ne("код фото")
+        & store_ids.str.lower().ne("склад")
+    )
+    skipped_rows = int((~keep).sum())
+    df, codes, store_ids = df[keep], codes[keep], store_ids[keep]
 
-        if not branch:
+    def _branch_for(store_id_raw: str) -> Optional[str]:
+        branch = store_to_branch.get(_norm_store_id(store_id_raw))
+        if not branch and store_id_raw.replace(".", "", 1).isdigit():
             # Доп. попытка: иногда в файле могут быть «30421» — прямые коды склада
-            branch = store_to_branch.get(_norm_store_id(str(int(float(store_id_raw)))) if store_id_raw.replace(".", "", 1).isdigit() else "")
-        if not branch:
-            raise ValueError(f"❌ Branch не найден для enterprise_code={enterprise_code}, store_id={store_id_raw}")
-
-        converted.append({
-            "branch": branch,
-            "code": item_code,
-            "price": price,
-            "price_reserve": price_reserve,
-            "qty": qty,
-        })
+            branch = store_to_branch.get(_norm_store_id(str(int(float(store_id_raw)))))
+        return branch
+
+    branches = map_column(store_ids, _branch_for)
+    missing_branch = branches.isna() | branches.eq("")
+    if missing_branch.any():
+        store_id_raw = store_ids[missing_branch].iloc[0]
+        raise ValueError(f"❌ Branch не найден для enterprise_code={enterprise_code}, store_id={store_id_raw}")
+
+    stock = pd.DataFrame(
+        {
+            "branch": branches,
+            "code": codes,
+            "price": to_float(column_or_default(df, "price")),
+            "price_reserve": to_float(column_or_default(df, "price_reserve")),
+            "qty": to_int_nonneg(column_or_default(df, "qty")),
+        },
+        index=df.index,
+    )
+    converted = to_records(stock)
 
     logging.info(
         "Сток сконвертирован: %s позиций (enterprise=%s). Пропущено строк: %s",
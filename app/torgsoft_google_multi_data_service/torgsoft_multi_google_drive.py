@@ -7,10 +7,8 @@ from typing import List, Dict, Any
 
 from dotenv import load_dotenv
 from sqlalchemy.future import select
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
 
+from app.core.google_drive_client import get_drive_client
 from app.database import get_async_db, EnterpriseSettings, MappingBranch
 from app.services.notification_service import send_notification
 
@@ -48,11 +46,7 @@ async def _connect_to_google_drive():
             send_notification(msg, "Разработчик")
             raise FileNotFoundError(msg)
 
-        credentials = service_account.Credentials.from_service_account_file(
-            creds_path,
-            scopes=["https://www.googleapis.com/auth/drive"],
-        )
-        return build("drive", "v3", credentials=credentials)
+        return get_drive_client(creds_path)
     except Exception as e:
         msg = f"Ошибка при подключении к Google Drive: {e}"
         logging.error(msg)
@@ -66,12 +60,7 @@ async def _fetch_files_from_folder(drive_service, folder_id: str) -> List[Dict[s
     """
     try:
         logging.info(f"Получение файлов из папки: {folder_id}")
-        results = (
-            drive_service.files()
-            .list(q=f"'{folder_id}' in parents and trashed=false", fields="files(id, name)")
-            .execute()
-        )
-        return results.get("files", [])
+        return await drive_service.list_files(folder_id)
     except Exception as e:
         msg = f"Ошибка при получении файлов из папки {folder_id}: {e}"
         logging.error(msg)
@@ -81,19 +70,10 @@ async def _fetch_files_from_folder(drive_service, folder_id: str) -> List[Dict[s
 
 async def _download_file(drive_service, file_id: str, file_name: str) -> str:
     """
-    Скачивание файла из Drive в temp.
+    Скачивание файла из Drive в уникальный temp-файл (см. AsyncDriveClient.download_to_temp).
     """
     try:
-        file_path = os.path.join(_get_temp_dir(), file_name)
-        request = drive_service.files().get_media(fileId=file_id)
-        with open(file_path, "wb") as fh:
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-                if status:
-                    logging.info(f"Скачивание {file_name}: {int(status.progress() * 100)}%")
-        return file_path
+        return await drive_service.download_to_temp(file_id, file_name, _get_temp_dir())
     except Exception as e:
         msg = f"Ошибка при скачивании файла {file_name}: {e}"
         logging.error(msg)
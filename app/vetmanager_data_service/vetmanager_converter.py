@@ -24,11 +24,11 @@ from decimal import Decimal, InvalidOperation, ROUND_FLOOR
 from dataclasses import dataclass
 from typing import Any, Dict, List, Optional, Tuple
 
-import requests
 import aiohttp
 from aiohttp import ClientSession, ClientTimeout
 
 from sqlalchemy.future import select
+from app.core.paginated_fetch import Page, RetryPolicy, TokenBucket, get_json_with_retry, get_rate_limiter, iter_pages
 from app.database import get_async_db, EnterpriseSettings
 from app.models import MappingBranch
 from app.services.database_service import process_database_service
@@ -43,6 +43,8 @@ CATALOG_PAGE_LIMIT = 200            # Пагинация каталога
 SYNC_HTTP_RETRY_ATTEMPTS = 3
 ASYNC_HTTP_RETRY_ATTEMPTS = 3
 HTTP_RETRY_BACKOFF_SEC = 0.5
+CATALOG_PAGES_IN_FLIGHT = int(os.getenv("VETMANAGER_FETCH_MAX_IN_FLIGHT", "4"))
+API_RATE_LIMIT_PER_SEC = float(os.getenv("VETMANAGER_RATE_LIMIT_PER_SEC", "5"))
 
 
 @dataclass(frozen=True)
@@ -187,7 +189,7 @@ async def get_ids_from_mapping_branch(
     return _parse_store_id_csv(chosen)
 
 
-# ===== HTTP (sync для каталога) =====
+# ===== HTTP (каталог и служебные запросы) =====
 def vet_headers(api_key: str) -> Dict[str, str]:
     return {
         "X-REST-API-KEY": api_key,
@@ -200,40 +202,23 @@ def _should_retry_status(status_code: int) -> bool:
     return status_code == 429 or 500 <= status_code < 600
 
 
-def http_get(url: str, headers: Dict[str, str], logger: logging.Logger) -> requests.Response:
-    for attempt in range(1, SYNC_HTTP_RETRY_ATTEMPTS + 1):
-        logger.info("HTTP GET → %s attempt=%s/%s", url, attempt, SYNC_HTTP_RETRY_ATTEMPTS)
-        try:
-            resp = requests.get(url, headers=headers, timeout=30)
-        except requests.RequestException as exc:
-            logger.warning(
-                "HTTP request exception for %s attempt=%s/%s error=%s",
-                url,
-                attempt,
-                SYNC_HTTP_RETRY_ATTEMPTS,
-                exc,
-            )
-            if attempt >= SYNC_HTTP_RETRY_ATTEMPTS:
-                raise
-            time.sleep(HTTP_RETRY_BACKOFF_SEC * attempt)
-            continue
+def vet_rate_limiter(domain: str) -> TokenBucket:
+    return get_rate_limiter(f"vetmanager:{domain}", API_RATE_LIMIT_PER_SEC, capacity=API_RATE_LIMIT_PER_SEC)
 
-        logger.info("HTTP %s ← %s attempt=%s/%s", resp.status_code, url, attempt, SYNC_HTTP_RETRY_ATTEMPTS)
-        if _should_retry_status(resp.status_code) and attempt < SYNC_HTTP_RETRY_ATTEMPTS:
-            logger.warning(
-                "Retrying HTTP %s for %s attempt=%s/%s",
-                resp.status_code,
-                url,
-                attempt,
-                SYNC_HTTP_RETRY_ATTEMPTS,
-            )
-            time.sleep(HTTP_RETRY_BACKOFF_SEC * attempt)
-            continue
 
-        resp.raise_for_status()
-        return resp
-
-    raise RuntimeError(f"Unexpected retry fallthrough for URL: {url}")
+async def http_get(url: str, headers: Dict[str, str], logger: logging.Logger, domain: str) -> Any:
+    """GET → JSON с повторами на 429/5xx (backoff без блокировки event loop)."""
+    logger.info("HTTP GET → %s", url)
+    payload = await get_json_with_retry(
+        url,
+        headers=headers,
+        timeout_sec=30,
+        limiter=vet_rate_limiter(domain),
+        retry=RetryPolicy(attempts=SYNC_HTTP_RETRY_ATTEMPTS, backoff_sec=HTTP_RETRY_BACKOFF_SEC),
+        label=url,
+    )
+    logger.info("HTTP 200 ← %s", url)
+    return payload
 
 
 # ===== УТИЛИТЫ =====
@@ -274,11 +259,10 @@ def extract_store_id(row: Dict[str, Any]) -> Optional[str]:
 
 
 # ===== ПОЛЬЗОВАТЕЛЬ / КЛИНИКИ =====
-def discover_user_id(domain: str, api_key: str, logger: logging.Logger) -> str:
+async def discover_user_id(domain: str, api_key: str, logger: logging.Logger) -> str:
     url = (f"https://{domain}/rest/api/User?filter="
            "[{\"property\":\"is_limited\",\"value\":0,\"operator\":\"=\"}]")
-    r = http_get(url, vet_headers(api_key), logger)
-    data = r.json()
+    data = await http_get(url, vet_headers(api_key), logger, domain)
     items = (data.get("data") or {}).get("user") or data.get("items") or []
     if not isinstance(items, list) or not items:
         raise ValueError("Cannot autodetect user_id: empty user list")
@@ -288,17 +272,16 @@ def discover_user_id(domain: str, api_key: str, logger: logging.Logger) -> str:
     return str(items[0].get("id"))
 
 
-def discover_clinics(domain: str, api_key: str, logger: logging.Logger, user_id: str) -> List[str]:
+async def discover_clinics(domain: str, api_key: str, logger: logging.Logger, user_id: str) -> List[str]:
     url = f"https://{domain}/rest/api/user/allowedClinicsByUserId?user_id={user_id}"
-    r = http_get(url, vet_headers(api_key), logger)
-    data = r.json()
+    data = await http_get(url, vet_headers(api_key), logger, domain)
     items = (data.get("data") or {}).get("clinics") or data.get("items") or []
     if not isinstance(items, list) or not items:
         raise ValueError("Cannot autodetect clinics: empty clinics list")
     return [str(c.get("id")) for c in items if c.get("id") is not None]
 
 
-def discover_single_clinic(
+async def discover_single_clinic(
     domain: str,
     api_key: str,
     logger: logging.Logger,
@@ -309,8 +292,8 @@ def discover_single_clinic(
     Проверяем, что пользователю эта клиника доступна.
     """
     started_at = time.monotonic()
-    uid = discover_user_id(domain, api_key, logger)
-    clinics = discover_clinics(domain, api_key, logger, uid)
+    uid = await discover_user_id(domain, api_key, logger)
+    clinics = await discover_clinics(domain, api_key, logger, uid)
     if preferred_clinic_id in clinics:
         logger.info(
             "Using FIXED clinic_id=%s (allowed=%s elapsed=%.2fs)",
@@ -357,21 +340,22 @@ def select_price_from_catalog(good: Dict[str, Any], clinic_id: str) -> float:
 
 
 # ===== КАТАЛОГ =====
-def fetch_goods_paginated(
+async def fetch_goods_paginated(
     domain: str,
     api_key: str,
     logger: logging.Logger,
     limit: int = CATALOG_PAGE_LIMIT
 ) -> List[Dict[str, Any]]:
-    """Каталог: /rest/api/Good → берём массив из data.good (или data.items)."""
+    """
+    Каталог: /rest/api/Good → берём массив из data.good (или data.items).
+    Следующие страницы (offset) запрашиваются заранее, до CATALOG_PAGES_IN_FLIGHT одновременно.
+    """
     base = f"https://{domain}/rest/api/Good"
-    goods: List[Dict[str, Any]] = []
-    offset = 0
-    page = 1
-    while True:
-        url = f"{base}?limit={limit}&offset={offset}"
-        r = http_get(url, vet_headers(api_key), logger)
-        payload = r.json()
+    headers = vet_headers(api_key)
+
+    async def fetch_page(page: int) -> Page:
+        offset = (page - 1) * limit
+        payload = await http_get(f"{base}?limit={limit}&offset={offset}", headers, logger, domain)
         data_node = payload.get("data") if isinstance(payload, dict) else None
         items: List[Dict[str, Any]] = []
         if isinstance(data_node, dict):
@@ -379,15 +363,12 @@ def fetch_goods_paginated(
                 items = data_node["good"]
             elif isinstance(data_node.get("items"), list):
                 items = data_node["items"]
-        count = len(items)
-        logger.info(f"Goods page {page}: got {count} items")
-        if count == 0:
-            break
-        goods.extend(items)
-        if len(items) < limit:
-            break
-        offset += limit
-        page += 1
+        return Page(number=page, items=items, is_last=len(items) < limit)
+
+    goods: List[Dict[str, Any]] = []
+    async for page in iter_pages(fetch_page, max_in_flight=CATALOG_PAGES_IN_FLIGHT):
+        logger.info(f"Goods page {page.number}: got {len(page.items)} items")
+        goods.extend(page.items)
     logger.info(f"Fetched goods total={len(goods)}")
     return goods
 
@@ -483,7 +464,7 @@ async def fetch_stock_concurrent(
     Асинхронно, с ограничением конкурентности, тянем остатки по target_store_id для всех goods.
     Возвращаем только товары с qty>0 и агрегированную статистику по fetch phase.
     """
-    uid, clinic_id = discover_single_clinic(domain, api_key, logger, preferred_clinic_id)
+    uid, clinic_id = await discover_single_clinic(domain, api_key, logger, preferred_clinic_id)
     base_stock = f"https://{domain}/rest/api/Good/StockBalancesForProduct"
 
     timeout = ClientTimeout(total=REQUEST_TIMEOUT_SEC)
@@ -622,7 +603,7 @@ async def run_service(enterprise_code: str, file_type: str) -> None:
         # 1) Каталог
         logger.info("===== STAGE: Fetch GOODS =====")
         goods_fetch_started_at = time.monotonic()
-        all_goods = fetch_goods_paginated(api_config.domain, api_config.api_key, logger, limit=CATALOG_PAGE_LIMIT)
+        all_goods = await fetch_goods_paginated(api_config.domain, api_config.api_key, logger, limit=CATALOG_PAGE_LIMIT)
         goods = filter_goods_for_catalog(all_goods, logger)
         catalog = transform_catalog(goods, logger)
         logger.info(